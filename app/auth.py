@@ -1,11 +1,13 @@
+from dataclasses import dataclass
 from datetime import datetime, timedelta, timezone
 from jose import JWTError, jwt
-from passlib.context import CryptContext
 from fastapi import Depends, HTTPException
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from sqlalchemy.orm import Session
 from app.database import get_db
 from app.models import User
+from app.services.passwords import PasswordHasherBusy, password_hasher, pwd_context
+from app.services.principals import Principal, load_principal, remember_principal
 import os
 import logging
 
@@ -20,21 +22,58 @@ if not SECRET_KEY:
 ALGORITHM = os.getenv("JWT_ALGORITHM", "HS256")
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("JWT_ACCESS_TOKEN_EXPIRE_MINUTES", "60"))
 
-# Password hashing - using Argon2 (no 72 byte limit, more secure)
-pwd_context = CryptContext(schemes=["argon2"], deprecated="auto")
 
 # HTTP Bearer scheme for JWT tokens
 security = HTTPBearer()
 optional_security = HTTPBearer(auto_error=False)
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
-    """Verify a password against its hash"""
+    """Verify a password against its hash (blocking; scripts and startup only)"""
     return pwd_context.verify(plain_password, hashed_password)
 
 def get_password_hash(password: str) -> str:
-    """Hash a password"""
+    """Hash a password (blocking; scripts and startup only)"""
     return pwd_context.hash(password)
 
+
+def release_db_connection(db: Session, *instances) -> None:
+    """
+    Detach already loaded rows and end the read transaction, so the pooled
+    connection is not held while a request waits for the hashing pool. Write
+    back afterwards with an UPDATE (the rows are no longer in the session).
+    """
+    for instance in instances:
+        db.expunge(instance)
+    db.rollback()
+
+
+def _hasher_busy(exc: PasswordHasherBusy) -> HTTPException:
+    logger.warning(f"Password hashing pool saturated: {exc}")
+    return HTTPException(status_code=503, detail="Server busy, try again", headers={"Retry-After": "1"})
+
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """verify_password on the bounded hashing pool; 503 when the pool is saturated."""
+    try:
+        return await password_hasher.verify(plain_password, hashed_password)
+    except PasswordHasherBusy as exc:
+        raise _hasher_busy(exc)
+
+
+async def verify_password_and_update(plain_password: str, hashed_password: str) -> tuple[bool, str | None]:
+    """Like verify_password_async, plus a new hash when the stored one uses outdated Argon2 parameters."""
+    try:
+        return await password_hasher.verify_and_update(plain_password, hashed_password)
+    except PasswordHasherBusy as exc:
+        raise _hasher_busy(exc)
+
+
+async def get_password_hash_async(password: str) -> str:
+    try:
+        return await password_hasher.hash(password)
+    except PasswordHasherBusy as exc:
+        raise _hasher_busy(exc)
+
 def create_access_token(data: dict, expires_minutes: int | None = None):
     """
     Create a JWT access token.
@@ -47,8 +86,10 @@ def create_access_token(data: dict, expires_minutes: int | None = None):
     
     # Calculate expiration using ENV value
     minutes = expires_minutes if expires_minutes is not None else ACCESS_TOKEN_EXPIRE_MINUTES
-    expire = datetime.now(timezone.utc) + timedelta(minutes=minutes)
-    to_encode.update({"exp": expire})
+    issued_at = datetime.now(timezone.utc)
+    expire = issued_at + timedelta(minutes=minutes)
+    # iat also keys the principal cache (one entry per issued token)
+    to_encode.update({"iat": issued_at, "exp": expire})
     
     # Encode JWT using values from ENV
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
@@ -56,38 +97,83 @@ def create_access_token(data: dict, expires_minutes: int | None = None):
     logger.info(f"JWT token created for user_id={to_encode.get('sub')}, expires_at={expire.isoformat()}")
     return encoded_jwt
 
-async def get_current_user(
-    credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: Session = Depends(get_db),
-) -> User:
-    logger.info("get_current_user invoked")
-    
-    token = credentials.credentials
-    
+@dataclass(frozen=True)
+class TokenClaims:
+    """Verified JWT claims; enough for endpoints that only need the caller's id and role."""
+
+    user_id: int
+    role: str
+    issued_at: float  # iat; tokens issued before iat was added fall back to exp
+
+    @property
+    def is_admin(self) -> bool:
+        return self.role in ("admin", "owner")
+
+
+def decode_token_claims(token: str) -> TokenClaims:
+    """Verify signature/expiry and parse the claims; 401 on anything invalid."""
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        logger.info(f"Token payload: {payload}")
     except JWTError as e:
-        logger.error(f"JWT decode failed: {e}")
+        logger.warning(f"JWT decode failed: {e}")
         raise HTTPException(status_code=401, detail=f"Invalid token: {e}")
-    
+
     sub = payload.get("sub")
     if not sub:
         raise HTTPException(status_code=401, detail="Token missing subject")
-    
+
     try:
         user_id = int(sub)
     except (ValueError, TypeError):
         raise HTTPException(status_code=401, detail="Token subject must be an integer")
-    
-    user = db.query(User).filter(User.id == user_id).first()
-    
+
+    issued_at = payload.get("iat") or payload.get("exp") or 0
+    return TokenClaims(user_id=user_id, role=str(payload.get("role") or "user"), issued_at=float(issued_at))
+
+
+async def get_token_claims(credentials: HTTPAuthorizationCredentials = Depends(security)) -> TokenClaims:
+    """Claims only, no database access. The role is as of login time."""
+    return decode_token_claims(credentials.credentials)
+
+
+async def get_current_user(
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    db: Session = Depends(get_db),
+) -> User:
+    """Full ORM user, for handlers that modify it or need balances (credits)."""
+    claims = decode_token_claims(credentials.credentials)
+    user = db.query(User).filter(User.id == claims.user_id).first()
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
-    
+    remember_principal(user, claims.issued_at)
     return user
 
 
+def _resolve_principal(db: Session, claims: TokenClaims) -> Principal:
+    principal = load_principal(db, claims.user_id, claims.issued_at)
+    if principal is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    return principal
+
+
+async def get_current_principal(
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    db: Session = Depends(get_db),
+) -> Principal:
+    """Identity, role and profile of the caller; cached per token for a few seconds."""
+    return _resolve_principal(db, decode_token_claims(credentials.credentials))
+
+
+async def get_optional_principal(
+    credentials: HTTPAuthorizationCredentials | None = Depends(optional_security),
+    db: Session = Depends(get_db),
+) -> Principal | None:
+    """Principal if a JWT was provided, otherwise None."""
+    if credentials is None:
+        return None
+    return _resolve_principal(db, decode_token_claims(credentials.credentials))
+
+
 async def get_optional_user(
     credentials: HTTPAuthorizationCredentials | None = Depends(optional_security),
     db: Session = Depends(get_db),
@@ -95,28 +181,14 @@ async def get_optional_user(
     """Return current user if JWT provided, otherwise None."""
     if credentials is None:
         return None
-    token = credentials.credentials
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-    except JWTError as e:
-        raise HTTPException(status_code=401, detail=f"Invalid token: {e}")
-
-    sub = payload.get("sub")
-    if not sub:
-        raise HTTPException(status_code=401, detail="Token missing subject")
-
-    try:
-        user_id = int(sub)
-    except (ValueError, TypeError):
-        raise HTTPException(status_code=401, detail="Token subject must be an integer")
-
-    user = db.query(User).filter(User.id == user_id).first()
+    claims = decode_token_claims(credentials.credentials)
+    user = db.query(User).filter(User.id == claims.user_id).first()
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     return user
 
-async def get_current_owner(current_user: User = Depends(get_current_user)) -> User:
+async def get_current_owner(current_user: Principal = Depends(get_current_principal)) -> Principal:
     """Require that the authenticated user is the platform owner."""
-    if not bool(current_user.is_owner):
+    if not current_user.is_owner:
         raise HTTPException(status_code=403, detail="Owner access required")
     return current_user
@@ -1,10 +1,14 @@
 from sqlalchemy import create_engine, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy import inspect
 import os
 import logging
 
+from app.db_pool import PoolSettings, async_engine_kwargs, log_pool_settings, sync_engine_kwargs
+
 logger = logging.getLogger(__name__)
 
 # Database URL - must be set in environment
@@ -22,11 +26,31 @@ if not DATABASE_URL.startswith(("postgresql://", "postgresql+")):
         "Only PostgreSQL connections are allowed."
     )
 
-engine = create_engine(DATABASE_URL)
+# Pool size, timeouts and PgBouncer mode come from DB_* env vars (see app/db_pool.py)
+POOL_SETTINGS = PoolSettings.from_env()
+log_pool_settings(POOL_SETTINGS)
+
+engine = create_engine(DATABASE_URL, **sync_engine_kwargs(POOL_SETTINGS))
 
 logger.info(f"Using database: {DATABASE_URL}")
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+def _build_async_database_url(url: str):
+    """Same database via asyncpg; libpq's sslmode is spelled ssl there."""
+    async_url = make_url(url).set(drivername="postgresql+asyncpg")
+    query = dict(async_url.query)
+    if "sslmode" in query:
+        query["ssl"] = query.pop("sslmode")
+        async_url = async_url.set(query=query)
+    return async_url
+
+
+# Async engine for hot paths (scanner verify, admin presence). Shares the schema with
+# the sync engine; everything else keeps using SessionLocal/get_db.
+async_engine = create_async_engine(_build_async_database_url(DATABASE_URL), **async_engine_kwargs(POOL_SETTINGS))
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
 Base = declarative_base()
 
 def ensure_access_token_columns():
@@ -40,19 +64,11 @@ def ensure_access_token_columns():
     if 'scan_count' not in columns:
         alters.append("ALTER TABLE access_tokens ADD COLUMN scan_count INTEGER DEFAULT 0")
     if not alters:
-        with engine.begin() as conn:
-            conn.execute(text("UPDATE access_tokens SET is_active = TRUE WHERE is_active IS NULL"))
-            conn.execute(text("UPDATE access_tokens SET scan_count = 0 WHERE scan_count IS NULL"))
         return
+    # NULL backfill: migration backfill_legacy_nulls (app/migrations.py)
     with engine.begin() as conn:
         for statement in alters:
             conn.execute(text(statement))
-        inspector_after = inspect(engine)
-        columns_after = [col['name'] for col in inspector_after.get_columns('access_tokens')]
-        if 'is_active' in columns_after:
-            conn.execute(text("UPDATE access_tokens SET is_active = TRUE WHERE is_active IS NULL"))
-        if 'scan_count' in columns_after:
-            conn.execute(text("UPDATE access_tokens SET scan_count = 0 WHERE scan_count IS NULL"))
 
 def ensure_user_password_column():
     """Ensure users table has password_hash column"""
@@ -73,8 +89,6 @@ def ensure_user_credits_column():
     if 'credits' not in columns:
         with engine.begin() as conn:
             conn.execute(text("ALTER TABLE users ADD COLUMN credits INTEGER DEFAULT 0"))
-            # Set default credits for existing users
-            conn.execute(text("UPDATE users SET credits = 0 WHERE credits IS NULL"))
 
 def ensure_user_admin_column():
     """Ensure users table has is_admin column"""
@@ -85,8 +99,6 @@ def ensure_user_admin_column():
     if 'is_admin' not in columns:
         with engine.begin() as conn:
             conn.execute(text("ALTER TABLE users ADD COLUMN is_admin BOOLEAN DEFAULT FALSE"))
-            # Set default is_admin for existing users
-            conn.execute(text("UPDATE users SET is_admin = FALSE WHERE is_admin IS NULL"))
 
 def ensure_user_profile_columns():
     """Ensure users table has profile-related columns (first_name/last_name/phone_number)."""
@@ -140,7 +152,6 @@ def ensure_user_owner_column():
     if 'is_owner' not in columns:
         with engine.begin() as conn:
             conn.execute(text("ALTER TABLE users ADD COLUMN is_owner BOOLEAN DEFAULT FALSE"))
-            conn.execute(text("UPDATE users SET is_owner = FALSE WHERE is_owner IS NULL"))
 
 def ensure_access_token_nullable_columns():
     """Ensure access_tokens table has nullable payment_id and expires_at"""
@@ -245,6 +256,8 @@ def ensure_access_log_columns():
     if 'raw_data' not in columns:
         alters.append("ALTER TABLE access_logs ADD COLUMN raw_data TEXT")
 
+    if not alters:
+        return
     with engine.begin() as conn:
         for statement in alters:
             try:
@@ -252,12 +265,6 @@ def ensure_access_log_columns():
             except Exception as e:
                 logger.warning(f"Error executing migration statement: {statement}, error: {e}")
 
-        # Ensure direction has default value for existing rows
-        try:
-            conn.execute(text("UPDATE access_logs SET direction = 'in' WHERE direction IS NULL"))
-        except Exception:
-            pass
-
 def ensure_access_log_extended_columns():
     """Ensure access_logs has extended audit fields"""
     inspector = inspect(engine)
@@ -424,7 +431,6 @@ def ensure_branding_feature_columns():
     with engine.begin() as conn:
         try:
             conn.execute(text("ALTER TABLE branding_settings ADD COLUMN reservations_enabled BOOLEAN DEFAULT FALSE"))
-            conn.execute(text("UPDATE branding_settings SET reservations_enabled = FALSE WHERE reservations_enabled IS NULL"))
         except Exception as e:
             logger.warning(f"Error adding reservations_enabled to branding_settings: {e}")
 
@@ -435,3 +441,9 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+async def get_async_db():
+    """Dependency for getting an asyncpg-backed AsyncSession"""
+    async with AsyncSessionLocal() as db:
+        yield db
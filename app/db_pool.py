@@ -0,0 +1,231 @@
+"""
+Connection pool configuration and instrumentation for the sync and async engines.
+
+Settings come from the environment (DB_POOL_*, DB_STATEMENT_TIMEOUT_MS, ...).
+Both engines use QueuePool subclasses that time every checkout, so /health and
+/metrics can report checkout wait, saturation and timeouts per pool.
+"""
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any
+from uuid import uuid4
+
+from sqlalchemy import exc
+from sqlalchemy.pool import AsyncAdaptedQueuePool, NullPool, QueuePool
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds (seconds) of the checkout wait histogram; the last bucket is +Inf.
+WAIT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in {"1", "true", "yes", "on"}
+
+
+@dataclass(frozen=True)
+class PoolSettings:
+    pool_size: int = 10
+    max_overflow: int = 10
+    pool_timeout: float = 10.0
+    pool_recycle: int = 1800
+    pre_ping: bool = True
+    statement_timeout_ms: int = 30000
+    idle_in_transaction_timeout_ms: int = 60000
+    pgbouncer: bool = False
+    application_name: str = "gymscanner"
+
+    @classmethod
+    def from_env(cls) -> "PoolSettings":
+        return cls(
+            pool_size=int(os.getenv("DB_POOL_SIZE", cls.pool_size)),
+            max_overflow=int(os.getenv("DB_MAX_OVERFLOW", cls.max_overflow)),
+            pool_timeout=float(os.getenv("DB_POOL_TIMEOUT", cls.pool_timeout)),
+            pool_recycle=int(os.getenv("DB_POOL_RECYCLE", cls.pool_recycle)),
+            pre_ping=_env_bool("DB_POOL_PRE_PING", cls.pre_ping),
+            statement_timeout_ms=int(os.getenv("DB_STATEMENT_TIMEOUT_MS", cls.statement_timeout_ms)),
+            idle_in_transaction_timeout_ms=int(
+                os.getenv("DB_IDLE_IN_TRANSACTION_TIMEOUT_MS", cls.idle_in_transaction_timeout_ms)
+            ),
+            pgbouncer=_env_bool("DB_PGBOUNCER", cls.pgbouncer),
+            application_name=os.getenv("DB_APPLICATION_NAME", cls.application_name),
+        )
+
+    def server_settings(self) -> dict[str, str]:
+        """Session GUCs sent at connect time (0 = leave the server default)."""
+        settings = {}
+        if self.statement_timeout_ms > 0:
+            settings["statement_timeout"] = str(self.statement_timeout_ms)
+        if self.idle_in_transaction_timeout_ms > 0:
+            settings["idle_in_transaction_session_timeout"] = str(self.idle_in_transaction_timeout_ms)
+        return settings
+
+
+class PoolMetrics:
+    """Checkout counters for one pool. Updated under a lock; read via snapshot()."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.saturated_checkouts = 0
+        self.timeouts = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+        self.wait_buckets = [0] * (len(WAIT_BUCKETS) + 1)
+
+    def observe(self, wait: float, *, saturated: bool, timed_out: bool) -> None:
+        with self._lock:
+            if timed_out:
+                self.timeouts += 1
+                return
+            self.checkouts += 1
+            if saturated:
+                self.saturated_checkouts += 1
+            self.wait_seconds_total += wait
+            if wait > self.wait_seconds_max:
+                self.wait_seconds_max = wait
+            for index, bound in enumerate(WAIT_BUCKETS):
+                if wait <= bound:
+                    self.wait_buckets[index] += 1
+                    break
+            else:
+                self.wait_buckets[-1] += 1
+
+    def snapshot(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                "checkouts": self.checkouts,
+                "saturated_checkouts": self.saturated_checkouts,
+                "timeouts": self.timeouts,
+                "wait_seconds_total": round(self.wait_seconds_total, 6),
+                "wait_seconds_max": round(self.wait_seconds_max, 6),
+                "wait_buckets": dict(zip([*map(str, WAIT_BUCKETS), "+Inf"], self.wait_buckets)),
+            }
+
+
+_metrics: dict[str, PoolMetrics] = {}
+
+
+def get_pool_metrics(name: str) -> PoolMetrics:
+    if name not in _metrics:
+        _metrics.setdefault(name, PoolMetrics(name))
+    return _metrics[name]
+
+
+class _InstrumentedPoolMixin:
+    """Times QueuePool._do_get; metrics are keyed by logging name so recreate() keeps them."""
+
+    def _do_get(self):
+        metrics = get_pool_metrics(self._orig_logging_name or "default")
+        saturated = self._max_overflow > -1 and self.checkedout() >= self.size() + self._max_overflow
+        start = time.perf_counter()
+        try:
+            record = super()._do_get()
+        except exc.TimeoutError:
+            metrics.observe(time.perf_counter() - start, saturated=True, timed_out=True)
+            raise
+        metrics.observe(time.perf_counter() - start, saturated=saturated, timed_out=False)
+        return record
+
+
+class InstrumentedQueuePool(_InstrumentedPoolMixin, QueuePool):
+    pass
+
+
+class InstrumentedAsyncAdaptedQueuePool(_InstrumentedPoolMixin, AsyncAdaptedQueuePool):
+    pass
+
+
+def _queue_pool_kwargs(settings: PoolSettings, name: str) -> dict[str, Any]:
+    return {
+        "pool_size": settings.pool_size,
+        "max_overflow": settings.max_overflow,
+        "pool_timeout": settings.pool_timeout,
+        "pool_recycle": settings.pool_recycle,
+        "pool_pre_ping": settings.pre_ping,
+        "pool_logging_name": name,
+    }
+
+
+def sync_engine_kwargs(settings: PoolSettings) -> dict[str, Any]:
+    """create_engine() arguments for psycopg2."""
+    kwargs = _queue_pool_kwargs(settings, "sync")
+    kwargs["poolclass"] = InstrumentedQueuePool
+    connect_args: dict[str, Any] = {"application_name": settings.application_name}
+    server_settings = settings.server_settings()
+    if server_settings and not settings.pgbouncer:
+        connect_args["options"] = " ".join(f"-c {key}={value}" for key, value in server_settings.items())
+    kwargs["connect_args"] = connect_args
+    return kwargs
+
+
+def async_engine_kwargs(settings: PoolSettings) -> dict[str, Any]:
+    """create_async_engine() arguments for asyncpg."""
+    server_settings = {"application_name": settings.application_name}
+    if settings.pgbouncer:
+        # Transaction pooling hands each transaction to a different server connection:
+        # named prepared statements would collide or vanish, so disable caching and use
+        # unique names. PgBouncer already pools, so the app keeps no idle connections.
+        return {
+            "poolclass": NullPool,
+            "pool_pre_ping": settings.pre_ping,
+            "connect_args": {
+                "server_settings": server_settings,
+                "statement_cache_size": 0,
+                "prepared_statement_cache_size": 0,
+                "prepared_statement_name_func": lambda: f"__asyncpg_{uuid4()}__",
+            },
+        }
+    server_settings.update(settings.server_settings())
+    kwargs = _queue_pool_kwargs(settings, "async")
+    kwargs["poolclass"] = InstrumentedAsyncAdaptedQueuePool
+    kwargs["connect_args"] = {"server_settings": server_settings}
+    return kwargs
+
+
+def pool_status(pool: Any) -> dict[str, Any]:
+    """Current occupancy plus cumulative checkout metrics for an engine's pool."""
+    if not isinstance(pool, QueuePool):
+        return {"class": type(pool).__name__}
+    name = pool._orig_logging_name or "default"
+    capacity = pool.size() + max(pool._max_overflow, 0)
+    checked_out = pool.checkedout()
+    return {
+        "class": type(pool).__name__,
+        "size": pool.size(),
+        "max_overflow": pool._max_overflow,
+        "checked_in": pool.checkedin(),
+        "checked_out": checked_out,
+        "overflow": pool.overflow(),
+        "saturation": round(checked_out / capacity, 3) if capacity else None,
+        **get_pool_metrics(name).snapshot(),
+    }
+
+
+def log_pool_settings(settings: PoolSettings) -> None:
+    logger.info(
+        "DB pool: size=%s overflow=%s timeout=%ss recycle=%ss pre_ping=%s statement_timeout=%sms "
+        "idle_in_tx_timeout=%sms pgbouncer=%s",
+        settings.pool_size,
+        settings.max_overflow,
+        settings.pool_timeout,
+        settings.pool_recycle,
+        settings.pre_ping,
+        settings.statement_timeout_ms,
+        settings.idle_in_transaction_timeout_ms,
+        settings.pgbouncer,
+    )
+    if settings.pgbouncer and settings.server_settings():
+        logger.warning(
+            "DB_PGBOUNCER is on: statement/idle timeouts are not sent as startup parameters; "
+            "set them on the role instead (ALTER ROLE ... SET statement_timeout = ...)."
+        )
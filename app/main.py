@@ -1,4 +1,4 @@
-from fastapi import FastAPI, Response
+from fastapi import FastAPI, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from sqlalchemy import text
@@ -14,22 +14,22 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 # Import modules first (these should not fail)
-from app.database import (
-    engine,
-    Base,
-    ensure_access_token_columns,
-    ensure_user_password_column,
-    ensure_access_log_columns,
-    ensure_access_log_extended_columns,
-    ensure_access_log_presence_session_column,
-    ensure_user_presence_columns,
-    ensure_membership_columns,
-    ensure_user_profile_columns,
-)
-from app.routes import payments, qr, verify, admin, auth, user_qr, credits, branding, owner, calcom
-from app.database import ensure_user_owner_column, ensure_calcom_columns, ensure_branding_feature_columns
+from app.database import async_engine, engine
+from app.migrations import run_migrations
+from app.routes import payments, qr, verify, admin, auth, user_qr, credits, branding, owner, calcom, occupancy, analytics
 from app.services.owner import ensure_owner_account, ensure_branding_defaults
 from app.services.membership import ensure_default_membership_packages
+from app.services.access_log_writer import start_access_log_writer, stop_access_log_writer
+from app.services.access_log_partitions import start_partition_maintenance, stop_partition_maintenance
+from app.services.api_keys import start_api_key_usage_flush, stop_api_key_usage_flush
+from app.services.occupancy import occupancy as occupancy_tracker, start_occupancy_sync, stop_occupancy_sync
+from app.services.presence_sweeper import get_presence_sweeper, start_presence_sweeper, stop_presence_sweeper
+from app.services.visit_rollups import get_visit_rollup_worker, start_visit_rollups, stop_visit_rollups
+from app.services.occupancy_forecast import forecast_profiles, start_forecast_updates, stop_forecast_updates
+from app.services.passwords import password_hasher, shutdown_password_hasher
+from app.services.rate_limit import close_verify_rate_limiter
+from app.request_log import RequestLogMiddleware, start_request_log, stop_request_log
+from app.metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, MetricsMiddleware, instrument_engine, metrics_authorized, render_metrics
 
 logger.info("Starting application initialization...")
 
@@ -59,60 +59,23 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Add logging middleware to debug requests
-@app.middleware("http")
-async def log_requests(request, call_next):
-    def _sanitize_headers(headers: dict[str, str]) -> dict[str, str]:
-        redacted = {}
-        for key, value in headers.items():
-            if key.lower() in {"authorization", "x-api-key"}:
-                redacted[key] = "[redacted]"
-            else:
-                redacted[key] = value
-        return redacted
-
-    print(f"[MIDDLEWARE] Request: {request.method} {request.url.path}")
-    print(f"[MIDDLEWARE] Headers: {_sanitize_headers(dict(request.headers))}")
-
-    response = await call_next(request)
-    print(f"[MIDDLEWARE] Response status: {response.status_code}")
-    return response
+# Per-route latency and SQL statement counts for /metrics
+app.add_middleware(MetricsMiddleware)
+instrument_engine(engine)
+instrument_engine(async_engine.sync_engine)
+
+# Structured JSON request log (sampled, written by a background thread)
+app.add_middleware(RequestLogMiddleware)
 
 # Initialize database on startup (not during import)
 @app.on_event("startup")
 async def initialize_database():
     """Initialize database tables - called on application startup"""
     try:
-        # Test database connection first
-        logger.info("Testing database connection...")
-        with engine.connect() as conn:
-            conn.execute(text("SELECT 1"))
-        logger.info("Database connection successful")
-        
-        # Create database tables
-        logger.info("Creating database tables...")
-        Base.metadata.create_all(bind=engine)
-        logger.info("Database tables created successfully")
-        
-        # Run migrations
-        ensure_access_token_columns()
-        ensure_user_password_column()
-        from app.database import ensure_user_credits_column, ensure_access_token_nullable_columns, ensure_user_admin_column, ensure_last_scan_at_column, ensure_payment_comgate_columns
-        ensure_user_credits_column()
-        ensure_access_token_nullable_columns()
-        ensure_user_admin_column()
-        ensure_user_owner_column()
-        ensure_last_scan_at_column()
-        ensure_payment_comgate_columns()
-        ensure_access_log_extended_columns()
-        ensure_access_log_presence_session_column()
-        ensure_user_presence_columns()
-        ensure_access_log_columns()
-        ensure_membership_columns()
-        ensure_user_profile_columns()
-        ensure_calcom_columns()
-        ensure_branding_feature_columns()
-        logger.info("Database migrations completed")
+        # Apply pending schema migrations; doubles as the connection check
+        # (a single query when the schema is up to date)
+        schema_version = run_migrations(engine)
+        logger.info(f"Database schema at version {schema_version}")
         ensure_owner_account()
         ensure_branding_defaults()
         ensure_default_membership_packages()
@@ -130,6 +93,37 @@ async def initialize_database():
         logger.warning("=" * 60)
         # Don't raise - let app start (but DB operations will fail)
 
+    start_request_log()
+    # Started regardless of DB state: undeliverable batches are spooled to disk.
+    start_access_log_writer(engine)
+    # Creates upcoming access_logs partitions and archives expired months (own thread).
+    start_partition_maintenance(engine)
+    # Batched api_keys.last_used_at updates (verification itself never writes).
+    start_api_key_usage_flush(engine)
+    # Live occupancy: rebuilt from open presence sessions now, then resynced periodically.
+    start_occupancy_sync(engine)
+    # Closes sessions past the max visit length / closing time (after the occupancy rebuild).
+    start_presence_sweeper(engine)
+    # Hourly/daily visit statistics, fed from closed presence sessions.
+    start_visit_rollups(engine)
+    # Per-weekday 15-minute occupancy profiles: built from recent weeks now, then one day at a time.
+    start_forecast_updates(engine)
+
+
+@app.on_event("shutdown")
+async def shutdown_access_log_writer():
+    """Flush queued access logs before the process exits."""
+    stop_access_log_writer()
+    stop_partition_maintenance()
+    stop_api_key_usage_flush()
+    stop_occupancy_sync()
+    stop_presence_sweeper()
+    stop_visit_rollups()
+    stop_forecast_updates()
+    shutdown_password_hasher()
+    await close_verify_rate_limiter()
+    stop_request_log()
+
 # Include routers
 app.include_router(auth.router, prefix="/api", tags=["auth"])
 app.include_router(user_qr.router, prefix="/api", tags=["user_qr"])
@@ -141,6 +135,8 @@ app.include_router(admin.router, prefix="/api/admin", tags=["admin"])
 app.include_router(owner.router, prefix="/api", tags=["owner"])
 app.include_router(branding.router, prefix="/api", tags=["branding"])
 app.include_router(calcom.router, prefix="/api", tags=["calcom"])
+app.include_router(occupancy.router, prefix="/api", tags=["occupancy"])
+app.include_router(analytics.router, prefix="/api/admin", tags=["analytics"])
 
 static_dir = Path(os.getenv("STATIC_DIR", "static"))
 static_dir.mkdir(parents=True, exist_ok=True)
@@ -173,13 +169,34 @@ async def health_check():
         db_status = "connected"
     except Exception as e:
         db_status = f"error: {str(e)}"
-    
+
+    from app.database import async_engine, engine
+    from app.db_pool import pool_status
+
+    sweeper = get_presence_sweeper()
+    rollups = get_visit_rollup_worker()
     return {
         "status": "healthy",
         "database": db_status,
-        "app": "running"
+        "app": "running",
+        "pools": {
+            "sync": pool_status(engine.pool),
+            "async": pool_status(async_engine.sync_engine.pool),
+        },
+        "password_hashing": password_hasher.stats(),
+        "occupancy": occupancy_tracker.stats(),
+        "presence_sweeper": sweeper.stats() if sweeper else None,
+        "visit_rollups": rollups.stats() if rollups else None,
+        "occupancy_forecast": forecast_profiles.stats(),
     }
 
+@app.get("/metrics", include_in_schema=False)
+async def metrics(request: Request):
+    """Prometheus text exposition (METRICS_TOKEN, when set, is required as a Bearer token)."""
+    if not metrics_authorized(request.headers.get("authorization")):
+        raise HTTPException(status_code=401, detail="Invalid metrics token")
+    return Response(content=render_metrics(), media_type=METRICS_CONTENT_TYPE)
+
 @app.get("/api/routes")
 async def list_routes():
     """List all available API routes for debugging"""
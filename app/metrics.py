@@ -0,0 +1,421 @@
+"""
+Prometheus text-format metrics served at /metrics.
+
+Hot-path metrics (request latency per route template, DB queries per request,
+verify outcomes) are Counter/Histogram objects whose values live in per-thread
+shards: a thread only ever writes its own dict, so recording takes no lock and
+cannot lose increments. A scrape copies and sums the shards; shards of threads
+that have exited are folded into a retired total.
+
+Gauges and counters kept by other subsystems (DB pools, access-log and
+request-log queues, caches, password hashing) are read from their stats() at
+scrape time, so they cost nothing between scrapes.
+
+Set METRICS_TOKEN to require "Authorization: Bearer <token>" on /metrics.
+"""
+from __future__ import annotations
+
+import hmac
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Any, Callable, Iterable, Optional, Union
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app.db_pool import WAIT_BUCKETS, pool_status
+from app.request_log import get_request_log_emitter, route_template
+from app.services.access_log_writer import get_access_log_writer
+from app.services.api_keys import api_key_cache
+from app.services.entitlement_cache import entitlement_cache
+from app.services.occupancy import occupancy
+from app.services.passwords import password_hasher
+from app.services.presence_sweeper import get_presence_sweeper
+from app.services.principals import principal_cache
+from app.services.qr_render import qr_cache
+
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 50)
+
+Labels = tuple[str, ...]
+Number = Union[int, float]
+
+
+class _ThreadShards:
+    """One values dict per thread; only the owning thread writes to it."""
+
+    def __init__(self):
+        self._local = threading.local()
+        self._shards: list[tuple[threading.Thread, dict]] = []
+        self._retired: dict = {}
+        self._collect_lock = threading.Lock()  # scrapes only, never taken by writers
+
+    def local(self) -> dict:
+        try:
+            return self._local.values
+        except AttributeError:
+            values = self._local.values = {}
+            self._shards.append((threading.current_thread(), values))
+            return values
+
+    def collect(self) -> dict:
+        with self._collect_lock:
+            totals = _copy_values(self._retired)
+            for shard in list(self._shards):
+                thread, values = shard
+                _merge(totals, values)
+                if not thread.is_alive():
+                    # Nobody writes this shard any more: fold it in once and forget it.
+                    _merge(self._retired, values)
+                    self._shards.remove(shard)
+            return totals
+
+
+def _copy_values(values: dict) -> dict:
+    return {key: list(value) if isinstance(value, list) else value for key, value in values.items()}
+
+
+def _merge(into: dict, values: dict) -> None:
+    for key, value in values.copy().items():
+        if isinstance(value, list):
+            current = into.get(key)
+            if current is None:
+                into[key] = list(value)
+            else:
+                for index, item in enumerate(value):
+                    current[index] += item
+        else:
+            into[key] = into.get(key, 0) + value
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._shards = _ThreadShards()
+
+    def inc(self, labels: Labels = (), amount: Number = 1) -> None:
+        values = self._shards.local()
+        values[labels] = values.get(labels, 0) + amount
+
+    def collect(self) -> dict[Labels, Number]:
+        return self._shards.collect()
+
+    def render(self) -> list[str]:
+        return [
+            _sample(self.name, dict(zip(self.labelnames, labels)), value)
+            for labels, value in sorted(self.collect().items())
+        ]
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (), *, buckets: Iterable[float]):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._shards = _ThreadShards()
+
+    def observe(self, labels: Labels, value: Number) -> None:
+        values = self._shards.local()
+        row = values.get(labels)
+        if row is None:
+            # per-bucket counts (last one is +Inf), then the sum
+            row = values[labels] = [0] * (len(self.buckets) + 2)
+        row[bisect_left(self.buckets, value)] += 1
+        row[-1] += value
+
+    def collect(self) -> dict[Labels, list]:
+        return self._shards.collect()
+
+    def render(self) -> list[str]:
+        lines = []
+        for labels, row in sorted(self.collect().items()):
+            lines.extend(_histogram_samples(self.name, dict(zip(self.labelnames, labels)), self.buckets, row[:-1], row[-1]))
+        return lines
+
+
+def _format_value(value: Number) -> str:
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _sample(name: str, labels: dict[str, Any], value: Number) -> str:
+    if labels:
+        rendered = ",".join(f'{key}="{_escape(label)}"' for key, label in labels.items())
+        return f"{name}{{{rendered}}} {_format_value(value)}"
+    return f"{name} {_format_value(value)}"
+
+
+def _histogram_samples(
+    name: str, labels: dict[str, Any], buckets: Iterable[float], counts: list[int], total: Number
+) -> list[str]:
+    lines = []
+    cumulative = 0
+    for bound, count in zip([*buckets, "+Inf"], counts):
+        cumulative += count
+        le = bound if isinstance(bound, str) else _format_value(float(bound))
+        lines.append(_sample(f"{name}_bucket", {**labels, "le": le}, cumulative))
+    lines.append(_sample(f"{name}_sum", labels, round(total, 6) if isinstance(total, float) else total))
+    lines.append(_sample(f"{name}_count", labels, cumulative))
+    return lines
+
+
+def _family(name: str, kind: str, documentation: str, samples: list[str]) -> list[str]:
+    if not samples:
+        return []
+    return [f"# HELP {name} {documentation}", f"# TYPE {name} {kind}", *samples]
+
+
+def _single(name: str, kind: str, documentation: str, value: Number) -> list[str]:
+    return _family(name, kind, documentation, [_sample(name, {}, value)])
+
+
+Metric = Union[Counter, Histogram]
+Collector = Callable[[], list[str]]
+
+_metrics: list[Metric] = []
+_collectors: list[Collector] = []
+
+
+def counter(name: str, documentation: str, labelnames: Iterable[str] = ()) -> Counter:
+    metric = Counter(name, documentation, labelnames)
+    _metrics.append(metric)
+    return metric
+
+
+def histogram(name: str, documentation: str, labelnames: Iterable[str] = (), *, buckets: Iterable[float]) -> Histogram:
+    metric = Histogram(name, documentation, labelnames, buckets=buckets)
+    _metrics.append(metric)
+    return metric
+
+
+def collector(fn: Collector) -> Collector:
+    """Register a function returning exposition lines, called on every scrape."""
+    _collectors.append(fn)
+    return fn
+
+
+def render_metrics() -> str:
+    lines: list[str] = []
+    for metric in _metrics:
+        lines.extend(_family(metric.name, metric.kind, metric.documentation, metric.render()))
+    for fn in _collectors:
+        lines.extend(fn())
+    return "\n".join(lines) + "\n"
+
+
+def metrics_authorized(authorization: Optional[str]) -> bool:
+    if not METRICS_TOKEN:
+        return True
+    return hmac.compare_digest(authorization or "", f"Bearer {METRICS_TOKEN}")
+
+
+# --- hot-path metrics ---------------------------------------------------------
+
+request_duration = histogram(
+    "gymscanner_http_request_duration_seconds",
+    "HTTP request latency by route template.",
+    ("method", "route", "status"),
+    buckets=LATENCY_BUCKETS,
+)
+request_queries = histogram(
+    "gymscanner_http_request_db_queries",
+    "SQL statements executed per HTTP request.",
+    ("method", "route"),
+    buckets=QUERY_BUCKETS,
+)
+verify_outcomes = counter(
+    "gymscanner_verify_outcomes_total",
+    "Scanner verify results by outcome and reason.",
+    ("outcome", "reason"),
+)
+
+_request_query_count: ContextVar[Optional[list[int]]] = ContextVar("request_query_count", default=None)
+
+
+def _count_query(*_args) -> None:
+    # Runs in whichever thread executes the statement; the context (and the list) is the request's.
+    count = _request_query_count.get()
+    if count is not None:
+        count[0] += 1
+
+
+def instrument_engine(engine: Engine) -> None:
+    """Count statements per request on this (sync) engine; pass async_engine.sync_engine for asyncpg."""
+    if not event.contains(engine, "before_cursor_execute", _count_query):
+        event.listen(engine, "before_cursor_execute", _count_query)
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording latency and query count per route template."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+        count = [0]
+        token = _request_query_count.set(count)
+        started = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            _request_query_count.reset(token)
+            route = route_template(scope)
+            request_duration.observe((scope["method"], route, str(status)), elapsed)
+            request_queries.observe((scope["method"], route), count[0])
+
+
+# --- scrape-time collectors ---------------------------------------------------
+
+@collector
+def _collect_pools() -> list[str]:
+    from app.database import async_engine, engine
+
+    pools = {"sync": pool_status(engine.pool), "async": pool_status(async_engine.sync_engine.pool)}
+    gauges = {
+        "size": "Configured pool size.",
+        "checked_out": "Connections currently checked out.",
+        "overflow": "Current overflow connections.",
+    }
+    counters = {
+        "checkouts": "Connection checkouts.",
+        "saturated_checkouts": "Checkouts that found the pool exhausted.",
+        "timeouts": "Checkouts that timed out.",
+    }
+    lines = []
+    for field, documentation in gauges.items():
+        # QueuePool.overflow() counts up from -pool_size; report only real overflow connections
+        samples = [
+            _sample(f"gymscanner_db_pool_{field}", {"pool": name}, max(s[field], 0) if field == "overflow" else s[field])
+            for name, s in pools.items()
+            if field in s
+        ]
+        lines += _family(f"gymscanner_db_pool_{field}", "gauge", documentation, samples)
+    for field, documentation in counters.items():
+        name = f"gymscanner_db_pool_{field}_total"
+        samples = [_sample(name, {"pool": pool}, s[field]) for pool, s in pools.items() if field in s]
+        lines += _family(name, "counter", documentation, samples)
+    wait_samples = []
+    for pool, s in pools.items():
+        if "wait_buckets" in s:
+            counts = list(s["wait_buckets"].values())
+            wait_samples += _histogram_samples(
+                "gymscanner_db_pool_checkout_wait_seconds", {"pool": pool}, WAIT_BUCKETS, counts, s["wait_seconds_total"]
+            )
+    lines += _family("gymscanner_db_pool_checkout_wait_seconds", "histogram", "Time spent waiting for a connection.", wait_samples)
+    return lines
+
+
+@collector
+def _collect_queues() -> list[str]:
+    lines = []
+    writer = get_access_log_writer()
+    if writer is not None:
+        stats = writer.stats()
+        lines += _single("gymscanner_access_log_queue_depth", "gauge", "Access log rows waiting for the batch writer.", stats["queue_depth"])
+        lines += _single("gymscanner_access_log_queue_capacity", "gauge", "Access log queue size limit.", stats["queue_capacity"])
+        lines += _single("gymscanner_access_log_written_total", "counter", "Access log rows inserted.", stats["written"])
+        lines += _single("gymscanner_access_log_spilled_total", "counter", "Access log rows spilled to the spool file.", stats["spilled"])
+        lines += _single("gymscanner_access_log_failed_flushes_total", "counter", "Access log batches that failed to insert.", stats["failed_flushes"])
+    emitter = get_request_log_emitter()
+    if emitter is not None:
+        stats = emitter.stats()
+        lines += _single("gymscanner_request_log_queue_depth", "gauge", "Request log records waiting to be written.", stats["queue_depth"])
+        lines += _single("gymscanner_request_log_dropped_total", "counter", "Request log records dropped on a full queue.", stats["dropped"])
+    return lines
+
+
+def _cache_stats() -> dict[str, tuple[int, int, int]]:
+    """cache -> (entries, hits, misses)"""
+    entitlements = entitlement_cache.stats()
+    principals = principal_cache.stats()
+    api_keys = api_key_cache.stats()
+    qr = qr_cache.stats()
+    return {
+        "entitlement": (entitlements["size"], entitlements["hits"], entitlements["misses"]),
+        "principal": (principals["size"], principals["hits"], principals["misses"]),
+        "api_key": (api_keys["size"], api_keys["hits"], api_keys["misses"]),
+        "qr_render": (qr["size"], qr["hits"] + qr["disk_hits"], qr["renders"]),
+    }
+
+
+@collector
+def _collect_caches() -> list[str]:
+    caches = _cache_stats()
+    ratios = [
+        _sample("gymscanner_cache_hit_ratio", {"cache": name}, round(hits / (hits + misses), 4))
+        for name, (_, hits, misses) in caches.items()
+        if hits + misses
+    ]
+    return [
+        *_family("gymscanner_cache_entries", "gauge", "Entries held in the in-process cache.",
+                 [_sample("gymscanner_cache_entries", {"cache": name}, entries) for name, (entries, _, _) in caches.items()]),
+        *_family("gymscanner_cache_hits_total", "counter", "Cache lookups answered from the cache.",
+                 [_sample("gymscanner_cache_hits_total", {"cache": name}, hits) for name, (_, hits, _) in caches.items()]),
+        *_family("gymscanner_cache_misses_total", "counter", "Cache lookups that went to the database (or renderer).",
+                 [_sample("gymscanner_cache_misses_total", {"cache": name}, misses) for name, (_, _, misses) in caches.items()]),
+        *_family("gymscanner_cache_hit_ratio", "gauge", "Hits / lookups since process start.", ratios),
+    ]
+
+
+@collector
+def _collect_password_hashing() -> list[str]:
+    stats = password_hasher.stats()
+    lines = []
+    for field, kind, documentation in (
+        ("running", "gauge", "Password hash calls running on the pool."),
+        ("queued", "gauge", "Password hash calls waiting for a pool thread."),
+        ("completed", "counter", "Password hash calls finished."),
+        ("rejected", "counter", "Password hash calls rejected because the pool was full."),
+        ("rehashed", "counter", "Stored hashes upgraded on login."),
+    ):
+        name = f"gymscanner_password_hash_{field}" + ("_total" if kind == "counter" else "")
+        lines += _single(name, kind, documentation, stats[field])
+    return lines
+
+
+@collector
+def _collect_occupancy() -> list[str]:
+    stats = occupancy.stats()
+    return [
+        *_single("gymscanner_occupancy", "gauge", "People in the gym (open presence sessions).", stats["count"]),
+        *_single("gymscanner_occupancy_subscribers", "gauge", "Open live occupancy streams.", stats["subscribers"]),
+        *_single("gymscanner_occupancy_corrections_total", "counter", "Resyncs that found the in-memory state out of date.", stats["corrections"]),
+    ]
+
+
+@collector
+def _collect_presence_sweeper() -> list[str]:
+    sweeper = get_presence_sweeper()
+    closed = sweeper.total_closed if sweeper else 0
+    return _single("gymscanner_presence_sessions_timed_out_total", "counter", "Presence sessions closed by the stale-session sweeper.", closed)
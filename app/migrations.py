@@ -0,0 +1,450 @@
+"""
+Versioned schema migrations tracked in the schema_version table.
+
+Startup calls run_migrations(engine). When the database is already at
+LATEST_VERSION this is a single `SELECT max(version)`; otherwise pending
+migrations run in order under a PostgreSQL advisory lock, so several app
+instances booting at once apply each migration exactly once.
+
+New schema changes are appended to MIGRATIONS with the next version number.
+Never edit or renumber a migration that has shipped. Data backfills use
+backfill_in_batches and commit per batch; they must be idempotent, because a
+crash between batches reruns the whole migration. Migrations that rewrite a
+large table are marked manual: startup skips them (with a warning) and only
+the CLI below applies them, in a maintenance window.
+
+    python -m app.migrations          # apply pending migrations, manual ones included
+    python -m app.migrations status   # show applied / pending versions
+"""
+from __future__ import annotations
+
+import logging
+import os
+import sys
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Callable, Optional
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.exc import OperationalError, ProgrammingError
+
+logger = logging.getLogger(__name__)
+
+MIGRATION_BATCH_SIZE = int(os.getenv("MIGRATION_BATCH_SIZE", "5000"))
+# Arbitrary constant shared by all app instances (pg_advisory_lock key).
+MIGRATION_LOCK_KEY = 72_615_001
+
+
+@dataclass(frozen=True)
+class Migration:
+    version: int
+    name: str
+    apply: Callable[[Connection], None]
+    # Non-transactional migrations manage their own commits (batched backfills,
+    # CREATE INDEX CONCURRENTLY) and must be safe to re-run after a crash.
+    transactional: bool = True
+    # Manual migrations are never run by app startup, only by `python -m app.migrations`.
+    manual: bool = False
+
+
+def backfill_in_batches(
+    conn: Connection,
+    table: str,
+    set_clause: str,
+    where: str,
+    *,
+    batch_size: Optional[int] = None,
+    key: str = "id",
+) -> int:
+    """
+    UPDATE rows matching `where` in batches of `batch_size`, committing after each
+    batch so locks stay short and progress survives an interruption.
+    """
+    batch_size = batch_size or MIGRATION_BATCH_SIZE
+    statement = text(
+        f"UPDATE {table} SET {set_clause} "
+        f"WHERE {key} IN (SELECT {key} FROM {table} WHERE {where} LIMIT :limit)"
+    )
+    total = 0
+    while True:
+        updated = conn.execute(statement, {"limit": batch_size}).rowcount
+        conn.commit()
+        total += updated
+        if updated < batch_size:
+            break
+        logger.info("Backfill %s (%s): %s rows so far", table, set_clause, total)
+    if total:
+        logger.info("Backfill %s (%s): %s rows", table, set_clause, total)
+    return total
+
+
+def create_index_concurrently(conn: Connection, name: str, table: str, definition: str) -> None:
+    """
+    CREATE INDEX CONCURRENTLY IF NOT EXISTS without blocking writes. A build that
+    failed earlier leaves an INVALID index behind; it is dropped and rebuilt.
+    `definition` is everything after the table name: "(cols) [WHERE ...]".
+    """
+    if conn.dialect.name != "postgresql":
+        conn.execute(text(f"CREATE INDEX IF NOT EXISTS {name} ON {table} {definition}"))
+        conn.commit()
+        return
+
+    conn.commit()
+    # CONCURRENTLY refuses to run inside a transaction block.
+    conn.execution_options(isolation_level="AUTOCOMMIT")
+    try:
+        valid = conn.execute(
+            text(
+                "SELECT i.indisvalid FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+                "WHERE c.relname = :name"
+            ),
+            {"name": name},
+        ).scalar()
+        if valid is False:
+            logger.warning("Index %s is INVALID (interrupted build); rebuilding", name)
+            conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+        started = time.perf_counter()
+        conn.execute(text(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {table} {definition}"))
+        if valid is not True:
+            logger.info("Index %s built in %.0fms", name, (time.perf_counter() - started) * 1000)
+    finally:
+        conn.rollback()  # ends SQLAlchemy's autobegun (no-op) transaction
+        conn.execution_options(isolation_level=conn.default_isolation_level)
+
+
+# --- migrations -------------------------------------------------------------
+
+
+def _baseline_schema(conn: Connection) -> None:
+    """Tables from the models plus the columns older databases were missing."""
+    import app.models  # noqa: F401  (registers the tables on Base.metadata)
+    from app import database
+    from app.database import Base
+
+    Base.metadata.create_all(bind=conn)
+    conn.commit()
+
+    database.ensure_access_token_columns()
+    database.ensure_user_password_column()
+    database.ensure_user_credits_column()
+    database.ensure_access_token_nullable_columns()
+    database.ensure_user_admin_column()
+    database.ensure_user_owner_column()
+    database.ensure_last_scan_at_column()
+    database.ensure_payment_comgate_columns()
+    database.ensure_access_log_extended_columns()
+    database.ensure_access_log_presence_session_column()
+    database.ensure_user_presence_columns()
+    database.ensure_access_log_columns()
+    database.ensure_membership_columns()
+    database.ensure_user_profile_columns()
+    database.ensure_calcom_columns()
+    database.ensure_branding_feature_columns()
+
+
+def _backfill_legacy_nulls(conn: Connection) -> None:
+    """NULLs left in columns added by the legacy ensure_* helpers (previously re-run on every boot)."""
+    backfill_in_batches(conn, "access_tokens", "is_active = TRUE", "is_active IS NULL")
+    backfill_in_batches(conn, "access_tokens", "scan_count = 0", "scan_count IS NULL")
+    backfill_in_batches(conn, "access_logs", "direction = 'in'", "direction IS NULL")
+    backfill_in_batches(conn, "users", "credits = 0", "credits IS NULL")
+    backfill_in_batches(conn, "users", "is_admin = FALSE", "is_admin IS NULL")
+    backfill_in_batches(conn, "users", "is_owner = FALSE", "is_owner IS NULL")
+    backfill_in_batches(conn, "branding_settings", "reservations_enabled = FALSE", "reservations_enabled IS NULL")
+
+
+def _hot_path_indexes(conn: Connection) -> None:
+    """Indexes for scan verification, presence and log listing (mirrored in app/models.py)."""
+    # cooldown: max(last_scan_at) over the user's active tokens
+    create_index_concurrently(
+        conn, "ix_access_tokens_user_last_scan_active", "access_tokens", "(user_id, last_scan_at) WHERE is_active IS TRUE"
+    )
+    # active membership / next membership start for a user at a timestamp
+    create_index_concurrently(
+        conn, "ix_memberships_user_status_validity", "memberships", "(user_id, status, valid_from, valid_to)"
+    )
+    # open presence session of a user; open sessions are a tiny fraction of the table
+    create_index_concurrently(
+        conn, "ix_presence_sessions_open_user", "presence_sessions", "(user_id, started_at) WHERE ended_at IS NULL"
+    )
+    # newest-first log listings
+    create_index_concurrently(conn, "ix_access_logs_created_at", "access_logs", "(created_at)")
+    # latest log of a user (rebuild_presence_from_logs ordering)
+    create_index_concurrently(
+        conn,
+        "ix_access_logs_user_scanned_at",
+        "access_logs",
+        "(user_id, scanned_at DESC NULLS LAST, created_at DESC)",
+    )
+    create_index_concurrently(
+        conn,
+        "ix_calcom_webhook_events_type_status_received",
+        "calcom_webhook_events",
+        "(event_type, status, received_at)",
+    )
+
+
+def _partition_access_logs(conn: Connection) -> None:
+    """
+    Rebuild access_logs as a monthly range-partitioned table (PostgreSQL only, manual).
+
+    Rows are copied in id batches while the old table stays writable; the foreign
+    keys exist on the new table from the start, so each batch is checked as it is
+    copied. A row whose transaction committed after its id batch was copied is
+    invisible to that batch, so the batches are followed by NOT EXISTS catch-up
+    passes: one over the whole table without a lock, then a final one bounded to
+    the newest ids plus the rename under an exclusive lock. The primary key becomes
+    (id, created_at) because partitioned tables need the partition key in unique
+    constraints, so door_logs.access_log_id loses its foreign key for good.
+    """
+    from app.services import access_log_partitions as partitions
+
+    if conn.dialect.name != "postgresql" or partitions.is_partitioned(conn):
+        return
+    conn.execute(text("DROP TABLE IF EXISTS access_logs_partitioned CASCADE"))
+    conn.commit()
+    backfill_in_batches(
+        conn, "access_logs", "created_at = COALESCE(processed_at, scanned_at, now())", "created_at IS NULL"
+    )
+
+    conn.execute(
+        text(
+            "CREATE TABLE access_logs_partitioned "
+            "(LIKE access_logs INCLUDING DEFAULTS INCLUDING CONSTRAINTS) PARTITION BY RANGE (created_at)"
+        )
+    )
+    conn.execute(text("ALTER TABLE access_logs_partitioned ALTER COLUMN created_at SET NOT NULL"))
+    conn.execute(
+        text("ALTER TABLE access_logs_partitioned ADD CONSTRAINT access_logs_partitioned_pkey PRIMARY KEY (id, created_at)")
+    )
+    conn.execute(text("CREATE TABLE access_logs_partitioned_default PARTITION OF access_logs_partitioned DEFAULT"))
+    first = conn.execute(text("SELECT min(created_at) FROM access_logs")).scalar()
+    now = datetime.now(timezone.utc)
+    month = partitions.month_start(first or now)
+    last = partitions.add_months(partitions.month_start(now), partitions.ACCESS_LOG_PARTITION_MONTHS_AHEAD)
+    while month <= last:
+        start, end = month.isoformat(), partitions.add_months(month, 1).isoformat()
+        conn.execute(
+            text(
+                f"CREATE TABLE {partitions.partition_name(month)} PARTITION OF access_logs_partitioned "
+                f"FOR VALUES FROM ('{start} 00:00:00+00') TO ('{end} 00:00:00+00')"
+            )
+        )
+        month = partitions.add_months(month, 1)
+    conn.execute(text("CREATE INDEX ix_access_logs_partitioned_created_at ON access_logs_partitioned (created_at)"))
+    conn.execute(
+        text(
+            "CREATE INDEX ix_access_logs_partitioned_user_scanned_at ON access_logs_partitioned "
+            "(user_id, scanned_at DESC NULLS LAST, created_at DESC)"
+        )
+    )
+    # Added while the table is empty: no full validation (and no long lock on the parents) after the swap.
+    for column, parent in (("user_id", "users"), ("token_id", "access_tokens"), ("presence_session_id", "presence_sessions")):
+        conn.execute(
+            text(
+                f"ALTER TABLE access_logs_partitioned ADD CONSTRAINT access_logs_{column}_fkey "
+                f"FOREIGN KEY ({column}) REFERENCES {parent}(id)"
+            )
+        )
+    conn.commit()
+
+    copied_up_to = conn.execute(text("SELECT coalesce(max(id), 0) FROM access_logs")).scalar()
+    conn.commit()
+    batch = MIGRATION_BATCH_SIZE
+    for low in range(0, copied_up_to, batch):
+        conn.execute(
+            text("INSERT INTO access_logs_partitioned SELECT * FROM access_logs WHERE id > :low AND id <= :high"),
+            {"low": low, "high": min(low + batch, copied_up_to)},
+        )
+        conn.commit()
+        logger.info("access_logs partitioning: copied ids up to %s of %s", min(low + batch, copied_up_to), copied_up_to)
+
+    # Rows added since, or committed late with an id inside an already copied batch.
+    missing = text(
+        "INSERT INTO access_logs_partitioned SELECT a.* FROM access_logs a WHERE a.id > :after AND NOT EXISTS "
+        "(SELECT 1 FROM access_logs_partitioned p WHERE p.id = a.id AND p.created_at = a.created_at)"
+    )
+    caught_up_to = conn.execute(text("SELECT coalesce(max(id), 0) FROM access_logs")).scalar()
+    conn.commit()
+    caught_up = conn.execute(missing, {"after": 0}).rowcount
+    conn.commit()
+    logger.info("access_logs partitioning: %s rows caught up before locking", caught_up)
+
+    with conn.begin():
+        conn.execute(text("LOCK TABLE access_logs IN ACCESS EXCLUSIVE MODE"))
+        # only writes in flight during the pass above can still be missing; they hold the newest ids
+        conn.execute(missing, {"after": max(caught_up_to - MIGRATION_BATCH_SIZE, 0)})
+        sequence = conn.execute(text("SELECT pg_get_serial_sequence('access_logs', 'id')")).scalar()
+        conn.execute(text("ALTER TABLE door_logs DROP CONSTRAINT IF EXISTS door_logs_access_log_id_fkey"))
+        if sequence:
+            conn.execute(text(f"ALTER SEQUENCE {sequence} OWNED BY NONE"))
+        conn.execute(text("DROP TABLE access_logs"))
+        conn.execute(text("ALTER TABLE access_logs_partitioned RENAME TO access_logs"))
+        conn.execute(text("ALTER TABLE access_logs_partitioned_default RENAME TO access_logs_default"))
+        conn.execute(text("ALTER TABLE access_logs RENAME CONSTRAINT access_logs_partitioned_pkey TO access_logs_pkey"))
+        conn.execute(text("ALTER INDEX ix_access_logs_partitioned_created_at RENAME TO ix_access_logs_created_at"))
+        conn.execute(
+            text("ALTER INDEX ix_access_logs_partitioned_user_scanned_at RENAME TO ix_access_logs_user_scanned_at")
+        )
+        if sequence:
+            conn.execute(text(f"ALTER SEQUENCE {sequence} OWNED BY access_logs.id"))
+
+
+def _rate_limit_buckets(conn: Connection) -> None:
+    """State of the shared rate limiter (app/services/rate_limit.py, RATE_LIMIT_BACKEND=postgres)."""
+    if conn.dialect.name != "postgresql":
+        return
+    # UNLOGGED: no WAL per scan; after a crash the table comes back empty, which only resets budgets.
+    conn.execute(
+        text("CREATE UNLOGGED TABLE IF NOT EXISTS rate_limit_buckets (key text PRIMARY KEY, tat double precision NOT NULL)")
+    )
+
+
+def _visit_rollups(conn: Connection) -> None:
+    """presence_sessions.rolled_up_at and the visit_stats_* rollup tables (app/services/visit_rollups.py)."""
+    from sqlalchemy import inspect
+
+    from app.models import VisitStatsDaily, VisitStatsHourly, VisitStatsUserDaily
+
+    if "rolled_up_at" not in {column["name"] for column in inspect(conn).get_columns("presence_sessions")}:
+        conn.execute(text("ALTER TABLE presence_sessions ADD COLUMN rolled_up_at TIMESTAMP WITH TIME ZONE"))
+    for model in (VisitStatsHourly, VisitStatsDaily, VisitStatsUserDaily):
+        model.__table__.create(conn, checkfirst=True)
+    conn.commit()
+    # closed sessions not counted yet: the whole history right after this migration, then a handful
+    create_index_concurrently(
+        conn,
+        "ix_presence_sessions_pending_rollup",
+        "presence_sessions",
+        "(id) WHERE ended_at IS NOT NULL AND rolled_up_at IS NULL",
+    )
+
+
+MIGRATIONS: list[Migration] = [
+    Migration(1, "baseline_schema", _baseline_schema, transactional=False),
+    Migration(2, "backfill_legacy_nulls", _backfill_legacy_nulls, transactional=False),
+    Migration(3, "hot_path_indexes", _hot_path_indexes, transactional=False),
+    Migration(4, "partition_access_logs", _partition_access_logs, transactional=False, manual=True),
+    Migration(5, "rate_limit_buckets", _rate_limit_buckets),
+    Migration(6, "visit_rollups", _visit_rollups, transactional=False),
+]
+
+LATEST_VERSION = MIGRATIONS[-1].version
+
+
+# --- runner -----------------------------------------------------------------
+
+
+def current_version(conn: Connection) -> Optional[int]:
+    """Highest applied version, or None when schema_version does not exist yet."""
+    try:
+        return conn.execute(text("SELECT max(version) FROM schema_version")).scalar()
+    except (ProgrammingError, OperationalError):
+        conn.rollback()
+        return None
+
+
+def _ensure_version_table(conn: Connection) -> None:
+    conn.execute(
+        text(
+            """
+            CREATE TABLE IF NOT EXISTS schema_version (
+                version INTEGER PRIMARY KEY,
+                name VARCHAR(200) NOT NULL,
+                applied_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                duration_ms INTEGER
+            )
+            """
+        )
+    )
+    conn.commit()
+
+
+def _applied_versions(conn: Connection) -> set[int]:
+    versions = set(conn.execute(text("SELECT version FROM schema_version")).scalars())
+    conn.commit()
+    return versions
+
+
+def _lock(conn: Connection) -> None:
+    if conn.dialect.name == "postgresql":
+        conn.execute(text("SELECT pg_advisory_lock(:key)"), {"key": MIGRATION_LOCK_KEY})
+        # Backfills and index builds may legitimately outlive DB_STATEMENT_TIMEOUT_MS.
+        conn.execute(text("SET statement_timeout = 0"))
+        conn.commit()
+
+
+def _unlock(conn: Connection) -> None:
+    if conn.dialect.name == "postgresql":
+        conn.rollback()
+        conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": MIGRATION_LOCK_KEY})
+        conn.execute(text("RESET statement_timeout"))
+        conn.commit()
+
+
+def run_migrations(
+    engine: Engine, migrations: Optional[list[Migration]] = None, *, include_manual: bool = False
+) -> int:
+    """Apply pending migrations (manual ones only with include_manual); returns the resulting schema version."""
+    migrations = MIGRATIONS if migrations is None else migrations
+    latest = max(m.version for m in migrations if include_manual or not m.manual)
+
+    with engine.connect() as conn:
+        version = current_version(conn)
+    if version == latest and not include_manual:
+        return version
+
+    with engine.connect() as conn:
+        _lock(conn)
+        try:
+            _ensure_version_table(conn)
+            applied = _applied_versions(conn)
+            for migration in migrations:
+                if migration.version in applied:
+                    continue
+                if migration.manual and not include_manual:
+                    logger.warning(
+                        "Migration %s_%s is manual and was skipped; apply it with `python -m app.migrations`",
+                        migration.version,
+                        migration.name,
+                    )
+                    continue
+                logger.info("Applying migration %s_%s", migration.version, migration.name)
+                started = time.perf_counter()
+                if migration.transactional:
+                    with conn.begin():
+                        migration.apply(conn)
+                else:
+                    migration.apply(conn)
+                    conn.commit()
+                duration_ms = int((time.perf_counter() - started) * 1000)
+                conn.execute(
+                    text("INSERT INTO schema_version (version, name, duration_ms) VALUES (:version, :name, :duration)"),
+                    {"version": migration.version, "name": migration.name, "duration": duration_ms},
+                )
+                conn.commit()
+                logger.info("Migration %s_%s applied in %sms", migration.version, migration.name, duration_ms)
+        finally:
+            _unlock(conn)
+        return current_version(conn)
+
+
+def _status(engine: Engine) -> None:
+    with engine.connect() as conn:
+        version = current_version(conn)
+        applied = _applied_versions(conn) if version is not None else set()
+    for migration in MIGRATIONS:
+        state = "applied" if migration.version in applied else "pending (manual)" if migration.manual else "pending"
+        print(f"{migration.version:>4}  {migration.name:<40} {state}")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    from app.database import engine
+
+    if len(sys.argv) > 1 and sys.argv[1] == "status":
+        _status(engine)
+    else:
+        print(f"schema version: {run_migrations(engine, include_manual=True)}")
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, Boolean, ForeignKey, Text, Float, Enum, JSON
+from sqlalchemy import Column, Integer, BigInteger, String, Date, DateTime, Boolean, ForeignKey, Text, Float, Enum, JSON, Index, text
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from app.database import Base
@@ -68,6 +68,17 @@ class AccessToken(Base):
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     used_at = Column(DateTime(timezone=True), nullable=True)
     last_scan_at = Column(DateTime(timezone=True), nullable=True)  # Last successful scan time for cooldown (user-level)
+
+    # Hot-path indexes; existing databases get them from migration 3 (app/migrations.py)
+    __table_args__ = (
+        Index(
+            "ix_access_tokens_user_last_scan_active",
+            user_id,
+            last_scan_at,
+            postgresql_where=text("is_active IS TRUE"),
+            sqlite_where=text("is_active IS TRUE"),
+        ),
+    )
     
     user = relationship("User", back_populates="access_tokens")
     payment = relationship("Payment", back_populates="access_tokens")
@@ -111,7 +122,17 @@ class AccessLog(Base):
     direction_mismatch = Column(Boolean, nullable=True, default=False)
     raw_token_masked = Column(String, nullable=True)
     metadata_json = Column("metadata", JSON, nullable=True)
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    # Partition key: on PostgreSQL the table is range-partitioned by month on created_at
+    # (migration partition_access_logs, app/services/access_log_partitions.py)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+
+    __table_args__ = (
+        Index("ix_access_logs_created_at", created_at),
+        # NULLS LAST in an index is PostgreSQL-only
+        Index("ix_access_logs_user_scanned_at", user_id, scanned_at.desc().nullslast(), created_at.desc()).ddl_if(
+            dialect="postgresql"
+        ),
+    )
     
     user = relationship("User")
     token = relationship("AccessToken", back_populates="access_logs")
@@ -134,6 +155,24 @@ class PresenceSession(Base):
     metadata_json = Column("metadata", JSON, nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+    # set once the closed session is counted in the visit_stats_* rollups (app/services/visit_rollups.py)
+    rolled_up_at = Column(DateTime(timezone=True), nullable=True)
+
+    __table_args__ = (
+        Index(
+            "ix_presence_sessions_open_user",
+            user_id,
+            started_at,
+            postgresql_where=text("ended_at IS NULL"),
+            sqlite_where=text("ended_at IS NULL"),
+        ),
+        Index(
+            "ix_presence_sessions_pending_rollup",
+            id,
+            postgresql_where=text("ended_at IS NOT NULL AND rolled_up_at IS NULL"),
+            sqlite_where=text("ended_at IS NOT NULL AND rolled_up_at IS NULL"),
+        ),
+    )
 
     user = relationship("User", back_populates="presence_sessions")
     token = relationship("AccessToken")
@@ -146,7 +185,8 @@ class DoorLog(Base):
     id = Column(Integer, primary_key=True, index=True)
     device_id = Column(String, nullable=False)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=True)
-    access_log_id = Column(Integer, ForeignKey("access_logs.id"), nullable=True)
+    # No FK: access_logs is partitioned and its primary key is (id, created_at)
+    access_log_id = Column(Integer, nullable=True)
     duration = Column(Integer, nullable=False)
     status = Column(String, nullable=False)  # opened, hw_error, timeout, skipped
     initiated_by = Column(String, nullable=False, default="scan")
@@ -155,7 +195,11 @@ class DoorLog(Base):
     raw_error = Column(Text, nullable=True)
 
     user = relationship("User")
-    access_log = relationship("AccessLog")
+    access_log = relationship(
+        "AccessLog",
+        primaryjoin="foreign(DoorLog.access_log_id) == AccessLog.id",
+        viewonly=True,
+    )
 
 
 class MembershipPackage(Base):
@@ -221,6 +265,10 @@ class Membership(Base):
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     created_by_admin_id = Column(Integer, ForeignKey("users.id"), nullable=True)
 
+    __table_args__ = (
+        Index("ix_memberships_user_status_validity", user_id, status, valid_from, valid_to),
+    )
+
     user = relationship("User", back_populates="memberships", foreign_keys=[user_id])
     package = relationship("MembershipPackage", back_populates="memberships")
     created_by_admin = relationship("User", foreign_keys=[created_by_admin_id])
@@ -273,6 +321,10 @@ class CalcomWebhookEvent(Base):
     received_at = Column(DateTime(timezone=True), server_default=func.now())
     payload = Column(JSON, nullable=True)
 
+    __table_args__ = (
+        Index("ix_calcom_webhook_events_type_status_received", event_type, status, received_at),
+    )
+
 
 class CalcomAdminSettings(Base):
     __tablename__ = "calcom_admin_settings"
@@ -285,3 +337,30 @@ class CalcomAdminSettings(Base):
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
 
     admin = relationship("User")
+
+
+# Visit rollups, maintained incrementally from closed presence sessions (app/services/visit_rollups.py)
+class VisitStatsHourly(Base):
+    __tablename__ = "visit_stats_hourly"
+
+    hour_start = Column(DateTime(timezone=True), primary_key=True)  # UTC hour
+    arrivals = Column(Integer, nullable=False, default=0)  # visits that started in this hour
+    visit_seconds = Column(BigInteger, nullable=False, default=0)  # time spent in the gym during this hour, all visits
+
+
+class VisitStatsDaily(Base):
+    __tablename__ = "visit_stats_daily"
+
+    day = Column(Date, primary_key=True)  # local day (GYM_TIMEZONE) the visits started on
+    visits = Column(Integer, nullable=False, default=0)
+    members = Column(Integer, nullable=False, default=0)  # distinct users
+    total_seconds = Column(BigInteger, nullable=False, default=0)
+
+
+class VisitStatsUserDaily(Base):
+    __tablename__ = "visit_stats_user_daily"
+
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    day = Column(Date, primary_key=True)
+    visits = Column(Integer, nullable=False, default=0)
+    total_seconds = Column(BigInteger, nullable=False, default=0)
@@ -0,0 +1,310 @@
+"""
+Structured HTTP request log (JSON lines), written off the event loop.
+
+RequestLogMiddleware is a plain ASGI middleware: per request it only takes
+timestamps, captures the response status and, if the request is kept by the
+sampling rules, puts a small dict on a bounded queue. A daemon thread formats
+the records and writes them to stdout (or REQUEST_LOG_PATH). When the queue is
+full records are dropped and counted; a request never waits for logging.
+
+Records carry the route template (/api/admin/users/{user_id}), never the raw
+path or query string, which may contain QR tokens. Only headers listed in
+REQUEST_LOG_HEADERS are included and the ones in REQUEST_LOG_REDACT_HEADERS
+are replaced by "[redacted]"; both sets are resolved once at startup.
+
+Sampling: server errors and requests slower than REQUEST_LOG_SLOW_MS are always
+logged, paths under REQUEST_LOG_QUIET_PATHS (health checks, static files) with
+REQUEST_LOG_QUIET_SAMPLE_RATE, everything else with REQUEST_LOG_SAMPLE_RATE.
+Each record includes the rate it was sampled with.
+"""
+from __future__ import annotations
+
+import json
+import logging
+import os
+import queue
+import random
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable, Optional, TextIO
+
+logger = logging.getLogger(__name__)
+
+
+def _env_list(name: str, default: str) -> tuple[str, ...]:
+    raw = os.getenv(name, default)
+    return tuple(item.strip().lower() for item in raw.replace(" ", ",").split(",") if item.strip())
+
+
+REQUEST_LOG_ENABLED = os.getenv("REQUEST_LOG_ENABLED", "true").strip().lower() in {"1", "true", "yes", "on"}
+REQUEST_LOG_PATH = os.getenv("REQUEST_LOG_PATH", "")
+REQUEST_LOG_SAMPLE_RATE = float(os.getenv("REQUEST_LOG_SAMPLE_RATE", "1.0"))
+REQUEST_LOG_QUIET_SAMPLE_RATE = float(os.getenv("REQUEST_LOG_QUIET_SAMPLE_RATE", "0"))
+REQUEST_LOG_QUIET_PATHS = _env_list("REQUEST_LOG_QUIET_PATHS", "/health,/metrics,/static/,/favicon.ico")
+REQUEST_LOG_SLOW_MS = float(os.getenv("REQUEST_LOG_SLOW_MS", "1000"))
+REQUEST_LOG_HEADERS = _env_list(
+    "REQUEST_LOG_HEADERS",
+    "user-agent,x-forwarded-for,x-request-id,x-scanner-id,authorization,x-api-key,x-turnstile-api-key",
+)
+REQUEST_LOG_REDACT_HEADERS = _env_list(
+    "REQUEST_LOG_REDACT_HEADERS", "authorization,cookie,x-api-key,x-turnstile-api-key"
+)
+REQUEST_LOG_QUEUE_SIZE = int(os.getenv("REQUEST_LOG_QUEUE_SIZE", "10000"))
+REQUEST_LOG_BATCH_SIZE = int(os.getenv("REQUEST_LOG_BATCH_SIZE", "200"))
+REQUEST_LOG_FLUSH_INTERVAL_MS = int(os.getenv("REQUEST_LOG_FLUSH_INTERVAL_MS", "500"))
+
+REDACTED = "[redacted]"
+UNMATCHED_ROUTE = "<unmatched>"
+
+
+_route_templates: dict[Any, str] = {}
+
+
+def route_template(scope) -> str:
+    """Path template of the route that handled the request (call after the app ran)."""
+    # The router stores the matched endpoint in the scope; map it back to its path template.
+    endpoint = scope.get("endpoint")
+    if endpoint is None:
+        return UNMATCHED_ROUTE
+    template = _route_templates.get(endpoint)
+    if template is None:
+        template = UNMATCHED_ROUTE
+        for route in getattr(scope.get("app"), "routes", ()):
+            if getattr(route, "endpoint", None) is endpoint or getattr(route, "app", None) is endpoint:
+                template = route.path
+                break
+        _route_templates[endpoint] = template
+    return template
+
+
+class RequestLogEmitter:
+    """Bounded queue + writer thread for request log records."""
+
+    def __init__(
+        self,
+        stream: Optional[TextIO] = None,
+        *,
+        path: str = REQUEST_LOG_PATH,
+        queue_size: int = REQUEST_LOG_QUEUE_SIZE,
+        batch_size: int = REQUEST_LOG_BATCH_SIZE,
+        flush_interval_ms: int = REQUEST_LOG_FLUSH_INTERVAL_MS,
+    ):
+        self._stream = stream
+        self.path = path
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = max(flush_interval_ms, 1) / 1000
+        self._queue: queue.Queue[dict[str, Any]] = queue.Queue(maxsize=max(1, queue_size))
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._owns_stream = False
+        self.emitted = 0
+        self.dropped = 0
+        self.write_errors = 0
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> None:
+        if self.running:
+            return
+        if self._stream is None:
+            if self.path:
+                self._stream = open(self.path, "a", encoding="utf-8")
+                self._owns_stream = True
+            else:
+                self._stream = sys.stdout
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="request-log", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """Stop the thread after writing everything still queued."""
+        if not self.running:
+            return
+        self._stop.set()
+        self._thread.join(timeout)
+        self._thread = None
+        self._write(self._drain(self._queue.qsize()))
+        if self._owns_stream:
+            self._stream.close()
+            self._stream = None
+            self._owns_stream = False
+
+    def emit(self, record: dict[str, Any]) -> None:
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
+
+    def stats(self) -> dict:
+        return {
+            "queue_depth": self._queue.qsize(),
+            "queue_capacity": self._queue.maxsize,
+            "emitted": self.emitted,
+            "dropped": self.dropped,
+            "write_errors": self.write_errors,
+        }
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            batch = self._collect_batch()
+            if batch:
+                self._write(batch)
+        self._write(self._drain(self._queue.qsize()))
+
+    def _collect_batch(self) -> list[dict[str, Any]]:
+        deadline = time.monotonic() + self.flush_interval
+        batch: list[dict[str, Any]] = []
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or self._stop.is_set():
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _drain(self, limit: int) -> list[dict[str, Any]]:
+        records: list[dict[str, Any]] = []
+        while len(records) < limit:
+            try:
+                records.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return records
+
+    def _write(self, records: list[dict[str, Any]]) -> None:
+        if not records or self._stream is None:
+            return
+        lines = []
+        for record in records:
+            record["ts"] = datetime.fromtimestamp(record["ts"], timezone.utc).isoformat(timespec="milliseconds")
+            lines.append(json.dumps(record, ensure_ascii=False, separators=(",", ":"), default=str))
+        try:
+            self._stream.write("\n".join(lines) + "\n")
+            self._stream.flush()
+            self.emitted += len(records)
+        except Exception as exc:
+            self.write_errors += 1
+            logger.error("Request log write failed, %s records lost: %s", len(records), exc)
+
+
+class RequestLogMiddleware:
+    """ASGI middleware that hands sampled request records to the running emitter."""
+
+    def __init__(
+        self,
+        app,
+        *,
+        emitter: Optional[Callable[[], Optional[RequestLogEmitter]]] = None,
+        sample_rate: float = REQUEST_LOG_SAMPLE_RATE,
+        quiet_sample_rate: float = REQUEST_LOG_QUIET_SAMPLE_RATE,
+        quiet_paths: tuple[str, ...] = REQUEST_LOG_QUIET_PATHS,
+        slow_ms: float = REQUEST_LOG_SLOW_MS,
+        headers: tuple[str, ...] = REQUEST_LOG_HEADERS,
+        redact_headers: tuple[str, ...] = REQUEST_LOG_REDACT_HEADERS,
+        rng: Callable[[], float] = random.random,
+    ):
+        self.app = app
+        self._emitter = emitter or get_request_log_emitter
+        self.sample_rate = sample_rate
+        self.quiet_sample_rate = quiet_sample_rate
+        self.quiet_paths = tuple(quiet_paths)
+        self.slow_ms = slow_ms
+        self._rng = rng
+        redacted = {name.lower() for name in redact_headers}
+        # raw ASGI header name -> (record key, redact?)
+        self._headers = {
+            name.lower().encode("latin-1"): (name.lower(), name.lower() in redacted) for name in headers
+        }
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        emitter = self._emitter()
+        if emitter is None:
+            await self.app(scope, receive, send)
+            return
+
+        path = scope["path"]  # Mount rewrites scope["path"] for the mounted app
+        started_at = time.time()
+        started = time.perf_counter()
+        status = 500
+        sent_bytes = 0
+
+        async def send_wrapper(message):
+            nonlocal status, sent_bytes
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                sent_bytes += len(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            duration_ms = (time.perf_counter() - started) * 1000
+            rate = self._sample_rate(path, status, duration_ms)
+            if rate >= 1.0 or (rate > 0 and self._rng() < rate):
+                emitter.emit(self._record(scope, started_at, status, duration_ms, sent_bytes, rate))
+
+    def _sample_rate(self, path: str, status: int, duration_ms: float) -> float:
+        if status >= 500 or duration_ms >= self.slow_ms:
+            return 1.0
+        if path.startswith(self.quiet_paths):
+            return self.quiet_sample_rate
+        return self.sample_rate
+
+    def _record(self, scope, started_at: float, status: int, duration_ms: float, sent_bytes: int, rate: float) -> dict:
+        record = {
+            "ts": started_at,
+            "method": scope["method"],
+            "route": route_template(scope),
+            "status": status,
+            "duration_ms": round(duration_ms, 2),
+            "bytes": sent_bytes,
+            "client": scope["client"][0] if scope.get("client") else None,
+        }
+        if rate < 1.0:
+            record["sample_rate"] = rate
+        headers = {}
+        for name, value in scope.get("headers", ()):
+            wanted = self._headers.get(name)
+            if wanted is not None:
+                headers[wanted[0]] = REDACTED if wanted[1] else value.decode("latin-1")
+        if headers:
+            record["headers"] = headers
+        return record
+
+
+_emitter: Optional[RequestLogEmitter] = None
+
+
+def get_request_log_emitter() -> Optional[RequestLogEmitter]:
+    """Running emitter, or None when logging is disabled or not started (scripts, tests)."""
+    if _emitter is not None and _emitter.running:
+        return _emitter
+    return None
+
+
+def start_request_log() -> Optional[RequestLogEmitter]:
+    global _emitter
+    if not REQUEST_LOG_ENABLED:
+        return None
+    if _emitter is None:
+        _emitter = RequestLogEmitter()
+    _emitter.start()
+    return _emitter
+
+
+def stop_request_log() -> None:
+    if _emitter is not None:
+        _emitter.stop()
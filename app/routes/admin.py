@@ -1,22 +1,51 @@
 from datetime import datetime
-import base64
-import io
-import qrcode
+from typing import Literal
 import re
+from urllib.parse import quote
 
-from fastapi import APIRouter, Depends, HTTPException, Query, Request
-from sqlalchemy import or_
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from sqlalchemy import or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from pydantic import BaseModel, Field, root_validator
 
-from app.auth import get_current_user, get_optional_user
-from app.database import get_db
+from app.auth import get_optional_principal, release_db_connection
+from app.database import get_async_db, get_db
 from app.models import AccessToken, Membership, MembershipPackage, AccessLog, User, PresenceSession, APIKey
-from app.services.api_keys import create_api_key, serialize_api_key, verify_api_key
+from app.routes.log_listing import ListingFormat, access_log_filters, listing_response
+from app.routes.occupancy import occupancy_stream_response
+from app.routes.qr import qr_image_url_prefix
+from app.services.access_log_partitions import list_archives, parse_month, read_archive
+from app.services.access_log_query import AccessLogFilters
+from app.services.api_keys import (
+    create_api_key,
+    invalidate_api_key,
+    scanner_key_metadata,
+    serialize_api_key,
+    verify_api_key,
+)
+from app.services.scanner_metrics import scanner_metrics
+from app.services.entitlement_cache import invalidate_token_entitlement, invalidate_user_entitlements
 from app.services.membership import MembershipService
-from app.services.presence_sessions import PresenceSessionService, serialize_presence_session
+from app.services.occupancy import occupancy
+from app.services.presence_sessions import (
+    PresenceSessionService,
+    active_sessions_statement,
+    serialize_presence_session,
+    sessions_statement,
+)
 from app.services.presence import rebuild_presence_from_logs, set_presence
+from app.services.presence_reconcile import (
+    PRESENCE_RECONCILE_BATCH_SIZE,
+    ReconcileAlreadyRunning,
+    current_reconcile,
+    start_reconcile_job,
+)
+from app.services.presence_sweeper import sweep_stale_sessions
+from app.services.principals import Principal
+from app.services.qr_render import QRFormat, qr_data_url
 from app.services.token_service import generate_unique_token
+from app.services.visit_rollups import request_visit_rollup
 
 router = APIRouter()
 
@@ -47,44 +76,34 @@ def _ensure_active_token_for_user(db: Session, user_id: int) -> AccessToken:
 def require_admin(
     request: Request,
     db: Session = Depends(get_db),
-    optional_user: User | None = Depends(get_optional_user),
-) -> User:
+    optional_user: Principal | None = Depends(get_optional_principal),
+) -> Principal:
     """
     Allow admin access via JWT or active API key (X-API-KEY).
-    Returns the resolved user (creator of the key if available) or a proxy admin user.
+    Always a Principal (id/role/profile, no ORM row): the cached JWT principal, the
+    creator of the key if available, or an admin principal named after the key.
     """
     api_key_raw = request.headers.get("X-API-KEY") or request.headers.get("x-api-key")
     if api_key_raw:
         api_key_obj = verify_api_key(db, api_key_raw.strip())
-        if api_key_obj:
+        # scanner keys only authenticate turnstiles on /api/verify*
+        if api_key_obj and not api_key_obj.is_scanner:
             if api_key_obj.created_by_user_id:
                 creator = db.query(User).filter(User.id == api_key_obj.created_by_user_id).first()
                 if creator:
-                    return creator
-            proxy = User()
-            proxy.id = api_key_obj.created_by_user_id
-            proxy.is_admin = True
-            proxy.email = "api-key"
-            proxy.name = api_key_obj.name
-            return proxy
+                    return Principal.from_user(creator)
+            return Principal(id=api_key_obj.created_by_user_id, email="api-key", name=api_key_obj.name, is_admin=True)
 
     if optional_user:
-        is_admin = bool(optional_user.is_admin) if optional_user.is_admin is not None else False
-        if not is_admin:
+        if not optional_user.is_admin:
             raise HTTPException(status_code=403, detail="Admin access required")
         return optional_user
 
     raise HTTPException(status_code=401, detail="Unauthorized")
 
-def build_qr_image(token_str: str) -> str:
-    qr = qrcode.QRCode(version=1, box_size=6, border=2)
-    qr.add_data(token_str)
-    qr.make(fit=True)
-    img = qr.make_image(fill_color="black", back_color="white")
-    buffer = io.BytesIO()
-    img.save(buffer, format="PNG")
-    buffer.seek(0)
-    return f"data:image/png;base64,{base64.b64encode(buffer.getvalue()).decode()}"
+def build_qr_image(token_str: str, format: QRFormat = "png1bit", scale: int = 6) -> str:
+    # png1bit is pixel-identical to the old PNG but smaller once base64-inflated into JSON
+    return qr_data_url(token_str, format=format, scale=scale, border=2)
 
 class UpdateCreditsRequest(BaseModel):
     credits: int
@@ -169,6 +188,13 @@ class ConsumeSessionsRequest(BaseModel):
 
 class APIKeyCreateRequest(BaseModel):
     name: str = Field(..., min_length=3, max_length=120)
+    kind: Literal["admin", "scanner"] = "admin"
+    scanner_id: str | None = Field(default=None, max_length=100)
+    rate_limit_per_minute: int | None = Field(default=None, ge=0)
+
+
+class APIKeyUpdateRequest(BaseModel):
+    rate_limit_per_minute: int | None = Field(default=None, ge=0)
 
 
 class APIKeyResponse(BaseModel):
@@ -179,6 +205,9 @@ class APIKeyResponse(BaseModel):
     created_at: str | None = None
     last_used_at: str | None = None
     created_by_user_id: int | None = None
+    kind: str = "admin"
+    scanner_id: str | None = None
+    rate_limit_per_minute: int | None = None
     token: str | None = None  # only populated on create
 
 
@@ -232,7 +261,7 @@ def serialize_membership(membership: Membership) -> dict:
 @router.get("/users/search")
 async def search_users(
     q: str = Query(..., description="Search query (name or email)"),
-    current_user: User = Depends(require_admin),
+    current_user: Principal = Depends(require_admin),
     db: Session = Depends(get_db)
 ):
     """Search users by name or email"""
@@ -261,7 +290,7 @@ async def search_users(
 
 @router.get("/users")
 async def list_users(
-    current_user: User = Depends(require_admin),
+    current_user: Principal = Depends(require_admin),
     db: Session = Depends(get_db)
 ):
     """List all users"""
@@ -286,7 +315,9 @@ async def list_users(
 @router.get("/users/{user_id}/qr", response_model=AdminUserQrResponse)
 async def admin_get_user_qr(
     user_id: int,
-    current_user: User = Depends(require_admin),
+    format: QRFormat = Query("png1bit"),
+    scale: int = Query(6, ge=1, le=40),
+    current_user: Principal = Depends(require_admin),
     db: Session = Depends(get_db),
 ):
     user = db.query(User).filter(User.id == user_id).first()
@@ -295,7 +326,7 @@ async def admin_get_user_qr(
     token = _ensure_active_token_for_user(db, user.id)
     return AdminUserQrResponse(
         token=token.token,
-        qr_code_url=build_qr_image(token.token),
+        qr_code_url=build_qr_image(token.token, format=format, scale=scale),
         user_name=user.name,
         user_email=user.email,
     )
@@ -304,7 +335,9 @@ async def admin_get_user_qr(
 @router.post("/users/{user_id}/qr/regenerate", response_model=AdminUserQrResponse)
 async def admin_regenerate_user_qr(
     user_id: int,
-    current_user: User = Depends(require_admin),
+    format: QRFormat = Query("png1bit"),
+    scale: int = Query(6, ge=1, le=40),
+    current_user: Principal = Depends(require_admin),
     db: Session = Depends(get_db),
 ):
     user = db.query(User).filter(User.id == user_id).first()
@@ -316,9 +349,10 @@ async def admin_regenerate_user_qr(
     ).update({"is_active": False})
     db.flush()
     token = _ensure_active_token_for_user(db, user.id)
+    invalidate_user_entitlements(user.id)
     return AdminUserQrResponse(
         token=token.token,
-        qr_code_url=build_qr_image(token.token),
+        qr_code_url=build_qr_image(token.token, format=format, scale=scale),
         user_name=user.name,
         user_email=user.email,
     )
@@ -327,7 +361,7 @@ async def admin_regenerate_user_qr(
 async def update_user_credits(
     user_id: int,
     request: UpdateCreditsRequest,
-    current_user: User = Depends(require_admin),
+    current_user: Principal = Depends(require_admin),
     db: Session = Depends(get_db)
 ):
     """Add or remove credits from a user"""
@@ -338,6 +372,7 @@ async def update_user_credits(
     old_credits = user.credits or 0
     user.credits = max(0, old_credits + request.credits)  # Prevent negative credits
     db.commit()
+    invalidate_user_entitlements(user.id)
     db.refresh(user)
     
     return {
@@ -354,7 +389,7 @@ async def update_user_credits(
 @router.get("/membership-packages")
 async def list_membership_packages(
     include_inactive: bool = Query(False, description="Include inactive packages"),
-    current_user: User = Depends(require_admin),
+    current_user: Principal = Depends(require_admin),
     db: Session = Depends(get_db),
 ):
     service = MembershipService(db)
@@ -365,7 +400,7 @@ async def list_membership_packages(
 @router.post("/membership-packages")
 async def create_membership_package(
     payload: MembershipPackagePayload,
-    current_user: User = Depends(require_admin),
+    current_user: Principal = Depends(require_admin),
     db: Session = Depends(get_db),
 ):
     service = MembershipService(db)
@@ -393,7 +428,7 @@ async def create_membership_package(
 async def update_membership_package(
     package_id: int,
     payload: MembershipPackageUpdateRequest,
-    current_user: User = Depends(require_admin),
+    current_user: Principal = Depends(require_admin),
     db: Session = Depends(get_db),
 ):
     service = MembershipService(db)
@@ -426,7 +461,7 @@ async def update_membership_package(
 async def toggle_membership_package(
     package_id: int,
     payload: TogglePackageRequest,
-    current_user: User = Depends(require_admin),
+    current_user: Principal = Depends(require_admin),
     db: Session = Depends(get_db),
 ):
     service = MembershipService(db)
@@ -442,7 +477,7 @@ async def toggle_membership_package(
 @router.get("/users/{user_id}/memberships")
 async def list_user_memberships(
     user_id: int,
-    current_user: User = Depends(require_admin),
+    current_user: Principal = Depends(require_admin),
     db: Session = Depends(get_db),
 ):
     user = db.query(User).filter(User.id == user_id).first()
@@ -457,7 +492,7 @@ async def list_user_memberships(
 async def assign_membership_to_user(
     user_id: int,
     payload: AssignMembershipRequest,
-    current_user: User = Depends(require_admin),
+    current_user: Principal = Depends(require_admin),
     db: Session = Depends(get_db),
 ):
     user = db.query(User).filter(User.id == user_id).first()
@@ -497,6 +532,7 @@ async def assign_membership_to_user(
             auto_renew=payload.auto_renew,
         )
     db.commit()
+    invalidate_user_entitlements(user_id)
     db.refresh(membership)
     return serialize_membership(membership)
 
@@ -506,7 +542,7 @@ async def update_membership_status(
     user_id: int,
     membership_id: int,
     payload: UpdateMembershipStatusRequest,
-    current_user: User = Depends(require_admin),
+    current_user: Principal = Depends(require_admin),
     db: Session = Depends(get_db),
 ):
     membership = (
@@ -518,6 +554,7 @@ async def update_membership_status(
     if payload.note:
         membership.notes = (membership.notes or "") + f"\n[{datetime.now().isoformat()}] {payload.note}"
     db.commit()
+    invalidate_user_entitlements(user_id)
     db.refresh(membership)
     return serialize_membership(membership)
 
@@ -527,11 +564,15 @@ async def consume_membership_sessions(
     user_id: int,
     membership_id: int,
     payload: ConsumeSessionsRequest,
-    current_user: User = Depends(require_admin),
+    current_user: Principal = Depends(require_admin),
     db: Session = Depends(get_db),
 ):
+    # Row lock: scans increment sessions_used relatively, this read-modify-write must not overwrite them.
     membership = (
-        db.query(Membership).filter(Membership.id == membership_id, Membership.user_id == user_id).first()
+        db.query(Membership)
+        .filter(Membership.id == membership_id, Membership.user_id == user_id)
+        .with_for_update()
+        .first()
     )
     if not membership:
         raise HTTPException(status_code=404, detail="Membership not found")
@@ -541,12 +582,13 @@ async def consume_membership_sessions(
     except ValueError as exc:
         raise HTTPException(status_code=400, detail=str(exc))
     db.commit()
+    invalidate_user_entitlements(user_id)
     db.refresh(membership)
     return serialize_membership(membership)
 
 @router.get("/api-keys", response_model=list[APIKeyResponse])
 async def list_api_keys(
-    current_user: User = Depends(require_admin),
+    current_user: Principal = Depends(require_admin),
     db: Session = Depends(get_db),
 ):
     """List API keys without exposing secrets."""
@@ -557,24 +599,59 @@ async def list_api_keys(
 @router.post("/api-keys", response_model=APIKeyResponse)
 async def create_api_key_endpoint(
     payload: APIKeyCreateRequest,
-    current_user: User = Depends(require_admin),
+    current_user: Principal = Depends(require_admin),
     db: Session = Depends(get_db),
 ):
     """Create a new API key and return the secret once."""
+    metadata = None
+    if payload.kind == "scanner":
+        metadata = scanner_key_metadata(payload.scanner_id, payload.rate_limit_per_minute)
     api_key, raw_key = create_api_key(
         db,
         name=payload.name,
         created_by_user_id=current_user.id if current_user else None,
+        metadata=metadata,
     )
     data = serialize_api_key(api_key)
     data["token"] = raw_key
     return APIKeyResponse(**data)
 
 
+@router.patch("/api-keys/{key_id}", response_model=APIKeyResponse)
+async def update_api_key(
+    key_id: int,
+    payload: APIKeyUpdateRequest,
+    current_user: Principal = Depends(require_admin),
+    db: Session = Depends(get_db),
+):
+    """Change a scanner key's verify budget (null = default limit, 0 = unlimited)."""
+    key = db.query(APIKey).filter(APIKey.id == key_id).first()
+    if not key:
+        raise HTTPException(status_code=404, detail="API key not found")
+    metadata = dict(key.metadata_json or {})
+    if metadata.get("kind") != "scanner":
+        raise HTTPException(status_code=400, detail="Only scanner keys have a verify budget")
+    if payload.rate_limit_per_minute is None:
+        metadata.pop("rate_limit_per_minute", None)
+    else:
+        metadata["rate_limit_per_minute"] = payload.rate_limit_per_minute
+    key.metadata_json = metadata
+    db.commit()
+    invalidate_api_key(key_id)
+    db.refresh(key)
+    return APIKeyResponse(**serialize_api_key(key))
+
+
+@router.get("/scanners/metrics")
+async def scanner_device_metrics(current_user: Principal = Depends(require_admin)):
+    """Per-device verify throughput, outcomes and latency since this worker started."""
+    return {"devices": scanner_metrics.snapshot(), "untracked_requests": scanner_metrics.dropped}
+
+
 @router.post("/api-keys/{key_id}/revoke")
 async def revoke_api_key(
     key_id: int,
-    current_user: User = Depends(require_admin),
+    current_user: Principal = Depends(require_admin),
     db: Session = Depends(get_db),
 ):
     key = db.query(APIKey).filter(APIKey.id == key_id).first()
@@ -582,13 +659,14 @@ async def revoke_api_key(
         raise HTTPException(status_code=404, detail="API key not found")
     key.is_active = False
     db.commit()
+    invalidate_api_key(key_id)
     return {"status": "ok", "message": "API key revoked"}
 
 
 @router.delete("/api-keys/{key_id}")
 async def delete_api_key(
     key_id: int,
-    current_user: User = Depends(require_admin),
+    current_user: Principal = Depends(require_admin),
     db: Session = Depends(get_db),
 ):
     key = db.query(APIKey).filter(APIKey.id == key_id).first()
@@ -596,111 +674,247 @@ async def delete_api_key(
         raise HTTPException(status_code=404, detail="API key not found")
     db.delete(key)
     db.commit()
+    invalidate_api_key(key_id)
     return {"status": "ok", "message": "API key deleted"}
 
+TOKEN_LISTING_COLUMNS = (
+    AccessToken.id,
+    AccessToken.token,
+    AccessToken.expires_at,
+    AccessToken.created_at,
+    AccessToken.used_at,
+    AccessToken.is_active,
+    AccessToken.scan_count,
+    User.id.label("user_id"),
+    User.name.label("user_name"),
+    User.email.label("user_email"),
+)
+
+
+def token_listing_statement(limit: int):
+    """Newest tokens with their owner in one query; only the columns the listing returns."""
+    return (
+        select(*TOKEN_LISTING_COLUMNS)
+        .join(User, User.id == AccessToken.user_id)
+        .order_by(AccessToken.created_at.desc())
+        .limit(limit)
+    )
+
+
+def _serialize_token(row, qr_prefix: str) -> dict:
+    return {
+        "id": row.id,
+        "token": row.token,
+        "user_id": row.user_id,
+        "user_name": row.user_name,
+        "user_email": row.user_email,
+        "expires_at": row.expires_at.isoformat() if row.expires_at else None,
+        "created_at": row.created_at.isoformat() if row.created_at else None,
+        "used_at": row.used_at.isoformat() if row.used_at else None,
+        "is_active": row.is_active,
+        "scan_count": row.scan_count or 0,
+        "qr_code_url": f"{qr_prefix}{quote(row.token, safe='')}",
+    }
+
+
 @router.get("/tokens")
 async def list_tokens(
-    current_user: User = Depends(require_admin),
+    request: Request,
+    limit: int = Query(100, ge=1, le=1000),
+    current_user: Principal = Depends(require_admin),
     db: Session = Depends(get_db)
 ):
-    """List all access tokens"""
-    tokens = db.query(AccessToken).join(User).order_by(AccessToken.created_at.desc()).limit(100).all()
-    response = []
-    for token in tokens:
-        user = token.user
-        response.append({
-            "id": token.id,
-            "token": token.token,
-            "user_id": user.id if user else None,
-            "user_name": user.name if user else None,
-            "user_email": user.email if user else None,
-            "expires_at": token.expires_at.isoformat() if token.expires_at else None,
-            "created_at": token.created_at.isoformat() if token.created_at else None,
-            "used_at": token.used_at.isoformat() if token.used_at else None,
-            "is_active": token.is_active,
-            "scan_count": token.scan_count or 0,
-            "qr_code_url": build_qr_image(token.token)
-        })
-    return response
+    """List access tokens; qr_code_url points at /api/qr_image so images load lazily."""
+    qr_prefix = qr_image_url_prefix(request)
+    return [_serialize_token(row, qr_prefix) for row in db.execute(token_listing_statement(limit))]
+
+
+SCAN_LOG_COLUMNS = ["id", "user_id", "user_name", "reason", "status", "allowed", "direction", "scanner_id", "created_at", "metadata"]
+
+
+def _serialize_scan_log(row) -> dict:
+    log = row.AccessLog
+    return {
+        "id": log.id,
+        "user_id": log.user_id,
+        "user_name": row.user_name,
+        "reason": log.reason,
+        "status": log.status,
+        "allowed": log.allowed,
+        "direction": log.direction,
+        "scanner_id": log.scanner_id,
+        "created_at": log.created_at.isoformat() if log.created_at else None,
+        "metadata": log.metadata_json,
+    }
 
 
 @router.get("/scan-logs")
 async def list_scan_logs(
-    limit: int = Query(20, ge=1, le=100),
-    current_user: User = Depends(require_admin),
+    request: Request,
+    response: Response,
+    limit: int | None = Query(None, ge=1, description="page size (json, max 100) or row cap (ndjson/csv)"),
+    cursor: str | None = Query(None, description="X-Next-Cursor of the previous page"),
+    format: ListingFormat = Query("json"),
+    filters: AccessLogFilters = Depends(access_log_filters),
+    current_user: Principal = Depends(require_admin),
     db: Session = Depends(get_db),
 ):
-    logs = (
-        db.query(AccessLog)
-        .order_by(AccessLog.created_at.desc())
-        .limit(limit)
-        .all()
+    """Scan logs newest first; keyset-paginated (json) or streamed (ndjson/csv)."""
+    if format == "json" and limit is not None and limit > 100:
+        raise HTTPException(status_code=422, detail="limit must be <= 100 for format=json")
+    return listing_response(
+        request=request,
+        response=response,
+        db=db,
+        filters=filters,
+        cursor=cursor,
+        limit=limit,
+        page_size=20,
+        output=format,
+        serialize=_serialize_scan_log,
+        columns=SCAN_LOG_COLUMNS,
+        filename="scan-logs",
     )
-    results = []
-    for log in logs:
-        results.append(
-            {
-                "id": log.id,
-                "user_id": log.user_id,
-                "user_name": log.user.name if log.user else None,
-                "reason": log.reason,
-                "status": log.status,
-                "allowed": log.allowed,
-                "created_at": log.created_at.isoformat() if log.created_at else None,
-                "metadata": log.metadata_json,
-            }
-        )
-    return results
+
+@router.get("/scan-logs/archive")
+def list_scan_log_archives(current_user: Principal = Depends(require_admin)):
+    """Months whose access logs were moved out of the database by retention."""
+    return [{"month": a["month"], "size_bytes": a["size_bytes"]} for a in list_archives()]
+
+
+@router.get("/scan-logs/archive/{month}")
+def read_scan_log_archive(
+    month: str,
+    user_id: int | None = Query(None),
+    status: str | None = Query(None),
+    limit: int = Query(100, ge=1, le=1000),
+    offset: int = Query(0, ge=0),
+    current_user: Principal = Depends(require_admin),
+    db: Session = Depends(get_db),
+):
+    """Read an archived month (YYYY-MM), oldest first (sync: the gzip scan runs in the threadpool)."""
+    try:
+        rows = read_archive(parse_month(month), user_id=user_id, status=status, limit=limit, offset=offset)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Archive not found")
+    user_ids = {row["user_id"] for row in rows if row["user_id"] is not None}
+    names = dict(db.query(User.id, User.name).filter(User.id.in_(user_ids)).all()) if user_ids else {}
+    for row in rows:
+        row["user_name"] = names.get(row["user_id"])
+        for field in ("scanned_at", "created_at"):
+            if row[field] is not None:
+                row[field] = row[field].isoformat()
+    return rows
+
+async def _load_user_map(db: AsyncSession, user_ids: list[int]) -> dict[int, User]:
+    if not user_ids:
+        return {}
+    users = await db.scalars(select(User).where(User.id.in_(set(user_ids))))
+    return {u.id: u for u in users}
+
 
 @router.get("/presence/active")
 async def list_active_presence(
-    current_user: User = Depends(require_admin),
-    db: Session = Depends(get_db),
+    current_user: Principal = Depends(require_admin),
+    db: AsyncSession = Depends(get_async_db),
 ):
-    service = PresenceSessionService(db)
-    sessions = service.list_active_sessions()
-    user_map = {u.id: u for u in db.query(User).filter(User.id.in_([s.user_id for s in sessions])).all()}
+    sessions = list(await db.scalars(active_sessions_statement()))
+    user_map = await _load_user_map(db, [s.user_id for s in sessions])
     return [serialize_presence_session(session, user_map.get(session.user_id)) for session in sessions]
 
 
+@router.get("/presence/live")
+async def live_presence(current_user: Principal = Depends(require_admin)):
+    """Who is in the gym right now, from the in-memory occupancy tracker (no DB query)."""
+    return occupancy.snapshot(detail=True)
+
+
+@router.get("/presence/live/stream")
+async def live_presence_stream(
+    current_user: Principal = Depends(require_admin),
+    db: Session = Depends(get_db),
+):
+    """Server-Sent Events: "snapshot" on connect, then "enter"/"exit" with the occupant."""
+    # The stream can stay open for hours; do not keep the auth query's connection checked out.
+    release_db_connection(db)
+    return occupancy_stream_response(detail=True)
+
+
 @router.get("/presence/sessions")
 async def list_presence_sessions(
     user_id: int | None = Query(default=None),
     limit: int = Query(default=50, ge=1, le=200),
-    current_user: User = Depends(require_admin),
-    db: Session = Depends(get_db),
+    current_user: Principal = Depends(require_admin),
+    db: AsyncSession = Depends(get_async_db),
 ):
-    service = PresenceSessionService(db)
-    sessions = service.list_sessions(user_id=user_id, limit=limit)
-    user_ids = [s.user_id for s in sessions]
-    user_map = {u.id: u for u in db.query(User).filter(User.id.in_(user_ids)).all()}
+    sessions = list(await db.scalars(sessions_statement(user_id=user_id, limit=limit)))
+    user_map = await _load_user_map(db, [s.user_id for s in sessions])
     return [serialize_presence_session(session, user_map.get(session.user_id)) for session in sessions]
 
 
+@router.post("/presence/sweep")
+def sweep_presence_sessions(
+    current_user: Principal = Depends(require_admin),
+    db: Session = Depends(get_db),
+):
+    """Close stale sessions now (the sweeper also runs periodically); returns how many were closed."""
+    return sweep_stale_sessions(db.get_bind())
+
+
+@router.post("/presence/reconcile", status_code=202)
+def reconcile_presence_all(
+    dry_run: bool = Query(True),
+    batch_size: int = Query(PRESENCE_RECONCILE_BATCH_SIZE, ge=1, le=10000),
+    current_user: Principal = Depends(require_admin),
+    db: Session = Depends(get_db),
+):
+    """Recompute presence of all users in the background; dry_run (default) only collects the diff."""
+    try:
+        progress = start_reconcile_job(db.get_bind(), dry_run=dry_run, batch_size=batch_size)
+    except ReconcileAlreadyRunning as exc:
+        raise HTTPException(status_code=409, detail=str(exc))
+    return progress.to_dict()
+
+
+@router.get("/presence/reconcile")
+async def reconcile_presence_progress(current_user: Principal = Depends(require_admin)):
+    """Progress (and, for a dry run, the diff) of the running or last reconciliation."""
+    progress = current_reconcile()
+    if progress is None:
+        raise HTTPException(status_code=404, detail="No reconciliation has run")
+    return progress.to_dict()
+
+
 @router.post("/presence/{session_id}/end")
 async def end_presence_session(
     session_id: int,
     payload: EndPresenceSessionRequest,
-    current_user: User = Depends(require_admin),
-    db: Session = Depends(get_db),
+    current_user: Principal = Depends(require_admin),
+    db: AsyncSession = Depends(get_async_db),
 ):
-    service = PresenceSessionService(db)
-    session = db.query(PresenceSession).filter(PresenceSession.id == session_id).first()
+    session = await db.get(PresenceSession, session_id)
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
-    service.force_close(session, status=payload.status, notes=payload.note)
-    user = db.query(User).filter(User.id == session.user_id).first()
-    # Update user presence flag and last_exit timestamp
-    if user:
-        set_presence(db, user, False, session.ended_at or datetime.utcnow())
-    db.commit()
-    db.refresh(session)
+    user = await db.get(User, session.user_id)
+
+    def _close(sync_db: Session) -> None:
+        PresenceSessionService(sync_db).force_close(session, status=payload.status, notes=payload.note)
+        # Update user presence flag and last_exit timestamp
+        if user:
+            set_presence(sync_db, user, False, session.ended_at or datetime.utcnow())
+
+    await db.run_sync(_close)
+    await db.commit()
+    occupancy.leave(session.user_id, session_id=session.id)
+    request_visit_rollup()
     return serialize_presence_session(session, user)
 
 @router.post("/tokens/{token_id}/activate")
 async def activate_token(
     token_id: int,
-    current_user: User = Depends(require_admin),
+    current_user: Principal = Depends(require_admin),
     db: Session = Depends(get_db)
 ):
     """Activate a token"""
@@ -709,12 +923,15 @@ async def activate_token(
         raise HTTPException(status_code=404, detail="Token not found")
     token.is_active = True
     db.commit()
+    # Reactivated token rejoins the shared cooldown, so drop the whole user.
+    invalidate_user_entitlements(token.user_id)
+    invalidate_token_entitlement(token.token)
     return {"status": "ok", "message": "Token activated"}
 
 @router.post("/tokens/{token_id}/deactivate")
 async def deactivate_token(
     token_id: int,
-    current_user: User = Depends(require_admin),
+    current_user: Principal = Depends(require_admin),
     db: Session = Depends(get_db)
 ):
     """Deactivate a token"""
@@ -723,13 +940,15 @@ async def deactivate_token(
         raise HTTPException(status_code=404, detail="Token not found")
     token.is_active = False
     db.commit()
+    invalidate_user_entitlements(token.user_id)
+    invalidate_token_entitlement(token.token)
     return {"status": "ok", "message": "Token deactivated"}
 
 
 @router.post("/users/{user_id}/rebuild-presence")
 async def rebuild_presence(
     user_id: int,
-    current_user: User = Depends(require_admin),
+    current_user: Principal = Depends(require_admin),
     db: Session = Depends(get_db),
 ):
     """Rebuild presence flag from latest AccessLog (admin fix-up)."""
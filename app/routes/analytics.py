@@ -0,0 +1,76 @@
+from datetime import date, datetime, timedelta, timezone
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.orm import Session
+
+from app.database import get_db
+from app.services.principals import Principal
+from app.routes.admin import require_admin
+from app.services.timezone import get_gym_timezone
+from app.services.visit_rollups import daily_stats, hourly_stats, peak_hours, user_stats
+
+router = APIRouter()
+
+MAX_DAILY_RANGE_DAYS = 366
+MAX_HOURLY_RANGE_DAYS = 31
+
+
+def _local_today() -> date:
+    return datetime.now(timezone.utc).astimezone(get_gym_timezone()).date()
+
+
+def _date_range(date_from: date | None, date_to: date | None, *, default_days: int, max_days: int) -> tuple[date, date]:
+    date_to = date_to or _local_today()
+    date_from = date_from or date_to - timedelta(days=default_days - 1)
+    if date_from > date_to:
+        raise HTTPException(status_code=400, detail="date_from is after date_to")
+    if (date_to - date_from).days + 1 > max_days:
+        raise HTTPException(status_code=400, detail=f"Range is limited to {max_days} days")
+    return date_from, date_to
+
+
+@router.get("/analytics/daily")
+def analytics_daily(
+    date_from: date | None = Query(None, description="local day, default 30 days back"),
+    date_to: date | None = Query(None, description="local day, default today"),
+    current_user: Principal = Depends(require_admin),
+    db: Session = Depends(get_db),
+):
+    """Visits, distinct members and visit time per day, from the visit_stats_daily rollup."""
+    date_from, date_to = _date_range(date_from, date_to, default_days=30, max_days=MAX_DAILY_RANGE_DAYS)
+    return daily_stats(db, date_from, date_to)
+
+
+@router.get("/analytics/hourly")
+def analytics_hourly(
+    date_from: date | None = Query(None, description="local day, default today"),
+    date_to: date | None = Query(None, description="local day, default today"),
+    current_user: Principal = Depends(require_admin),
+    db: Session = Depends(get_db),
+):
+    """Arrivals and average occupancy per hour (hours without visits are omitted)."""
+    date_from, date_to = _date_range(date_from, date_to, default_days=1, max_days=MAX_HOURLY_RANGE_DAYS)
+    return hourly_stats(db, date_from, date_to)
+
+
+@router.get("/analytics/peak-hours")
+def analytics_peak_hours(
+    days: int = Query(28, ge=1, le=MAX_HOURLY_RANGE_DAYS * 3),
+    current_user: Principal = Depends(require_admin),
+    db: Session = Depends(get_db),
+):
+    """Average arrivals and occupancy per hour of day over the last `days` days, with the busiest hour."""
+    return peak_hours(db, days=days, today=_local_today())
+
+
+@router.get("/analytics/users/{user_id}")
+def analytics_user(
+    user_id: int,
+    date_from: date | None = Query(None, description="local day, default 90 days back"),
+    date_to: date | None = Query(None, description="local day, default today"),
+    current_user: Principal = Depends(require_admin),
+    db: Session = Depends(get_db),
+):
+    """A member's visits per day, total and average visit time."""
+    date_from, date_to = _date_range(date_from, date_to, default_days=90, max_days=MAX_DAILY_RANGE_DAYS)
+    return user_stats(db, user_id, date_from, date_to)
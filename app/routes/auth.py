@@ -1,17 +1,22 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordRequestForm
+from sqlalchemy import update
 from sqlalchemy.orm import Session
 from pydantic import BaseModel, EmailStr, Field, field_validator
 from typing import Annotated
 from app.database import get_db
 from app.models import User
 from app.auth import (
-    verify_password,
-    get_password_hash,
+    verify_password_async,
+    verify_password_and_update,
+    get_password_hash_async,
+    release_db_connection,
     create_access_token,
     get_current_user
 )
 from app.models import AccessToken
+from app.services.entitlement_cache import invalidate_user_entitlements
+from app.services.principals import invalidate_principal
 import os
 from datetime import timedelta
 
@@ -79,7 +84,8 @@ async def register(
             )
         
         # Create new user with hashed password
-        password_hash = get_password_hash(request.password)
+        release_db_connection(db)
+        password_hash = await get_password_hash_async(request.password)
         first_name, last_name = _split_full_name(request.name)
         user = User(
             email=request.email,
@@ -125,13 +131,19 @@ async def login(
                 headers={"WWW-Authenticate": "Bearer"},
             )
         
-        # Verify password
-        if not verify_password(form_data.password, user.password_hash):
+        # Verify password (on the hashing pool, not the event loop)
+        release_db_connection(db, user)
+        valid, new_hash = await verify_password_and_update(form_data.password, user.password_hash)
+        if not valid:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Incorrect email or password",
                 headers={"WWW-Authenticate": "Bearer"},
             )
+        if new_hash:
+            # Stored hash predates the current ARGON2_* parameters
+            db.execute(update(User).where(User.id == user.id).values(password_hash=new_hash))
+            db.commit()
         
         # Create access token (sub must be a string for JWT standard)
         role = "owner" if bool(user.is_owner) else ("admin" if bool(user.is_admin) else "user")
@@ -292,6 +304,8 @@ async def update_profile(
     current_user.phone_number = request.phone_number
 
     db.commit()
+    invalidate_user_entitlements(current_user.id)
+    invalidate_principal(current_user.id)
     db.refresh(current_user)
     qr_count = db.query(AccessToken).filter(AccessToken.user_id == current_user.id).count()
     return _serialize_user_info(current_user, qr_count)
@@ -308,26 +322,26 @@ async def change_password(
     Optional endpoint for settings page.
     """
     # Verify current password
-    if not verify_password(request.current_password, current_user.password_hash):
+    release_db_connection(db, current_user)
+    if not await verify_password_async(request.current_password, current_user.password_hash):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Current password is incorrect"
         )
     
     # Check if new password is different from current
-    if verify_password(request.new_password, current_user.password_hash):
+    if await verify_password_async(request.new_password, current_user.password_hash):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="New password must be different from current password"
         )
     
     # Hash new password
-    new_password_hash = get_password_hash(request.new_password)
+    new_password_hash = await get_password_hash_async(request.new_password)
     
     # Update user password
-    current_user.password_hash = new_password_hash
+    db.execute(update(User).where(User.id == current_user.id).values(password_hash=new_password_hash))
     db.commit()
-    db.refresh(current_user)
     
     return ChangePasswordResponse(
         message="Password changed successfully"
@@ -11,10 +11,11 @@ from pydantic import BaseModel, Field
 from sqlalchemy import or_
 from sqlalchemy.orm import Session
 
-from app.auth import get_current_user
+from app.auth import get_current_principal
 from app.database import get_db
 from app.models import User, CalcomWebhookEvent
 from app.routes.admin import require_admin
+from app.services.principals import Principal
 from app.services.calcom import (
     get_or_create_settings,
     get_or_create_admin_settings,
@@ -389,7 +390,7 @@ async def calcom_webhook_handler_with_admin(admin_id: int, request: Request, db:
 
 
 @router.get("/admin/calcom/settings", response_model=CalcomSettingsResponse)
-def get_calcom_settings(request: Request, db: Session = Depends(get_db), current_admin: User = Depends(require_admin)):
+def get_calcom_settings(request: Request, db: Session = Depends(get_db), current_admin: Principal = Depends(require_admin)):
     settings = get_or_create_settings(db)
     admin_settings = get_or_create_admin_settings(db, current_admin.id)
     webhook_url = str(request.url_for("calcom_webhook_handler"))
@@ -407,7 +408,7 @@ def update_calcom_settings(
     request: Request,
     payload: CalcomSettingsUpdate,
     db: Session = Depends(get_db),
-    current_admin: User = Depends(require_admin),
+    current_admin: Principal = Depends(require_admin),
 ):
     settings = get_or_create_settings(db)
     admin_settings = get_or_create_admin_settings(db, current_admin.id)
@@ -441,7 +442,7 @@ def update_calcom_settings(
 @router.get("/admin/calcom/events", response_model=list[CalcomEventResponse])
 def list_calcom_events(
     db: Session = Depends(get_db),
-    _: User = Depends(require_admin),
+    _: Principal = Depends(require_admin),
     limit: int = Query(default=20, ge=1, le=100),
 ):
     events = list_recent_events(db, limit=limit)
@@ -451,7 +452,7 @@ def list_calcom_events(
 @router.get("/admin/calcom/bookings", response_model=list[CalcomBookingResponse])
 def list_calcom_bookings(
     db: Session = Depends(get_db),
-    current_admin: User = Depends(require_admin),
+    current_admin: Principal = Depends(require_admin),
     limit: int = Query(default=50, ge=1, le=200),
 ):
     events = (
@@ -535,7 +536,7 @@ def list_calcom_bookings(
 @router.get("/calcom/my-bookings", response_model=list[CalcomBookingResponse])
 def list_my_calcom_bookings(
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_principal),
     limit: int = Query(default=50, ge=1, le=200),
 ):
     user_email = (current_user.email or "").lower()
@@ -4,6 +4,7 @@ from pydantic import BaseModel
 from app.database import get_db
 from app.models import User, Payment
 from app.auth import get_current_user
+from app.services.entitlement_cache import invalidate_user_entitlements
 import uuid
 from datetime import datetime, timezone
 
@@ -49,6 +50,7 @@ async def buy_credits(
     # Add credits to user
     current_user.credits = (current_user.credits or 0) + request.credits
     db.commit()
+    invalidate_user_entitlements(current_user.id)
     db.refresh(current_user)
     
     return BuyCreditsResponse(
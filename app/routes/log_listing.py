@@ -0,0 +1,99 @@
+"""
+Query parameters and responses shared by the access-log listings
+(/api/admin/scan-logs, /api/access_logs). Not a router.
+
+format=json returns one page as a JSON list; the next page's cursor is sent in
+the X-Next-Cursor header (and a Link rel="next"), so the body stays the plain
+list existing clients expect. format=ndjson|csv streams every matching row.
+"""
+from __future__ import annotations
+
+from datetime import datetime, timezone
+from typing import Any, Callable, Literal, Optional
+
+from fastapi import HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import Session
+
+from app.database import SessionLocal
+from app.services.access_log_query import (
+    AccessLogFilters,
+    Cursor,
+    csv_lines,
+    decode_cursor,
+    fetch_page,
+    iter_rows,
+    ndjson_lines,
+)
+
+ListingFormat = Literal["json", "ndjson", "csv"]
+
+
+def _aware(value: Optional[datetime]) -> Optional[datetime]:
+    if value is not None and value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value
+
+
+def access_log_filters(
+    user_id: Optional[int] = Query(None),
+    scanner_id: Optional[str] = Query(None),
+    direction: Optional[Literal["in", "out"]] = Query(None),
+    status: Optional[str] = Query(None, description="allow / deny"),
+    since: Optional[datetime] = Query(None, description="created_at >= since (ISO 8601, UTC if naive)"),
+    until: Optional[datetime] = Query(None, description="created_at < until"),
+) -> AccessLogFilters:
+    return AccessLogFilters(
+        user_id=user_id,
+        scanner_id=scanner_id,
+        direction=direction,
+        status=status,
+        since=_aware(since),
+        until=_aware(until),
+    )
+
+
+def parse_cursor(cursor: Optional[str]) -> Optional[Cursor]:
+    if not cursor:
+        return None
+    try:
+        return decode_cursor(cursor)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def listing_response(
+    *,
+    request: Request,
+    response: Response,
+    db: Session,
+    filters: AccessLogFilters,
+    cursor: Optional[str],
+    limit: Optional[int],
+    page_size: int,
+    output: ListingFormat,
+    serialize: Callable[[Any], dict[str, Any]],
+    columns: list[str],
+    filename: str,
+):
+    after = parse_cursor(cursor)
+    if output == "json":
+        rows, next_cursor = fetch_page(db, filters, limit=limit or page_size, after=after)
+        if next_cursor:
+            response.headers["X-Next-Cursor"] = next_cursor
+            next_url = request.url.include_query_params(cursor=next_cursor)
+            response.headers["Link"] = f'<{next_url}>; rel="next"'
+        return [serialize(row) for row in rows]
+
+    records = (serialize(row) for row in iter_rows(SessionLocal, filters, after=after, max_rows=limit))
+    if output == "ndjson":
+        return StreamingResponse(
+            ndjson_lines(records),
+            media_type="application/x-ndjson",
+            headers={"Content-Disposition": f'attachment; filename="{filename}.ndjson"'},
+        )
+    return StreamingResponse(
+        csv_lines(records, columns),
+        media_type="text/csv; charset=utf-8",
+        headers={"Content-Disposition": f'attachment; filename="{filename}.csv"'},
+    )
@@ -0,0 +1,66 @@
+import os
+from datetime import date, datetime, time, timezone
+
+from fastapi import APIRouter, HTTPException, Query, Response
+from fastapi.responses import StreamingResponse
+
+from app.services.occupancy import OccupancyBusy, occupancy, occupancy_event_stream
+from app.services.occupancy_forecast import forecast_profiles
+from app.services.timezone import get_gym_timezone
+
+router = APIRouter()
+
+# Lobby screens: head count only, no names. Set OCCUPANCY_PUBLIC=false to hide it.
+OCCUPANCY_PUBLIC = os.getenv("OCCUPANCY_PUBLIC", "true").strip().lower() in {"1", "true", "yes", "on"}
+
+
+def occupancy_stream_response(*, detail: bool) -> StreamingResponse:
+    """Server-Sent Events response fed from the in-memory occupancy tracker."""
+    try:
+        frames = occupancy_event_stream(detail=detail)
+    except OccupancyBusy:
+        raise HTTPException(status_code=503, detail="Too many live occupancy streams", headers={"Retry-After": "30"})
+    return StreamingResponse(
+        frames,
+        media_type="text/event-stream",
+        # X-Accel-Buffering: nginx/Traefik must not buffer the stream
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def _require_public() -> None:
+    if not OCCUPANCY_PUBLIC:
+        raise HTTPException(status_code=404, detail="Not found")
+
+
+@router.get("/occupancy")
+async def current_occupancy():
+    """Current head count (served from memory)."""
+    _require_public()
+    return occupancy.snapshot(detail=False)
+
+
+@router.get("/occupancy/stream")
+async def occupancy_stream():
+    """
+    Live head count as Server-Sent Events: a "count" event on connect and after
+    every entry/exit, ": ping" comments in between.
+    """
+    _require_public()
+    return occupancy_stream_response(detail=False)
+
+
+@router.get("/occupancy/forecast")
+async def occupancy_forecast(
+    response: Response,
+    day: date | None = Query(None, description="local day, default today"),
+    at: time | None = Query(None, description="HH:MM, adds that 15-minute slot as `at`"),
+):
+    """Expected head count per 15 minutes for the day's weekday (served from memory), plus the current count."""
+    _require_public()
+    day = day or datetime.now(timezone.utc).astimezone(get_gym_timezone()).date()
+    payload = forecast_profiles.forecast(day, at=at)
+    payload["current"] = occupancy.count
+    # profiles change once a day; the current count is only a hint here (use /occupancy/stream for live data)
+    response.headers["Cache-Control"] = "public, max-age=60"
+    return payload
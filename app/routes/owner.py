@@ -4,11 +4,13 @@ from uuid import uuid4
 from typing import Optional
 from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, status
 from fastapi.security import OAuth2PasswordRequestForm
+from sqlalchemy import update
 from sqlalchemy.orm import Session
 from pydantic import BaseModel
-from app.auth import verify_password, create_access_token, get_current_owner
+from app.auth import verify_password_and_update, create_access_token, get_current_owner, release_db_connection
 from app.database import get_db
 from app.models import User, BrandingSettings
+from app.services.principals import Principal
 from app.services.owner import ensure_branding_defaults, OWNER_ACCESS_TOKEN_EXPIRE_MINUTES
 from app.schemas.branding import BrandingResponse, BrandingUpdateRequest
 
@@ -77,8 +79,15 @@ async def owner_login(
         User.is_owner.is_(True)
     ).first()
 
-    if not owner or not verify_password(form_data.password, owner.password_hash):
+    if not owner:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid owner credentials")
+    release_db_connection(db, owner)
+    valid, new_hash = await verify_password_and_update(form_data.password, owner.password_hash)
+    if not valid:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid owner credentials")
+    if new_hash:
+        db.execute(update(User).where(User.id == owner.id).values(password_hash=new_hash))
+        db.commit()
 
     expires_minutes = OWNER_ACCESS_TOKEN_EXPIRE_MINUTES
     access_token = create_access_token({"sub": str(owner.id), "role": "owner"}, expires_minutes)
@@ -90,7 +99,7 @@ async def owner_login(
     )
 
 @router.get("/me")
-async def owner_me(current_owner: User = Depends(get_current_owner)):
+async def owner_me(current_owner: Principal = Depends(get_current_owner)):
     return {
         "id": current_owner.id,
         "email": current_owner.email,
@@ -99,14 +108,14 @@ async def owner_me(current_owner: User = Depends(get_current_owner)):
     }
 
 @router.get("/branding", response_model=BrandingResponse)
-async def get_branding(current_owner: User = Depends(get_current_owner), db: Session = Depends(get_db)):
+async def get_branding(current_owner: Principal = Depends(get_current_owner), db: Session = Depends(get_db)):
     branding = _get_branding(db)
     return _serialize_branding(branding)
 
 @router.put("/branding", response_model=BrandingResponse)
 async def update_branding(
     request: BrandingUpdateRequest,
-    current_owner: User = Depends(get_current_owner),
+    current_owner: Principal = Depends(get_current_owner),
     db: Session = Depends(get_db)
 ):
     branding = _get_branding(db)
@@ -133,7 +142,7 @@ async def update_branding(
 @router.post("/logo-upload", response_model=BrandingResponse)
 async def upload_logo(
     file: UploadFile = File(...),
-    current_owner: User = Depends(get_current_owner),
+    current_owner: Principal = Depends(get_current_owner),
     db: Session = Depends(get_db),
 ):
     if file.content_type not in ALLOWED_CONTENT_TYPES:
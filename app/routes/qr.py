@@ -1,19 +1,31 @@
-from fastapi import APIRouter, Depends, HTTPException
+from typing import Optional
+from urllib.parse import quote, urlencode
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
 from fastapi.responses import Response
 from sqlalchemy.orm import Session
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from app.database import get_db
 from app.models import Payment, AccessToken
-import qrcode
-import io
 from datetime import datetime, timedelta, timezone
+from app.services.qr_render import (
+    QR_IMAGE_MAX_AGE_SECONDS,
+    QRFormat,
+    QRSpec,
+    negotiate_format,
+    qr_cache,
+    render_qr,
+)
 from app.services.token_service import generate_unique_token
+from app.services.utils import etag_matches
 
 router = APIRouter()
 
 class QRRequest(BaseModel):
     payment_id: str
     expires_in_days: int = 1  # Default 1 day, can be customized
+    format: QRFormat = "png"
+    scale: int = Field(10, ge=1, le=40)
 
 class QRResponse(BaseModel):
     token: str
@@ -60,20 +72,7 @@ async def generate_qr(
     db.add(access_token)
     db.commit()
     
-    # Generate QR code
-    qr = qrcode.QRCode(version=1, box_size=10, border=5)
-    qr.add_data(token_str)
-    qr.make(fit=True)
-    
-    img = qr.make_image(fill_color="black", back_color="white")
-    img_buffer = io.BytesIO()
-    img.save(img_buffer, format="PNG")
-    img_buffer.seek(0)
-    
-    # Convert to data URL for frontend display
-    import base64
-    img_base64 = base64.b64encode(img_buffer.getvalue()).decode()
-    qr_code_url = f"data:image/png;base64,{img_base64}"
+    qr_code_url = render_qr(token_str, format=qr_request.format, scale=qr_request.scale).data_url()
     
     return QRResponse(
         token=token_str,
@@ -81,16 +80,44 @@ async def generate_qr(
         expires_at=expires_at.isoformat()
     )
 
+def qr_image_url_prefix(request: Request) -> str:
+    """
+    Path of /api/qr_image/, relative to the API base: the frontend prefixes its
+    NEXT_PUBLIC_API_URL. An absolute URL built from the request would say http://
+    behind the TLS-terminating proxy and be blocked as mixed content.
+    """
+    return request.app.url_path_for("get_qr_image", token="_")[:-1]
+
+
+def qr_image_url(request: Request, token: str, *, format: Optional[QRFormat] = None, scale: Optional[int] = None) -> str:
+    """Without format the image endpoint picks one from the Accept header of whoever loads it."""
+    params = {key: value for key, value in (("format", format), ("scale", scale)) if value is not None}
+    query = f"?{urlencode(params)}" if params else ""
+    return f"{qr_image_url_prefix(request)}{quote(token, safe='')}{query}"
+
+
 @router.get("/qr_image/{token}")
-async def get_qr_image(token: str):
-    """Get QR code as PNG image"""
-    qr = qrcode.QRCode(version=1, box_size=10, border=5)
-    qr.add_data(token)
-    qr.make(fit=True)
-    
-    img = qr.make_image(fill_color="black", back_color="white")
-    img_buffer = io.BytesIO()
-    img.save(img_buffer, format="PNG")
-    img_buffer.seek(0)
-    
-    return Response(content=img_buffer.getvalue(), media_type="image/png")
+def get_qr_image(
+    token: str,
+    request: Request,
+    format: Optional[QRFormat] = Query(None, description="svg / png1bit / png; default negotiated from Accept"),
+    scale: int = Query(10, ge=1, le=40, description="pixels per module"),
+    border: int = Query(5, ge=0, le=20),
+):
+    """
+    QR code as an image. The bytes depend only on the URL (and Accept when no format
+    is given), so responses carry a strong ETag and may be cached by the browser;
+    revalidation returns 304.
+    """
+    spec = QRSpec(token=token, scale=scale, border=border, format=format or negotiate_format(request.headers.get("accept"), scale))
+    headers = {
+        "ETag": spec.etag,
+        # private: the URL carries an access token, keep it out of shared caches
+        "Cache-Control": f"private, max-age={QR_IMAGE_MAX_AGE_SECONDS}, immutable",
+    }
+    if format is None:
+        headers["Vary"] = "Accept"
+    if etag_matches(request.headers.get("if-none-match"), spec.etag):
+        return Response(status_code=304, headers=headers)
+    rendered = qr_cache.render(spec)
+    return Response(content=rendered.content, media_type=rendered.media_type, headers=headers)
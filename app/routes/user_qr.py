@@ -1,16 +1,17 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
 from fastapi.responses import Response
 from sqlalchemy.orm import Session
 from pydantic import BaseModel
 from app.database import get_db
 from app.models import AccessToken, User
-from app.auth import get_current_user
-import qrcode
-import io
-from datetime import datetime, timedelta, timezone
+from app.auth import TokenClaims, get_current_user, get_token_claims
+from app.routes.qr import qr_image_url
+from typing import Any
+from app.services.entitlement_cache import invalidate_user_entitlements
 from app.services.token_service import generate_unique_token
-from app.services.membership import MembershipService, serialize_membership_for_response
-from app.services.presence_sessions import PresenceSessionService, serialize_presence_session
+from app.services.dashboard import SECTIONS as DASHBOARD_SECTIONS, combined_etag, load_dashboard, section_etag
+from app.services.qr_render import QRFormat
+from app.services.utils import etag_matches, if_none_match_tags
 
 router = APIRouter()
 
@@ -64,68 +65,82 @@ class PersonalQRResponse(BaseModel):
     presence_sessions: list[dict] | None = None
 
 
-def _build_membership_context(db: Session, user_id: int):
-    membership_service = MembershipService(db)
-    now_ts = datetime.now(timezone.utc)
-    active_membership = membership_service.get_active_membership(user_id, now_ts)
-    membership_payload = serialize_membership_for_response(active_membership)
-    membership_summary = None
-    if membership_payload:
-        membership_summary = MembershipSummary(
-            has_membership=membership_payload.get("has_membership", False),
-            package_name=membership_payload.get("package_name"),
-            package_type=membership_payload.get("package_type"),
-            valid_from=membership_payload.get("valid_from"),
-            valid_to=membership_payload.get("valid_to"),
-            status=membership_payload.get("status"),
-            reason=membership_payload.get("reason"),
-            message=membership_payload.get("message"),
-        )
+class MyTokenResponse(BaseModel):
+    token: str
+    qr_code_url: str
+    etag: str
+
+
+class DashboardSection(BaseModel):
+    etag: str
+    not_modified: bool = False
+    data: Any = None
+
 
-    membership_list: list[MembershipDetail] = []
-    for membership in membership_service.list_user_memberships(user_id):
-        payload = serialize_membership_for_response(membership)
-        membership_list.append(
-            MembershipDetail(
-                membership_id=membership.id,
-                package_name=payload.get("package_name") or membership.package_name_cache,
-                package_type=payload.get("package_type") or membership.package.package_type if membership.package else None,
-                membership_type=membership.membership_type,
-                status=payload.get("status") or membership.status,
-                valid_from=payload.get("valid_from"),
-                valid_to=payload.get("valid_to"),
-                daily_limit=payload.get("daily_limit"),
-                daily_usage_count=payload.get("daily_usage_count"),
-                sessions_total=payload.get("sessions_total"),
-                sessions_used=payload.get("sessions_used"),
-                message=payload.get("message"),
-            )
-        )
+class DashboardResponse(BaseModel):
+    etag: str
+    sections: dict[str, DashboardSection]
+
+
+def _personal_qr_response(db: Session, user: User, token_str: str, qr_code_url: str) -> PersonalQRResponse:
+    sections = {name: section.data for name, section in load_dashboard(db, user).items()}
+    return PersonalQRResponse(
+        token=token_str,
+        qr_code_url=qr_code_url,
+        **sections["profile"],
+        membership=sections["membership"],
+        memberships=sections["memberships"],
+        packages=sections["packages"],
+        presence_sessions=sections["presence_sessions"],
+    )
+
+
+def _get_or_create_active_token(db: Session, user_id: int) -> AccessToken:
+    # Find the most recent active token for this user
+    active_token = db.query(AccessToken).filter(
+        AccessToken.user_id == user_id,
+        AccessToken.is_active == True
+    ).order_by(AccessToken.created_at.desc()).first()
+    if active_token:
+        return active_token
+    # callers authenticated by JWT claims alone may hold a token of a deleted account
+    if db.get(User, user_id) is None:
+        raise HTTPException(status_code=404, detail="User not found")
+
+    # If no active token exists, create a new one
+    token_str = generate_unique_token(db)
+    access_token = AccessToken(
+        token=token_str,
+        user_id=user_id,
+        payment_id=None,
+        expires_at=None,  # No expiration in credit system
+        is_active=True,
+        scan_count=0
+    )
+    db.add(access_token)
+    try:
+        db.commit()
+        db.refresh(access_token)
+    except Exception as e:
+        db.rollback()
+        # If payment_id is NOT NULL, try to fix the database
+        if "NOT NULL constraint failed: access_tokens.payment_id" in str(e):
+            from app.database import ensure_access_token_nullable_columns
+            ensure_access_token_nullable_columns()
+            # Try again
+            db.add(access_token)
+            db.commit()
+            db.refresh(access_token)
+        else:
+            raise
+    return access_token
 
-    packages = []
-    for pkg in membership_service.list_packages(include_inactive=False):
-        packages.append(
-            PublicPackage(
-                id=pkg.id,
-                name=pkg.name,
-                slug=pkg.slug,
-                description=pkg.description,
-                price_czk=pkg.price_czk,
-                duration_days=pkg.duration_days,
-                daily_entry_limit=pkg.daily_entry_limit,
-                session_limit=pkg.session_limit,
-                package_type=pkg.package_type,
-            )
-        )
-    return membership_summary, membership_list, packages
-def _list_presence_sessions(db: Session, user_id: int, limit: int = 20):
-    service = PresenceSessionService(db)
-    sessions = service.list_sessions(user_id=user_id, limit=limit)
-    user = db.query(User).filter(User.id == user_id).first()
-    return [serialize_presence_session(session, user) for session in sessions]
 
 @router.get("/my_qr", response_model=PersonalQRResponse)
 async def get_my_qr(
+    request: Request,
+    format: QRFormat | None = Query(None, description="pin the image format; default negotiated by /api/qr_image"),
+    scale: int | None = Query(None, ge=1, le=40),
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
@@ -133,75 +148,76 @@ async def get_my_qr(
     Get or generate personal QR code for the authenticated user.
     Credit system: 1 credit = 1 workout, no expiration.
     """
-    # Find the most recent active token for this user
-    active_token = db.query(AccessToken).filter(
-        AccessToken.user_id == current_user.id,
-        AccessToken.is_active == True
-    ).order_by(AccessToken.created_at.desc()).first()
-    
-    # If no active token exists, create a new one
-    if not active_token:
-        token_str = generate_unique_token(db)
-        
-        access_token = AccessToken(
-            token=token_str,
-            user_id=current_user.id,
-            payment_id=None,
-            expires_at=None,  # No expiration in credit system
-            is_active=True,
-            scan_count=0
-        )
-        db.add(access_token)
-        try:
-            db.commit()
-            db.refresh(access_token)
-            active_token = access_token
-        except Exception as e:
-            db.rollback()
-            # If payment_id is NOT NULL, try to fix the database
-            if "NOT NULL constraint failed: access_tokens.payment_id" in str(e):
-                from app.database import ensure_access_token_nullable_columns
-                ensure_access_token_nullable_columns()
-                # Try again
-                db.add(access_token)
-                db.commit()
-                db.refresh(access_token)
-                active_token = access_token
-            else:
-                raise
-    
-    # Generate QR code
-    qr = qrcode.QRCode(version=1, box_size=10, border=5)
-    qr.add_data(active_token.token)
-    qr.make(fit=True)
-    
-    img = qr.make_image(fill_color="black", back_color="white")
-    img_buffer = io.BytesIO()
-    img.save(img_buffer, format="PNG")
-    img_buffer.seek(0)
-    
-    # Convert to data URL for frontend display
-    import base64
-    img_base64 = base64.b64encode(img_buffer.getvalue()).decode()
-    qr_code_url = f"data:image/png;base64,{img_base64}"
-    
-    membership_summary, membership_list, packages = _build_membership_context(db, current_user.id)
-    presence_sessions = _list_presence_sessions(db, current_user.id, limit=50)
+    active_token = _get_or_create_active_token(db, current_user.id)
+    # Image is served (and browser-cached) by /api/qr_image; no per-request render here
+    qr_code_url = qr_image_url(request, active_token.token, format=format, scale=scale)
+    return _personal_qr_response(db, current_user, active_token.token, qr_code_url)
 
-    return PersonalQRResponse(
-        token=active_token.token,
-        qr_code_url=qr_code_url,
-        user_name=current_user.name,
-        user_email=current_user.email,
-        credits=current_user.credits or 0,
-        membership=membership_summary,
-        packages=packages,
-        memberships=membership_list,
-        presence_sessions=presence_sessions,
+
+@router.get("/my_qr/token", response_model=MyTokenResponse)
+async def get_my_token(
+    request: Request,
+    response: Response,
+    format: QRFormat | None = Query(None, description="pin the image format; default negotiated by /api/qr_image"),
+    scale: int | None = Query(None, ge=1, le=40),
+    claims: TokenClaims = Depends(get_token_claims),
+    db: Session = Depends(get_db)
+):
+    """Only the active token and its image URL; cheap enough to poll, 304 while unchanged (JWT claims only)."""
+    active_token = _get_or_create_active_token(db, claims.user_id)
+    qr_code_url = qr_image_url(request, active_token.token, format=format, scale=scale)
+    etag = section_etag("token", [active_token.token, qr_code_url])
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return MyTokenResponse(token=active_token.token, qr_code_url=qr_code_url, etag=etag)
+
+
+@router.get("/dashboard", response_model=DashboardResponse)
+async def get_dashboard(
+    request: Request,
+    response: Response,
+    sections: str | None = Query(None, description=f"comma separated subset of: {', '.join(DASHBOARD_SECTIONS)}"),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Dashboard data in independently cacheable sections. Send the section ETags you
+    hold in If-None-Match: matching sections come back as not_modified without data,
+    and if all of them match the response is a 304.
+    """
+    wanted = DASHBOARD_SECTIONS
+    if sections:
+        wanted = tuple(name.strip() for name in sections.split(",") if name.strip())
+        unknown = sorted(set(wanted) - set(DASHBOARD_SECTIONS))
+        if unknown:
+            raise HTTPException(status_code=422, detail=f"Unknown sections: {', '.join(unknown)}")
+
+    loaded = load_dashboard(db, current_user, wanted)
+    etag = combined_etag(loaded.values())
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    known = if_none_match_tags(request.headers.get("if-none-match"))
+    if etag in known or (loaded and all(section.etag in known for section in loaded.values())):
+        return Response(status_code=304, headers=headers)
+
+    response.headers.update(headers)
+    return DashboardResponse(
+        etag=etag,
+        sections={
+            name: DashboardSection(etag=section.etag, not_modified=True)
+            if section.etag in known
+            else DashboardSection(etag=section.etag, data=section.data)
+            for name, section in loaded.items()
+        },
     )
 
+
 @router.post("/regenerate_qr", response_model=PersonalQRResponse)
 async def regenerate_qr(
+    request: Request,
+    format: QRFormat | None = Query(None, description="pin the image format; default negotiated by /api/qr_image"),
+    scale: int | None = Query(None, ge=1, le=40),
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
@@ -229,34 +245,9 @@ async def regenerate_qr(
     )
     db.add(access_token)
     db.commit()
+    invalidate_user_entitlements(current_user.id)
     db.refresh(access_token)
     
-    # Generate QR code
-    qr = qrcode.QRCode(version=1, box_size=10, border=5)
-    qr.add_data(token_str)
-    qr.make(fit=True)
-    
-    img = qr.make_image(fill_color="black", back_color="white")
-    img_buffer = io.BytesIO()
-    img.save(img_buffer, format="PNG")
-    img_buffer.seek(0)
-    
-    # Convert to data URL
-    import base64
-    img_base64 = base64.b64encode(img_buffer.getvalue()).decode()
-    qr_code_url = f"data:image/png;base64,{img_base64}"
-    
-    membership_summary, membership_list, packages = _build_membership_context(db, current_user.id)
-    presence_sessions = _list_presence_sessions(db, current_user.id, limit=50)
+    qr_code_url = qr_image_url(request, token_str, format=format, scale=scale)
     
-    return PersonalQRResponse(
-        token=token_str,
-        qr_code_url=qr_code_url,
-        user_name=current_user.name,
-        user_email=current_user.email,
-        credits=current_user.credits or 0,
-        membership=membership_summary,
-        packages=packages,
-        memberships=membership_list,
-        presence_sessions=presence_sessions,
-    )
+    return _personal_qr_response(db, current_user, token_str, qr_code_url)
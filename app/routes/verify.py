@@ -1,17 +1,31 @@
-from fastapi import APIRouter, Depends, HTTPException, Request, status as http_status
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status as http_status
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from sqlalchemy import and_
 from pydantic import BaseModel
-from app.database import get_db
-from app.models import AccessToken, AccessLog, User
+from app.database import get_async_db, get_db
+from app.models import AccessLog, PresenceSession
 from app.services.membership import MembershipService, serialize_membership_for_response
 from app.services.presence_sessions import PresenceSessionService
-from app.services.presence import set_presence
+from app.services.presence import set_presence_for_user_id
+from app.services.principals import Principal
+from app.services.visit_rollups import request_visit_rollup
+from app.services.occupancy import Occupant, occupancy
+from app.services.rate_limit import get_verify_rate_limiter, rate_limit_headers
+from app.routes.admin import require_admin
+from app.routes.log_listing import ListingFormat, access_log_filters, listing_response
+from app.services.access_log_query import AccessLogFilters
+from app.services.access_log_writer import get_access_log_writer
+from app.services.entitlement_cache import get_verification_context, invalidate_user_entitlements, store_granted_scan
+from app.services.verification import VerificationContext, persist_membership_usage, record_granted_scan
+from app.services.api_keys import verify_api_key_async
+from app.services.scanner_metrics import ScannerIdentity, scanner_metrics
+from app.metrics import verify_outcomes
 from datetime import datetime, timezone, timedelta
+from typing import Awaitable
+import hmac
 import logging
 import os
 import time
-from collections import deque
 
 logger = logging.getLogger(__name__)
 
@@ -19,9 +33,6 @@ router = APIRouter()
 
 # Cooldown duration in seconds
 COOLDOWN_SECONDS = 60
-RATE_LIMIT_PER_MINUTE = int(os.getenv("VERIFY_RATE_LIMIT_PER_MINUTE", "120"))
-_rate_limit_window_seconds = 60
-_rate_limit_buckets: dict[str, deque[float]] = {}
 
 
 def _get_api_verify_key() -> str | None:
@@ -29,42 +40,115 @@ def _get_api_verify_key() -> str | None:
     return os.getenv("API_VERIFY_KEY") or os.getenv("TURNSTILE_API_KEY")
 
 
-def _enforce_rate_limit(key: str):
-    """Simple sliding window rate limit per API key."""
-    if RATE_LIMIT_PER_MINUTE <= 0:
+# scanner_daemon sends X-TURNSTILE-API-KEY; integrations use X-API-KEY
+API_KEY_HEADERS = ("X-API-KEY", "X-TURNSTILE-API-KEY")
+
+
+def _provided_api_key(request: Request) -> str | None:
+    for header in API_KEY_HEADERS:
+        value = (request.headers.get(header) or "").strip()
+        if value:
+            return value
+    return None
+
+
+def _scanner_id(request: Request) -> str | None:
+    value = (request.headers.get("X-Scanner-Id") or "").strip()
+    return value[:100] or None
+
+
+async def _enforce_rate_limit(
+    request: Request,
+    response: Response,
+    scanner: ScannerIdentity,
+    *,
+    api_key_bucket: str,
+    key_limit: int | None = None,
+) -> None:
+    """Per API key, scanner and client IP budgets; sets RateLimit-* headers."""
+    limiter = await get_verify_rate_limiter()
+    limits = {"api_key": key_limit} if key_limit is not None else None
+    if not limiter.enabled and limits is None:
         return
-    now = time.time()
-    bucket = _rate_limit_buckets.setdefault(key, deque())
-    window_start = now - _rate_limit_window_seconds
-    while bucket and bucket[0] < window_start:
-        bucket.popleft()
-    if len(bucket) >= RATE_LIMIT_PER_MINUTE:
+    decision = await limiter.check(
+        # narrowest first: a scanner over its own budget never charges the shared IP bucket
+        {
+            "scanner": scanner.label if scanner.scanner_id else None,
+            "api_key": api_key_bucket,
+            "ip": request.client.host if request.client else None,
+        },
+        limits=limits,
+    )
+    if decision is None:
+        return
+    headers = rate_limit_headers(decision)
+    if not decision.allowed:
+        _record_outcome(scanner, "rate_limited", f"rate_limit_{decision.rule.scope}")
         raise HTTPException(
             status_code=http_status.HTTP_429_TOO_MANY_REQUESTS,
             detail="Rate limit exceeded",
+            headers=headers,
         )
-    bucket.append(now)
+    response.headers.update(headers)
 
 
-def _require_api_key(request: Request):
-    """Require global API key for /api/verify (protects PIN/QR endpoint)."""
+async def _require_api_key(request: Request, response: Response, db: AsyncSession) -> ScannerIdentity:
+    """
+    Authenticate a scanner: the shared env key (API_VERIFY_KEY) or an active key from
+    the api_keys table. Returns the device identity used for rate limits and metrics.
+    """
+    provided = _provided_api_key(request)
+    if not provided:
+        raise HTTPException(status_code=http_status.HTTP_401_UNAUTHORIZED, detail="Unauthorized")
+
     expected = _get_api_verify_key()
-    provided = request.headers.get("X-API-KEY")
-    if not expected:
-        raise HTTPException(
-            status_code=http_status.HTTP_503_SERVICE_UNAVAILABLE,
-            detail="API key not configured",
-        )
-    if provided != expected:
-        raise HTTPException(
-            status_code=http_status.HTTP_401_UNAUTHORIZED,
-            detail="Unauthorized",
-        )
-    _enforce_rate_limit(provided)
+    if expected and hmac.compare_digest(provided.encode(), expected.encode()):
+        scanner = ScannerIdentity(api_key_id=None, api_key_name=None, scanner_id=_scanner_id(request))
+        await _enforce_rate_limit(request, response, scanner, api_key_bucket=provided)
+        return scanner
+
+    record = await verify_api_key_async(db, provided)
+    if record is None:
+        raise HTTPException(status_code=http_status.HTTP_401_UNAUTHORIZED, detail="Unauthorized")
+    scanner = ScannerIdentity(
+        api_key_id=record.id,
+        api_key_name=record.name,
+        scanner_id=record.scanner_id or _scanner_id(request),
+    )
+    await _enforce_rate_limit(
+        request,
+        response,
+        scanner,
+        api_key_bucket=f"id:{record.id}",
+        key_limit=record.rate_limit_per_minute,
+    )
+    return scanner
 
 
-def log_access(
-    db: Session,
+def _record_outcome(scanner: ScannerIdentity, outcome: str, reason: str | None, started: float | None = None) -> None:
+    """Per-device scanner metrics plus the process-wide verify outcome counter."""
+    latency_ms = (time.perf_counter() - started) * 1000 if started is not None else 0.0
+    scanner_metrics.record(scanner, outcome, reason=reason, latency_ms=latency_ms)
+    verify_outcomes.inc((outcome, reason or "none"))
+
+
+async def _tracked(scanner: ScannerIdentity, call: Awaitable):
+    """Await a verify handler and record its outcome and latency against the device."""
+    started = time.perf_counter()
+    try:
+        result = await call
+    except HTTPException as exc:
+        _record_outcome(scanner, "error", f"http_{exc.status_code}", started)
+        raise
+    except Exception:
+        _record_outcome(scanner, "error", "exception", started)
+        raise
+    _record_outcome(scanner, "allowed" if result.allowed else "denied", result.reason, started)
+    return result
+
+
+async def log_access(
+    db: AsyncSession,
     *,
     token_id: int | None,
     token_string: str,
@@ -78,7 +162,29 @@ def log_access(
     commit: bool = True,
     metadata: dict | None = None,
 ):
-    """Persist access log entry with optional commit control."""
+    """
+    Persist access log entry with optional commit control.
+    Standalone entries (commit=True, e.g. denied scans) go through the batched
+    background writer when it is running; commit=False keeps the row in the
+    caller's transaction.
+    """
+    writer = get_access_log_writer() if commit else None
+    if writer is not None:
+        writer.enqueue(
+            {
+                "token_id": token_id,
+                "token_string": token_string,
+                "status": status,
+                "reason": reason,
+                "ip_address": ip_address,
+                "user_agent": user_agent,
+                "direction": direction,
+                "scanner_id": scanner_id,
+                "raw_data": raw_data,
+                "metadata": metadata,
+            }
+        )
+        return
     try:
         access_log = AccessLog(
             token_id=token_id,
@@ -94,10 +200,10 @@ def log_access(
         )
         db.add(access_log)
         if commit:
-            db.commit()
+            await db.commit()
     except Exception as e:
         logger.error(f"Error logging access attempt: {e}", exc_info=True)
-        db.rollback()
+        await db.rollback()
 
 class VerifyRequest(BaseModel):
     token: str
@@ -157,7 +263,7 @@ class MembershipCheckResponse(BaseModel):
 async def process_verification(
     token_str: str,
     request: Request,
-    db: Session,
+    db: AsyncSession,
     *,
     direction: str = "in",
     scanner_id: str | None = None,
@@ -166,14 +272,18 @@ async def process_verification(
     """
     Shared verification logic for web scanner and turnstile scanner.
     direction/scanner_id/raw_data are used for richer logging.
+    Token, user, cooldown and active membership are resolved in a single query
+    (see app.services.verification), served from the entitlement cache on repeat
+    scans; a granted scan then issues one UPDATE + INSERT.
     """
     client_ip = request.client.host if request.client else None
     user_agent = request.headers.get("user-agent", None)
 
     try:
-        token = db.query(AccessToken).filter(AccessToken.token == token_str).first()
-        if not token:
-            log_access(
+        now_ts = datetime.now(timezone.utc)
+        ctx = await get_verification_context(db, token_str, now_ts)
+        if ctx is None:
+            await log_access(
                 db,
                 token_id=None,
                 token_string=token_str,
@@ -192,10 +302,10 @@ async def process_verification(
                 cooldown_seconds_left=None,
             )
 
-        if not token.is_active:
-            log_access(
+        if not ctx.token_is_active:
+            await log_access(
                 db,
-                token_id=token.id,
+                token_id=ctx.token_id,
                 token_string=token_str,
                 status="deny",
                 reason="Token deactivated",
@@ -212,9 +322,8 @@ async def process_verification(
                 cooldown_seconds_left=None,
             )
 
-        user = db.query(User).filter(User.id == token.user_id).first()
-        if not user:
-            log_access(
+        if not ctx.user_found:
+            await log_access(
                 db,
                 token_id=None,
                 token_string=token_str,
@@ -233,53 +342,29 @@ async def process_verification(
                 cooldown_seconds_left=None,
             )
 
-        user_active_tokens = (
-            db.query(AccessToken)
-            .filter(
-                and_(
-                    AccessToken.user_id == user.id,
-                    AccessToken.is_active == True,
-                    AccessToken.last_scan_at.isnot(None),
-                )
+        cooldown_seconds_left = ctx.cooldown_seconds_left(datetime.now(timezone.utc), COOLDOWN_SECONDS)
+        if cooldown_seconds_left is not None:
+            await log_access(
+                db,
+                token_id=ctx.token_id,
+                token_string=token_str,
+                status="deny",
+                reason=f"Cooldown active ({cooldown_seconds_left}s remaining)",
+                ip_address=client_ip,
+                user_agent=user_agent,
+                direction=direction,
+                scanner_id=scanner_id,
+                raw_data=raw_data,
+            )
+            return VerifyResponse(
+                allowed=False,
+                reason="cooldown",
+                credits_left=ctx.user_credits or 0,
+                cooldown_seconds_left=cooldown_seconds_left,
             )
-            .order_by(AccessToken.last_scan_at.desc())
-            .first()
-        )
-
-        cooldown_seconds_left = None
-        if user_active_tokens and user_active_tokens.last_scan_at:
-            last_scan_time = user_active_tokens.last_scan_at
-            if last_scan_time.tzinfo is None:
-                last_scan_time = last_scan_time.replace(tzinfo=timezone.utc)
-
-            now = datetime.now(timezone.utc)
-            time_since_last_scan = now - last_scan_time
-            if time_since_last_scan.total_seconds() < COOLDOWN_SECONDS:
-                cooldown_seconds_left = int(
-                    COOLDOWN_SECONDS - time_since_last_scan.total_seconds()
-                )
-                log_access(
-                    db,
-                    token_id=token.id,
-                    token_string=token_str,
-                    status="deny",
-                    reason=f"Cooldown active ({cooldown_seconds_left}s remaining)",
-                    ip_address=client_ip,
-                    user_agent=user_agent,
-                    direction=direction,
-                    scanner_id=scanner_id,
-                    raw_data=raw_data,
-                )
-                return VerifyResponse(
-                    allowed=False,
-                    reason="cooldown",
-                    credits_left=user.credits or 0,
-                    cooldown_seconds_left=cooldown_seconds_left,
-                )
 
         membership_service = MembershipService(db)
-        now_ts = datetime.now(timezone.utc)
-        membership = membership_service.get_active_membership(user.id, now_ts)
+        membership = ctx.membership
         membership_metadata = {"membership_id": membership.id, "package_id": membership.package_id} if membership else None
         membership_payload = None
         access_via_membership = False
@@ -292,9 +377,9 @@ async def process_verification(
                 daily_limit_hit=verdict.daily_limit_hit,
             )
             if not verdict.allowed:
-                log_access(
+                await log_access(
                     db,
-                    token_id=token.id,
+                    token_id=ctx.token_id,
                     token_string=token_str,
                     status="deny",
                     reason=f"Membership denied ({verdict.reason})",
@@ -308,10 +393,10 @@ async def process_verification(
                 return VerifyResponse(
                     allowed=False,
                     reason=verdict.reason or "membership_denied",
-                    credits_left=user.credits or 0,
+                    credits_left=ctx.user_credits or 0,
                     cooldown_seconds_left=None,
-                    user_name=user.name,
-                    user_email=user.email,
+                    user_name=ctx.user_name,
+                    user_email=ctx.user_email,
                     message=membership_payload.get("message") if membership_payload else None,
                     membership=membership_payload,
                 )
@@ -321,10 +406,10 @@ async def process_verification(
 
         if not access_via_membership:
             # Kreditová logika: pouze kontrola, bez odečtu
-            if user.credits is None or user.credits <= 0:
-                log_access(
+            if ctx.user_credits is None or ctx.user_credits <= 0:
+                await log_access(
                     db,
-                    token_id=token.id,
+                    token_id=ctx.token_id,
                     token_string=token_str,
                     status="deny",
                     reason="No credits available",
@@ -338,27 +423,42 @@ async def process_verification(
                 return VerifyResponse(
                     allowed=False,
                     reason="no_credits",
-                    credits_left=user.credits or 0,
+                    credits_left=ctx.user_credits or 0,
                     cooldown_seconds_left=None,
                     message=membership_payload.get("message") if membership_payload else None,
                     membership=membership_payload,
                 )
 
         try:
-            credits_after = user.credits or 0
+            credits_after = ctx.user_credits or 0
 
             now = datetime.now(timezone.utc)
-            token.used_at = now
-            token.scan_count = (token.scan_count or 0) + 1
-            token.last_scan_at = now
-
-            db.query(AccessToken).filter(
-                and_(AccessToken.user_id == user.id, AccessToken.is_active == True)
-            ).update({"last_scan_at": now}, synchronize_session=False)
+            if not await record_granted_scan(db, ctx, now, cooldown_seconds=COOLDOWN_SECONDS):
+                # another worker granted a scan of this user after ctx was read (or cached)
+                fresh = await _reload_after_conflict(db, token_str, ctx.user_id, now)
+                cooldown_seconds_left = (fresh.cooldown_seconds_left(now, COOLDOWN_SECONDS) if fresh else None) or 1
+                await log_access(
+                    db,
+                    token_id=ctx.token_id,
+                    token_string=token_str,
+                    status="deny",
+                    reason=f"Cooldown active ({cooldown_seconds_left}s remaining)",
+                    ip_address=client_ip,
+                    user_agent=user_agent,
+                    direction=direction,
+                    scanner_id=scanner_id,
+                    raw_data=raw_data,
+                )
+                return VerifyResponse(
+                    allowed=False,
+                    reason="cooldown",
+                    credits_left=ctx.user_credits or 0,
+                    cooldown_seconds_left=cooldown_seconds_left,
+                )
 
-            log_access(
+            await log_access(
                 db,
-                token_id=token.id,
+                token_id=ctx.token_id,
                 token_string=token_str,
                 status="allow",
                 reason="membership_ok" if access_via_membership else f"Access granted (credits remaining: {credits_after})",
@@ -371,34 +471,60 @@ async def process_verification(
                 metadata=membership_metadata,
             )
 
-            if access_via_membership and membership:
-                membership_service.record_entry_usage(membership, at_ts=now)
+            if access_via_membership and membership and not await persist_membership_usage(db, membership, now):
+                fresh = await _reload_after_conflict(db, token_str, ctx.user_id, now)
+                reason, membership_payload = _conflict_verdict(membership_service, fresh, now)
+                await log_access(
+                    db,
+                    token_id=ctx.token_id,
+                    token_string=token_str,
+                    status="deny",
+                    reason=f"Membership denied ({reason})",
+                    ip_address=client_ip,
+                    user_agent=user_agent,
+                    direction=direction,
+                    scanner_id=scanner_id,
+                    raw_data=raw_data,
+                    metadata=membership_metadata,
+                )
+                return VerifyResponse(
+                    allowed=False,
+                    reason=reason,
+                    credits_left=ctx.user_credits or 0,
+                    cooldown_seconds_left=None,
+                    user_name=ctx.user_name,
+                    user_email=ctx.user_email,
+                    message=membership_payload.get("message"),
+                    membership=membership_payload,
+                )
 
-            db.commit()
+            await db.commit()
+            ctx.last_scan_at = now
+            store_granted_scan(token_str, ctx)
             return VerifyResponse(
                 allowed=True,
                 reason="ok",
                 credits_left=credits_after,
                 cooldown_seconds_left=COOLDOWN_SECONDS,
-                user_name=user.name,
-                user_email=user.email,
+                user_name=ctx.user_name,
+                user_email=ctx.user_email,
                 message=membership_payload.get("message") if membership_payload else None,
                 membership=membership_payload,
             )
 
         except Exception as e:
             logger.error(f"Error processing access grant: {e}", exc_info=True)
-            db.rollback()
+            await db.rollback()
             return VerifyResponse(
                 allowed=False,
                 reason="invalid_token",
-                credits_left=user.credits or 0,
+                credits_left=ctx.user_credits or 0,
                 cooldown_seconds_left=None,
             )
 
     except Exception as e:
         logger.error(f"Unexpected error in verify_token: {e}", exc_info=True)
-        db.rollback()
+        await db.rollback()
         raise HTTPException(
             status_code=http_status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Internal server error: {str(e)}",
@@ -409,7 +535,8 @@ async def process_verification(
 async def verify_token(
     verify_request: VerifyRequest,
     request: Request,
-    db: Session = Depends(get_db)
+    response: Response,
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Verify a QR code token for turnstile access.
@@ -417,15 +544,74 @@ async def verify_token(
     Implements 60-second cooldown on user level (all tokens of same user share cooldown).
     Logs all access attempts for audit purposes.
     """
-    _require_api_key(request)
+    scanner = await _require_api_key(request, response, db)
     token_str = verify_request.token
-    return await process_verification(token_str, request, db, direction="in")
+    return await _tracked(
+        scanner,
+        process_verification(token_str, request, db, direction="in", scanner_id=scanner.scanner_id),
+    )
 
 
-def _membership_check(
-    token_str: str,
+def _apply_presence_change(
     db: Session,
     *,
+    user_id: int,
+    token_id: int,
+    membership_id: int,
+    direction: str,
+    now_ts: datetime,
+) -> PresenceSession | None:
+    """Open/close the presence session and update the user's presence flag; returns that session."""
+    presence_service = PresenceSessionService(db)
+    active_session = presence_service.find_active_session(user_id)
+    if direction == "entry":
+        if not active_session:
+            active_session = presence_service.start_session(
+                user_id=user_id,
+                token_id=token_id,
+                membership_id=membership_id,
+                access_log=None,
+                scanned_at=now_ts,
+                metadata={"source": "api_entry"},
+            )
+        set_presence_for_user_id(db, user_id, True, now_ts)
+    elif direction == "exit":
+        if active_session:
+            presence_service.end_session(
+                session=active_session,
+                access_log=None,
+                scanned_at=now_ts,
+                status="closed",
+                notes=None,
+            )
+        set_presence_for_user_id(db, user_id, False, now_ts)
+    return active_session
+
+
+async def _reload_after_conflict(
+    db: AsyncSession, token_str: str, user_id: int, now_ts: datetime
+) -> VerificationContext | None:
+    """A guarded UPDATE saw newer state than ctx: undo the scan and read the entitlement again."""
+    await db.rollback()
+    invalidate_user_entitlements(user_id)
+    return await get_verification_context(db, token_str, now_ts)
+
+
+def _conflict_verdict(
+    membership_service: MembershipService, ctx: VerificationContext | None, now_ts: datetime
+) -> tuple[str, dict]:
+    """Deny reason + membership payload after persist_membership_usage hit a limit."""
+    membership = ctx.membership if ctx else None
+    verdict = membership_service.can_consume_entry(membership, at_ts=now_ts) if membership else None
+    reason = verdict.reason if verdict and not verdict.allowed and verdict.reason else "membership_denied"
+    payload = serialize_membership_for_response(membership, reason=reason, daily_limit_hit=reason == "daily_limit")
+    return reason, payload
+
+
+async def _membership_check(
+    token_str: str,
+    db: AsyncSession,
+    *,
     record_usage: bool,
     direction: str,
 ) -> MembershipCheckResponse:
@@ -435,15 +621,17 @@ def _membership_check(
     record_usage=False => pouze ověří.
     direction: "entry" nebo "exit" pro správu presence.
     """
-    token = db.query(AccessToken).filter(AccessToken.token == token_str.strip()).first()
-    if not token:
+    now_ts = datetime.now(timezone.utc)
+    token_str = token_str.strip()
+    ctx = await get_verification_context(db, token_str, now_ts)
+    if ctx is None:
         return MembershipCheckResponse(
             allowed=False,
             reason="token_not_found",
             membership=None,
             message=None,
         )
-    if not token.is_active:
+    if not ctx.token_is_active:
         return MembershipCheckResponse(
             allowed=False,
             reason="token_deactivated",
@@ -451,8 +639,7 @@ def _membership_check(
             message=None,
         )
 
-    user = db.query(User).filter(User.id == token.user_id).first()
-    if not user:
+    if not ctx.user_found:
         return MembershipCheckResponse(
             allowed=False,
             reason="user_not_found",
@@ -460,9 +647,8 @@ def _membership_check(
             message=None,
         )
 
-    now_ts = datetime.now(timezone.utc)
     membership_service = MembershipService(db)
-    membership = membership_service.get_active_membership(user.id, now_ts)
+    membership = ctx.membership
     if not membership:
         membership_payload = serialize_membership_for_response(None, reason="membership_missing")
         return MembershipCheckResponse(
@@ -492,41 +678,33 @@ def _membership_check(
             message=membership_payload.get("message") if membership_payload else None,
         )
 
-    presence_service = PresenceSessionService(db)
-    active_session = presence_service.find_active_session(user.id)
-    has_changes = False
-
-    if direction == "entry":
-        if record_usage:
-            membership_service.record_entry_usage(membership, at_ts=now_ts)
-            has_changes = True
-        if not active_session:
-            presence_service.start_session(
-                user=user,
-                token=token,
-                membership=membership,
-                access_log=None,
-                scanned_at=now_ts,
-                metadata={"source": "api_entry"},
-            )
-            has_changes = True
-        set_presence(db, user, True, now_ts)
-        has_changes = True
+    if direction == "entry" and record_usage and not await persist_membership_usage(db, membership, now_ts):
+        # the daily/session limit was used up by a scan this (possibly cached) ctx did not see
+        fresh = await _reload_after_conflict(db, token_str, ctx.user_id, now_ts)
+        reason, membership_payload = _conflict_verdict(membership_service, fresh, now_ts)
+        return MembershipCheckResponse(
+            allowed=False,
+            reason=reason,
+            membership=membership_payload,
+            message=membership_payload.get("message"),
+        )
+    # Presence bookkeeping uses the ORM service; run it on the sync facade of the AsyncSession.
+    presence_session = await db.run_sync(
+        _apply_presence_change,
+        user_id=ctx.user_id,
+        token_id=ctx.token_id,
+        membership_id=membership.id,
+        direction=direction,
+        now_ts=now_ts,
+    )
+    await db.commit()
+    if direction == "entry" and presence_session is not None:
+        occupancy.enter(Occupant.from_session(presence_session, ctx.user_name, ctx.user_email))
     elif direction == "exit":
-        if active_session:
-            presence_service.end_session(
-                session=active_session,
-                access_log=None,
-                scanned_at=now_ts,
-                status="closed",
-                notes=None,
-            )
-            has_changes = True
-        set_presence(db, user, False, now_ts)
-        has_changes = True
-
-    if has_changes:
-        db.commit()
+        occupancy.leave(ctx.user_id)
+        request_visit_rollup()
+    if direction == "entry" and record_usage:
+        store_granted_scan(token_str, ctx)
 
     return MembershipCheckResponse(
         allowed=True,
@@ -540,51 +718,80 @@ def _membership_check(
 async def verify_entry(
     verify_request: VerifyRequest,
     request: Request,
-    db: Session = Depends(get_db),
+    response: Response,
+    db: AsyncSession = Depends(get_async_db),
 ):
     """
     Ověření pro vstup (odečítá denní limit/sessions při úspěchu).
-    Requires X-API-KEY.
+    Requires X-API-KEY (or X-TURNSTILE-API-KEY).
     """
-    _require_api_key(request)
-    return _membership_check(verify_request.token, db, record_usage=True, direction="entry")
+    scanner = await _require_api_key(request, response, db)
+    return await _tracked(
+        scanner,
+        _membership_check(verify_request.token, db, record_usage=True, direction="entry"),
+    )
 
 
 @router.post("/verify/exit", response_model=MembershipCheckResponse)
 async def verify_exit(
     verify_request: VerifyRequest,
     request: Request,
-    db: Session = Depends(get_db),
+    response: Response,
+    db: AsyncSession = Depends(get_async_db),
 ):
     """
     Ověření pro odchod (neodečítá vstup, jen validuje).
-    Requires X-API-KEY.
+    Requires X-API-KEY (or X-TURNSTILE-API-KEY).
     """
-    _require_api_key(request)
-    return _membership_check(verify_request.token, db, record_usage=False, direction="exit")
+    scanner = await _require_api_key(request, response, db)
+    return await _tracked(
+        scanner,
+        _membership_check(verify_request.token, db, record_usage=False, direction="exit"),
+    )
+
+
+ACCESS_LOG_COLUMNS = ["id", "token_string", "status", "reason", "ip_address", "user_id", "direction", "scanner_id", "created_at"]
+
+
+def _serialize_access_log(row) -> dict:
+    log = row.AccessLog
+    return {
+        "id": log.id,
+        "token_string": log.token_string,
+        "status": log.status,
+        "reason": log.reason,
+        "ip_address": log.ip_address,
+        "user_id": log.user_id,
+        "direction": log.direction,
+        "scanner_id": log.scanner_id,
+        "created_at": log.created_at.isoformat(),
+    }
+
+
 @router.get("/access_logs")
 async def get_access_logs(
-    limit: int = 100,
-    db: Session = Depends(get_db)
+    request: Request,
+    response: Response,
+    limit: int | None = Query(None, ge=1, description="page size (json, max 1000) or row cap (ndjson/csv)"),
+    cursor: str | None = Query(None, description="X-Next-Cursor of the previous page"),
+    format: ListingFormat = Query("json"),
+    filters: AccessLogFilters = Depends(access_log_filters),
+    current_user: Principal = Depends(require_admin),
+    db: Session = Depends(get_db),
 ):
-    """Get recent access logs (for admin/debugging purposes)"""
-    try:
-        logs = db.query(AccessLog).order_by(AccessLog.created_at.desc()).limit(limit).all()
-        
-        return [
-            {
-                "id": log.id,
-                "token_string": log.token_string,
-                "status": log.status,
-                "reason": log.reason,
-                "ip_address": log.ip_address,
-                "created_at": log.created_at.isoformat()
-            }
-            for log in logs
-        ]
-    except Exception as e:
-        logger.error(f"Error fetching access logs: {e}", exc_info=True)
-        raise HTTPException(
-            status_code=http_status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail="Error fetching access logs"
-        )
+    """Get access logs newest first (admin only: rows carry tokens, users and IPs); keyset-paginated or streamed."""
+    if format == "json" and limit is not None and limit > 1000:
+        raise HTTPException(status_code=422, detail="limit must be <= 1000 for format=json")
+    return listing_response(
+        request=request,
+        response=response,
+        db=db,
+        filters=filters,
+        cursor=cursor,
+        limit=limit,
+        page_size=100,
+        output=format,
+        serialize=_serialize_access_log,
+        columns=ACCESS_LOG_COLUMNS,
+        filename="access-logs",
+    )
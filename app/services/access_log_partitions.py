@@ -0,0 +1,411 @@
+"""
+Monthly partitions, retention and archive for the access_logs table.
+
+access_logs is range-partitioned by created_at (UTC months, see migration
+partition_access_logs): one table per month named access_logs_YYYY_MM plus
+access_logs_default for rows outside every pre-created month. Maintenance
+(startup + every ACCESS_LOG_MAINTENANCE_INTERVAL_HOURS):
+
+* creates partitions ACCESS_LOG_PARTITION_MONTHS_AHEAD months in advance,
+* handles months older than ACCESS_LOG_RETENTION_MONTHS (default 0 = keep
+  everything): with ACCESS_LOG_RETENTION_MODE=archive they are exported to
+  ACCESS_LOG_ARCHIVE_DIR/access_logs_YYYY_MM.csv.gz (row count verified)
+  before the partition is detached and dropped; with =drop they are dropped.
+  Archive mode does nothing until ACCESS_LOG_ARCHIVE_DIR is set explicitly;
+  it must be a persistent volume, the archive is the only copy left.
+
+Dropping a whole partition is instant and leaves no dead tuples, so index
+size and vacuum work follow the retention window, not the table's lifetime.
+Archived months stay readable through read_archive().
+
+    python -m app.services.access_log_partitions          # run maintenance now
+    python -m app.services.access_log_partitions status   # partitions + archives
+"""
+from __future__ import annotations
+
+import csv
+import gzip
+import json
+import logging
+import os
+import re
+import sys
+import threading
+from datetime import date, datetime, timezone
+from pathlib import Path
+from typing import Any, Iterator, Optional
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection, Engine
+
+logger = logging.getLogger(__name__)
+
+ACCESS_LOG_PARTITION_MONTHS_AHEAD = int(os.getenv("ACCESS_LOG_PARTITION_MONTHS_AHEAD", "2"))
+ACCESS_LOG_RETENTION_MONTHS = int(os.getenv("ACCESS_LOG_RETENTION_MONTHS", "0"))
+ACCESS_LOG_RETENTION_MODE = os.getenv("ACCESS_LOG_RETENTION_MODE", "archive")
+ACCESS_LOG_ARCHIVE_DIR = os.getenv("ACCESS_LOG_ARCHIVE_DIR", "").strip()
+ACCESS_LOG_MAINTENANCE_INTERVAL_HOURS = float(os.getenv("ACCESS_LOG_MAINTENANCE_INTERVAL_HOURS", "6"))
+
+PARENT_TABLE = "access_logs"
+DEFAULT_PARTITION = "access_logs_default"
+# pg_try_advisory_lock key: only one instance maintains partitions at a time.
+MAINTENANCE_LOCK_KEY = 72_615_008
+
+_PARTITION_RE = re.compile(r"^access_logs_(\d{4})_(\d{2})$")
+_ARCHIVE_RE = re.compile(r"^access_logs_(\d{4})_(\d{2})\.csv\.gz$")
+
+
+def month_start(value: datetime | date) -> date:
+    return date(value.year, value.month, 1)
+
+
+def add_months(month: date, count: int) -> date:
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    return f"{PARENT_TABLE}_{month.year:04d}_{month.month:02d}"
+
+
+def parse_month(value: str) -> date:
+    """'2026-03' -> date(2026, 3, 1); raises ValueError on anything else."""
+    match = re.fullmatch(r"(\d{4})-(\d{2})", value)
+    if not match or not 1 <= int(match.group(2)) <= 12:
+        raise ValueError(f"Expected YYYY-MM, got {value!r}")
+    return date(int(match.group(1)), int(match.group(2)), 1)
+
+
+def _bound(month: date) -> str:
+    return f"{month.isoformat()} 00:00:00+00"
+
+
+# --- partitions -------------------------------------------------------------
+
+
+def is_partitioned(conn: Connection) -> bool:
+    if conn.dialect.name != "postgresql":
+        return False
+    return bool(
+        conn.execute(
+            text(
+                "SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid "
+                "WHERE c.relname = :name AND c.relnamespace = current_schema()::regnamespace"
+            ),
+            {"name": PARENT_TABLE},
+        ).scalar()
+    )
+
+
+def list_partition_months(conn: Connection) -> list[date]:
+    names = conn.execute(
+        text(
+            "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+            "WHERE i.inhparent = CAST(:parent AS regclass)"
+        ),
+        {"parent": PARENT_TABLE},
+    ).scalars()
+    months = []
+    for name in names:
+        match = _PARTITION_RE.match(name)
+        if match:
+            months.append(date(int(match.group(1)), int(match.group(2)), 1))
+    return sorted(months)
+
+
+def create_month_partition(conn: Connection, month: date) -> bool:
+    """
+    Create the partition for `month` unless it exists. Rows that already landed in
+    the default partition for that month are moved into it. Commits.
+    """
+    if month in list_partition_months(conn):
+        conn.commit()
+        return False
+    name = partition_name(month)
+    start, end = _bound(month), _bound(add_months(month, 1))
+    params = {"start": start, "end": end}
+    has_default = conn.execute(text("SELECT to_regclass(:name) IS NOT NULL"), {"name": DEFAULT_PARTITION}).scalar()
+    stray = has_default and conn.execute(
+        text(f"SELECT EXISTS (SELECT 1 FROM {DEFAULT_PARTITION} WHERE created_at >= :start AND created_at < :end)"),
+        params,
+    ).scalar()
+    if not stray:
+        conn.execute(text(f"CREATE TABLE {name} PARTITION OF {PARENT_TABLE} FOR VALUES FROM ('{start}') TO ('{end}')"))
+    else:
+        # ATTACH refuses while the default partition still holds rows of the new range.
+        conn.execute(text(f"CREATE TABLE {name} (LIKE {PARENT_TABLE} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"))
+        conn.execute(
+            text(
+                f"WITH moved AS (DELETE FROM {DEFAULT_PARTITION} WHERE created_at >= :start AND created_at < :end "
+                f"RETURNING *) INSERT INTO {name} SELECT * FROM moved"
+            ),
+            params,
+        )
+        conn.execute(text(f"ALTER TABLE {PARENT_TABLE} ATTACH PARTITION {name} FOR VALUES FROM ('{start}') TO ('{end}')"))
+    conn.commit()
+    logger.info("Created access_logs partition %s", name)
+    return True
+
+
+def ensure_partitions(conn: Connection, *, now: Optional[datetime] = None, months_ahead: Optional[int] = None) -> list[str]:
+    """Partitions for the current month and `months_ahead` following months."""
+    now = now or datetime.now(timezone.utc)
+    months_ahead = ACCESS_LOG_PARTITION_MONTHS_AHEAD if months_ahead is None else months_ahead
+    current = month_start(now)
+    created = []
+    for offset in range(months_ahead + 1):
+        month = add_months(current, offset)
+        if create_month_partition(conn, month):
+            created.append(partition_name(month))
+    return created
+
+
+# --- retention / archive ----------------------------------------------------
+
+
+def archive_path(month: date, archive_dir: Optional[str | Path] = None) -> Path:
+    directory = archive_dir or ACCESS_LOG_ARCHIVE_DIR
+    if not directory:
+        raise FileNotFoundError("ACCESS_LOG_ARCHIVE_DIR is not set")
+    return Path(directory) / f"{partition_name(month)}.csv.gz"
+
+
+def export_partition(conn: Connection, month: date, archive_dir: Optional[str | Path] = None) -> Path:
+    """
+    COPY one month to a gzip'd CSV (header + rows ordered by created_at, id).
+    Written to a .tmp file, fsync'd, row count checked against the partition,
+    then renamed into place.
+    """
+    name = partition_name(month)
+    target = archive_path(month, archive_dir)
+    target.parent.mkdir(parents=True, exist_ok=True)
+    tmp = target.with_name(target.name + ".tmp")
+
+    expected = conn.execute(text(f"SELECT count(*) FROM {name}")).scalar()
+    raw = conn.connection.dbapi_connection
+    with gzip.open(tmp, "wt", encoding="utf-8", newline="") as handle:
+        with raw.cursor() as cursor:
+            cursor.copy_expert(
+                f"COPY (SELECT * FROM {name} ORDER BY created_at, id) TO STDOUT WITH (FORMAT csv, HEADER)",
+                handle,
+            )
+    with open(tmp, "rb") as handle:
+        os.fsync(handle.fileno())
+    conn.commit()
+
+    written = sum(1 for _ in iter_archive_rows(tmp))
+    if written != expected:
+        tmp.unlink(missing_ok=True)
+        raise RuntimeError(f"Archive of {name} has {written} rows, partition has {expected}")
+    os.replace(tmp, target)
+    logger.info("Archived %s (%s rows) to %s", name, written, target)
+    return target
+
+
+def drop_partition(conn: Connection, month: date) -> None:
+    name = partition_name(month)
+    conn.execute(text(f"ALTER TABLE {PARENT_TABLE} DETACH PARTITION {name}"))
+    conn.execute(text(f"DROP TABLE {name}"))
+    conn.commit()
+    logger.info("Dropped access_logs partition %s", name)
+
+
+def apply_retention(
+    conn: Connection,
+    *,
+    now: Optional[datetime] = None,
+    retention_months: Optional[int] = None,
+    mode: Optional[str] = None,
+    archive_dir: Optional[str | Path] = None,
+) -> list[str]:
+    """Archive (or just drop) partitions entirely older than the retention window."""
+    retention_months = ACCESS_LOG_RETENTION_MONTHS if retention_months is None else retention_months
+    mode = mode or ACCESS_LOG_RETENTION_MODE
+    if retention_months <= 0:
+        return []
+    if mode not in {"archive", "drop"}:
+        raise ValueError(f"ACCESS_LOG_RETENTION_MODE must be 'archive' or 'drop', not {mode!r}")
+    if mode == "archive" and not (archive_dir or ACCESS_LOG_ARCHIVE_DIR):
+        # Never drop a month whose only copy would land on the container's ephemeral disk.
+        logger.warning("access_logs retention skipped: ACCESS_LOG_RETENTION_MODE=archive needs ACCESS_LOG_ARCHIVE_DIR")
+        return []
+    cutoff = add_months(month_start(now or datetime.now(timezone.utc)), -retention_months)
+    removed = []
+    for month in list_partition_months(conn):
+        if month >= cutoff:
+            continue
+        if mode == "archive":
+            export_partition(conn, month, archive_dir)
+        drop_partition(conn, month)
+        removed.append(partition_name(month))
+    conn.commit()
+    return removed
+
+
+def run_partition_maintenance(engine: Engine, *, now: Optional[datetime] = None) -> dict[str, Any]:
+    """Create upcoming partitions and apply retention; no-op unless access_logs is partitioned."""
+    with engine.connect() as conn:
+        if not is_partitioned(conn):
+            conn.commit()
+            return {"partitioned": False}
+        if not conn.execute(text("SELECT pg_try_advisory_lock(:key)"), {"key": MAINTENANCE_LOCK_KEY}).scalar():
+            conn.commit()
+            return {"partitioned": True, "skipped": "another instance is running maintenance"}
+        # Monthly COPY exports and DETACH may legitimately outlive DB_STATEMENT_TIMEOUT_MS.
+        conn.execute(text("SET statement_timeout = 0"))
+        conn.commit()
+        try:
+            created = ensure_partitions(conn, now=now)
+            removed = apply_retention(conn, now=now)
+        finally:
+            conn.rollback()
+            conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": MAINTENANCE_LOCK_KEY})
+            conn.execute(text("RESET statement_timeout"))
+            conn.commit()
+    return {"partitioned": True, "created": created, "removed": removed}
+
+
+# --- archive reader ---------------------------------------------------------
+
+
+def list_archives(archive_dir: Optional[str | Path] = None) -> list[dict[str, Any]]:
+    directory = archive_dir or ACCESS_LOG_ARCHIVE_DIR
+    if not directory or not Path(directory).is_dir():
+        return []
+    directory = Path(directory)
+    archives = []
+    for path in sorted(directory.iterdir()):
+        match = _ARCHIVE_RE.match(path.name)
+        if match:
+            archives.append(
+                {"month": f"{match.group(1)}-{match.group(2)}", "path": str(path), "size_bytes": path.stat().st_size}
+            )
+    return archives
+
+
+def iter_archive_rows(path: str | Path) -> Iterator[dict[str, str]]:
+    with gzip.open(path, "rt", encoding="utf-8", newline="") as handle:
+        yield from csv.DictReader(handle)
+
+
+def _parse_timestamp(value: str) -> Optional[datetime]:
+    if not value:
+        return None
+    # COPY writes "2026-01-05 10:00:00.123+00"; fromisoformat needs a full offset.
+    if re.search(r"[+-]\d{2}$", value):
+        value += ":00"
+    return datetime.fromisoformat(value)
+
+
+def _parse_bool(value: str) -> Optional[bool]:
+    return {"t": True, "f": False}.get(value)
+
+
+def _archive_record(row: dict[str, str]) -> dict[str, Any]:
+    metadata = row.get("metadata")
+    return {
+        "id": int(row["id"]),
+        "user_id": int(row["user_id"]) if row.get("user_id") else None,
+        "token_string": row.get("token_string"),
+        "status": row.get("status"),
+        "reason": row.get("reason") or None,
+        "allowed": _parse_bool(row.get("allowed", "")),
+        "direction": row.get("direction") or None,
+        "scanner_id": row.get("scanner_id") or None,
+        "scanned_at": _parse_timestamp(row.get("scanned_at", "")),
+        "created_at": _parse_timestamp(row.get("created_at", "")),
+        "metadata": json.loads(metadata) if metadata else None,
+    }
+
+
+def read_archive(
+    month: date,
+    *,
+    user_id: Optional[int] = None,
+    status: Optional[str] = None,
+    limit: int = 100,
+    offset: int = 0,
+    archive_dir: Optional[str | Path] = None,
+) -> list[dict[str, Any]]:
+    """Rows of an archived month, oldest first, filtered by user_id / status."""
+    path = archive_path(month, archive_dir)
+    if not path.exists():
+        raise FileNotFoundError(path)
+    results = []
+    skipped = 0
+    for row in iter_archive_rows(path):
+        if user_id is not None and row.get("user_id") != str(user_id):
+            continue
+        if status is not None and row.get("status") != status:
+            continue
+        if skipped < offset:
+            skipped += 1
+            continue
+        results.append(_archive_record(row))
+        if len(results) >= limit:
+            break
+    return results
+
+
+# --- background scheduling --------------------------------------------------
+
+
+class PartitionMaintainer:
+    """Daemon thread running run_partition_maintenance at startup and then periodically."""
+
+    def __init__(self, engine: Engine, *, interval_hours: float = ACCESS_LOG_MAINTENANCE_INTERVAL_HOURS):
+        self.engine = engine
+        self.interval_seconds = interval_hours * 3600
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.last_result: Optional[dict[str, Any]] = None
+
+    def start(self) -> None:
+        if self._thread is not None or self.interval_seconds <= 0:
+            return
+        self._thread = threading.Thread(target=self._run, name="access-log-partitions", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                self.last_result = run_partition_maintenance(self.engine)
+            except Exception:
+                logger.exception("access_logs partition maintenance failed")
+            self._stop.wait(self.interval_seconds)
+
+
+_maintainer: Optional[PartitionMaintainer] = None
+
+
+def start_partition_maintenance(engine: Engine) -> PartitionMaintainer:
+    global _maintainer
+    if _maintainer is None:
+        _maintainer = PartitionMaintainer(engine)
+    _maintainer.start()
+    return _maintainer
+
+
+def stop_partition_maintenance() -> None:
+    if _maintainer is not None:
+        _maintainer.stop()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    from app.database import engine
+
+    if len(sys.argv) > 1 and sys.argv[1] == "status":
+        with engine.connect() as conn:
+            months = list_partition_months(conn) if is_partitioned(conn) else []
+        print("partitions:", ", ".join(partition_name(m) for m in months) or "-")
+        for archive in list_archives():
+            print(f"archive {archive['month']}: {archive['path']} ({archive['size_bytes']} B)")
+    else:
+        print(run_partition_maintenance(engine))
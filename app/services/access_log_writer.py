@@ -0,0 +1,310 @@
+"""
+Background, batched writer for AccessLog rows.
+
+Scan handlers enqueue plain row dicts; a daemon thread flushes them with one
+multi-row INSERT every ACCESS_LOG_FLUSH_INTERVAL_MS or ACCESS_LOG_BATCH_SIZE rows.
+enqueue() never blocks: it is called on the event loop serving /api/verify,
+so when the queue is full the row goes to an overflow list that a separate
+spool thread appends (and fsyncs) to the spool file. Batches that fail to
+insert (Postgres down) are appended to the same spool file and replayed once
+the database accepts writes again.
+"""
+from __future__ import annotations
+
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Optional
+
+from sqlalchemy import insert
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.exc import OperationalError
+
+from app.models import AccessLog
+
+logger = logging.getLogger(__name__)
+
+ACCESS_LOG_QUEUE_SIZE = int(os.getenv("ACCESS_LOG_QUEUE_SIZE", "10000"))
+ACCESS_LOG_BATCH_SIZE = int(os.getenv("ACCESS_LOG_BATCH_SIZE", "500"))
+ACCESS_LOG_FLUSH_INTERVAL_MS = int(os.getenv("ACCESS_LOG_FLUSH_INTERVAL_MS", "200"))
+ACCESS_LOG_SPOOL_PATH = os.getenv("ACCESS_LOG_SPOOL_PATH", "var/access_log_spool.jsonl")
+
+_DATETIME_FIELDS = ("scanned_at", "processed_at", "created_at")
+
+
+def _encode_row(row: dict[str, Any]) -> str:
+    encoded = dict(row)
+    for field in _DATETIME_FIELDS:
+        value = encoded.get(field)
+        if isinstance(value, datetime):
+            encoded[field] = value.isoformat()
+    return json.dumps(encoded, ensure_ascii=False)
+
+
+def _decode_row(line: str) -> dict[str, Any]:
+    row = json.loads(line)
+    for field in _DATETIME_FIELDS:
+        value = row.get(field)
+        if isinstance(value, str):
+            row[field] = datetime.fromisoformat(value)
+    return row
+
+
+class AccessLogWriter:
+    """Bounded queue + flusher thread for access_logs inserts."""
+
+    def __init__(
+        self,
+        engine: Engine,
+        *,
+        queue_size: int = ACCESS_LOG_QUEUE_SIZE,
+        batch_size: int = ACCESS_LOG_BATCH_SIZE,
+        flush_interval_ms: int = ACCESS_LOG_FLUSH_INTERVAL_MS,
+        spool_path: str | os.PathLike = ACCESS_LOG_SPOOL_PATH,
+    ):
+        self.engine = engine
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = max(flush_interval_ms, 1) / 1000
+        self.spool_path = Path(spool_path)
+        self._queue: queue.Queue[dict[str, Any]] = queue.Queue(maxsize=max(1, queue_size))
+        self._spool_lock = threading.Lock()
+        # Rows that did not fit in the queue, waiting for the spool thread.
+        self._overflow: deque[dict[str, Any]] = deque()
+        self._overflow_lock = threading.Lock()
+        self._overflow_scheduled = False
+        self._spool_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="access-log-spool")
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.written = 0
+        self.spilled = 0
+        self.failed_flushes = 0
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> None:
+        if self.running:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="access-log-writer", daemon=True)
+        self._thread.start()
+        logger.info(
+            "Access log writer started (batch=%s, interval=%sms, queue=%s)",
+            self.batch_size,
+            int(self.flush_interval * 1000),
+            self._queue.maxsize,
+        )
+
+    def stop(self, timeout: float = 10.0) -> None:
+        """Stop the thread after draining everything still queued."""
+        if not self.running:
+            return
+        self._stop.set()
+        self._thread.join(timeout)
+        self._thread = None
+        # Anything enqueued after the thread's final drain.
+        self._flush(self._drain(self._queue.qsize()))
+        self._spool_executor.submit(self._spill_overflow).result()
+
+    def enqueue(self, row: dict[str, Any]) -> None:
+        """
+        Queue one access_logs row without blocking (safe on the event loop). When the
+        queue is full the row is handed to the spool thread instead of being dropped.
+        """
+        row.setdefault("created_at", datetime.now(timezone.utc))
+        row.setdefault("processed_at", row["created_at"])
+        try:
+            self._queue.put_nowait(row)
+        except queue.Full:
+            self.spilled += 1
+            with self._overflow_lock:
+                self._overflow.append(row)
+                if self._overflow_scheduled:
+                    return
+                self._overflow_scheduled = True
+            self._spool_executor.submit(self._spill_overflow)
+
+    def flush_spills(self) -> None:
+        """Wait until every overflow row handed to the spool thread is on disk."""
+        self._spool_executor.submit(lambda: None).result()
+
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
+
+    def stats(self) -> dict:
+        return {
+            "queue_depth": self._queue.qsize(),
+            "queue_capacity": self._queue.maxsize,
+            "written": self.written,
+            "spilled": self.spilled,
+            "failed_flushes": self.failed_flushes,
+        }
+
+    def _run(self) -> None:
+        self._replay_spool()
+        while not self._stop.is_set():
+            batch = self._collect_batch()
+            if batch:
+                if self._flush(batch):
+                    self._replay_spool()
+        self._flush(self._drain(self._queue.qsize()))
+
+    def _collect_batch(self) -> list[dict[str, Any]]:
+        deadline = time.monotonic() + self.flush_interval
+        batch: list[dict[str, Any]] = []
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or self._stop.is_set():
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _drain(self, limit: int) -> list[dict[str, Any]]:
+        rows: list[dict[str, Any]] = []
+        while len(rows) < limit:
+            try:
+                rows.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return rows
+
+    def _insert(self, rows: list[dict[str, Any]]) -> None:
+        # SQLAlchemy renders executemany inserts as multi-row VALUES ("insertmanyvalues").
+        with self.engine.begin() as conn:
+            conn.execute(insert(AccessLog.__table__), rows)
+
+    def _flush(self, rows: list[dict[str, Any]]) -> bool:
+        if not rows:
+            return True
+        try:
+            for start in range(0, len(rows), self.batch_size):
+                chunk = rows[start:start + self.batch_size]
+                self._insert(chunk)
+                self.written += len(chunk)
+            return True
+        except Exception as exc:
+            self.failed_flushes += 1
+            logger.error("Access log flush failed, spooling %s rows to %s: %s", len(rows), self.spool_path, exc)
+            self._spool(rows[start:])
+            return False
+
+    def _spill_overflow(self) -> None:
+        with self._overflow_lock:
+            rows = list(self._overflow)
+            self._overflow.clear()
+            self._overflow_scheduled = False
+        if rows:
+            self._spool(rows)
+
+    def _spool(self, rows: list[dict[str, Any]]) -> None:
+        with self._spool_lock:
+            try:
+                self.spool_path.parent.mkdir(parents=True, exist_ok=True)
+                with self.spool_path.open("a", encoding="utf-8") as handle:
+                    for row in rows:
+                        handle.write(_encode_row(row) + "\n")
+                    handle.flush()
+                    os.fsync(handle.fileno())
+            except Exception as exc:
+                logger.error("Access log spool write failed, %s rows lost: %s", len(rows), exc, exc_info=True)
+
+    def _replay_spool(self) -> None:
+        """
+        Insert spooled rows back into Postgres; the file is removed only after success.
+        Lines that do not parse (a write torn by a crash) or rows the database rejects
+        are moved to a .rejected-* file next to the spool; every other row is inserted.
+        """
+        replay_path = self.spool_path.with_suffix(self.spool_path.suffix + ".replay")
+        with self._spool_lock:
+            if not replay_path.exists():
+                if not self.spool_path.exists():
+                    return
+                self.spool_path.rename(replay_path)
+        rows: list[tuple[str, dict[str, Any]]] = []
+        torn: list[str] = []
+        with replay_path.open("r", encoding="utf-8") as handle:
+            for line in handle:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    rows.append((line, _decode_row(line)))
+                except ValueError:
+                    torn.append(line)
+        refused: list[str] = []
+        try:
+            # One transaction: if the database goes away midway nothing is written and the
+            # next successful flush retries the whole file.
+            with self.engine.begin() as conn:
+                for start in range(0, len(rows), self.batch_size):
+                    refused.extend(self._replay_batch(conn, rows[start:start + self.batch_size]))
+        except OperationalError as exc:
+            logger.warning("Access log spool replay failed: %s", exc)
+            return
+        inserted = len(rows) - len(refused)
+        rejected = torn + refused
+        if rejected:
+            rejected_path = replay_path.with_suffix(f".rejected-{int(time.time())}")
+            with rejected_path.open("a", encoding="utf-8") as handle:
+                handle.write("\n".join(rejected) + "\n")
+            logger.error("Access log spool: %s rows rejected, moved to %s", len(rejected), rejected_path)
+        replay_path.unlink()
+        self.written += inserted
+        logger.info("Replayed %s spooled access log rows", inserted)
+
+    @staticmethod
+    def _replay_batch(conn: Connection, rows: list[tuple[str, dict[str, Any]]]) -> list[str]:
+        """Insert one batch inside a savepoint; on a rejected row retry row by row. Returns the rejected lines."""
+        try:
+            with conn.begin_nested():
+                conn.execute(insert(AccessLog.__table__), [row for _, row in rows])
+            return []
+        except OperationalError:
+            raise
+        except Exception:
+            pass
+        rejected = []
+        for line, row in rows:
+            try:
+                with conn.begin_nested():
+                    conn.execute(insert(AccessLog.__table__), [row])
+            except OperationalError:
+                raise
+            except Exception as exc:
+                logger.warning("Access log spool row rejected: %s", exc)
+                rejected.append(line)
+        return rejected
+
+
+_writer: Optional[AccessLogWriter] = None
+
+
+def get_access_log_writer() -> Optional[AccessLogWriter]:
+    """Running writer, or None when the app has not started it (scripts, tests)."""
+    if _writer is not None and _writer.running:
+        return _writer
+    return None
+
+
+def start_access_log_writer(engine: Engine) -> AccessLogWriter:
+    global _writer
+    if _writer is None:
+        _writer = AccessLogWriter(engine)
+    _writer.start()
+    return _writer
+
+
+def stop_access_log_writer() -> None:
+    if _writer is not None:
+        _writer.stop()
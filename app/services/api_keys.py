@@ -1,12 +1,234 @@
+"""
+API keys for server integrations: creation, verification and usage tracking.
+
+Verification is read-only: verified keys are kept in a small TTL + LRU cache
+(hash -> APIKeyRecord snapshot), so repeated requests with the same key skip the
+database entirely, and `last_used_at` is recorded in memory and written by a
+background thread every API_KEY_LAST_USED_FLUSH_SECONDS as one batched UPDATE.
+Revoking or deleting a key must call invalidate_api_key(); the TTL only bounds
+how long other worker processes keep accepting it.
+
+Scanner keys (metadata {"kind": "scanner", "scanner_id": ..., "rate_limit_per_minute": ...})
+authenticate one turnstile device on /api/verify* and are not accepted as admin keys.
+"""
+from __future__ import annotations
+
 import hashlib
+import logging
+import os
 import secrets
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
 from datetime import datetime, timezone
-from typing import Optional
+from typing import Any, Callable, Optional
 
+from sqlalchemy import bindparam, select, update
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
 from app.models import APIKey
 
+logger = logging.getLogger(__name__)
+
+API_KEY_CACHE_TTL_SECONDS = float(os.getenv("API_KEY_CACHE_TTL_SECONDS", "15"))
+API_KEY_CACHE_MAX_ENTRIES = int(os.getenv("API_KEY_CACHE_MAX_ENTRIES", "1000"))
+API_KEY_LAST_USED_FLUSH_SECONDS = float(os.getenv("API_KEY_LAST_USED_FLUSH_SECONDS", "60"))
+
+SCANNER_KEY_KIND = "scanner"
+
+
+@dataclass(frozen=True)
+class APIKeyRecord:
+    """Detached snapshot of a verified APIKey row (safe to share between requests)."""
+
+    id: int
+    name: str
+    prefix: str
+    created_by_user_id: Optional[int]
+    expires_at: Optional[datetime]
+    metadata: dict[str, Any] = field(default_factory=dict)
+
+    @classmethod
+    def from_model(cls, api_key: APIKey) -> "APIKeyRecord":
+        return cls(
+            id=api_key.id,
+            name=api_key.name,
+            prefix=api_key.prefix,
+            created_by_user_id=api_key.created_by_user_id,
+            expires_at=_aware(api_key.expires_at),
+            metadata=dict(api_key.metadata_json or {}),
+        )
+
+    def is_expired(self, at_ts: datetime) -> bool:
+        return self.expires_at is not None and self.expires_at <= at_ts
+
+    @property
+    def is_scanner(self) -> bool:
+        return self.metadata.get("kind") == SCANNER_KEY_KIND
+
+    @property
+    def scanner_id(self) -> Optional[str]:
+        return self.metadata.get("scanner_id") or None
+
+    @property
+    def rate_limit_per_minute(self) -> Optional[int]:
+        """Per-key verify budget; None falls back to VERIFY_RATE_LIMIT_PER_MINUTE."""
+        value = self.metadata.get("rate_limit_per_minute")
+        return int(value) if value is not None else None
+
+
+def _aware(value: Optional[datetime]) -> Optional[datetime]:
+    if value is None or value.tzinfo is not None:
+        return value
+    return value.replace(tzinfo=timezone.utc)
+
+
+class APIKeyCache:
+    """TTL + LRU map of key hash -> APIKeyRecord. Unknown keys are never cached. Thread-safe."""
+
+    def __init__(
+        self,
+        *,
+        ttl_seconds: float,
+        max_entries: int,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._clock = clock
+        self._entries: OrderedDict[str, tuple[APIKeyRecord, float]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl_seconds > 0 and self.max_entries > 0
+
+    def get(self, key_hash: str) -> Optional[APIKeyRecord]:
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entries.get(key_hash)
+            if entry is None or entry[1] <= self._clock():
+                self._entries.pop(key_hash, None)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key_hash)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key_hash: str, record: APIKeyRecord) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            self._entries.pop(key_hash, None)
+            self._entries[key_hash] = (record, self._clock() + self.ttl_seconds)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key_id: int) -> None:
+        with self._lock:
+            for key_hash in [h for h, (record, _) in self._entries.items() if record.id == key_id]:
+                del self._entries[key_hash]
+                self.invalidations += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+            }
+
+
+class LastUsedTracker:
+    """
+    Coalesces `last_used_at` bumps: mark() only stores the newest timestamp per key
+    id; flush() writes all pending ids with one executemany UPDATE. A daemon thread
+    flushes periodically once started; stop() performs a final flush.
+    """
+
+    def __init__(self, engine: Optional[Engine] = None, *, interval_seconds: float = API_KEY_LAST_USED_FLUSH_SECONDS):
+        self.engine = engine
+        self.interval_seconds = interval_seconds
+        self._pending: dict[int, datetime] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.flushed = 0
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def mark(self, key_id: int, used_at: datetime) -> None:
+        with self._lock:
+            previous = self._pending.get(key_id)
+            if previous is None or used_at > previous:
+                self._pending[key_id] = used_at
+
+    def pending(self) -> int:
+        with self._lock:
+            return len(self._pending)
+
+    def flush(self, engine: Optional[Engine] = None) -> int:
+        engine = engine or self.engine
+        if engine is None:
+            return 0
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+        statement = (
+            update(APIKey.__table__)
+            .where(APIKey.__table__.c.id == bindparam("key_id"))
+            .values(last_used_at=bindparam("used_at"))
+        )
+        rows = [{"key_id": key_id, "used_at": used_at} for key_id, used_at in pending.items()]
+        try:
+            with engine.begin() as conn:
+                conn.execute(statement, rows)
+        except Exception as exc:
+            logger.warning("API key last_used_at flush failed, retrying later: %s", exc)
+            for key_id, used_at in pending.items():
+                self.mark(key_id, used_at)
+            return 0
+        self.flushed += len(rows)
+        return len(rows)
+
+    def start(self, engine: Engine) -> None:
+        self.engine = engine
+        if self.running or self.interval_seconds <= 0:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="api-key-last-used", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+        self.flush()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval_seconds):
+            self.flush()
+
+
+api_key_cache = APIKeyCache(ttl_seconds=API_KEY_CACHE_TTL_SECONDS, max_entries=API_KEY_CACHE_MAX_ENTRIES)
+last_used_tracker = LastUsedTracker()
+
 
 def _hash_key(raw_key: str) -> str:
     return hashlib.sha256(raw_key.encode("utf-8")).hexdigest()
@@ -46,32 +268,75 @@ def create_api_key(
     return api_key, raw_key
 
 
-def verify_api_key(db: Session, raw_key: str) -> Optional[APIKey]:
-    """Return APIKey if valid/active/not expired; otherwise None."""
+def _active_key_statement(key_hash: str):
+    return select(APIKey).where(APIKey.key_hash == key_hash, APIKey.is_active.is_(True))
+
+
+def _accept(record: Optional[APIKeyRecord], now: datetime) -> Optional[APIKeyRecord]:
+    if record is None or record.is_expired(now):
+        return None
+    last_used_tracker.mark(record.id, now)
+    return record
+
+
+def verify_api_key(db: Session, raw_key: str) -> Optional[APIKeyRecord]:
+    """
+    Return the key record if valid/active/not expired; otherwise None.
+    Read-only: cache hits skip the database and last_used_at is flushed in the background.
+    """
     if not raw_key:
         return None
     key_hash = _hash_key(raw_key)
-    now = datetime.now(timezone.utc)
-    api_key = (
-        db.query(APIKey)
-        .filter(
-            APIKey.key_hash == key_hash,
-            APIKey.is_active.is_(True),
-        )
-        .first()
-    )
-    if not api_key:
-        return None
-    if api_key.expires_at and api_key.expires_at <= now:
+    record = api_key_cache.get(key_hash)
+    if record is None:
+        api_key = db.scalars(_active_key_statement(key_hash)).first()
+        if not api_key:
+            return None
+        record = APIKeyRecord.from_model(api_key)
+        api_key_cache.put(key_hash, record)
+    return _accept(record, datetime.now(timezone.utc))
+
+
+async def verify_api_key_async(db: AsyncSession, raw_key: str) -> Optional[APIKeyRecord]:
+    """verify_api_key for the async scanner endpoints; shares the same cache."""
+    if not raw_key:
         return None
-    api_key.last_used_at = now
-    db.add(api_key)
-    db.commit()
-    db.refresh(api_key)
-    return api_key
+    key_hash = _hash_key(raw_key)
+    record = api_key_cache.get(key_hash)
+    if record is None:
+        api_key = (await db.scalars(_active_key_statement(key_hash))).first()
+        if not api_key:
+            return None
+        record = APIKeyRecord.from_model(api_key)
+        api_key_cache.put(key_hash, record)
+    return _accept(record, datetime.now(timezone.utc))
+
+
+def scanner_key_metadata(scanner_id: Optional[str], rate_limit_per_minute: Optional[int]) -> dict:
+    metadata: dict[str, Any] = {"kind": SCANNER_KEY_KIND}
+    if scanner_id:
+        metadata["scanner_id"] = scanner_id
+    if rate_limit_per_minute is not None:
+        metadata["rate_limit_per_minute"] = rate_limit_per_minute
+    return metadata
+
+
+def invalidate_api_key(key_id: int) -> None:
+    """Call after revoking or deleting a key so this process stops accepting it at once."""
+    api_key_cache.invalidate(key_id)
+
+
+def start_api_key_usage_flush(engine: Engine) -> LastUsedTracker:
+    last_used_tracker.start(engine)
+    return last_used_tracker
+
+
+def stop_api_key_usage_flush() -> None:
+    last_used_tracker.stop()
 
 
 def serialize_api_key(api_key: APIKey) -> dict:
+    metadata = api_key.metadata_json or {}
     return {
         "id": api_key.id,
         "name": api_key.name,
@@ -80,4 +345,7 @@ def serialize_api_key(api_key: APIKey) -> dict:
         "created_at": api_key.created_at.isoformat() if api_key.created_at else None,
         "last_used_at": api_key.last_used_at.isoformat() if api_key.last_used_at else None,
         "created_by_user_id": api_key.created_by_user_id,
+        "kind": metadata.get("kind") or "admin",
+        "scanner_id": metadata.get("scanner_id"),
+        "rate_limit_per_minute": metadata.get("rate_limit_per_minute"),
     }
@@ -0,0 +1,150 @@
+"""
+Member dashboard read model: the data behind /api/my_qr split into sections.
+
+Every section is loaded with a fixed number of queries regardless of how many
+memberships or sessions the user has (memberships join their package; the
+active membership is picked from that same list), and carries its own ETag so
+a client can skip sections it already has. Only requested sections are loaded.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Any, Iterable, Optional
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session, joinedload
+
+from app.models import Membership, MembershipPackage, User
+from app.services.membership import serialize_membership_for_response
+from app.services.presence_sessions import serialize_presence_session, sessions_statement
+
+SECTIONS = ("profile", "membership", "memberships", "packages", "presence_sessions")
+PRESENCE_SESSION_LIMIT = 50
+ACTIVE_MEMBERSHIP_STATUSES = ("active", "grace")
+
+
+@dataclass(frozen=True)
+class Section:
+    name: str
+    data: Any
+    etag: str
+
+
+def section_etag(name: str, data: Any) -> str:
+    body = json.dumps(data, sort_keys=True, separators=(",", ":"), default=str)
+    return f'"{name}-{hashlib.sha256(body.encode()).hexdigest()[:20]}"'
+
+
+def combined_etag(sections: Iterable[Section]) -> str:
+    joined = ",".join(section.etag for section in sections)
+    return f'"dashboard-{hashlib.sha256(joined.encode()).hexdigest()[:20]}"'
+
+
+def _aware(value: datetime) -> datetime:
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+
+def pick_active_membership(memberships: list[Membership], at_ts: datetime) -> Optional[Membership]:
+    """Same selection as MembershipService.get_active_membership, over an already loaded list."""
+    candidates = [
+        membership
+        for membership in memberships
+        if membership.status in ACTIVE_MEMBERSHIP_STATUSES
+        and membership.valid_from is not None
+        and membership.valid_to is not None
+        and _aware(membership.valid_from) <= at_ts <= _aware(membership.valid_to)
+    ]
+    return max(candidates, key=lambda membership: _aware(membership.valid_from), default=None)
+
+
+def _membership_summary(membership: Optional[Membership]) -> Optional[dict]:
+    payload = serialize_membership_for_response(membership)
+    if not payload:
+        return None
+    keys = ("has_membership", "package_name", "package_type", "valid_from", "valid_to", "status", "reason", "message")
+    summary = {key: payload.get(key) for key in keys}
+    summary["has_membership"] = bool(summary["has_membership"])
+    return summary
+
+
+def _membership_detail(membership: Membership) -> dict:
+    payload = serialize_membership_for_response(membership)
+    package = membership.package
+    return {
+        "membership_id": membership.id,
+        "package_name": payload.get("package_name") or membership.package_name_cache,
+        "package_type": (payload.get("package_type") or package.package_type) if package else None,
+        "membership_type": membership.membership_type,
+        "status": payload.get("status") or membership.status,
+        "valid_from": payload.get("valid_from"),
+        "valid_to": payload.get("valid_to"),
+        "daily_limit": payload.get("daily_limit"),
+        "daily_usage_count": payload.get("daily_usage_count"),
+        "sessions_total": payload.get("sessions_total"),
+        "sessions_used": payload.get("sessions_used"),
+        "message": payload.get("message"),
+    }
+
+
+def _package(package: MembershipPackage) -> dict:
+    return {
+        "id": package.id,
+        "name": package.name,
+        "slug": package.slug,
+        "description": package.description,
+        "price_czk": package.price_czk,
+        "duration_days": package.duration_days,
+        "daily_entry_limit": package.daily_entry_limit,
+        "session_limit": package.session_limit,
+        "package_type": package.package_type,
+    }
+
+
+def load_dashboard(
+    db: Session,
+    user: User,
+    sections: Iterable[str] = SECTIONS,
+    *,
+    at_ts: Optional[datetime] = None,
+) -> dict[str, Section]:
+    """
+    Load the requested sections for an already loaded user: at most three queries
+    (memberships + packages joined, active packages, presence sessions).
+    """
+    wanted = [name for name in SECTIONS if name in set(sections)]
+    now_ts = _aware(at_ts or datetime.now(timezone.utc))
+    data: dict[str, Any] = {}
+
+    if "profile" in wanted:
+        data["profile"] = {"user_name": user.name, "user_email": user.email, "credits": user.credits or 0}
+
+    if "membership" in wanted or "memberships" in wanted:
+        memberships = list(
+            db.scalars(
+                select(Membership)
+                .options(joinedload(Membership.package))
+                .where(Membership.user_id == user.id)
+                .order_by(Membership.valid_from.desc())
+            ).unique()
+        )
+        if "membership" in wanted:
+            data["membership"] = _membership_summary(pick_active_membership(memberships, now_ts))
+        if "memberships" in wanted:
+            data["memberships"] = [_membership_detail(membership) for membership in memberships]
+
+    if "packages" in wanted:
+        packages = db.scalars(
+            select(MembershipPackage)
+            .where(MembershipPackage.is_active.is_(True))
+            .order_by(MembershipPackage.created_at.desc(), MembershipPackage.id.asc())
+        )
+        data["packages"] = [_package(package) for package in packages]
+
+    if "presence_sessions" in wanted:
+        sessions = db.scalars(sessions_statement(user_id=user.id, limit=PRESENCE_SESSION_LIMIT))
+        data["presence_sessions"] = [serialize_presence_session(session, user) for session in sessions]
+
+    return {name: Section(name=name, data=data[name], etag=section_etag(name, data[name])) for name in wanted}
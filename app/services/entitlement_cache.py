@@ -0,0 +1,182 @@
+"""
+In-process cache of scan entitlements (token -> user, cooldown, active membership).
+
+Entries are VerificationContext snapshots keyed by token string, bounded by a TTL
+and an LRU size limit. Code paths that change tokens, credits or memberships must
+invalidate explicitly (invalidate_user_entitlements / invalidate_token_entitlement);
+the TTL only bounds staleness for edits made outside the application.
+
+Counters in a cached context (cooldown timestamp, daily/session usage) may lag
+behind scans granted by other workers. They only pre-screen a scan: the writes in
+app.services.verification are relative and re-check cooldown and limits against
+the rows, and a scan that loses that check is denied and its cache entry dropped.
+"""
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Callable, Optional
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.services.verification import VerificationContext, load_verification_context_async
+
+logger = logging.getLogger(__name__)
+
+ENTITLEMENT_CACHE_TTL_SECONDS = float(os.getenv("ENTITLEMENT_CACHE_TTL_SECONDS", "30"))
+ENTITLEMENT_CACHE_MAX_ENTRIES = int(os.getenv("ENTITLEMENT_CACHE_MAX_ENTRIES", "5000"))
+
+
+@dataclass
+class _Entry:
+    context: VerificationContext
+    expires_at: float
+    stale_from: Optional[datetime]
+
+
+class EntitlementCache:
+    """TTL + LRU map of token string -> VerificationContext. Thread-safe."""
+
+    def __init__(
+        self,
+        *,
+        ttl_seconds: float,
+        max_entries: int,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._clock = clock
+        self._entries: OrderedDict[str, _Entry] = OrderedDict()
+        self._tokens_by_user: dict[int, set[str]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl_seconds > 0 and self.max_entries > 0
+
+    def get(self, token_str: str, at_ts: datetime) -> Optional[VerificationContext]:
+        """Return a private copy of the cached context, or None on miss/expiry."""
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entries.get(token_str)
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry.expires_at <= self._clock() or (entry.stale_from is not None and at_ts >= entry.stale_from):
+                self._remove(token_str)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(token_str)
+            self.hits += 1
+            return entry.context.copy()
+
+    def put(self, token_str: str, context: VerificationContext) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            self._remove(token_str)
+            self._entries[token_str] = _Entry(
+                context=context.copy(),
+                expires_at=self._clock() + self.ttl_seconds,
+                stale_from=context.membership_selection_expires_at(),
+            )
+            if context.user_id is not None:
+                self._tokens_by_user.setdefault(context.user_id, set()).add(token_str)
+            while len(self._entries) > self.max_entries:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def invalidate_token(self, token_str: str) -> None:
+        with self._lock:
+            if self._remove(token_str):
+                self.invalidations += 1
+
+    def invalidate_user(self, user_id: int) -> None:
+        with self._lock:
+            for token_str in list(self._tokens_by_user.get(user_id, ())):
+                if self._remove(token_str):
+                    self.invalidations += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._tokens_by_user.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+    def _remove(self, token_str: str) -> bool:
+        entry = self._entries.pop(token_str, None)
+        if entry is None:
+            return False
+        user_id = entry.context.user_id
+        if user_id is not None:
+            tokens = self._tokens_by_user.get(user_id)
+            if tokens is not None:
+                tokens.discard(token_str)
+                if not tokens:
+                    del self._tokens_by_user[user_id]
+        return True
+
+
+entitlement_cache = EntitlementCache(
+    ttl_seconds=ENTITLEMENT_CACHE_TTL_SECONDS,
+    max_entries=ENTITLEMENT_CACHE_MAX_ENTRIES,
+)
+
+
+async def get_verification_context(
+    db: AsyncSession, token_str: str, at_ts: datetime
+) -> Optional[VerificationContext]:
+    """
+    Cached variant of load_verification_context_async. Unknown tokens are not cached,
+    so freshly issued tokens resolve immediately.
+    """
+    context = entitlement_cache.get(token_str, at_ts)
+    if context is not None:
+        return context
+    context = await load_verification_context_async(db, token_str, at_ts)
+    if context is not None:
+        entitlement_cache.put(token_str, context)
+    return context
+
+
+def store_granted_scan(token_str: str, context: VerificationContext) -> None:
+    """
+    Write-through after a committed scan. Cooldown is shared by all tokens of the
+    user, so sibling tokens are dropped and only the scanned one is refreshed.
+    """
+    if context.user_id is not None:
+        entitlement_cache.invalidate_user(context.user_id)
+    entitlement_cache.put(token_str, context)
+
+
+def invalidate_user_entitlements(user_id: Optional[int]) -> None:
+    if user_id is None:
+        return
+    entitlement_cache.invalidate_user(user_id)
+
+
+def invalidate_token_entitlement(token_str: Optional[str]) -> None:
+    if not token_str:
+        return
+    entitlement_cache.invalidate_token(token_str)
@@ -0,0 +1,387 @@
+"""
+Live gym occupancy kept in memory and pushed to subscribers.
+
+OccupancyTracker mirrors the active presence_sessions rows (one occupant per
+user). It is rebuilt from the database at startup, updated by the code paths
+that open or close sessions (verify entry/exit, admin force exit) once their
+transaction has committed, and re-synchronised every OCCUPANCY_RESYNC_SECONDS
+to pick up sessions changed outside this process (scripts, other workers).
+Readers (the live endpoints and their Server-Sent Events streams) never touch
+the database.
+
+Every change gets a new version. Each subscriber owns a bounded asyncio.Queue;
+publishing never blocks, and a subscriber that falls behind gets one RESYNC
+marker instead of a backlog, after which its stream sends a fresh snapshot.
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+import threading
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import AsyncIterator, Iterable, Optional
+
+from sqlalchemy import select
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from app.models import PresenceSession, User
+
+logger = logging.getLogger(__name__)
+
+OCCUPANCY_RESYNC_SECONDS = float(os.getenv("OCCUPANCY_RESYNC_SECONDS", "300"))
+OCCUPANCY_MAX_SUBSCRIBERS = int(os.getenv("OCCUPANCY_MAX_SUBSCRIBERS", "200"))
+# anonymous lobby streams may take only this many of OCCUPANCY_MAX_SUBSCRIBERS; the rest stays for admins
+OCCUPANCY_PUBLIC_MAX_SUBSCRIBERS = int(os.getenv("OCCUPANCY_PUBLIC_MAX_SUBSCRIBERS", "150"))
+OCCUPANCY_SUBSCRIBER_QUEUE = int(os.getenv("OCCUPANCY_SUBSCRIBER_QUEUE", "100"))
+OCCUPANCY_SSE_HEARTBEAT_SECONDS = float(os.getenv("OCCUPANCY_SSE_HEARTBEAT_SECONDS", "15"))
+
+RESYNC = object()
+
+
+def _utc(value: datetime) -> datetime:
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+
+@dataclass(frozen=True)
+class Occupant:
+    session_id: int
+    user_id: int
+    user_name: Optional[str]
+    user_email: Optional[str]
+    token_id: Optional[int]
+    membership_id: Optional[int]
+    started_at: datetime
+
+    @classmethod
+    def from_session(
+        cls, session: PresenceSession, user_name: Optional[str], user_email: Optional[str]
+    ) -> "Occupant":
+        return cls(
+            session_id=session.id,
+            user_id=session.user_id,
+            user_name=user_name,
+            user_email=user_email,
+            token_id=session.token_id,
+            membership_id=session.membership_id,
+            started_at=_utc(session.started_at),
+        )
+
+    def to_dict(self) -> dict:
+        # Same keys as serialize_presence_session(), so the admin console can use either.
+        return {
+            "id": self.session_id,
+            "user_id": self.user_id,
+            "user_name": self.user_name,
+            "user_email": self.user_email,
+            "token_id": self.token_id,
+            "membership_id": self.membership_id,
+            "started_at": self.started_at.isoformat(),
+            "ended_at": None,
+            "last_direction": "in",
+            "status": "active",
+        }
+
+
+@dataclass(frozen=True)
+class OccupancyEvent:
+    kind: str  # "enter" | "exit" | "snapshot"
+    version: int
+    count: int
+    at: datetime
+    occupant: Optional[Occupant] = None
+
+
+class OccupancyBusy(RuntimeError):
+    """OCCUPANCY_MAX_SUBSCRIBERS streams (or OCCUPANCY_PUBLIC_MAX_SUBSCRIBERS public ones) are already open."""
+
+
+class Subscription:
+    def __init__(self, loop: asyncio.AbstractEventLoop, max_queued: int):
+        self.loop = loop
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max(1, max_queued))
+
+    def deliver(self, event: OccupancyEvent) -> None:
+        """Runs on the subscriber's loop."""
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(RESYNC)
+
+
+class OccupancyTracker:
+    """Occupants by user id, a change version and the open subscriptions. Thread-safe."""
+
+    def __init__(
+        self,
+        *,
+        max_subscribers: int = OCCUPANCY_MAX_SUBSCRIBERS,
+        max_public_subscribers: int = OCCUPANCY_PUBLIC_MAX_SUBSCRIBERS,
+    ):
+        self.max_subscribers = max_subscribers
+        self.max_public_subscribers = max_public_subscribers
+        self._occupants: dict[int, Occupant] = {}
+        self._subscribers: set[Subscription] = set()
+        self._public: set[Subscription] = set()
+        self._lock = threading.Lock()
+        self.version = 0
+        self.updated_at = datetime.now(timezone.utc)
+        self.ready = False
+        self.resyncs = 0
+        self.corrections = 0
+
+    @property
+    def count(self) -> int:
+        return len(self._occupants)
+
+    def enter(self, occupant: Occupant) -> None:
+        with self._lock:
+            if self._occupants.get(occupant.user_id) == occupant:
+                return
+            self._occupants[occupant.user_id] = occupant
+            self._changed("enter", occupant)
+
+    def leave(self, user_id: int, *, session_id: Optional[int] = None) -> None:
+        with self._lock:
+            occupant = self._occupants.get(user_id)
+            if occupant is None or (session_id is not None and occupant.session_id != session_id):
+                return
+            del self._occupants[user_id]
+            self._changed("exit", occupant)
+
+    def replace(self, occupants: Iterable[Occupant], *, expected_version: Optional[int] = None) -> bool:
+        """
+        Swap in a full state read from the database. With expected_version the swap is
+        skipped (False) if a change was applied while that state was being read.
+        """
+        fresh = {occupant.user_id: occupant for occupant in occupants}
+        with self._lock:
+            if expected_version is not None and expected_version != self.version:
+                return False
+            self.ready = True
+            self.resyncs += 1
+            if fresh == self._occupants:
+                return True
+            if self.resyncs > 1:
+                self.corrections += 1
+            self._occupants = fresh
+            self._changed("snapshot")
+        return True
+
+    def snapshot(self, *, detail: bool) -> dict:
+        with self._lock:
+            payload = {
+                "count": len(self._occupants),
+                "version": self.version,
+                "updated_at": self.updated_at.isoformat(),
+            }
+            if detail:
+                occupants = sorted(self._occupants.values(), key=lambda o: o.started_at, reverse=True)
+                payload["occupants"] = [occupant.to_dict() for occupant in occupants]
+        return payload
+
+    def subscribe(self, *, public: bool = False, max_queued: int = OCCUPANCY_SUBSCRIBER_QUEUE) -> Subscription:
+        """Call from the event loop that will consume the subscription."""
+        subscription = Subscription(asyncio.get_running_loop(), max_queued)
+        with self._lock:
+            self._check_capacity(public)
+            self._subscribers.add(subscription)
+            if public:
+                self._public.add(subscription)
+        return subscription
+
+    def check_capacity(self, *, public: bool = False) -> None:
+        with self._lock:
+            self._check_capacity(public)
+
+    def _check_capacity(self, public: bool) -> None:
+        # Caller holds the lock.
+        if len(self._subscribers) >= self.max_subscribers:
+            raise OccupancyBusy(f"{len(self._subscribers)} occupancy streams open")
+        if public and len(self._public) >= self.max_public_subscribers:
+            raise OccupancyBusy(f"{len(self._public)} public occupancy streams open")
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        with self._lock:
+            self._subscribers.discard(subscription)
+            self._public.discard(subscription)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "ready": self.ready,
+                "count": len(self._occupants),
+                "version": self.version,
+                "subscribers": len(self._subscribers),
+                "public_subscribers": len(self._public),
+                "resyncs": self.resyncs,
+                "corrections": self.corrections,
+            }
+
+    def _changed(self, kind: str, occupant: Optional[Occupant] = None) -> None:
+        # Caller holds the lock, so subscribers receive events in version order.
+        self.version += 1
+        self.updated_at = datetime.now(timezone.utc)
+        event = OccupancyEvent(kind, self.version, len(self._occupants), self.updated_at, occupant)
+        for subscription in list(self._subscribers):
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.deliver, event)
+            except RuntimeError:  # loop closed
+                self._subscribers.discard(subscription)
+                self._public.discard(subscription)
+
+
+occupancy = OccupancyTracker()
+
+
+def load_active_occupants(db: Session) -> list[Occupant]:
+    """Active presence sessions with their users' names, in one query."""
+    rows = db.execute(
+        select(
+            PresenceSession.id,
+            PresenceSession.user_id,
+            PresenceSession.token_id,
+            PresenceSession.membership_id,
+            PresenceSession.started_at,
+            User.name,
+            User.email,
+        )
+        .join(User, User.id == PresenceSession.user_id, isouter=True)
+        .where(PresenceSession.ended_at.is_(None), PresenceSession.status == "active")
+        .order_by(PresenceSession.started_at.desc())
+    ).all()
+    occupants: dict[int, Occupant] = {}
+    for row in rows:
+        if row.user_id in occupants:
+            continue  # rows are newest first; a user has at most one visible occupant
+        occupants[row.user_id] = Occupant(
+            session_id=row.id,
+            user_id=row.user_id,
+            user_name=row.name,
+            user_email=row.email,
+            token_id=row.token_id,
+            membership_id=row.membership_id,
+            started_at=_utc(row.started_at),
+        )
+    return list(occupants.values())
+
+
+def rebuild_occupancy(engine: Engine, tracker: Optional[OccupancyTracker] = None) -> bool:
+    tracker = tracker or occupancy
+    version = tracker.version
+    with Session(engine) as db:
+        occupants = load_active_occupants(db)
+    return tracker.replace(occupants, expected_version=version)
+
+
+def _event_frame(name: str, version: int, payload: dict) -> str:
+    return f"event: {name}\nid: {version}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+
+def occupancy_event_stream(
+    *,
+    detail: bool,
+    tracker: Optional[OccupancyTracker] = None,
+    heartbeat_seconds: float = OCCUPANCY_SSE_HEARTBEAT_SECONDS,
+) -> AsyncIterator[str]:
+    """
+    text/event-stream frames: a snapshot first, then "enter"/"exit" events with
+    the occupant (detail=True) or "count" events (detail=False). Count-only
+    streams are the anonymous lobby ones and count against the smaller public
+    cap. Raises OccupancyBusy right away (not from the iterator) when too many
+    streams are open. Call from the event loop that will consume the stream.
+    """
+    tracker = tracker or occupancy
+    public = not detail
+    tracker.check_capacity(public=public)
+
+    def snapshot_frame() -> tuple[int, str]:
+        payload = tracker.snapshot(detail=detail)
+        return payload["version"], _event_frame("snapshot" if detail else "count", payload["version"], payload)
+
+    async def frames() -> AsyncIterator[str]:
+        # Subscribed only once iteration starts: a response that is never sent leaves nothing behind.
+        subscription = tracker.subscribe(public=public)
+        try:
+            version, frame = snapshot_frame()
+            yield frame
+            while True:
+                try:
+                    event = await asyncio.wait_for(subscription.queue.get(), heartbeat_seconds)
+                except asyncio.TimeoutError:
+                    yield ": ping\n\n"
+                    continue
+                if event is RESYNC or event.kind == "snapshot":
+                    version, frame = snapshot_frame()
+                    yield frame
+                    continue
+                if event.version <= version:
+                    continue  # already part of the snapshot we sent
+                version = event.version
+                payload = {"count": event.count, "version": event.version, "updated_at": event.at.isoformat()}
+                if detail:
+                    payload["occupant"] = event.occupant.to_dict()
+                    yield _event_frame(event.kind, event.version, payload)
+                else:
+                    yield _event_frame("count", event.version, payload)
+        finally:
+            tracker.unsubscribe(subscription)
+
+    return frames()
+
+
+class OccupancySync:
+    """Startup rebuild plus a periodic resync thread."""
+
+    def __init__(self, tracker: OccupancyTracker, *, interval_seconds: float = OCCUPANCY_RESYNC_SECONDS):
+        self.tracker = tracker
+        self.interval_seconds = interval_seconds
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.engine: Optional[Engine] = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, engine: Engine) -> None:
+        self.engine = engine
+        self._sync()
+        if self.running or self.interval_seconds <= 0:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="occupancy-sync", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval_seconds):
+            self._sync()
+
+    def _sync(self) -> None:
+        try:
+            if rebuild_occupancy(self.engine, self.tracker):
+                logger.debug("Occupancy resynced: %s in the gym", self.tracker.count)
+        except Exception as exc:
+            logger.error("Occupancy rebuild failed: %s", exc)
+
+
+_sync = OccupancySync(occupancy)
+
+
+def start_occupancy_sync(engine: Engine) -> None:
+    _sync.start(engine)
+
+
+def stop_occupancy_sync() -> None:
+    _sync.stop()
@@ -0,0 +1,260 @@
+"""
+"How busy will it be at 18:00?" served from memory.
+
+OccupancyProfiles keeps, per local weekday (GYM_TIMEZONE), one compact array
+of 96 floats: the expected number of people in the gym in each 15-minute slot.
+A finished local day is turned into its own 96-slot vector (seconds spent in
+the gym by all closed presence sessions overlapping each slot / slot length;
+slots follow the local wall clock, so DST days have correctly sized slots) and
+folded into its weekday's profile as an exponentially weighted mean:
+FORECAST_ALPHA weights the newest week, earlier weeks fade out. The first
+observations of a weekday are plain averages.
+
+ForecastUpdater builds the profiles from the last FORECAST_HISTORY_WEEKS weeks
+at startup (one query) and then folds each day once it has settled (one query
+per day). A day is folded only FORECAST_SETTLE_HOURS after its local midnight:
+sessions still open at midnight, or left open until the presence sweeper times
+them out (PRESENCE_MAX_VISIT_HOURS + one PRESENCE_SWEEP_INTERVAL_MINUTES), get
+their ended_at by then, and a folded day is never revisited. Forecast requests
+never touch the database.
+
+Offline evaluation on synthetic sessions: python -m benchmarks.forecast_eval
+"""
+from __future__ import annotations
+
+import bisect
+import logging
+import os
+import threading
+from array import array
+from datetime import date, datetime, time, timedelta, timezone
+from typing import Iterable, Optional, Sequence
+from zoneinfo import ZoneInfo
+
+from sqlalchemy import select
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from app.services.timezone import get_gym_timezone
+
+logger = logging.getLogger(__name__)
+
+FORECAST_ALPHA = float(os.getenv("FORECAST_ALPHA", "0.25"))
+FORECAST_HISTORY_WEEKS = int(os.getenv("FORECAST_HISTORY_WEEKS", "8"))
+FORECAST_CHECK_INTERVAL_SECONDS = float(os.getenv("FORECAST_CHECK_INTERVAL_SECONDS", "600"))
+# same defaults as app.services.presence_sweeper, which cannot be imported without DATABASE_URL
+_SWEEPER_HORIZON_HOURS = float(os.getenv("PRESENCE_MAX_VISIT_HOURS", "8")) + float(
+    os.getenv("PRESENCE_SWEEP_INTERVAL_MINUTES", "10")
+) / 60
+FORECAST_SETTLE_HOURS = float(os.getenv("FORECAST_SETTLE_HOURS", str(_SWEEPER_HORIZON_HOURS)))
+
+SLOT_MINUTES = 15
+SLOTS_PER_DAY = 24 * 60 // SLOT_MINUTES
+
+Visit = tuple[datetime, datetime]  # aware (started_at, ended_at)
+
+
+def slot_label(slot: int) -> str:
+    return f"{slot * SLOT_MINUTES // 60:02d}:{slot * SLOT_MINUTES % 60:02d}"
+
+
+def slot_for(at: time) -> int:
+    return (at.hour * 60 + at.minute) // SLOT_MINUTES
+
+
+def slot_edges(day: date, tz: ZoneInfo) -> list[datetime]:
+    """SLOTS_PER_DAY + 1 UTC instants: local wall-clock slot starts of `day`, then the next midnight."""
+    edges = []
+    for slot in range(SLOTS_PER_DAY):
+        minutes = slot * SLOT_MINUTES
+        edges.append(datetime.combine(day, time(minutes // 60, minutes % 60), tzinfo=tz).astimezone(timezone.utc))
+    edges.append(datetime.combine(day + timedelta(days=1), time(0, 0), tzinfo=tz).astimezone(timezone.utc))
+    return edges
+
+
+def _aware(value: datetime) -> datetime:
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+
+def daily_occupancy(visits: Iterable[Visit], first_day: date, last_day: date, tz: ZoneInfo) -> dict[date, array]:
+    """Average head count per slot for every local day in [first_day, last_day] (days without visits are zeros)."""
+    days: dict[date, array] = {}
+    edges: dict[date, list[datetime]] = {}
+    day = first_day
+    while day <= last_day:
+        days[day] = array("d", bytes(8 * SLOTS_PER_DAY))
+        edges[day] = slot_edges(day, tz)
+        day += timedelta(days=1)
+    range_start, range_end = edges[first_day][0], edges[last_day][-1]
+
+    for started_at, ended_at in visits:
+        start, end = max(_aware(started_at), range_start), min(_aware(ended_at), range_end)
+        if end <= start:
+            continue
+        day = start.astimezone(tz).date()
+        while day <= last_day:
+            day_edges = edges[day]
+            if day_edges[0] >= end:
+                break
+            slots = days[day]
+            slot = max(bisect.bisect_right(day_edges, start) - 1, 0)
+            while slot < SLOTS_PER_DAY and day_edges[slot] < end:
+                slot_start, slot_end = day_edges[slot], day_edges[slot + 1]
+                length = (slot_end - slot_start).total_seconds()
+                if length > 0:
+                    overlap = (min(end, slot_end) - max(start, slot_start)).total_seconds()
+                    if overlap > 0:
+                        slots[slot] += overlap / length
+                slot += 1
+            day += timedelta(days=1)
+    return days
+
+
+class OccupancyProfiles:
+    """7 x SLOTS_PER_DAY expected head counts; folds are serialized, readers never block on the DB."""
+
+    def __init__(self, *, alpha: float = FORECAST_ALPHA):
+        self.alpha = alpha
+        self._profiles = [array("d", bytes(8 * SLOTS_PER_DAY)) for _ in range(7)]
+        self._observed = array("i", [0] * 7)
+        self._lock = threading.Lock()
+        self.last_day: Optional[date] = None
+
+    def fold_day(self, day: date, occupancy: Sequence[float]) -> None:
+        """Blend one finished day into its weekday profile (days must arrive in order)."""
+        weekday = day.weekday()
+        with self._lock:
+            if self.last_day is not None and day <= self.last_day:
+                return
+            observed = self._observed[weekday] + 1
+            rate = max(self.alpha, 1.0 / observed)
+            current = self._profiles[weekday]
+            # built aside and swapped in, so a concurrent reader sees either the old or the new profile
+            self._profiles[weekday] = array("d", (old + rate * (new - old) for old, new in zip(current, occupancy)))
+            self._observed[weekday] = observed
+            self.last_day = day
+
+    def profile(self, weekday: int) -> array:
+        return self._profiles[weekday]
+
+    def observed(self, weekday: int) -> int:
+        return self._observed[weekday]
+
+    def forecast(self, day: date, *, at: Optional[time] = None) -> dict:
+        weekday = day.weekday()
+        profile = self._profiles[weekday]
+        slots = [{"time": slot_label(slot), "expected": round(value, 1)} for slot, value in enumerate(profile)]
+        peak = max(range(SLOTS_PER_DAY), key=profile.__getitem__)
+        payload = {
+            "day": day.isoformat(),
+            "weekday": weekday,
+            "slot_minutes": SLOT_MINUTES,
+            "days_observed": self._observed[weekday],
+            "peak": slots[peak] if profile[peak] > 0 else None,
+            "slots": slots,
+        }
+        if at is not None:
+            payload["at"] = slots[slot_for(at)]
+        return payload
+
+    def stats(self) -> dict:
+        return {
+            "last_day": self.last_day.isoformat() if self.last_day else None,
+            "days_observed": list(self._observed),
+        }
+
+
+forecast_profiles = OccupancyProfiles()
+
+
+def load_visits(db: Session, start: datetime, end: datetime) -> list[Visit]:
+    """Closed sessions overlapping [start, end)."""
+    from app.models import PresenceSession  # imported here so benchmarks.forecast_eval runs without DATABASE_URL
+
+    rows = db.execute(
+        select(PresenceSession.started_at, PresenceSession.ended_at).where(
+            PresenceSession.started_at < end,
+            PresenceSession.ended_at > start,
+            PresenceSession.ended_at > PresenceSession.started_at,
+        )
+    ).all()
+    return [(row.started_at, row.ended_at) for row in rows]
+
+
+class ForecastUpdater:
+    """Startup build plus a thread folding each settled local day."""
+
+    def __init__(
+        self,
+        profiles: OccupancyProfiles,
+        *,
+        history_weeks: int = FORECAST_HISTORY_WEEKS,
+        settle_hours: float = FORECAST_SETTLE_HOURS,
+        interval_seconds: float = FORECAST_CHECK_INTERVAL_SECONDS,
+    ):
+        self.profiles = profiles
+        self.history_weeks = history_weeks
+        self.settle_hours = settle_hours
+        self.interval_seconds = interval_seconds
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.engine: Optional[Engine] = None
+
+    def catch_up(self, engine: Engine, *, now: Optional[datetime] = None, tz: Optional[ZoneInfo] = None) -> int:
+        """Fold every settled day not folded yet (at most history_weeks back); returns the number of days."""
+        tz = tz or get_gym_timezone()
+        now = now or datetime.now(timezone.utc)
+        # the last day whose end lies at least settle_hours before now
+        today = (now - timedelta(hours=self.settle_hours)).astimezone(tz).date()
+        last_day = today - timedelta(days=1)
+        if self.profiles.last_day is not None:
+            first_day = self.profiles.last_day + timedelta(days=1)
+        else:
+            first_day = today - timedelta(weeks=self.history_weeks)
+        if first_day > last_day:
+            return 0
+        start = slot_edges(first_day, tz)[0]
+        end = slot_edges(last_day, tz)[-1]
+        with Session(engine) as db:
+            visits = load_visits(db, start, end)
+        for day, occupancy in sorted(daily_occupancy(visits, first_day, last_day, tz).items()):
+            self.profiles.fold_day(day, occupancy)
+        return (last_day - first_day).days + 1
+
+    def start(self, engine: Engine) -> None:
+        self.engine = engine
+        self._catch_up()
+        if self._thread is not None or self.interval_seconds <= 0:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="occupancy-forecast", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval_seconds):
+            self._catch_up()
+
+    def _catch_up(self) -> None:
+        try:
+            folded = self.catch_up(self.engine)
+            if folded:
+                logger.info("Occupancy forecast: folded %s day(s), profiles up to %s", folded, self.profiles.last_day)
+        except Exception as exc:
+            logger.error("Occupancy forecast update failed: %s", exc)
+
+
+_updater = ForecastUpdater(forecast_profiles)
+
+
+def start_forecast_updates(engine: Engine) -> None:
+    _updater.start(engine)
+
+
+def stop_forecast_updates() -> None:
+    _updater.stop()
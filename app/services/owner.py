@@ -5,6 +5,7 @@ from sqlalchemy.orm import Session
 from app.database import SessionLocal
 from app.models import User, BrandingSettings
 from app.auth import get_password_hash
+from app.services.principals import invalidate_principal
 
 logger = logging.getLogger(__name__)
 
@@ -55,6 +56,7 @@ def ensure_owner_account():
             conflicting_user.is_admin = True
             conflicting_user.password_hash = get_password_hash(owner_password)
             db.commit()
+            invalidate_principal(conflicting_user.id)
             logger.info("Existing user %s promoted to owner.", normalized_email)
             return
 
@@ -0,0 +1,161 @@
+"""
+Argon2 password hashing off the event loop.
+
+Hashing and verification run in a dedicated, size-limited thread pool
+(argon2-cffi releases the GIL while hashing, so threads run in parallel).
+At most PASSWORD_HASH_WORKERS hashes run at once and at most
+PASSWORD_HASH_MAX_PENDING calls may be waiting or running; beyond that
+PasswordHasherBusy is raised instead of queueing unboundedly, so a login storm
+costs CPU on the pool threads but never blocks the loop that serves scanners.
+
+Argon2 cost parameters come from ARGON2_* env vars. Hashes made with other
+parameters still verify; verify_and_update() also returns a replacement hash
+so logins upgrade old hashes (rehash-on-login).
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional, TypeVar
+
+from passlib.context import CryptContext
+
+logger = logging.getLogger(__name__)
+
+ARGON2_TIME_COST = int(os.getenv("ARGON2_TIME_COST", "3"))
+ARGON2_MEMORY_COST_KIB = int(os.getenv("ARGON2_MEMORY_COST_KIB", "65536"))
+ARGON2_PARALLELISM = int(os.getenv("ARGON2_PARALLELISM", "4"))
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", "64"))
+
+T = TypeVar("T")
+
+
+def build_crypt_context(
+    *,
+    time_cost: int = ARGON2_TIME_COST,
+    memory_cost: int = ARGON2_MEMORY_COST_KIB,
+    parallelism: int = ARGON2_PARALLELISM,
+) -> CryptContext:
+    # Argon2 (no 72 byte limit); hashes with other parameters are reported by needs_update()
+    return CryptContext(
+        schemes=["argon2"],
+        deprecated="auto",
+        argon2__time_cost=time_cost,
+        argon2__memory_cost=memory_cost,
+        argon2__parallelism=parallelism,
+    )
+
+
+pwd_context = build_crypt_context()
+
+
+class PasswordHasherBusy(RuntimeError):
+    """More than max_pending hash/verify calls are already waiting or running."""
+
+
+class PasswordHasher:
+    """Bounded thread pool for CryptContext calls, with queue/latency counters."""
+
+    def __init__(
+        self,
+        context: CryptContext,
+        *,
+        workers: int = PASSWORD_HASH_WORKERS,
+        max_pending: int = PASSWORD_HASH_MAX_PENDING,
+    ):
+        self.context = context
+        self.workers = max(1, workers)
+        self.max_pending = max(self.workers, max_pending)
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._running = 0
+        self.completed = 0
+        self.rejected = 0
+        self.rehashed = 0
+        self.wait_ms_total = 0.0
+        self.wait_ms_max = 0.0
+        self.run_ms_total = 0.0
+
+    def _pool(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="password-hash")
+            return self._executor
+
+    async def _submit(self, fn: Callable[[], T]) -> T:
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self.rejected += 1
+                raise PasswordHasherBusy(f"{self._pending} password hash calls pending")
+            self._pending += 1
+        submitted = time.perf_counter()
+
+        def run() -> T:
+            started = time.perf_counter()
+            with self._lock:
+                self._running += 1
+                wait_ms = (started - submitted) * 1000
+                self.wait_ms_total += wait_ms
+                self.wait_ms_max = max(self.wait_ms_max, wait_ms)
+            try:
+                return fn()
+            finally:
+                with self._lock:
+                    self._running -= 1
+                    self.run_ms_total += (time.perf_counter() - started) * 1000
+
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._pool(), run)
+        finally:
+            with self._lock:
+                self._pending -= 1
+                self.completed += 1
+
+    async def hash(self, password: str) -> str:
+        return await self._submit(lambda: self.context.hash(password))
+
+    async def verify(self, password: str, password_hash: str) -> bool:
+        return await self._submit(lambda: self.context.verify(password, password_hash))
+
+    async def verify_and_update(self, password: str, password_hash: str) -> tuple[bool, Optional[str]]:
+        """(valid, new_hash); new_hash is set when the stored hash uses outdated parameters."""
+        valid, new_hash = await self._submit(lambda: self.context.verify_and_update(password, password_hash))
+        if new_hash is not None:
+            with self._lock:
+                self.rehashed += 1
+        return valid, new_hash
+
+    def stats(self) -> dict:
+        with self._lock:
+            done = max(self.completed, 1)
+            return {
+                "workers": self.workers,
+                "max_pending": self.max_pending,
+                "running": self._running,
+                "queued": self._pending - self._running,
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "rehashed": self.rehashed,
+                "wait_ms_avg": round(self.wait_ms_total / done, 2),
+                "wait_ms_max": round(self.wait_ms_max, 2),
+                "run_ms_avg": round(self.run_ms_total / done, 2),
+            }
+
+    def shutdown(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+
+password_hasher = PasswordHasher(pwd_context)
+
+
+def shutdown_password_hasher() -> None:
+    password_hasher.shutdown()
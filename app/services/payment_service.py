@@ -6,6 +6,7 @@ import httpx
 import uuid
 import os
 import logging
+from app.services.entitlement_cache import invalidate_user_entitlements
 from app.services.membership import MembershipService
 
 logger = logging.getLogger(__name__)
@@ -118,6 +119,7 @@ def mark_order_paid(db: Session, payment_id: str) -> Payment:
             logger.warning("Payment %s has no token_amount, skipping credit addition", payment_id)
     
     db.commit()
+    invalidate_user_entitlements(user.id)
     db.refresh(payment)
     db.refresh(user)
     
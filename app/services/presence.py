@@ -1,6 +1,7 @@
 import logging
 from datetime import datetime, timezone
 
+from sqlalchemy import update
 from sqlalchemy.orm import Session
 
 from app.models import User
@@ -19,6 +20,22 @@ def set_presence(db: Session, user: User, is_in_gym: bool, when: datetime):
     db.add(user)
 
 
+def set_presence_for_user_id(db: Session, user_id: int, is_in_gym: bool, when: datetime):
+    """Same as set_presence, but as a single UPDATE without loading the User row."""
+    ts = when if when.tzinfo else when.replace(tzinfo=timezone.utc)
+    values = {"is_in_gym": is_in_gym}
+    if is_in_gym:
+        values["last_entry_at"] = ts
+    else:
+        values["last_exit_at"] = ts
+    db.execute(
+        update(User)
+        .where(User.id == user_id)
+        .values(**values)
+        .execution_options(synchronize_session=False)
+    )
+
+
 def rebuild_presence_from_logs(db: Session, user: User):
     """Rebuild presence flag from the most recent access log (entry/exit)."""
     from app.models import AccessLog  # local import to avoid circular
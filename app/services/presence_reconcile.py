@@ -0,0 +1,374 @@
+"""
+Bulk presence reconciliation: users.is_in_gym / last_entry_at / last_exit_at
+and open presence_sessions recomputed for every user at once.
+
+The per-user rebuild_presence_from_logs() is fine for one account; after a
+scanner outage everybody needs fixing. This job reads the presence events in
+one DISTINCT ON (user_id) pass into a temporary table:
+
+* allowed access_logs scans flagged entry or exit (user via access_logs.user_id
+  or the token owner); like rebuild_presence_from_logs, a log with neither flag
+  (e.g. a plain /api/verify credit scan, always logged direction "in") is not a
+  presence event,
+* presence_sessions starts ("in") and ends ("out"), which is where the
+  /api/verify/entry|exit flow records presence.
+
+The latest event decides is_in_gym; the latest "in"/"out" give last_entry_at /
+last_exit_at (kept as they are when the user has no events, e.g. after log
+retention). Users are then processed in keyset batches of
+PRESENCE_RECONCILE_BATCH_SIZE, one transaction each:
+
+* users rows that differ are updated,
+* open sessions of users who are out (and duplicate open sessions) are closed
+  with status "anomaly" at the last exit,
+* users who are in without an open session get one starting at their last entry
+  (sessions that are too old are then closed by the presence sweeper).
+
+Users with presence activity after the snapshot are skipped, so live scans made
+while the job runs are never overwritten. dry_run=True computes the same diff
+without writing. Progress is exposed while the job runs (admin endpoint, CLI).
+PostgreSQL only.
+
+    python -m app.services.presence_reconcile --dry-run
+    python -m app.services.presence_reconcile --batch-size 500
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import os
+import threading
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timezone
+from typing import Any, Callable, Optional
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection, Engine
+
+from app.services.occupancy import rebuild_occupancy
+from app.services.visit_rollups import request_visit_rollup
+
+logger = logging.getLogger(__name__)
+
+PRESENCE_RECONCILE_BATCH_SIZE = int(os.getenv("PRESENCE_RECONCILE_BATCH_SIZE", "1000"))
+PRESENCE_RECONCILE_DIFF_LIMIT = int(os.getenv("PRESENCE_RECONCILE_DIFF_LIMIT", "500"))
+
+RECONCILE_NOTE = "Closed by presence reconciliation"
+RECONCILE_METADATA = json.dumps({"source": "reconcile"})
+
+_TRUTH_SQL = text(
+    """
+    CREATE TEMPORARY TABLE presence_truth AS
+    SELECT DISTINCT ON (user_id)
+           user_id,
+           direction AS last_direction,
+           at AS last_at,
+           max(at) FILTER (WHERE direction = 'in') OVER w AS last_entry_at,
+           max(at) FILTER (WHERE direction = 'out') OVER w AS last_exit_at
+    FROM (
+        SELECT COALESCE(l.user_id, t.user_id) AS user_id,
+               CASE WHEN l.entry THEN 'in' ELSE 'out' END AS direction,
+               COALESCE(l.scanned_at, l.created_at) AS at
+        FROM access_logs l
+        LEFT JOIN access_tokens t ON t.id = l.token_id
+        WHERE l.status = 'allow' AND (l.entry OR l.exit)
+        UNION ALL
+        SELECT user_id, 'in', started_at FROM presence_sessions
+        UNION ALL
+        -- zero-length sessions (closed duplicates) carry no exit
+        SELECT user_id, 'out', ended_at FROM presence_sessions WHERE ended_at > started_at
+    ) events
+    WHERE user_id IS NOT NULL AND at IS NOT NULL
+    WINDOW w AS (PARTITION BY user_id)
+    -- same instant: the exit wins ('out' > 'in')
+    ORDER BY user_id, at DESC, direction DESC
+    """
+)
+
+_BATCH_SQL = """
+    SELECT u.id AS user_id,
+           COALESCE(u.is_in_gym, false) AS old_in,
+           u.last_entry_at AS old_entry,
+           u.last_exit_at AS old_exit,
+           COALESCE(t.last_direction = 'in', false) AS new_in,
+           COALESCE(t.last_entry_at, u.last_entry_at) AS new_entry,
+           COALESCE(t.last_exit_at, u.last_exit_at) AS new_exit,
+           o.open_sessions,
+           o.newest_open_id,
+           o.newest_open_started_at
+    FROM users u
+    LEFT JOIN presence_truth t ON t.user_id = u.id
+    CROSS JOIN LATERAL (
+        SELECT count(*) AS open_sessions,
+               (array_agg(p.id ORDER BY p.started_at DESC, p.id DESC))[1] AS newest_open_id,
+               max(p.started_at) AS newest_open_started_at
+        FROM presence_sessions p
+        WHERE p.user_id = u.id AND p.ended_at IS NULL AND p.status = 'active'
+    ) o
+    WHERE u.id > :after
+    ORDER BY u.id
+    LIMIT :batch_size
+"""
+
+_UPDATE_USERS_SQL = text(
+    """
+    UPDATE users u
+    SET is_in_gym = d.is_in_gym, last_entry_at = d.last_entry_at, last_exit_at = d.last_exit_at
+    FROM unnest(
+        CAST(:user_ids AS integer[]),
+        CAST(:is_in_gym AS boolean[]),
+        CAST(:entries AS timestamptz[]),
+        CAST(:exits AS timestamptz[])
+    ) AS d(user_id, is_in_gym, last_entry_at, last_exit_at)
+    WHERE u.id = d.user_id
+    """
+)
+
+_CLOSE_SESSIONS_SQL = text(
+    """
+    WITH targets AS (
+        SELECT p.id,
+               GREATEST(p.started_at, COALESCE(t.last_exit_at, p.started_at)) AS ends_at
+        FROM presence_sessions p
+        LEFT JOIN presence_truth t ON t.user_id = p.user_id
+        WHERE p.user_id = ANY(CAST(:user_ids AS integer[]))
+          AND p.ended_at IS NULL AND p.status = 'active'
+          AND p.id <> ALL(CAST(:keep_ids AS integer[]))
+    )
+    UPDATE presence_sessions p
+    SET ended_at = s.ends_at,
+        status = 'anomaly',
+        last_direction = 'out',
+        duration_seconds = CAST(EXTRACT(EPOCH FROM s.ends_at - p.started_at) AS integer),
+        notes = CASE WHEN p.notes IS NULL OR p.notes = '' THEN :note ELSE p.notes || E'\\n' || :note END,
+        updated_at = now()
+    FROM targets s
+    WHERE p.id = s.id
+    """
+)
+
+_OPEN_SESSIONS_SQL = text(
+    """
+    INSERT INTO presence_sessions (user_id, started_at, last_direction, status, metadata, created_at, updated_at)
+    SELECT t.user_id, t.last_entry_at, 'in', 'active', CAST(:metadata AS json), now(), now()
+    FROM presence_truth t
+    WHERE t.user_id = ANY(CAST(:user_ids AS integer[])) AND t.last_entry_at IS NOT NULL
+    """
+)
+
+
+@dataclass
+class ReconcileProgress:
+    dry_run: bool
+    batch_size: int
+    status: str = "running"  # running | done | failed
+    started_at: datetime = field(default_factory=lambda: datetime.now(timezone.utc))
+    finished_at: Optional[datetime] = None
+    snapshot_at: Optional[datetime] = None
+    total_users: int = 0
+    processed_users: int = 0
+    batches: int = 0
+    users_changed: int = 0
+    sessions_closed: int = 0
+    sessions_opened: int = 0
+    skipped_recent: int = 0
+    error: Optional[str] = None
+    diff: list[dict[str, Any]] = field(default_factory=list)
+    diff_truncated: bool = False
+
+    def to_dict(self) -> dict[str, Any]:
+        payload = asdict(self)
+        for key in ("started_at", "finished_at", "snapshot_at"):
+            if payload[key] is not None:
+                payload[key] = payload[key].isoformat()
+        return payload
+
+
+def _iso(value: Optional[datetime]) -> Optional[str]:
+    return value.isoformat() if value is not None else None
+
+
+def _user_diff(row, snapshot_at: datetime) -> Optional[dict[str, Any]]:
+    """What reconciliation would change for one user row of _BATCH_SQL, None when nothing."""
+    recent = [ts for ts in (row.old_entry, row.old_exit, row.newest_open_started_at) if ts is not None]
+    if recent and max(recent) > snapshot_at:
+        return {"user_id": row.user_id, "skipped": "presence changed after the snapshot"}
+    diff: dict[str, Any] = {"user_id": row.user_id}
+    if row.old_in != row.new_in:
+        diff["is_in_gym"] = [row.old_in, row.new_in]
+    if row.old_entry != row.new_entry:
+        diff["last_entry_at"] = [_iso(row.old_entry), _iso(row.new_entry)]
+    if row.old_exit != row.new_exit:
+        diff["last_exit_at"] = [_iso(row.old_exit), _iso(row.new_exit)]
+    close = row.open_sessions - 1 if row.new_in and row.open_sessions else row.open_sessions
+    if close:
+        diff["close_sessions"] = close
+    if row.new_in and not row.open_sessions and row.new_entry is not None:
+        diff["open_session"] = True
+    return diff if len(diff) > 1 else None
+
+
+def _reconcile_batch(conn: Connection, rows, progress: ReconcileProgress, diff_limit: int) -> None:
+    changed_users, close_users, keep_ids, open_users = [], [], [], []
+    for row in rows:
+        diff = _user_diff(row, progress.snapshot_at)
+        if diff is None:
+            continue
+        if len(progress.diff) < diff_limit:
+            progress.diff.append(diff)
+        else:
+            progress.diff_truncated = True
+        if "skipped" in diff:
+            progress.skipped_recent += 1
+            continue
+        if {"is_in_gym", "last_entry_at", "last_exit_at"} & diff.keys():
+            changed_users.append(row)
+        if diff.get("close_sessions"):
+            close_users.append(row.user_id)
+            if row.new_in:
+                keep_ids.append(row.newest_open_id)
+            progress.sessions_closed += diff["close_sessions"]
+        if diff.get("open_session"):
+            open_users.append(row.user_id)
+            progress.sessions_opened += 1
+    progress.users_changed += len(changed_users)
+    if progress.dry_run:
+        return
+    if changed_users:
+        conn.execute(
+            _UPDATE_USERS_SQL,
+            {
+                "user_ids": [row.user_id for row in changed_users],
+                "is_in_gym": [row.new_in for row in changed_users],
+                "entries": [row.new_entry for row in changed_users],
+                "exits": [row.new_exit for row in changed_users],
+            },
+        )
+    if close_users:
+        conn.execute(_CLOSE_SESSIONS_SQL, {"user_ids": close_users, "keep_ids": keep_ids or [0], "note": RECONCILE_NOTE})
+    if open_users:
+        conn.execute(_OPEN_SESSIONS_SQL, {"user_ids": open_users, "metadata": RECONCILE_METADATA})
+
+
+def reconcile_presence(
+    engine: Engine,
+    *,
+    dry_run: bool = False,
+    batch_size: int = PRESENCE_RECONCILE_BATCH_SIZE,
+    diff_limit: int = PRESENCE_RECONCILE_DIFF_LIMIT,
+    progress: Optional[ReconcileProgress] = None,
+    on_batch: Optional[Callable[[ReconcileProgress], None]] = None,
+) -> ReconcileProgress:
+    """Reconcile every user's presence (see module docstring); returns the final progress."""
+    progress = progress or ReconcileProgress(dry_run=dry_run, batch_size=max(1, batch_size))
+    if engine.dialect.name != "postgresql":
+        raise RuntimeError(f"presence reconciliation needs PostgreSQL, not {engine.dialect.name}")
+    batch_sql = text(_BATCH_SQL if dry_run else _BATCH_SQL + " FOR UPDATE OF u")
+    try:
+        with engine.connect() as conn:
+            # The DISTINCT ON pass over all of access_logs may legitimately outlive DB_STATEMENT_TIMEOUT_MS.
+            conn.execute(text("SET statement_timeout = 0"))
+            conn.commit()
+            try:
+                progress.snapshot_at = conn.execute(text("SELECT now()")).scalar()
+                conn.execute(text("DROP TABLE IF EXISTS presence_truth"))
+                conn.execute(_TRUTH_SQL)
+                conn.execute(text("CREATE INDEX ON presence_truth (user_id)"))
+                conn.execute(text("ANALYZE presence_truth"))
+                progress.total_users = conn.execute(text("SELECT count(*) FROM users")).scalar()
+                conn.commit()  # the temp table lives as long as the connection
+                after = 0
+                while True:
+                    rows = conn.execute(batch_sql, {"after": after, "batch_size": progress.batch_size}).all()
+                    if not rows:
+                        conn.rollback()
+                        break
+                    _reconcile_batch(conn, rows, progress, diff_limit)
+                    conn.commit()
+                    after = rows[-1].user_id
+                    progress.processed_users += len(rows)
+                    progress.batches += 1
+                    if on_batch:
+                        on_batch(progress)
+            finally:
+                # the connection goes back to the pool: no temp table, default timeout
+                conn.rollback()
+                conn.execute(text("DROP TABLE IF EXISTS presence_truth"))
+                conn.execute(text("RESET statement_timeout"))
+                conn.commit()
+    except Exception as exc:
+        progress.status = "failed"
+        progress.error = str(exc)
+        progress.finished_at = datetime.now(timezone.utc)
+        raise
+    if not dry_run and (progress.sessions_closed or progress.sessions_opened):
+        rebuild_occupancy(engine)
+        request_visit_rollup()
+    progress.status = "done"
+    progress.finished_at = datetime.now(timezone.utc)
+    logger.info(
+        "Presence reconciliation%s: %s users changed, %s sessions closed, %s opened, %s skipped (of %s users)",
+        " (dry run)" if dry_run else "",
+        progress.users_changed,
+        progress.sessions_closed,
+        progress.sessions_opened,
+        progress.skipped_recent,
+        progress.processed_users,
+    )
+    return progress
+
+
+class ReconcileAlreadyRunning(RuntimeError):
+    pass
+
+
+_job_lock = threading.Lock()
+_current: Optional[ReconcileProgress] = None
+
+
+def current_reconcile() -> Optional[ReconcileProgress]:
+    """Progress of the running or last finished background reconciliation in this process."""
+    return _current
+
+
+def start_reconcile_job(engine: Engine, *, dry_run: bool, batch_size: int = PRESENCE_RECONCILE_BATCH_SIZE) -> ReconcileProgress:
+    """Run reconcile_presence in a background thread; raises ReconcileAlreadyRunning."""
+    global _current
+    with _job_lock:
+        if _current is not None and _current.status == "running":
+            raise ReconcileAlreadyRunning("presence reconciliation is already running")
+        progress = ReconcileProgress(dry_run=dry_run, batch_size=max(1, batch_size))
+        _current = progress
+
+    def run() -> None:
+        try:
+            reconcile_presence(engine, dry_run=dry_run, progress=progress)
+        except Exception:
+            logger.exception("Presence reconciliation failed")
+
+    threading.Thread(target=run, name="presence-reconcile", daemon=True).start()
+    return progress
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    parser = argparse.ArgumentParser(description="Reconcile presence of all users from access logs and sessions.")
+    parser.add_argument("--dry-run", action="store_true", help="print the diff, change nothing")
+    parser.add_argument("--batch-size", type=int, default=PRESENCE_RECONCILE_BATCH_SIZE)
+    args = parser.parse_args()
+
+    from app.database import engine
+
+    def report(progress: ReconcileProgress) -> None:
+        print(f"{progress.processed_users}/{progress.total_users} users, {progress.users_changed} changed", flush=True)
+
+    result = reconcile_presence(engine, dry_run=args.dry_run, batch_size=args.batch_size, on_batch=report)
+    if args.dry_run:
+        for entry in result.diff:
+            print(json.dumps(entry, ensure_ascii=False))
+        if result.diff_truncated:
+            print(f"... diff truncated at {PRESENCE_RECONCILE_DIFF_LIMIT} users")
+    summary = result.to_dict()
+    summary.pop("diff")
+    print(json.dumps(summary, ensure_ascii=False))
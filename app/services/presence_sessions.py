@@ -3,9 +3,34 @@ from __future__ import annotations
 from datetime import datetime, timezone
 from typing import Optional
 
+from sqlalchemy import select
 from sqlalchemy.orm import Session
 
-from app.models import AccessLog, PresenceSession, User, AccessToken, Membership
+from app.models import AccessLog, PresenceSession, User
+
+
+def active_session_for_user_statement(user_id: int):
+    return (
+        select(PresenceSession)
+        .where(PresenceSession.user_id == user_id, PresenceSession.ended_at.is_(None), PresenceSession.status == "active")
+        .order_by(PresenceSession.started_at.desc())
+        .limit(1)
+    )
+
+
+def active_sessions_statement():
+    return (
+        select(PresenceSession)
+        .where(PresenceSession.ended_at.is_(None), PresenceSession.status == "active")
+        .order_by(PresenceSession.started_at.desc())
+    )
+
+
+def sessions_statement(*, user_id: Optional[int] = None, limit: int = 20):
+    statement = select(PresenceSession)
+    if user_id is not None:
+        statement = statement.where(PresenceSession.user_id == user_id)
+    return statement.order_by(PresenceSession.started_at.desc()).limit(limit)
 
 
 class PresenceSessionService:
@@ -20,17 +45,17 @@ class PresenceSessionService:
     def start_session(
         self,
         *,
-        user: User,
-        token: Optional[AccessToken],
-        membership: Optional[Membership],
+        user_id: int,
+        token_id: Optional[int],
+        membership_id: Optional[int],
         access_log: Optional[AccessLog] = None,
         scanned_at: datetime,
         metadata: Optional[dict] = None,
     ) -> PresenceSession:
         session = PresenceSession(
-            user_id=user.id,
-            token_id=token.id if token else None,
-            membership_id=membership.id if membership else None,
+            user_id=user_id,
+            token_id=token_id,
+            membership_id=membership_id,
             started_at=self._normalize_ts(scanned_at),
             last_direction="in",
             status="active",
@@ -68,12 +93,7 @@ class PresenceSessionService:
         return session
 
     def find_active_session(self, user_id: int) -> Optional[PresenceSession]:
-        return (
-            self.db.query(PresenceSession)
-            .filter(PresenceSession.user_id == user_id, PresenceSession.ended_at.is_(None), PresenceSession.status == "active")
-            .order_by(PresenceSession.started_at.desc())
-            .first()
-        )
+        return self.db.scalars(active_session_for_user_statement(user_id)).first()
 
     def force_close(self, session: PresenceSession, *, status: str = "timeout", notes: Optional[str] = None) -> PresenceSession:
         session.ended_at = datetime.now(timezone.utc)
@@ -86,18 +106,10 @@ class PresenceSessionService:
         return session
 
     def list_active_sessions(self) -> list[PresenceSession]:
-        return (
-            self.db.query(PresenceSession)
-            .filter(PresenceSession.ended_at.is_(None), PresenceSession.status == "active")
-            .order_by(PresenceSession.started_at.desc())
-            .all()
-        )
+        return list(self.db.scalars(active_sessions_statement()))
 
     def list_sessions(self, *, user_id: Optional[int] = None, limit: int = 20) -> list[PresenceSession]:
-        query = self.db.query(PresenceSession)
-        if user_id is not None:
-            query = query.filter(PresenceSession.user_id == user_id)
-        return query.order_by(PresenceSession.started_at.desc()).limit(limit).all()
+        return list(self.db.scalars(sessions_statement(user_id=user_id, limit=limit)))
 
 
 def serialize_presence_session(session: PresenceSession, user: Optional[User] = None) -> dict:
@@ -0,0 +1,224 @@
+"""
+Closes presence sessions nobody checked out of.
+
+A session is stale when it has been open longer than PRESENCE_MAX_VISIT_HOURS,
+or when the gym's local closing time (GYM_CLOSING_TIME in GYM_TIMEZONE, see
+app.services.timezone) has passed since it started. Stale sessions get
+status "timeout" and an ended_at that is the earliest of: now, start + max
+visit, and the first closing time after the start, so visit durations stay
+plausible even when the sweep runs late.
+
+One sweep is a single statement per batch: the stale rows are locked with
+FOR UPDATE SKIP LOCKED (a scan closing the same session wins, concurrent
+sweepers split the work), closed with UPDATE ... RETURNING, and the owners'
+users.is_in_gym / last_exit_at are fixed in the same statement. Runs every
+PRESENCE_SWEEP_INTERVAL_MINUTES in a daemon thread; PostgreSQL only.
+
+    python -m app.services.presence_sweeper     # sweep now, print the result
+"""
+from __future__ import annotations
+
+import logging
+import os
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import Any, Optional
+
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+
+from app.services.occupancy import occupancy
+from app.services.timezone import get_gym_closing_time, get_gym_timezone, last_local_time_utc
+from app.services.visit_rollups import request_visit_rollup
+
+logger = logging.getLogger(__name__)
+
+PRESENCE_MAX_VISIT_HOURS = float(os.getenv("PRESENCE_MAX_VISIT_HOURS", "8"))
+PRESENCE_SWEEP_INTERVAL_MINUTES = float(os.getenv("PRESENCE_SWEEP_INTERVAL_MINUTES", "10"))
+PRESENCE_SWEEP_BATCH_SIZE = int(os.getenv("PRESENCE_SWEEP_BATCH_SIZE", "1000"))
+
+TIMEOUT_NOTE = "Automatically closed: no exit scan"
+
+# :closing is the local closing time ("22:00") or NULL; NULL terms drop out of LEAST().
+_SWEEP_SQL = text(
+    """
+    WITH stale AS (
+        SELECT p.id,
+               LEAST(
+                   CAST(:now AS timestamptz),
+                   p.started_at + make_interval(secs => CAST(:max_visit_seconds AS double precision)),
+                   (date_trunc('day', p.started_at AT TIME ZONE :tz)
+                        + CAST(:closing AS interval)
+                        + CASE WHEN CAST(p.started_at AT TIME ZONE :tz AS time) >= CAST(:closing AS time)
+                               THEN INTERVAL '1 day' ELSE INTERVAL '0 seconds' END
+                   ) AT TIME ZONE :tz
+               ) AS ends_at
+        FROM presence_sessions p
+        WHERE p.ended_at IS NULL
+          AND p.status = 'active'
+          AND (p.started_at < :age_cutoff OR p.started_at < :closing_cutoff)
+        ORDER BY p.id
+        LIMIT :batch_size
+        FOR UPDATE OF p SKIP LOCKED
+    ),
+    closed AS (
+        UPDATE presence_sessions p
+        SET ended_at = GREATEST(s.ends_at, p.started_at),
+            status = 'timeout',
+            last_direction = 'out',
+            duration_seconds = CAST(GREATEST(0, EXTRACT(EPOCH FROM s.ends_at - p.started_at)) AS integer),
+            notes = CASE WHEN p.notes IS NULL OR p.notes = '' THEN :note ELSE p.notes || E'\\n' || :note END,
+            updated_at = now()
+        FROM stale s
+        WHERE p.id = s.id
+        RETURNING p.id, p.user_id, p.started_at, p.ended_at
+    ),
+    fixed_users AS (
+        UPDATE users u
+        SET is_in_gym = false,
+            last_exit_at = GREATEST(COALESCE(u.last_exit_at, c.ended_at), c.ended_at)
+        FROM (SELECT user_id, max(ended_at) AS ended_at FROM closed GROUP BY user_id) c
+        WHERE u.id = c.user_id
+          AND NOT EXISTS (
+              SELECT 1 FROM presence_sessions o
+              WHERE o.user_id = u.id AND o.ended_at IS NULL AND o.status = 'active'
+                AND o.id NOT IN (SELECT id FROM closed)
+          )
+        RETURNING u.id
+    )
+    SELECT c.id, c.user_id, c.started_at, c.ended_at,
+           (SELECT count(*) FROM fixed_users) AS users_fixed
+    FROM closed c
+    ORDER BY c.id
+    """
+)
+
+
+def sweep_cutoffs(
+    now: datetime,
+    *,
+    max_visit_hours: Optional[float] = None,
+    closing_time=None,
+    tz=None,
+) -> dict[str, Optional[datetime]]:
+    """
+    Sessions started before age_cutoff or closing_cutoff are stale (None = rule disabled).
+    closing_cutoff is the last local closing time that has already passed.
+    """
+    max_visit_hours = PRESENCE_MAX_VISIT_HOURS if max_visit_hours is None else max_visit_hours
+    closing_time = get_gym_closing_time() if closing_time is None else closing_time
+    tz = tz or get_gym_timezone()
+    return {
+        "age_cutoff": now - timedelta(hours=max_visit_hours) if max_visit_hours > 0 else None,
+        "closing_cutoff": last_local_time_utc(now, closing_time, tz) if closing_time else None,
+    }
+
+
+def sweep_stale_sessions(
+    engine: Engine,
+    *,
+    now: Optional[datetime] = None,
+    max_visit_hours: Optional[float] = None,
+    closing_time=None,
+    batch_size: int = PRESENCE_SWEEP_BATCH_SIZE,
+) -> dict[str, Any]:
+    """Close every stale session (in batches of batch_size) and return how many were closed."""
+    if engine.dialect.name != "postgresql":
+        return {"closed": 0, "skipped": f"presence sweep needs PostgreSQL, not {engine.dialect.name}"}
+    now = now or datetime.now(timezone.utc)
+    max_visit_hours = PRESENCE_MAX_VISIT_HOURS if max_visit_hours is None else max_visit_hours
+    closing_time = get_gym_closing_time() if closing_time is None else closing_time
+    tz = get_gym_timezone()
+    cutoffs = sweep_cutoffs(now, max_visit_hours=max_visit_hours, closing_time=closing_time, tz=tz)
+    result: dict[str, Any] = {"closed": 0, "users_fixed": 0, **{k: v and v.isoformat() for k, v in cutoffs.items()}}
+    if cutoffs["age_cutoff"] is None and cutoffs["closing_cutoff"] is None:
+        result["skipped"] = "no max visit length or closing time configured"
+        return result
+
+    params = {
+        **cutoffs,
+        "now": now,
+        "max_visit_seconds": max_visit_hours * 3600 if max_visit_hours > 0 else None,
+        "closing": closing_time.strftime("%H:%M:%S") if closing_time else None,
+        "tz": tz.key,
+        "note": TIMEOUT_NOTE,
+        "batch_size": max(1, batch_size),
+    }
+    while True:
+        with engine.begin() as conn:
+            rows = conn.execute(_SWEEP_SQL, params).all()
+        for row in rows:
+            occupancy.leave(row.user_id, session_id=row.id)
+        result["closed"] += len(rows)
+        result["users_fixed"] += rows[0].users_fixed if rows else 0
+        if len(rows) < params["batch_size"]:
+            break
+    if result["closed"]:
+        request_visit_rollup()
+        logger.info(
+            "Presence sweep closed %s stale sessions (%s users marked out)", result["closed"], result["users_fixed"]
+        )
+    return result
+
+
+class PresenceSweeper:
+    """Daemon thread running sweep_stale_sessions at startup and then periodically."""
+
+    def __init__(self, engine: Engine, *, interval_minutes: float = PRESENCE_SWEEP_INTERVAL_MINUTES):
+        self.engine = engine
+        self.interval_seconds = interval_minutes * 60
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.last_result: Optional[dict[str, Any]] = None
+        self.total_closed = 0
+
+    def start(self) -> None:
+        if self._thread is not None or self.interval_seconds <= 0:
+            return
+        self._thread = threading.Thread(target=self._run, name="presence-sweeper", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def stats(self) -> dict[str, Any]:
+        return {"running": self._thread is not None, "total_closed": self.total_closed, "last": self.last_result}
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                self.last_result = sweep_stale_sessions(self.engine)
+                self.total_closed += self.last_result["closed"]
+            except Exception:
+                logger.exception("Presence sweep failed")
+            self._stop.wait(self.interval_seconds)
+
+
+_sweeper: Optional[PresenceSweeper] = None
+
+
+def get_presence_sweeper() -> Optional[PresenceSweeper]:
+    return _sweeper
+
+
+def start_presence_sweeper(engine: Engine) -> PresenceSweeper:
+    global _sweeper
+    if _sweeper is None:
+        _sweeper = PresenceSweeper(engine)
+    _sweeper.start()
+    return _sweeper
+
+
+def stop_presence_sweeper() -> None:
+    if _sweeper is not None:
+        _sweeper.stop()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    from app.database import engine
+
+    print(sweep_stale_sessions(engine))
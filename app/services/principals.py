@@ -0,0 +1,196 @@
+"""
+Short-lived cache of authenticated principals (who is calling, with which role).
+
+A Principal is a detached snapshot of the identity/role/profile columns of a
+User, cached per (user_id, token iat) for AUTH_PRINCIPAL_CACHE_TTL_SECONDS, so
+the parallel calls a page makes with one JWT resolve the user once. Balances
+(credits) are deliberately not part of it; handlers that need them or that
+modify the user still load the ORM row. Code that changes a user's role or
+profile must call invalidate_principal(); the TTL bounds staleness for other
+workers and for out-of-band edits (set_admin.py).
+"""
+from __future__ import annotations
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from app.models import User
+
+AUTH_PRINCIPAL_CACHE_TTL_SECONDS = float(os.getenv("AUTH_PRINCIPAL_CACHE_TTL_SECONDS", "5"))
+AUTH_PRINCIPAL_CACHE_MAX_ENTRIES = int(os.getenv("AUTH_PRINCIPAL_CACHE_MAX_ENTRIES", "10000"))
+
+PRINCIPAL_COLUMNS = (
+    User.id,
+    User.email,
+    User.name,
+    User.first_name,
+    User.last_name,
+    User.phone_number,
+    User.is_admin,
+    User.is_owner,
+    User.is_trainer,
+)
+
+
+@dataclass(frozen=True)
+class Principal:
+    id: int
+    email: Optional[str]
+    name: Optional[str]
+    first_name: Optional[str] = None
+    last_name: Optional[str] = None
+    phone_number: Optional[str] = None
+    is_admin: bool = False
+    is_owner: bool = False
+    is_trainer: bool = False
+
+    @property
+    def role(self) -> str:
+        return "owner" if self.is_owner else ("admin" if self.is_admin else "user")
+
+    @classmethod
+    def from_user(cls, user: User) -> "Principal":
+        return cls(
+            id=user.id,
+            email=user.email,
+            name=user.name,
+            first_name=user.first_name,
+            last_name=user.last_name,
+            phone_number=user.phone_number,
+            is_admin=bool(user.is_admin),
+            is_owner=bool(user.is_owner),
+            is_trainer=bool(user.is_trainer),
+        )
+
+    @classmethod
+    def from_row(cls, row) -> "Principal":
+        return cls(
+            id=row.id,
+            email=row.email,
+            name=row.name,
+            first_name=row.first_name,
+            last_name=row.last_name,
+            phone_number=row.phone_number,
+            is_admin=bool(row.is_admin),
+            is_owner=bool(row.is_owner),
+            is_trainer=bool(row.is_trainer),
+        )
+
+
+PrincipalKey = tuple[int, float]  # (user_id, token iat)
+
+
+class PrincipalCache:
+    """TTL + LRU map of (user_id, iat) -> Principal with a per-user index. Thread-safe."""
+
+    def __init__(
+        self,
+        *,
+        ttl_seconds: float,
+        max_entries: int,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._clock = clock
+        self._entries: OrderedDict[PrincipalKey, tuple[Principal, float]] = OrderedDict()
+        self._keys_by_user: dict[int, set[PrincipalKey]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl_seconds > 0 and self.max_entries > 0
+
+    def get(self, key: PrincipalKey) -> Optional[Principal]:
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] <= self._clock():
+                self._remove(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: PrincipalKey, principal: Principal) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = (principal, self._clock() + self.ttl_seconds)
+            self._keys_by_user.setdefault(key[0], set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def invalidate_user(self, user_id: int) -> None:
+        with self._lock:
+            for key in list(self._keys_by_user.get(user_id, ())):
+                if self._remove(key):
+                    self.invalidations += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._keys_by_user.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+            }
+
+    def _remove(self, key: PrincipalKey) -> bool:
+        if self._entries.pop(key, None) is None:
+            return False
+        keys = self._keys_by_user.get(key[0])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._keys_by_user[key[0]]
+        return True
+
+
+principal_cache = PrincipalCache(
+    ttl_seconds=AUTH_PRINCIPAL_CACHE_TTL_SECONDS,
+    max_entries=AUTH_PRINCIPAL_CACHE_MAX_ENTRIES,
+)
+
+
+def load_principal(db: Session, user_id: int, issued_at: float) -> Optional[Principal]:
+    """Cached principal for a token; on a miss one projected SELECT (no ORM identity)."""
+    key = (user_id, issued_at)
+    principal = principal_cache.get(key)
+    if principal is not None:
+        return principal
+    row = db.execute(select(*PRINCIPAL_COLUMNS).where(User.id == user_id)).first()
+    if row is None:
+        return None
+    principal = Principal.from_row(row)
+    principal_cache.put(key, principal)
+    return principal
+
+
+def remember_principal(user: User, issued_at: float) -> None:
+    """Write-through from handlers that already loaded the full User row."""
+    principal_cache.put((user.id, issued_at), Principal.from_user(user))
+
+
+def invalidate_principal(user_id: Optional[int]) -> None:
+    if user_id is None:
+        return
+    principal_cache.invalidate_user(user_id)
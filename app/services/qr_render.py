@@ -0,0 +1,245 @@
+"""
+QR code rendering with a content-addressed cache.
+
+A rendered image is a pure function of (token, scale, border, format), so the
+sha256 of those inputs (plus RENDER_VERSION) names it: it is the LRU key, the
+on-disk file name and the strong ETag. A matching If-None-Match can therefore
+be answered without touching the cache at all. Bump RENDER_VERSION whenever the
+output bytes for the same inputs change (renderer options, qrcode/Pillow upgrade
+that alters encoding).
+"""
+from __future__ import annotations
+
+import base64
+import hashlib
+import io
+import logging
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Literal, Optional
+
+import qrcode
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+RENDER_VERSION = 1
+QR_CACHE_MAX_ENTRIES = int(os.getenv("QR_CACHE_MAX_ENTRIES", "2048"))
+QR_CACHE_DIR = os.getenv("QR_CACHE_DIR", "")  # empty = memory only
+QR_IMAGE_MAX_AGE_SECONDS = int(os.getenv("QR_IMAGE_MAX_AGE_SECONDS", "86400"))
+
+DEFAULT_SCALE = 10  # pixels (SVG: user units) per module
+DEFAULT_BORDER = 5
+
+# svg: one stroked <path>, size independent of scale; png1bit: 1-bit PNG built
+# straight from the module matrix (optimised, no per-box drawing); png: the
+# original qrcode/PIL rendering, kept byte-for-byte for existing callers.
+QRFormat = Literal["svg", "png1bit", "png"]
+# From this scale up a short token's SVG is smaller than its 1-bit PNG
+# (see benchmarks/qr_formats.py).
+SVG_MIN_SCALE = 30
+
+
+@dataclass(frozen=True)
+class QRSpec:
+    token: str
+    scale: int = DEFAULT_SCALE
+    border: int = DEFAULT_BORDER
+    format: QRFormat = "png"
+
+    @property
+    def key(self) -> str:
+        raw = f"v{RENDER_VERSION}|{self.format}|{self.scale}|{self.border}|{self.token}"
+        return hashlib.sha256(raw.encode()).hexdigest()
+
+    @property
+    def etag(self) -> str:
+        return f'"{self.key[:32]}"'
+
+
+@dataclass(frozen=True)
+class RenderedQR:
+    content: bytes
+    media_type: str
+    etag: str
+
+    def data_url(self) -> str:
+        return f"data:{self.media_type};base64,{base64.b64encode(self.content).decode()}"
+
+
+def _qr_matrix(spec: QRSpec) -> qrcode.QRCode:
+    qr = qrcode.QRCode(version=1, box_size=spec.scale, border=spec.border)
+    qr.add_data(spec.token)
+    qr.make(fit=True)
+    return qr
+
+
+def _render_png(spec: QRSpec) -> bytes:
+    img = _qr_matrix(spec).make_image(fill_color="black", back_color="white")
+    buffer = io.BytesIO()
+    img.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def _render_png1bit(spec: QRSpec) -> bytes:
+    matrix = _qr_matrix(spec).get_matrix()  # includes the border
+    size = len(matrix)
+    img = Image.new("1", (size, size), 1)
+    img.putdata([0 if dark else 1 for row in matrix for dark in row])
+    if spec.scale > 1:
+        img = img.resize((size * spec.scale, size * spec.scale), Image.NEAREST)
+    buffer = io.BytesIO()
+    img.save(buffer, format="PNG", optimize=True)
+    return buffer.getvalue()
+
+
+def _render_svg(spec: QRSpec) -> bytes:
+    matrix = _qr_matrix(spec).get_matrix()  # includes the border
+    size = len(matrix)
+    # One stroked path: each horizontal run of dark modules is a relative move plus
+    # an h segment, which keeps the markup close to the PNG size for short tokens.
+    segments = []
+    pen_x = pen_y = 0
+    for y, row in enumerate(matrix):
+        x = 0
+        while x < size:
+            if not row[x]:
+                x += 1
+                continue
+            start = x
+            while x < size and row[x]:
+                x += 1
+            segments.append(f"m{start - pen_x} {y - pen_y}h{x - start}")
+            pen_x, pen_y = x, y
+    pixels = size * spec.scale
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{pixels}" height="{pixels}" '
+        f'viewBox="0 0 {size} {size}" shape-rendering="crispEdges">'
+        f'<path fill="#fff" d="M0 0h{size}v{size}H0z"/>'
+        f'<path stroke="#000" d="M0 .5{"".join(segments)}"/></svg>'
+    ).encode()
+
+
+# format -> (renderer, media type, file extension)
+RENDERERS: dict[str, tuple[Callable[[QRSpec], bytes], str, str]] = {
+    "svg": (_render_svg, "image/svg+xml", "svg"),
+    "png1bit": (_render_png1bit, "image/png", "png"),
+    "png": (_render_png, "image/png", "png"),
+}
+
+
+class QRRenderCache:
+    """LRU of rendered images with an optional write-through directory. Thread-safe."""
+
+    def __init__(self, *, max_entries: int, cache_dir: Optional[str] = None):
+        self.max_entries = max_entries
+        self.cache_dir = Path(cache_dir) if cache_dir else None
+        self._entries: OrderedDict[str, RenderedQR] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.renders = 0
+        self.evictions = 0
+
+    def render(self, spec: QRSpec) -> RenderedQR:
+        if spec.format not in RENDERERS:
+            raise ValueError(f"Unsupported QR format: {spec.format}")
+        key = spec.key
+        with self._lock:
+            cached = self._entries.get(key)
+            if cached is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return cached
+
+        renderer, media_type, extension = RENDERERS[spec.format]
+        content = self._read_disk(key, extension)
+        if content is None:
+            content = renderer(spec)
+            self._write_disk(key, extension, content)
+            with self._lock:
+                self.renders += 1
+        else:
+            with self._lock:
+                self.disk_hits += 1
+        rendered = RenderedQR(content=content, media_type=media_type, etag=spec.etag)
+        self._store(key, rendered)
+        return rendered
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "renders": self.renders,
+                "evictions": self.evictions,
+            }
+
+    def _store(self, key: str, rendered: RenderedQR) -> None:
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = rendered
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def _disk_path(self, key: str, extension: str) -> Optional[Path]:
+        if self.cache_dir is None:
+            return None
+        return self.cache_dir / key[:2] / f"{key}.{extension}"
+
+    def _read_disk(self, key: str, extension: str) -> Optional[bytes]:
+        path = self._disk_path(key, extension)
+        if path is None:
+            return None
+        try:
+            return path.read_bytes()
+        except FileNotFoundError:
+            return None
+        except OSError as exc:
+            logger.warning("QR cache read failed for %s: %s", path, exc)
+            return None
+
+    def _write_disk(self, key: str, extension: str, content: bytes) -> None:
+        path = self._disk_path(key, extension)
+        if path is None:
+            return
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+            tmp.write_bytes(content)
+            os.replace(tmp, path)
+        except OSError as exc:
+            # The disk tier is an optimisation only; the image is still served from memory.
+            logger.warning("QR cache write failed for %s: %s", path, exc)
+
+
+qr_cache = QRRenderCache(max_entries=QR_CACHE_MAX_ENTRIES, cache_dir=QR_CACHE_DIR or None)
+
+
+def render_qr(token: str, *, scale: int = DEFAULT_SCALE, border: int = DEFAULT_BORDER, format: QRFormat = "png") -> RenderedQR:
+    return qr_cache.render(QRSpec(token=token, scale=scale, border=border, format=format))
+
+
+def qr_data_url(token: str, **options) -> str:
+    return render_qr(token, **options).data_url()
+
+
+def negotiate_format(accept: Optional[str], scale: int) -> QRFormat:
+    """
+    Format for a client that did not ask for one: the smaller of png1bit and SVG
+    among what its Accept header allows. PNG bytes grow with scale, SVG bytes do not.
+    """
+    if scale >= SVG_MIN_SCALE and accept and "image/svg+xml" in accept:
+        return "svg"
+    return "png1bit"
@@ -0,0 +1,359 @@
+"""
+Rate limiting for the scanner endpoints (GCRA, a token bucket stored as one number).
+
+Each bucket keeps only its theoretical arrival time (TAT): a request at `now`
+moves it to max(TAT, now) + period/limit and is allowed while that stays within
+`period` of now. That is O(1) state per key, allows bursts of up to `limit`,
+and keys whose TAT is in the past carry no information and can be dropped.
+
+Backends (RATE_LIMIT_BACKEND):
+  memory    per process; the default, fine for a single uvicorn worker
+  postgres  UNLOGGED table rate_limit_buckets, one upsert per check, shared by workers
+  redis     Lua script on a Redis-compatible server (RATE_LIMIT_REDIS_URL, needs `redis`, requirements-redis.txt)
+"""
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import logging
+import math
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Optional, Protocol
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+logger = logging.getLogger(__name__)
+
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory").strip().lower()
+RATE_LIMIT_REDIS_URL = os.getenv("RATE_LIMIT_REDIS_URL", "redis://localhost:6379/0")
+# requests per minute; 0 disables that scope
+VERIFY_RATE_LIMIT_PER_MINUTE = int(os.getenv("VERIFY_RATE_LIMIT_PER_MINUTE", "120"))
+VERIFY_RATE_LIMIT_PER_SCANNER_PER_MINUTE = int(os.getenv("VERIFY_RATE_LIMIT_PER_SCANNER_PER_MINUTE", "60"))
+VERIFY_RATE_LIMIT_PER_IP_PER_MINUTE = int(os.getenv("VERIFY_RATE_LIMIT_PER_IP_PER_MINUTE", "600"))
+
+MEMORY_SWEEP_EVERY = 1000  # checks between sweeps of expired in-memory buckets
+POSTGRES_SWEEP_EVERY = 5000
+
+
+@dataclass(frozen=True)
+class RateLimitRule:
+    scope: str
+    limit: int
+    period_seconds: float = 60.0
+
+    @property
+    def emission_interval(self) -> float:
+        return self.period_seconds / self.limit
+
+    @property
+    def policy(self) -> str:
+        return f"{self.limit};w={int(self.period_seconds)}"
+
+
+@dataclass(frozen=True)
+class RateLimitDecision:
+    allowed: bool
+    rule: RateLimitRule
+    remaining: int
+    reset_after: float  # seconds until the bucket is full again
+    retry_after: float = 0.0  # seconds until the next request would be allowed (denials)
+
+
+def decide(rule: RateLimitRule, now: float, stored_tat: Optional[float]) -> tuple[RateLimitDecision, Optional[float]]:
+    """GCRA step: the decision and the TAT to store (None when denied, state unchanged)."""
+    interval = rule.emission_interval
+    tat = max(stored_tat or now, now)
+    new_tat = tat + interval
+    if new_tat - now <= rule.period_seconds + 1e-9:
+        return decision_from_tat(rule, now, new_tat, allowed=True), new_tat
+    return decision_from_tat(rule, now, tat, allowed=False), None
+
+
+def decision_from_tat(rule: RateLimitRule, now: float, tat: float, *, allowed: bool) -> RateLimitDecision:
+    """Rebuild a decision from the TAT a shared backend returned."""
+    interval = rule.emission_interval
+    backlog = max(0.0, tat - now)
+    if allowed:
+        remaining = int(math.floor((rule.period_seconds - backlog) / interval + 1e-9))
+        return RateLimitDecision(True, rule, max(0, remaining), backlog)
+    retry_after = max(0.0, backlog + interval - rule.period_seconds)
+    return RateLimitDecision(False, rule, 0, backlog, retry_after)
+
+
+class RateLimitBackend(Protocol):
+    async def hit(self, key: str, rule: RateLimitRule, now: float) -> RateLimitDecision: ...
+
+    async def refund(self, key: str, rule: RateLimitRule, now: float) -> None: ...
+
+    async def close(self) -> None: ...
+
+
+class MemoryBackend:
+    """dict key -> TAT for this process. Expired keys are swept periodically."""
+
+    def __init__(self, *, sweep_every: int = MEMORY_SWEEP_EVERY):
+        self._tats: dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._sweep_every = sweep_every
+        self._checks = 0
+
+    def __len__(self) -> int:
+        return len(self._tats)
+
+    async def hit(self, key: str, rule: RateLimitRule, now: float) -> RateLimitDecision:
+        with self._lock:
+            decision, new_tat = decide(rule, now, self._tats.get(key))
+            if new_tat is not None:
+                self._tats[key] = new_tat
+            self._checks += 1
+            if self._checks % self._sweep_every == 0:
+                self._sweep(now)
+        return decision
+
+    async def refund(self, key: str, rule: RateLimitRule, now: float) -> None:
+        with self._lock:
+            tat = self._tats.get(key)
+            if tat is None:
+                return
+            if tat - rule.emission_interval <= now:
+                del self._tats[key]
+            else:
+                self._tats[key] = tat - rule.emission_interval
+
+    def _sweep(self, now: float) -> None:
+        expired = [key for key, tat in self._tats.items() if tat <= now]
+        for key in expired:
+            del self._tats[key]
+
+    async def close(self) -> None:
+        return None
+
+
+class PostgresBackend:
+    """One atomic upsert per check on rate_limit_buckets (created by migration 5)."""
+
+    _HIT = text(
+        """
+        INSERT INTO rate_limit_buckets AS b (key, tat)
+        VALUES (:key, CAST(:now AS double precision) + CAST(:interval AS double precision))
+        ON CONFLICT (key) DO UPDATE
+            SET tat = GREATEST(b.tat, CAST(:now AS double precision)) + CAST(:interval AS double precision)
+            WHERE GREATEST(b.tat, CAST(:now AS double precision)) + CAST(:interval AS double precision)
+                - CAST(:now AS double precision) <= CAST(:period AS double precision)
+        RETURNING tat
+        """
+    )
+    _CURRENT = text("SELECT tat FROM rate_limit_buckets WHERE key = :key")
+    _REFUND = text("UPDATE rate_limit_buckets SET tat = tat - CAST(:interval AS double precision) WHERE key = :key")
+    _SWEEP = text("DELETE FROM rate_limit_buckets WHERE tat < CAST(:now AS double precision)")
+
+    def __init__(self, engine: AsyncEngine, *, sweep_every: int = POSTGRES_SWEEP_EVERY):
+        self.engine = engine
+        self._sweep_every = sweep_every
+        self._checks = 0
+
+    async def hit(self, key: str, rule: RateLimitRule, now: float) -> RateLimitDecision:
+        params = {"key": key, "now": now, "interval": rule.emission_interval, "period": rule.period_seconds + 1e-9}
+        async with self.engine.begin() as conn:
+            tat = (await conn.execute(self._HIT, params)).scalar()
+            if tat is None:
+                current = (await conn.execute(self._CURRENT, {"key": key})).scalar() or now
+                decision = decision_from_tat(rule, now, max(current, now), allowed=False)
+            else:
+                decision = decision_from_tat(rule, now, tat, allowed=True)
+            self._checks += 1
+            if self._checks % self._sweep_every == 0:
+                await conn.execute(self._SWEEP, {"now": now})
+        return decision
+
+    async def refund(self, key: str, rule: RateLimitRule, now: float) -> None:
+        async with self.engine.begin() as conn:
+            await conn.execute(self._REFUND, {"key": key, "interval": rule.emission_interval})
+
+    async def close(self) -> None:
+        return None
+
+
+class RedisBackend:
+    """GCRA as a Lua script; works with any server speaking the Redis protocol and EVAL."""
+
+    _SCRIPT = """
+    local now = tonumber(ARGV[1])
+    local interval = tonumber(ARGV[2])
+    local period = tonumber(ARGV[3])
+    local tat = tonumber(redis.call('GET', KEYS[1]))
+    if not tat or tat < now then tat = now end
+    local new_tat = tat + interval
+    if new_tat - now <= period then
+        redis.call('SET', KEYS[1], tostring(new_tat), 'PX', math.ceil((new_tat - now) * 1000))
+        return {1, tostring(new_tat)}
+    end
+    return {0, tostring(tat)}
+    """
+    _REFUND_SCRIPT = """
+    local now = tonumber(ARGV[1])
+    local interval = tonumber(ARGV[2])
+    local tat = tonumber(redis.call('GET', KEYS[1]))
+    if not tat then return 0 end
+    local new_tat = tat - interval
+    if new_tat <= now then
+        redis.call('DEL', KEYS[1])
+    else
+        redis.call('SET', KEYS[1], tostring(new_tat), 'PX', math.ceil((new_tat - now) * 1000))
+    end
+    return 1
+    """
+
+    def __init__(self, client, *, prefix: str = "ratelimit:"):
+        self.client = client
+        self.prefix = prefix
+        self._script = client.register_script(self._SCRIPT)
+        self._refund_script = client.register_script(self._REFUND_SCRIPT)
+
+    @classmethod
+    def from_url(cls, url: str) -> "RedisBackend":
+        try:
+            import redis.asyncio as redis_asyncio
+        except ImportError as exc:  # optional dependency
+            raise RuntimeError(
+                "RATE_LIMIT_BACKEND=redis requires the 'redis' package (pip install -r requirements-redis.txt)"
+            ) from exc
+        return cls(redis_asyncio.from_url(url))
+
+    async def hit(self, key: str, rule: RateLimitRule, now: float) -> RateLimitDecision:
+        allowed, tat = await self._script(
+            keys=[self.prefix + key], args=[repr(now), repr(rule.emission_interval), repr(rule.period_seconds + 1e-9)]
+        )
+        return decision_from_tat(rule, now, float(tat), allowed=bool(int(allowed)))
+
+    async def refund(self, key: str, rule: RateLimitRule, now: float) -> None:
+        await self._refund_script(keys=[self.prefix + key], args=[repr(now), repr(rule.emission_interval)])
+
+    async def close(self) -> None:
+        await self.client.aclose()
+
+
+def identity_key(scope: str, identity: str) -> str:
+    """Bucket key; identities (API keys in particular) are hashed so secrets never reach the store."""
+    return f"{scope}:{hashlib.sha256(identity.encode()).hexdigest()[:24]}"
+
+
+class RateLimiter:
+    """Checks a request against every configured scope it has an identity for."""
+
+    def __init__(self, backend: RateLimitBackend, rules: list[RateLimitRule], *, clock: Callable[[], float] = time.time):
+        self.backend = backend
+        self.rules = {rule.scope: rule for rule in rules if rule.limit > 0}
+        self._clock = clock
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.rules)
+
+    async def check(
+        self,
+        identities: dict[str, Optional[str]],
+        *,
+        limits: Optional[dict[str, int]] = None,
+    ) -> Optional[RateLimitDecision]:
+        """
+        Hit the bucket of each scope in order and stop at the first denial. Returns the
+        denial, or the allowed decision with the fewest remaining requests (for headers);
+        None when no rule applies. `limits` overrides a scope's limit for this caller
+        (per-key budgets); 0 exempts the caller from that scope.
+
+        Pass the narrowest scope first: a denied request is refunded to the buckets it
+        was already charged to, so a client over its own budget does not keep draining
+        a shared one (e.g. the IP of a NAT or proxy used by every scanner).
+        """
+        now = self._clock()
+        tightest: Optional[RateLimitDecision] = None
+        charged: list[tuple[str, RateLimitRule]] = []
+        for scope, identity in identities.items():
+            rule = self._rule_for(scope, limits)
+            if rule is None or not identity:
+                continue
+            key = identity_key(scope, identity)
+            decision = await self.backend.hit(key, rule, now)
+            if not decision.allowed:
+                for charged_key, charged_rule in charged:
+                    await self.backend.refund(charged_key, charged_rule, now)
+                return decision
+            charged.append((key, rule))
+            if tightest is None or decision.remaining < tightest.remaining:
+                tightest = decision
+        return tightest
+
+    def _rule_for(self, scope: str, limits: Optional[dict[str, int]]) -> Optional[RateLimitRule]:
+        if limits is None or limits.get(scope) is None:
+            return self.rules.get(scope)
+        limit = limits[scope]
+        if limit <= 0:
+            return None
+        base = self.rules.get(scope)
+        return RateLimitRule(scope, limit, base.period_seconds if base else 60.0)
+
+    async def close(self) -> None:
+        await self.backend.close()
+
+
+def rate_limit_headers(decision: RateLimitDecision) -> dict[str, str]:
+    """RateLimit-* fields (IETF httpapi draft) plus Retry-After on denials."""
+    headers = {
+        "RateLimit-Limit": str(decision.rule.limit),
+        "RateLimit-Remaining": str(decision.remaining),
+        "RateLimit-Reset": str(math.ceil(decision.reset_after)),
+        "RateLimit-Policy": decision.rule.policy,
+    }
+    if not decision.allowed:
+        headers["Retry-After"] = str(max(1, math.ceil(decision.retry_after)))
+    return headers
+
+
+def verify_rules() -> list[RateLimitRule]:
+    return [
+        RateLimitRule("ip", VERIFY_RATE_LIMIT_PER_IP_PER_MINUTE),
+        RateLimitRule("api_key", VERIFY_RATE_LIMIT_PER_MINUTE),
+        RateLimitRule("scanner", VERIFY_RATE_LIMIT_PER_SCANNER_PER_MINUTE),
+    ]
+
+
+def build_backend(name: str = RATE_LIMIT_BACKEND) -> RateLimitBackend:
+    if name == "memory":
+        return MemoryBackend()
+    if name == "postgres":
+        from app.database import async_engine
+
+        return PostgresBackend(async_engine)
+    if name == "redis":
+        return RedisBackend.from_url(RATE_LIMIT_REDIS_URL)
+    raise ValueError(f"Unknown RATE_LIMIT_BACKEND: {name}")
+
+
+_verify_limiter: Optional[RateLimiter] = None
+_verify_limiter_lock = asyncio.Lock()
+
+
+async def get_verify_rate_limiter() -> RateLimiter:
+    global _verify_limiter
+    if _verify_limiter is None:
+        async with _verify_limiter_lock:
+            if _verify_limiter is None:
+                _verify_limiter = RateLimiter(build_backend(), verify_rules())
+                logger.info(
+                    "Verify rate limiter: backend=%s rules=%s",
+                    RATE_LIMIT_BACKEND,
+                    {scope: rule.policy for scope, rule in _verify_limiter.rules.items()},
+                )
+    return _verify_limiter
+
+
+async def close_verify_rate_limiter() -> None:
+    global _verify_limiter
+    if _verify_limiter is not None:
+        await _verify_limiter.close()
+        _verify_limiter = None
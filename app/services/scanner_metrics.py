@@ -0,0 +1,128 @@
+"""
+Per-device counters for the scanner endpoints (/api/verify*).
+
+Every authenticated verify request is recorded against its device: the API key
+that made it plus the scanner id (from a scanner key, or the X-Scanner-Id header
+for the shared env key). Kept in memory per process; counters are cumulative since
+startup, `per_minute` is the request rate over the last SCANNER_METRICS_WINDOW_SECONDS.
+"""
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+SCANNER_METRICS_WINDOW_SECONDS = int(os.getenv("SCANNER_METRICS_WINDOW_SECONDS", "60"))
+SCANNER_METRICS_MAX_DEVICES = int(os.getenv("SCANNER_METRICS_MAX_DEVICES", "500"))
+
+OUTCOMES = ("allowed", "denied", "rate_limited", "error")
+
+
+@dataclass(frozen=True)
+class ScannerIdentity:
+    api_key_id: Optional[int]  # None = shared env key (API_VERIFY_KEY)
+    api_key_name: Optional[str]
+    scanner_id: Optional[str]
+
+    @property
+    def label(self) -> str:
+        key = f"key:{self.api_key_id}" if self.api_key_id is not None else "env"
+        return f"{key}/{self.scanner_id or '-'}"
+
+
+@dataclass
+class _DeviceStats:
+    identity: ScannerIdentity
+    outcomes: Counter = field(default_factory=Counter)
+    reasons: Counter = field(default_factory=Counter)
+    latency_ms_total: float = 0.0
+    latency_ms_max: float = 0.0
+    last_seen: Optional[datetime] = None
+    # ring of per-second request counts: slot -> (second, count)
+    window: dict[int, tuple[int, int]] = field(default_factory=dict)
+
+
+class ScannerMetrics:
+    """Thread-safe per-device counters; at most max_devices devices are tracked."""
+
+    def __init__(
+        self,
+        *,
+        window_seconds: int = SCANNER_METRICS_WINDOW_SECONDS,
+        max_devices: int = SCANNER_METRICS_MAX_DEVICES,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.window_seconds = max(1, window_seconds)
+        self.max_devices = max_devices
+        self._clock = clock
+        self._devices: dict[ScannerIdentity, _DeviceStats] = {}
+        self._lock = threading.Lock()
+        self.dropped = 0
+
+    def record(
+        self,
+        identity: ScannerIdentity,
+        outcome: str,
+        *,
+        reason: Optional[str] = None,
+        latency_ms: float = 0.0,
+    ) -> None:
+        second = int(self._clock())
+        with self._lock:
+            stats = self._devices.get(identity)
+            if stats is None:
+                if len(self._devices) >= self.max_devices:
+                    self.dropped += 1
+                    return
+                stats = self._devices[identity] = _DeviceStats(identity)
+            stats.outcomes[outcome] += 1
+            if reason and outcome != "allowed":
+                stats.reasons[reason] += 1
+            stats.latency_ms_total += latency_ms
+            stats.latency_ms_max = max(stats.latency_ms_max, latency_ms)
+            stats.last_seen = datetime.now(timezone.utc)
+            slot = second % self.window_seconds
+            slot_second, count = stats.window.get(slot, (second, 0))
+            stats.window[slot] = (second, count + 1 if slot_second == second else 1)
+
+    def snapshot(self) -> list[dict]:
+        """One dict per device, busiest first."""
+        now_second = int(self._clock())
+        with self._lock:
+            rows = [self._serialize(stats, now_second) for stats in self._devices.values()]
+        return sorted(rows, key=lambda row: row["requests"], reverse=True)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._devices.clear()
+            self.dropped = 0
+
+    def _serialize(self, stats: _DeviceStats, now_second: int) -> dict:
+        requests = sum(stats.outcomes.values())
+        recent = sum(
+            count for second, count in stats.window.values() if now_second - second < self.window_seconds
+        )
+        return {
+            "device": stats.identity.label,
+            "api_key_id": stats.identity.api_key_id,
+            "api_key_name": stats.identity.api_key_name,
+            "scanner_id": stats.identity.scanner_id,
+            "requests": requests,
+            **{outcome: stats.outcomes.get(outcome, 0) for outcome in OUTCOMES},
+            "error_rate": round(stats.outcomes.get("error", 0) / requests, 4) if requests else 0.0,
+            "denied_reasons": dict(stats.reasons),
+            "per_minute": round(recent * 60 / self.window_seconds, 2),
+            "latency_ms_avg": round(stats.latency_ms_total / requests, 2) if requests else 0.0,
+            "latency_ms_max": round(stats.latency_ms_max, 2),
+            "last_seen": stats.last_seen.isoformat() if stats.last_seen else None,
+        }
+
+
+scanner_metrics = ScannerMetrics()
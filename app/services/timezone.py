@@ -1,5 +1,6 @@
-from datetime import datetime, timezone, timedelta
+from datetime import datetime, time, timezone, timedelta
 import os
+from typing import Optional
 from zoneinfo import ZoneInfo
 
 
@@ -24,3 +25,26 @@ def day_bounds_utc(ts: datetime, tz: ZoneInfo):
     start_utc = day_start_local.astimezone(timezone.utc)
     end_utc = (day_start_local + timedelta(days=1)).astimezone(timezone.utc)
     return start_utc, end_utc
+
+
+def get_gym_closing_time() -> Optional[time]:
+    """Local closing time from GYM_CLOSING_TIME ("HH:MM"), or None when not configured/invalid."""
+    raw = os.getenv("GYM_CLOSING_TIME", "").strip()
+    if not raw:
+        return None
+    try:
+        return time.fromisoformat(raw)
+    except ValueError:
+        return None
+
+
+def last_local_time_utc(ts: datetime, at: time, tz: ZoneInfo) -> datetime:
+    """
+    Most recent instant <= ts (aware) at which the local clock in tz showed `at`, in UTC.
+    E.g. the last closing time that has already passed.
+    """
+    local = ts.astimezone(tz)
+    candidate = datetime.combine(local.date(), at, tzinfo=tz)
+    if candidate > local:
+        candidate = datetime.combine(local.date() - timedelta(days=1), at, tzinfo=tz)
+    return candidate.astimezone(timezone.utc)
@@ -1,4 +1,20 @@
+from typing import Optional
+
+
 def mask_token(token: str) -> str:
     if not token:
         return ""
     return f"{token[:4]}..." if len(token) > 4 else token
+
+
+def if_none_match_tags(if_none_match: Optional[str]) -> set[str]:
+    """Entity tags listed in an If-None-Match header, with any W/ prefix dropped."""
+    if not if_none_match:
+        return set()
+    return {value.strip().removeprefix("W/") for value in if_none_match.split(",") if value.strip()}
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """RFC 9110 weak comparison for If-None-Match (also accepts '*')."""
+    tags = if_none_match_tags(if_none_match)
+    return "*" in tags or etag in tags
@@ -0,0 +1,344 @@
+from __future__ import annotations
+
+from dataclasses import dataclass, replace
+from datetime import datetime, timedelta, timezone
+from typing import Any, Optional
+
+from sqlalchemy import and_, bindparam, case, exists, func, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, aliased
+
+from app.models import AccessToken, Membership, MembershipPackage, User
+from app.services.timezone import day_bounds_utc, get_gym_timezone
+
+ACTIVE_MEMBERSHIP_STATUSES = ("active", "grace")
+
+_MEMBERSHIP_FIELDS = (
+    "id",
+    "package_id",
+    "package_name_cache",
+    "membership_type",
+    "status",
+    "valid_from",
+    "valid_to",
+    "daily_limit_enabled",
+    "daily_limit",
+    "daily_usage_count",
+    "last_usage_at",
+    "sessions_total",
+    "sessions_used",
+    "auto_renew",
+    "notes",
+    "metadata_json",
+    "package_snapshot_json",
+)
+_PACKAGE_FIELDS = ("id", "name", "slug", "package_type")
+
+
+@dataclass
+class PackageSnapshot:
+    """Subset of MembershipPackage needed by scanner responses."""
+
+    id: int
+    name: Optional[str]
+    slug: Optional[str]
+    package_type: Optional[str]
+
+
+@dataclass
+class MembershipSnapshot:
+    """
+    Detached copy of a Membership row.
+    Attribute names mirror the ORM model so MembershipService verdict helpers
+    and serialize_membership_for_response accept it unchanged.
+    """
+
+    id: int
+    package_id: Optional[int]
+    package_name_cache: Optional[str]
+    membership_type: Optional[str]
+    status: Optional[str]
+    valid_from: Optional[datetime]
+    valid_to: Optional[datetime]
+    daily_limit_enabled: Optional[bool]
+    daily_limit: Optional[int]
+    daily_usage_count: Optional[int]
+    last_usage_at: Optional[datetime]
+    sessions_total: Optional[int]
+    sessions_used: Optional[int]
+    auto_renew: Optional[bool]
+    notes: Optional[str]
+    metadata_json: Optional[dict]
+    package_snapshot_json: Optional[dict]
+    package: Optional[PackageSnapshot] = None
+
+
+@dataclass
+class VerificationContext:
+    """Everything a scan needs to decide allow/deny, resolved in one query."""
+
+    token_id: int
+    token_is_active: bool
+    user_id: Optional[int]
+    user_name: Optional[str]
+    user_email: Optional[str]
+    user_credits: Optional[int]
+    last_scan_at: Optional[datetime]
+    membership: Optional[MembershipSnapshot]
+    next_membership_from: Optional[datetime] = None
+
+    @property
+    def user_found(self) -> bool:
+        return self.user_id is not None
+
+    def cooldown_seconds_left(self, now: datetime, cooldown_seconds: int) -> Optional[int]:
+        """Seconds until the user-level cooldown expires, or None if it is not active."""
+        if not self.last_scan_at:
+            return None
+        last_scan_time = self.last_scan_at
+        if last_scan_time.tzinfo is None:
+            last_scan_time = last_scan_time.replace(tzinfo=timezone.utc)
+        elapsed = (now - last_scan_time).total_seconds()
+        if elapsed < cooldown_seconds:
+            return int(cooldown_seconds - elapsed)
+        return None
+
+    def membership_selection_expires_at(self) -> Optional[datetime]:
+        """
+        First instant at which the query would pick a different membership
+        (current one ends or a later one starts); None if no change is scheduled.
+        """
+        boundaries = [
+            ts
+            for ts in (
+                self.membership.valid_to if self.membership else None,
+                self.next_membership_from,
+            )
+            if ts is not None
+        ]
+        return min(boundaries) if boundaries else None
+
+    def copy(self) -> "VerificationContext":
+        """Copy safe to mutate (persist_membership_usage, last_scan_at) without touching the original."""
+        membership = replace(self.membership) if self.membership else None
+        return replace(self, membership=membership)
+
+
+def build_verification_statement():
+    """
+    Single SELECT resolving token, user, user-level cooldown and the active membership + package.
+    Cooldown and membership selection are correlated subqueries on the user row, so the
+    whole read side of a scan is one round trip. Bind parameters: ``token``, ``at_ts``.
+    ``next_membership_from`` lets callers caching the result know when it goes stale.
+    """
+    at_ts = bindparam("at_ts")
+    cooldown_token = aliased(AccessToken)
+    candidate = aliased(Membership)
+    upcoming = aliased(Membership)
+
+    last_scan_at = (
+        select(func.max(cooldown_token.last_scan_at))
+        .where(
+            cooldown_token.user_id == User.id,
+            cooldown_token.is_active.is_(True),
+        )
+        .correlate(User)
+        .scalar_subquery()
+    )
+    active_membership_id = (
+        select(candidate.id)
+        .where(
+            candidate.user_id == User.id,
+            candidate.valid_from <= at_ts,
+            candidate.valid_to >= at_ts,
+            candidate.status.in_(ACTIVE_MEMBERSHIP_STATUSES),
+        )
+        .order_by(candidate.valid_from.desc())
+        .limit(1)
+        .correlate(User)
+        .scalar_subquery()
+    )
+    next_membership_from = (
+        select(func.min(upcoming.valid_from))
+        .where(
+            upcoming.user_id == User.id,
+            upcoming.valid_from > at_ts,
+            upcoming.status.in_(ACTIVE_MEMBERSHIP_STATUSES),
+        )
+        .correlate(User)
+        .scalar_subquery()
+    )
+
+    columns = [
+        AccessToken.id.label("token_id"),
+        AccessToken.is_active.label("token_is_active"),
+        User.id.label("user_id"),
+        User.name.label("user_name"),
+        User.email.label("user_email"),
+        User.credits.label("user_credits"),
+        last_scan_at.label("last_scan_at"),
+        next_membership_from.label("next_membership_from"),
+    ]
+    columns += [getattr(Membership, field).label(f"m_{field}") for field in _MEMBERSHIP_FIELDS]
+    columns += [getattr(MembershipPackage, field).label(f"p_{field}") for field in _PACKAGE_FIELDS]
+
+    return (
+        select(*columns)
+        .select_from(AccessToken)
+        .outerjoin(User, User.id == AccessToken.user_id)
+        .outerjoin(Membership, Membership.id == active_membership_id)
+        .outerjoin(MembershipPackage, MembershipPackage.id == Membership.package_id)
+        .where(AccessToken.token == bindparam("token"))
+        .limit(1)
+    )
+
+
+# Building the statement costs more than executing it; construct once and reuse.
+VERIFICATION_STATEMENT = build_verification_statement()
+
+
+def context_from_row(row: Any) -> VerificationContext:
+    mapping = row._mapping
+    membership = None
+    if mapping["m_id"] is not None:
+        package = None
+        if mapping["p_id"] is not None:
+            package = PackageSnapshot(**{field: mapping[f"p_{field}"] for field in _PACKAGE_FIELDS})
+        membership = MembershipSnapshot(
+            **{field: mapping[f"m_{field}"] for field in _MEMBERSHIP_FIELDS},
+            package=package,
+        )
+    return VerificationContext(
+        token_id=mapping["token_id"],
+        token_is_active=bool(mapping["token_is_active"]),
+        user_id=mapping["user_id"],
+        user_name=mapping["user_name"],
+        user_email=mapping["user_email"],
+        user_credits=mapping["user_credits"],
+        last_scan_at=mapping["last_scan_at"],
+        membership=membership,
+        next_membership_from=mapping["next_membership_from"],
+    )
+
+
+def load_verification_context(db: Session, token_str: str, at_ts: datetime) -> Optional[VerificationContext]:
+    """Return the scan read-model for token_str, or None if the token does not exist."""
+    row = db.execute(VERIFICATION_STATEMENT, {"token": token_str, "at_ts": at_ts}).first()
+    if row is None:
+        return None
+    return context_from_row(row)
+
+
+async def load_verification_context_async(
+    db: AsyncSession, token_str: str, at_ts: datetime
+) -> Optional[VerificationContext]:
+    """AsyncSession variant of load_verification_context."""
+    result = await db.execute(VERIFICATION_STATEMENT, {"token": token_str, "at_ts": at_ts})
+    row = result.first()
+    if row is None:
+        return None
+    return context_from_row(row)
+
+
+def build_scan_update_statement(ctx: VerificationContext, now: datetime, cooldown_seconds: int = 0):
+    """
+    One UPDATE for a granted scan: shared cooldown timestamp on all active tokens
+    of the user plus usage counters of the scanned token.
+
+    ctx.last_scan_at may come from the entitlement cache and miss a scan granted by
+    another worker, so the cooldown is re-checked here against the rows themselves;
+    no row updated means the cooldown is active. The per-row condition is what a
+    concurrent UPDATE re-evaluates after waiting for the row lock.
+    """
+    is_scanned = AccessToken.id == ctx.token_id
+    conditions = [AccessToken.user_id == ctx.user_id, AccessToken.is_active.is_(True)]
+    if cooldown_seconds > 0:
+        cutoff = now - timedelta(seconds=cooldown_seconds)
+        sibling = aliased(AccessToken)
+        conditions += [
+            or_(AccessToken.last_scan_at.is_(None), AccessToken.last_scan_at <= cutoff),
+            ~exists().where(
+                sibling.user_id == ctx.user_id, sibling.is_active.is_(True), sibling.last_scan_at > cutoff
+            ),
+        ]
+    return (
+        update(AccessToken)
+        .where(*conditions)
+        .values(
+            last_scan_at=now,
+            used_at=case((is_scanned, now), else_=AccessToken.used_at),
+            scan_count=case(
+                (is_scanned, func.coalesce(AccessToken.scan_count, 0) + 1),
+                else_=AccessToken.scan_count,
+            ),
+        )
+        .execution_options(synchronize_session=False)
+    )
+
+
+def build_membership_usage_statement(membership: MembershipSnapshot, now: datetime):
+    """
+    Count one entry the way MembershipService.record_entry_usage does, but relative to
+    the row's current values (other workers, admin session consumption) and guarded by
+    the limits, so cached counters can never be written back or overrun a limit.
+    RETURNING yields the new counters; no row means a limit was reached meanwhile.
+    Returns None when the membership tracks no usage.
+    """
+    values: dict[str, Any] = {}
+    conditions = [Membership.id == membership.id]
+    if membership.daily_limit_enabled and membership.daily_limit:
+        day_start, day_end = day_bounds_utc(now, get_gym_timezone())
+        used_today = and_(Membership.last_usage_at >= day_start, Membership.last_usage_at < day_end)
+        values["daily_usage_count"] = case(
+            (used_today, func.coalesce(Membership.daily_usage_count, 0) + 1), else_=1
+        )
+        values["last_usage_at"] = now
+        conditions.append(
+            or_(
+                Membership.last_usage_at.is_(None),
+                Membership.last_usage_at < day_start,
+                Membership.last_usage_at >= day_end,
+                Membership.daily_limit.is_(None),
+                func.coalesce(Membership.daily_usage_count, 0) < Membership.daily_limit,
+            )
+        )
+    if membership.sessions_total is not None:
+        values["sessions_used"] = func.coalesce(Membership.sessions_used, 0) + 1
+        conditions.append(
+            or_(
+                Membership.sessions_total.is_(None),
+                func.coalesce(Membership.sessions_used, 0) < Membership.sessions_total,
+            )
+        )
+    if not values:
+        return None
+    return (
+        update(Membership)
+        .where(*conditions)
+        .values(**values)
+        .returning(Membership.daily_usage_count, Membership.last_usage_at, Membership.sessions_used)
+        .execution_options(synchronize_session=False)
+    )
+
+
+async def record_granted_scan(
+    db: AsyncSession, ctx: VerificationContext, now: datetime, *, cooldown_seconds: int = 0
+) -> bool:
+    """False when another scan of the user started the cooldown meanwhile (nothing written)."""
+    result = await db.execute(build_scan_update_statement(ctx, now, cooldown_seconds))
+    return result.rowcount > 0
+
+
+async def persist_membership_usage(db: AsyncSession, membership: MembershipSnapshot, now: datetime) -> bool:
+    """
+    Count one entry on the membership row and copy the resulting counters into the
+    snapshot. False when the daily or session limit was used up meanwhile.
+    """
+    statement = build_membership_usage_statement(membership, now)
+    if statement is None:
+        return True
+    row = (await db.execute(statement)).first()
+    if row is None:
+        return False
+    membership.daily_usage_count, membership.last_usage_at, membership.sessions_used = row
+    return True
@@ -0,0 +1,377 @@
+"""
+Attendance rollups maintained incrementally from closed presence sessions.
+
+Three small tables answer "visits per day", "peak hour" and "average visit
+length" without touching presence_sessions or access_logs:
+
+* visit_stats_hourly     per UTC hour: arrivals and seconds spent in the gym
+                         (a visit is split across the hours it overlaps),
+* visit_stats_daily      per local day (GYM_TIMEZONE) the visits started on:
+                         visits, distinct members, total seconds,
+* visit_stats_user_daily the same per user and local day.
+
+A closed session is counted exactly once: one statement claims up to
+VISIT_ROLLUP_BATCH_SIZE closed sessions with rolled_up_at IS NULL (FOR UPDATE
+SKIP LOCKED, so instances never double count), stamps them and upserts the
+three tables. Zero-length sessions (closed duplicates) are stamped but not
+counted. The code paths that close sessions (exit scan, admin force exit,
+sweeper, reconciliation) wake the worker thread, which batches what closed in
+the meantime; it also polls every VISIT_ROLLUP_INTERVAL_SECONDS for sessions
+closed elsewhere. Readers only touch rollup rows of the requested range.
+Writing needs PostgreSQL.
+
+    python -m app.services.visit_rollups backfill            # count every pending session now
+    python -m app.services.visit_rollups backfill --rebuild  # empty the rollups and recount history
+"""
+from __future__ import annotations
+
+import argparse
+import logging
+import os
+import threading
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Callable, Optional
+from zoneinfo import ZoneInfo
+
+from sqlalchemy import func, select, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from app.models import PresenceSession, VisitStatsDaily, VisitStatsHourly, VisitStatsUserDaily
+from app.services.timezone import day_bounds_utc, get_gym_timezone
+
+logger = logging.getLogger(__name__)
+
+VISIT_ROLLUP_INTERVAL_SECONDS = float(os.getenv("VISIT_ROLLUP_INTERVAL_SECONDS", "60"))
+VISIT_ROLLUP_DEBOUNCE_SECONDS = float(os.getenv("VISIT_ROLLUP_DEBOUNCE_SECONDS", "2"))
+VISIT_ROLLUP_BATCH_SIZE = int(os.getenv("VISIT_ROLLUP_BATCH_SIZE", "5000"))
+
+_ROLLUP_SQL = text(
+    """
+    WITH claimed AS (
+        UPDATE presence_sessions p
+        SET rolled_up_at = now()
+        WHERE p.id IN (
+            SELECT id FROM presence_sessions
+            WHERE ended_at IS NOT NULL AND rolled_up_at IS NULL
+            ORDER BY id
+            LIMIT :batch_size
+            FOR UPDATE SKIP LOCKED
+        )
+        RETURNING p.user_id, p.started_at, p.ended_at
+    ),
+    visits AS (
+        SELECT user_id, started_at, ended_at,
+               CAST(started_at AT TIME ZONE :tz AS date) AS day,
+               CAST(round(EXTRACT(EPOCH FROM ended_at - started_at)) AS bigint) AS seconds
+        FROM claimed
+        WHERE ended_at > started_at
+    ),
+    user_daily AS (
+        INSERT INTO visit_stats_user_daily AS s (user_id, day, visits, total_seconds)
+        SELECT user_id, day, count(*), sum(seconds) FROM visits GROUP BY user_id, day
+        ON CONFLICT (user_id, day) DO UPDATE
+        SET visits = s.visits + EXCLUDED.visits, total_seconds = s.total_seconds + EXCLUDED.total_seconds
+        RETURNING s.day, (s.xmax = 0) AS first_visit_that_day
+    ),
+    daily AS (
+        INSERT INTO visit_stats_daily AS s (day, visits, members, total_seconds)
+        SELECT v.day, v.visits, COALESCE(m.members, 0), v.total_seconds
+        FROM (SELECT day, count(*) AS visits, sum(seconds) AS total_seconds FROM visits GROUP BY day) v
+        LEFT JOIN (
+            SELECT day, count(*) FILTER (WHERE first_visit_that_day) AS members FROM user_daily GROUP BY day
+        ) m ON m.day = v.day
+        ON CONFLICT (day) DO UPDATE
+        SET visits = s.visits + EXCLUDED.visits,
+            members = s.members + EXCLUDED.members,
+            total_seconds = s.total_seconds + EXCLUDED.total_seconds
+        RETURNING 1
+    ),
+    hourly AS (
+        INSERT INTO visit_stats_hourly AS s (hour_start, arrivals, visit_seconds)
+        SELECT h.hour_start,
+               count(*) FILTER (WHERE h.hour_start = v.first_hour),
+               CAST(round(sum(EXTRACT(EPOCH FROM
+                   LEAST(v.ended_at, h.hour_start + INTERVAL '1 hour') - GREATEST(v.started_at, h.hour_start)
+               ))) AS bigint)
+        FROM (
+            SELECT *, date_trunc('hour', started_at AT TIME ZONE 'UTC') AT TIME ZONE 'UTC' AS first_hour FROM visits
+        ) v
+        CROSS JOIN LATERAL generate_series(
+            v.first_hour, v.ended_at - INTERVAL '1 microsecond', INTERVAL '1 hour'
+        ) AS h(hour_start)
+        GROUP BY h.hour_start
+        ON CONFLICT (hour_start) DO UPDATE
+        SET arrivals = s.arrivals + EXCLUDED.arrivals, visit_seconds = s.visit_seconds + EXCLUDED.visit_seconds
+        RETURNING 1
+    )
+    SELECT (SELECT count(*) FROM claimed) AS sessions,
+           (SELECT count(*) FROM visits) AS visits,
+           (SELECT count(*) FROM daily) + (SELECT count(*) FROM hourly) + (SELECT count(*) FROM user_daily) AS rows_upserted
+    """
+)
+
+
+def roll_up_closed_sessions(
+    engine: Engine,
+    *,
+    batch_size: int = VISIT_ROLLUP_BATCH_SIZE,
+    on_batch: Optional[Callable[[dict[str, int]], None]] = None,
+) -> dict[str, int]:
+    """Count every closed session not rolled up yet, one transaction per batch."""
+    if engine.dialect.name != "postgresql":
+        raise RuntimeError(f"visit rollups need PostgreSQL, not {engine.dialect.name}")
+    params = {"batch_size": max(1, batch_size), "tz": get_gym_timezone().key}
+    totals = {"sessions": 0, "visits": 0, "batches": 0}
+    while True:
+        with engine.begin() as conn:
+            row = conn.execute(_ROLLUP_SQL, params).one()
+        if not row.sessions:
+            break
+        totals["sessions"] += row.sessions
+        totals["visits"] += row.visits
+        totals["batches"] += 1
+        if on_batch:
+            on_batch(totals)
+        if row.sessions < params["batch_size"]:
+            break
+    return totals
+
+
+def rebuild_rollups(engine: Engine, *, batch_size: int = VISIT_ROLLUP_BATCH_SIZE, on_batch=None) -> dict[str, int]:
+    """Empty the rollups, mark every session pending again and recount the whole history."""
+    with engine.begin() as conn:
+        conn.execute(text("LOCK TABLE visit_stats_hourly, visit_stats_daily, visit_stats_user_daily IN EXCLUSIVE MODE"))
+        conn.execute(text("TRUNCATE visit_stats_hourly, visit_stats_daily, visit_stats_user_daily"))
+        conn.execute(text("UPDATE presence_sessions SET rolled_up_at = NULL WHERE rolled_up_at IS NOT NULL"))
+    return roll_up_closed_sessions(engine, batch_size=batch_size, on_batch=on_batch)
+
+
+# --- readers (bounded by the requested range, any dialect) -------------------
+
+
+def _avg(total: int, count: int) -> Optional[int]:
+    return round(total / count) if count else None
+
+
+def daily_stats(db: Session, date_from: date, date_to: date) -> dict[str, Any]:
+    """Per local day in [date_from, date_to]; days without visits are included as zeros."""
+    rows = {
+        row.day: row
+        for row in db.scalars(
+            select(VisitStatsDaily).where(VisitStatsDaily.day >= date_from, VisitStatsDaily.day <= date_to)
+        )
+    }
+    days = []
+    day = date_from
+    while day <= date_to:
+        row = rows.get(day)
+        visits, members, seconds = (row.visits, row.members, row.total_seconds) if row else (0, 0, 0)
+        days.append(
+            {"day": day.isoformat(), "visits": visits, "members": members, "total_seconds": seconds, "avg_seconds": _avg(seconds, visits)}
+        )
+        day += timedelta(days=1)
+    visits = sum(d["visits"] for d in days)
+    seconds = sum(d["total_seconds"] for d in days)
+    return {
+        "from": date_from.isoformat(),
+        "to": date_to.isoformat(),
+        "visits": visits,
+        "total_seconds": seconds,
+        "avg_seconds": _avg(seconds, visits),
+        "days": days,
+    }
+
+
+def _hourly_rows(db: Session, date_from: date, date_to: date, tz: ZoneInfo) -> tuple[datetime, datetime, list]:
+    start, _ = day_bounds_utc(datetime.combine(date_from, datetime.min.time(), tzinfo=tz), tz)
+    _, end = day_bounds_utc(datetime.combine(date_to, datetime.min.time(), tzinfo=tz), tz)
+    rows = db.scalars(
+        select(VisitStatsHourly)
+        .where(VisitStatsHourly.hour_start >= start, VisitStatsHourly.hour_start < end)
+        .order_by(VisitStatsHourly.hour_start)
+    ).all()
+    return start, end, rows
+
+
+def _utc(value: datetime) -> datetime:
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+
+def hourly_stats(db: Session, date_from: date, date_to: date, *, tz: Optional[ZoneInfo] = None) -> list[dict[str, Any]]:
+    """Hours with activity in the local days [date_from, date_to], hour in local time."""
+    tz = tz or get_gym_timezone()
+    _, _, rows = _hourly_rows(db, date_from, date_to, tz)
+    return [
+        {
+            "hour": _utc(row.hour_start).astimezone(tz).isoformat(),
+            "arrivals": row.arrivals,
+            "avg_occupancy": round(row.visit_seconds / 3600, 2),
+        }
+        for row in rows
+    ]
+
+
+def peak_hours(db: Session, *, days: int, today: date, tz: Optional[ZoneInfo] = None) -> dict[str, Any]:
+    """Average arrivals and occupancy per local hour of day over the last `days` days (today included)."""
+    tz = tz or get_gym_timezone()
+    date_from = today - timedelta(days=days - 1)
+    _, _, rows = _hourly_rows(db, date_from, today, tz)
+    arrivals = [0] * 24
+    seconds = [0] * 24
+    for row in rows:
+        hour = _utc(row.hour_start).astimezone(tz).hour
+        arrivals[hour] += row.arrivals
+        seconds[hour] += row.visit_seconds
+    hours = [
+        {"hour": hour, "avg_arrivals": round(arrivals[hour] / days, 2), "avg_occupancy": round(seconds[hour] / 3600 / days, 2)}
+        for hour in range(24)
+    ]
+    busiest = max(hours, key=lambda entry: entry["avg_occupancy"])
+    return {
+        "from": date_from.isoformat(),
+        "to": today.isoformat(),
+        "days": days,
+        "peak_hour": busiest["hour"] if busiest["avg_occupancy"] else None,
+        "hours": hours,
+    }
+
+
+def user_stats(db: Session, user_id: int, date_from: date, date_to: date) -> dict[str, Any]:
+    """A member's visits per local day in the range (only days with visits) and totals."""
+    rows = db.scalars(
+        select(VisitStatsUserDaily)
+        .where(
+            VisitStatsUserDaily.user_id == user_id,
+            VisitStatsUserDaily.day >= date_from,
+            VisitStatsUserDaily.day <= date_to,
+        )
+        .order_by(VisitStatsUserDaily.day)
+    ).all()
+    visits = sum(row.visits for row in rows)
+    seconds = sum(row.total_seconds for row in rows)
+    return {
+        "user_id": user_id,
+        "from": date_from.isoformat(),
+        "to": date_to.isoformat(),
+        "visits": visits,
+        "days_visited": len(rows),
+        "total_seconds": seconds,
+        "avg_seconds": _avg(seconds, visits),
+        "days": [
+            {"day": row.day.isoformat(), "visits": row.visits, "total_seconds": row.total_seconds} for row in rows
+        ],
+    }
+
+
+def pending_rollup_count(db: Session) -> int:
+    """Closed sessions not counted yet (served by the partial index ix_presence_sessions_pending_rollup)."""
+    return db.scalar(
+        select(func.count())
+        .select_from(PresenceSession)
+        .where(PresenceSession.ended_at.is_not(None), PresenceSession.rolled_up_at.is_(None))
+    )
+
+
+# --- worker -------------------------------------------------------------------
+
+
+class VisitRollupWorker:
+    """Daemon thread rolling up closed sessions when woken and every interval_seconds."""
+
+    def __init__(
+        self,
+        engine: Engine,
+        *,
+        interval_seconds: float = VISIT_ROLLUP_INTERVAL_SECONDS,
+        debounce_seconds: float = VISIT_ROLLUP_DEBOUNCE_SECONDS,
+    ):
+        self.engine = engine
+        self.interval_seconds = interval_seconds
+        self.debounce_seconds = debounce_seconds
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.sessions_rolled_up = 0
+        self.last_run_at: Optional[datetime] = None
+
+    def start(self) -> None:
+        if self._thread is not None or self.interval_seconds <= 0:
+            return
+        self._thread = threading.Thread(target=self._run, name="visit-rollups", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def wake(self) -> None:
+        self._wake.set()
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "running": self._thread is not None,
+            "sessions_rolled_up": self.sessions_rolled_up,
+            "last_run_at": self.last_run_at.isoformat() if self.last_run_at else None,
+        }
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                self.sessions_rolled_up += roll_up_closed_sessions(self.engine)["sessions"]
+                self.last_run_at = datetime.now(timezone.utc)
+            except Exception:
+                logger.exception("Visit rollup failed")
+            self._wake.wait(self.interval_seconds)
+            self._wake.clear()
+            # let a burst of exits (end of a class) land in one batch
+            self._stop.wait(self.debounce_seconds)
+
+
+_worker: Optional[VisitRollupWorker] = None
+
+
+def get_visit_rollup_worker() -> Optional[VisitRollupWorker]:
+    return _worker
+
+
+def request_visit_rollup() -> None:
+    """Call after committing closed sessions; no-op when the worker is not running (scripts, tests)."""
+    if _worker is not None:
+        _worker.wake()
+
+
+def start_visit_rollups(engine: Engine) -> Optional[VisitRollupWorker]:
+    global _worker
+    if engine.dialect.name != "postgresql":
+        return None
+    if _worker is None:
+        _worker = VisitRollupWorker(engine)
+    _worker.start()
+    return _worker
+
+
+def stop_visit_rollups() -> None:
+    if _worker is not None:
+        _worker.stop()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    parser = argparse.ArgumentParser(description="Visit rollups from closed presence sessions.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    backfill = sub.add_parser("backfill", help="roll up every closed session not counted yet")
+    backfill.add_argument("--rebuild", action="store_true", help="empty the rollups first and recount all history")
+    backfill.add_argument("--batch-size", type=int, default=VISIT_ROLLUP_BATCH_SIZE)
+    args = parser.parse_args()
+
+    from app.database import engine
+
+    def report(totals: dict[str, int]) -> None:
+        print(f"batch {totals['batches']}: {totals['sessions']} sessions, {totals['visits']} visits", flush=True)
+
+    run = rebuild_rollups if args.rebuild else roll_up_closed_sessions
+    print(run(engine, batch_size=args.batch_size, on_batch=report))
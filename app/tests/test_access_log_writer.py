@@ -0,0 +1,101 @@
+import threading
+import time
+
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.pool import StaticPool
+
+from app.models import AccessLog
+from app.services.access_log_writer import AccessLogWriter
+
+
+def _sqlite_engine():
+    engine = create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+    AccessLog.__table__.create(engine)
+    return engine
+
+
+def _row(reason: str) -> dict:
+    return {"token_id": None, "token_string": "999999", "status": "deny", "reason": reason, "metadata": None}
+
+
+def _count(engine) -> int:
+    with engine.connect() as conn:
+        return conn.execute(select(func.count()).select_from(AccessLog.__table__)).scalar_one()
+
+
+def test_rows_are_flushed_on_stop(tmp_path):
+    engine = _sqlite_engine()
+    writer = AccessLogWriter(engine, flush_interval_ms=10_000, spool_path=tmp_path / "spool.jsonl")
+    writer.start()
+    for i in range(5):
+        writer.enqueue(_row(f"r{i}"))
+    writer.stop()
+
+    assert _count(engine) == 5
+    assert writer.stats()["written"] == 5
+    with engine.connect() as conn:
+        created = conn.execute(select(AccessLog.__table__.c.created_at)).scalars().all()
+    assert all(ts is not None for ts in created)
+
+
+def test_failed_flush_is_spooled_and_replayed(tmp_path):
+    spool = tmp_path / "spool.jsonl"
+    unreachable = create_engine("postgresql+psycopg2://nobody@127.0.0.1:1/none", connect_args={"connect_timeout": 1})
+    writer = AccessLogWriter(unreachable, spool_path=spool)
+    writer.enqueue(_row("db down"))
+    writer.enqueue(_row("db down"))
+    writer.stop()  # not running: no-op
+    assert not writer._flush(writer._drain(10))
+    assert len(spool.read_text().splitlines()) == 2
+
+    writer.engine = _sqlite_engine()
+    writer._replay_spool()
+    assert _count(writer.engine) == 2
+    assert not spool.exists()
+
+
+def test_replay_skips_torn_and_rejected_rows(tmp_path):
+    spool = tmp_path / "spool.jsonl"
+    writer = AccessLogWriter(_sqlite_engine(), batch_size=2, spool_path=spool)
+    writer._spool([_row("ok 1"), {**_row("no status"), "status": None}, _row("ok 2"), _row("ok 3")])
+    with spool.open("a", encoding="utf-8") as handle:
+        handle.write('{"token_string": "99')  # crash mid-write
+
+    writer._replay_spool()
+    with writer.engine.connect() as conn:
+        reasons = conn.execute(select(AccessLog.__table__.c.reason).order_by(AccessLog.__table__.c.id)).scalars().all()
+    assert reasons == ["ok 1", "ok 2", "ok 3"] and writer.written == 3
+    assert not spool.exists() and not spool.with_suffix(".jsonl.replay").exists()
+    [rejected] = tmp_path.glob("spool.jsonl.rejected-*")
+    lines = rejected.read_text().splitlines()
+    assert len(lines) == 2 and lines[0] == '{"token_string": "99' and '"no status"' in lines[1]
+
+
+def test_full_queue_spills_to_spool(tmp_path):
+    spool = tmp_path / "spool.jsonl"
+    writer = AccessLogWriter(_sqlite_engine(), queue_size=1, spool_path=spool)
+    writer.enqueue(_row("queued"))
+    writer.enqueue(_row("spilled"))
+    writer.flush_spills()
+
+    assert writer.stats()["queue_depth"] == 1
+    assert writer.stats()["spilled"] == 1
+    assert '"reason": "spilled"' in spool.read_text()
+
+
+def test_enqueue_never_waits_for_the_spool_file(tmp_path):
+    spool = tmp_path / "spool.jsonl"
+    writer = AccessLogWriter(_sqlite_engine(), queue_size=1, spool_path=spool)
+    disk_free = threading.Event()
+    original_spool = writer._spool
+    writer._spool = lambda rows: (disk_free.wait(5), original_spool(rows))
+
+    writer.enqueue(_row("queued"))
+    started = time.monotonic()
+    for i in range(3):
+        writer.enqueue(_row(f"spilled {i}"))
+    assert time.monotonic() - started < 0.5  # returned while the spool write is stuck
+
+    disk_free.set()
+    writer.flush_spills()
+    assert spool.read_text().count("spilled") == 3
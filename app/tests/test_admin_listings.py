@@ -0,0 +1,26 @@
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.models import AccessToken, User
+from app.routes.admin import _serialize_token, token_listing_statement
+
+
+def test_token_listing_is_one_query_with_qr_urls():
+    engine = create_engine("sqlite://", poolclass=StaticPool)
+    User.__table__.create(engine)
+    AccessToken.__table__.create(engine)
+    db = sessionmaker(bind=engine)()
+    for i in range(1, 6):
+        db.add(User(id=i, email=f"u{i}@example.com", name=f"User {i}", password_hash="!"))
+        db.add(AccessToken(id=i, token=f"{i:06d}", user_id=i, is_active=True))
+    db.commit()
+
+    statements = []
+    event.listen(engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+    rows = [_serialize_token(row, "/api/qr_image/") for row in db.execute(token_listing_statement(3))]
+
+    assert len(statements) == 1
+    assert len(rows) == 3
+    assert rows[0]["user_email"] == f"u{rows[0]['user_id']}@example.com"
+    assert rows[0]["qr_code_url"] == f"/api/qr_image/{rows[0]['token']}"
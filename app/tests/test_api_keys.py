@@ -0,0 +1,70 @@
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.database import Base
+from app.models import APIKey
+from app.services import api_keys
+from app.services.api_keys import APIKeyCache, LastUsedTracker, create_api_key, invalidate_api_key, verify_api_key
+
+
+def _session():
+    engine = create_engine("sqlite://", poolclass=StaticPool)
+    Base.metadata.create_all(engine)
+    return engine, sessionmaker(bind=engine)()
+
+
+def test_verified_keys_are_served_from_cache_without_writes(monkeypatch):
+    engine, db = _session()
+    monkeypatch.setattr(api_keys, "api_key_cache", APIKeyCache(ttl_seconds=60, max_entries=10))
+    monkeypatch.setattr(api_keys, "last_used_tracker", LastUsedTracker(engine))
+    key, raw = create_api_key(db, name="scanner", created_by_user_id=None)
+
+    statements = []
+    event.listen(engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+    for _ in range(5):
+        record = verify_api_key(db, raw)
+        assert record.id == key.id and record.name == "scanner"
+    assert len(statements) == 1 and statements[0].lstrip().upper().startswith("SELECT")
+    assert verify_api_key(db, raw + "x") is None
+    assert db.get(APIKey, key.id).last_used_at is None
+
+    statements.clear()
+    assert api_keys.last_used_tracker.flush() == 1
+    assert len(statements) == 1 and statements[0].lstrip().upper().startswith("UPDATE")
+    db.expire_all()
+    assert db.get(APIKey, key.id).last_used_at is not None
+    assert api_keys.last_used_tracker.flush() == 0
+
+
+def test_revoked_and_expired_keys_stop_verifying(monkeypatch):
+    _, db = _session()
+    monkeypatch.setattr(api_keys, "api_key_cache", APIKeyCache(ttl_seconds=60, max_entries=10))
+    monkeypatch.setattr(api_keys, "last_used_tracker", LastUsedTracker())
+    key, raw = create_api_key(db, name="integration", created_by_user_id=None)
+    assert verify_api_key(db, raw) is not None
+
+    key.is_active = False
+    db.commit()
+    assert verify_api_key(db, raw) is not None  # still cached until invalidated
+    invalidate_api_key(key.id)
+    assert verify_api_key(db, raw) is None
+
+    expiring, raw_expiring = create_api_key(db, name="temp", created_by_user_id=None)
+    expiring.expires_at = datetime.now(timezone.utc) - timedelta(seconds=1)
+    db.commit()
+    assert verify_api_key(db, raw_expiring) is None
+
+
+def test_tracker_keeps_newest_timestamp_per_key():
+    tracker = LastUsedTracker()
+    earlier = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    tracker.mark(1, earlier + timedelta(minutes=1))
+    tracker.mark(1, earlier)
+    tracker.mark(2, earlier)
+    assert tracker.pending() == 2
+    assert tracker._pending[1] == earlier + timedelta(minutes=1)
+    assert tracker.flush() == 0  # no engine yet: pending updates are kept
+    assert tracker.pending() == 2
@@ -0,0 +1,52 @@
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.database import Base
+from app.models import Membership, MembershipPackage, PresenceSession, User
+from app.services.dashboard import load_dashboard
+
+NOW = datetime(2026, 10, 1, 12, 0, tzinfo=timezone.utc)
+
+
+def test_dashboard_query_count_is_fixed_and_etags_track_changes():
+    engine = create_engine("sqlite://", poolclass=StaticPool)
+    Base.metadata.create_all(engine)
+    db = sessionmaker(bind=engine)()
+    user = User(id=1, email="a@example.com", name="Alice", password_hash="!", credits=3)
+    package = MembershipPackage(id=1, name="Měsíc", slug="mesic", price_czk=900, duration_days=30, package_type="membership")
+    db.add_all([user, package])
+    for k in range(6):
+        db.add(
+            Membership(
+                user_id=1,
+                package_id=1,
+                membership_type="package",
+                valid_from=NOW - timedelta(days=30 * k + 1),
+                valid_to=NOW + timedelta(days=29 - 30 * k),
+                status="active",
+            )
+        )
+        db.add(PresenceSession(user_id=1, started_at=NOW - timedelta(days=k), status="closed"))
+    db.commit()
+    db.refresh(user)
+
+    statements = []
+    event.listen(engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+    sections = load_dashboard(db, user, at_ts=NOW)
+    assert len(statements) == 3
+    assert len(sections["memberships"].data) == 6
+    assert sections["membership"].data["valid_to"].startswith((NOW + timedelta(days=29)).date().isoformat())
+    assert sections["memberships"].data[0]["package_type"] == "membership"
+    assert len(sections["presence_sessions"].data) == 6
+
+    statements.clear()
+    assert list(load_dashboard(db, user, ["presence_sessions"], at_ts=NOW)) == ["presence_sessions"]
+    assert len(statements) == 1
+
+    user.credits = 4
+    again = load_dashboard(db, user, at_ts=NOW)
+    assert again["profile"].etag != sections["profile"].etag
+    assert again["memberships"].etag == sections["memberships"].etag
@@ -0,0 +1,58 @@
+import sqlite3
+
+import pytest
+from sqlalchemy import exc
+
+from app.db_pool import (
+    InstrumentedQueuePool,
+    PoolSettings,
+    async_engine_kwargs,
+    get_pool_metrics,
+    pool_status,
+    sync_engine_kwargs,
+)
+
+
+def test_settings_from_env(monkeypatch):
+    monkeypatch.setenv("DB_POOL_SIZE", "3")
+    monkeypatch.setenv("DB_MAX_OVERFLOW", "0")
+    monkeypatch.setenv("DB_POOL_PRE_PING", "false")
+    monkeypatch.setenv("DB_STATEMENT_TIMEOUT_MS", "5000")
+    monkeypatch.setenv("DB_IDLE_IN_TRANSACTION_TIMEOUT_MS", "0")
+    settings = PoolSettings.from_env()
+
+    assert (settings.pool_size, settings.max_overflow, settings.pre_ping) == (3, 0, False)
+    assert settings.server_settings() == {"statement_timeout": "5000"}
+    assert sync_engine_kwargs(settings)["connect_args"]["options"] == "-c statement_timeout=5000"
+    assert async_engine_kwargs(settings)["connect_args"]["server_settings"]["statement_timeout"] == "5000"
+
+
+def test_pgbouncer_mode_disables_prepared_statement_cache():
+    settings = PoolSettings(pgbouncer=True)
+    connect_args = async_engine_kwargs(settings)["connect_args"]
+
+    assert connect_args["statement_cache_size"] == 0
+    assert connect_args["prepared_statement_cache_size"] == 0
+    assert connect_args["prepared_statement_name_func"]() != connect_args["prepared_statement_name_func"]()
+    assert "statement_timeout" not in connect_args["server_settings"]
+    assert "options" not in sync_engine_kwargs(settings)["connect_args"]
+
+
+def test_instrumented_pool_records_saturation_and_timeouts():
+    pool = InstrumentedQueuePool(
+        lambda: sqlite3.connect(":memory:"), pool_size=1, max_overflow=0, timeout=0.05, logging_name="test-pool"
+    )
+    first = pool.connect()
+    with pytest.raises(exc.TimeoutError):
+        pool.connect()
+    status = pool_status(pool)
+    assert status["checked_out"] == 1
+    assert status["saturation"] == 1.0
+    assert status["checkouts"] == 1
+    assert status["timeouts"] == 1
+
+    first.close()
+    pool.connect().close()
+    recreated = pool.recreate()
+    assert get_pool_metrics("test-pool").snapshot()["checkouts"] == 2
+    assert pool_status(recreated)["checkouts"] == 2
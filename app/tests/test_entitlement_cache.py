@@ -0,0 +1,75 @@
+from datetime import datetime, timedelta, timezone
+
+from app.services.entitlement_cache import EntitlementCache
+from app.tests.test_verification_context import _context, _membership
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def _cache(**overrides) -> tuple[EntitlementCache, FakeClock]:
+    clock = FakeClock()
+    values = dict(ttl_seconds=30, max_entries=3, clock=clock)
+    values.update(overrides)
+    return EntitlementCache(**values), clock
+
+
+def test_get_returns_copy_until_ttl_expires():
+    cache, clock = _cache()
+    now = datetime.now(timezone.utc)
+    cache.put("111111", _context(membership=_membership()))
+
+    cached = cache.get("111111", now)
+    assert cached is not None
+    cached.membership.daily_usage_count = 5
+    assert cache.get("111111", now).membership.daily_usage_count == 0
+
+    clock.now += 31
+    assert cache.get("111111", now) is None
+    assert cache.stats()["hits"] == 2
+    assert cache.stats()["misses"] == 1
+
+
+def test_entry_goes_stale_when_membership_selection_changes():
+    cache, _ = _cache(ttl_seconds=3600)
+    now = datetime.now(timezone.utc)
+    cache.put("111111", _context(membership=_membership(valid_to=now + timedelta(seconds=10))))
+    cache.put("222222", _context(token_id=2, user_id=11, next_membership_from=now + timedelta(seconds=5)))
+
+    assert cache.get("111111", now) is not None
+    assert cache.get("111111", now + timedelta(seconds=10)) is None
+    assert cache.get("222222", now + timedelta(seconds=4)) is not None
+    assert cache.get("222222", now + timedelta(seconds=5)) is None
+
+
+def test_lru_eviction_and_invalidation():
+    cache, _ = _cache()
+    now = datetime.now(timezone.utc)
+    cache.put("a", _context(token_id=1, user_id=1))
+    cache.put("b", _context(token_id=2, user_id=1))
+    cache.put("c", _context(token_id=3, user_id=2))
+    cache.get("a", now)
+    cache.put("d", _context(token_id=4, user_id=3))
+
+    assert cache.get("b", now) is None  # least recently used
+    assert cache.stats()["evictions"] == 1
+
+    cache.invalidate_user(1)
+    assert cache.get("a", now) is None
+    assert cache.get("c", now) is not None
+
+    cache.invalidate_token("c")
+    assert cache.get("c", now) is None
+    assert cache.stats()["size"] == 1
+
+
+def test_disabled_cache_never_stores():
+    cache, _ = _cache(ttl_seconds=0)
+    cache.put("111111", _context())
+    assert cache.get("111111", datetime.now(timezone.utc)) is None
+    assert cache.stats()["size"] == 0
@@ -0,0 +1,98 @@
+import asyncio
+import re
+import threading
+
+from fastapi import FastAPI
+from sqlalchemy import create_engine, text
+from sqlalchemy.pool import StaticPool
+
+from app import metrics
+from app.metrics import Counter, Histogram, MetricsMiddleware, instrument_engine, render_metrics
+
+# what a Prometheus scraper accepts for a sample line (no timestamps)
+SAMPLE_LINE = re.compile(r'^[a-zA-Z_:][a-zA-Z0-9_:]*(\{([a-zA-Z_]+="[^"]*",?)*\})? -?[0-9.e+-]+$')
+
+
+def _asgi_get(app, path: str) -> int:
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "root_path": "",
+        "query_string": b"",
+        "headers": [],
+        "client": ("127.0.0.1", 5000),
+        "server": ("testserver", 80),
+    }
+    statuses = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            statuses.append(message["status"])
+
+    asyncio.run(app(scope, receive, send))
+    return statuses[0]
+
+
+def test_thread_sharded_counters_lose_no_increments():
+    counter = Counter("test_total", "test", ("kind",))
+    histogram = Histogram("test_seconds", "test", buckets=(0.1, 1.0))
+
+    def work():
+        for _ in range(2000):
+            counter.inc(("a",))
+            histogram.observe((), 0.5)
+
+    threads = [threading.Thread(target=work) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert counter.collect() == {("a",): 8000}
+    assert counter.collect() == {("a",): 8000}  # exited threads' shards are retired, not dropped
+    assert histogram.collect()[()][:3] == [0, 8000, 0]
+    assert 'test_seconds_bucket{le="1"} 8000' in histogram.render()
+    assert 'test_seconds_bucket{le="0.1"} 0' in histogram.render()
+
+
+def test_middleware_records_latency_and_queries_per_route_template(monkeypatch):
+    engine = create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+    instrument_engine(engine)
+    app = FastAPI()
+
+    @app.get("/metrics-test/{item_id}")
+    def item(item_id: int):  # sync: runs in the threadpool, queries are still attributed
+        with engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+            conn.execute(text("SELECT 2"))
+        return {"id": item_id}
+
+    wrapped = MetricsMiddleware(app)
+    assert _asgi_get(wrapped, "/metrics-test/1") == 200
+    assert _asgi_get(wrapped, "/metrics-test/2") == 200
+    with engine.connect() as conn:
+        conn.execute(text("SELECT 3"))  # outside a request: not counted anywhere
+
+    queries = metrics.request_queries.collect()[("GET", "/metrics-test/{item_id}")]
+    assert queries[-1] == 4 and sum(queries[:-1]) == 2
+    assert sum(metrics.request_duration.collect()[("GET", "/metrics-test/{item_id}", "200")][:-1]) == 2
+
+    metrics.verify_outcomes.inc(("denied", "cooldown"))
+    body = render_metrics()
+    assert 'gymscanner_verify_outcomes_total{outcome="denied",reason="cooldown"}' in body
+    assert 'gymscanner_db_pool_checkouts_total{pool="sync"}' in body
+    assert 'gymscanner_cache_hits_total{cache="entitlement"}' in body
+    for line in body.splitlines():
+        assert line.startswith("# ") or SAMPLE_LINE.match(line), line
+
+    monkeypatch.setattr(metrics, "METRICS_TOKEN", "s3cret")
+    assert metrics.metrics_authorized("Bearer s3cret")
+    assert not metrics.metrics_authorized(None)
@@ -0,0 +1,75 @@
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.pool import StaticPool
+
+from app.migrations import Migration, backfill_in_batches, run_migrations
+
+
+def _sqlite_engine():
+    return create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+
+
+def _create_items(conn):
+    conn.execute(text("CREATE TABLE items (id INTEGER PRIMARY KEY, flag BOOLEAN)"))
+    conn.execute(text("INSERT INTO items (flag) VALUES " + ", ".join(["(NULL)"] * 25)))
+
+
+def _backfill_items(conn):
+    backfill_in_batches(conn, "items", "flag = 1", "flag IS NULL", batch_size=10)
+
+
+MIGRATIONS = [
+    Migration(1, "create_items", _create_items),
+    Migration(2, "backfill_items", _backfill_items, transactional=False),
+]
+
+
+def test_pending_migrations_apply_once_and_up_to_date_boot_is_one_query():
+    engine = _sqlite_engine()
+    assert run_migrations(engine, MIGRATIONS) == 2
+    with engine.connect() as conn:
+        assert conn.execute(text("SELECT count(*) FROM items WHERE flag IS NULL")).scalar() == 0
+        assert conn.execute(text("SELECT name FROM schema_version ORDER BY version")).scalars().all() == [
+            "create_items",
+            "backfill_items",
+        ]
+
+    statements = []
+    event.listen(engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+    assert run_migrations(engine, MIGRATIONS) == 2
+    assert statements == ["SELECT max(version) FROM schema_version"]
+
+
+def test_new_migration_applies_on_top_of_existing_version():
+    engine = _sqlite_engine()
+    run_migrations(engine, MIGRATIONS[:1])
+    applied = []
+    extra = Migration(3, "noop", lambda conn: applied.append(3))
+    assert run_migrations(engine, [*MIGRATIONS, extra]) == 3
+    assert applied == [3]
+
+
+def test_manual_migration_is_skipped_at_startup_and_applied_by_the_cli():
+    engine = _sqlite_engine()
+    applied = []
+    migrations = [
+        *MIGRATIONS,
+        Migration(3, "rewrite_big_table", lambda conn: applied.append(3), manual=True),
+        Migration(4, "noop", lambda conn: applied.append(4)),
+    ]
+    assert run_migrations(engine, migrations) == 4
+    assert applied == [4]
+    assert run_migrations(engine, migrations) == 4  # up to date for startup
+    assert run_migrations(engine, migrations, include_manual=True) == 4
+    assert applied == [4, 3]
+
+
+def test_backfill_commits_in_batches():
+    engine = _sqlite_engine()
+    commits = []
+    event.listen(engine, "commit", lambda conn: commits.append(1))
+    with engine.connect() as conn:
+        _create_items(conn)
+        conn.commit()
+        commits.clear()
+        assert backfill_in_batches(conn, "items", "flag = 1", "flag IS NULL", batch_size=10) == 25
+    assert len(commits) == 3
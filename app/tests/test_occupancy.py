@@ -0,0 +1,124 @@
+import asyncio
+import json
+import threading
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import StaticPool
+
+from app.database import Base
+from app.models import PresenceSession, User
+from app.services.occupancy import (
+    Occupant,
+    OccupancyBusy,
+    OccupancyTracker,
+    occupancy_event_stream,
+    rebuild_occupancy,
+)
+
+NOW = datetime(2026, 3, 2, 18, 0, tzinfo=timezone.utc)
+
+
+def _occupant(user_id: int, session_id: int) -> Occupant:
+    return Occupant(session_id, user_id, f"User {user_id}", None, None, None, NOW + timedelta(minutes=session_id))
+
+
+def _frame(raw: str) -> tuple[str, dict]:
+    fields = dict(line.split(": ", 1) for line in raw.strip().splitlines())
+    return fields["event"], json.loads(fields["data"])
+
+
+def test_rebuild_from_open_sessions_and_stale_resync_is_skipped():
+    engine = create_engine("sqlite://", poolclass=StaticPool)
+    Base.metadata.create_all(engine)
+    with Session(engine) as db:
+        db.add_all([User(id=1, email="a@x.cz", name="Anna", password_hash="!"), User(id=2, email="b@x.cz", name="Bob", password_hash="!")])
+        db.add_all([
+            PresenceSession(id=10, user_id=1, started_at=NOW, status="active", last_direction="in"),
+            PresenceSession(id=11, user_id=2, started_at=NOW, ended_at=NOW, status="closed", last_direction="out"),
+        ])
+        db.commit()
+
+    tracker = OccupancyTracker()
+    assert rebuild_occupancy(engine, tracker)
+    live = tracker.snapshot(detail=True)
+    assert live["count"] == 1 and live["occupants"][0]["id"] == 10 and live["occupants"][0]["user_name"] == "Anna"
+
+    version = tracker.version
+    tracker.enter(_occupant(2, 12))  # a scan lands while a resync is reading the database
+    assert not tracker.replace([], expected_version=version)
+    assert tracker.count == 2
+    tracker.leave(2, session_id=99)  # another session: ignored
+    tracker.leave(2)
+    assert tracker.count == 1 and tracker.stats()["version"] == version + 2
+
+
+def test_streams_push_changes_from_other_threads():
+    tracker = OccupancyTracker(max_subscribers=2)
+    tracker.enter(_occupant(1, 1))
+
+    async def exercise():
+        admin = occupancy_event_stream(detail=True, tracker=tracker, heartbeat_seconds=0.05)
+        lobby = occupancy_event_stream(detail=False, tracker=tracker, heartbeat_seconds=0.05)
+        assert _frame(await admin.__anext__())[0] == "snapshot"
+        assert _frame(await lobby.__anext__()) == ("count", tracker.snapshot(detail=False))
+        with pytest.raises(OccupancyBusy):
+            occupancy_event_stream(detail=False, tracker=tracker)
+
+        thread = threading.Thread(target=lambda: (tracker.enter(_occupant(2, 2)), tracker.leave(1)))
+        thread.start()
+        thread.join()
+        kind, payload = _frame(await admin.__anext__())
+        assert kind == "enter" and payload["occupant"]["user_id"] == 2 and payload["count"] == 2
+        kind, payload = _frame(await admin.__anext__())
+        assert kind == "exit" and payload["occupant"]["id"] == 1 and payload["count"] == 1
+        assert [_frame(await lobby.__anext__())[1]["count"] for _ in range(2)] == [2, 1]
+        assert await lobby.__anext__() == ": ping\n\n"
+
+        await admin.aclose()
+        await lobby.aclose()
+        assert tracker.stats()["subscribers"] == 0
+
+    asyncio.run(exercise())
+
+
+def test_public_streams_cannot_take_the_slots_reserved_for_admins():
+    tracker = OccupancyTracker(max_subscribers=3, max_public_subscribers=1)
+
+    async def exercise():
+        lobby = occupancy_event_stream(detail=False, tracker=tracker)
+        await lobby.__anext__()
+        with pytest.raises(OccupancyBusy):
+            occupancy_event_stream(detail=False, tracker=tracker)
+        admins = [occupancy_event_stream(detail=True, tracker=tracker) for _ in range(2)]
+        for admin in admins:
+            await admin.__anext__()
+        assert tracker.stats()["subscribers"] == 3 and tracker.stats()["public_subscribers"] == 1
+
+        await lobby.aclose()
+        lobby = occupancy_event_stream(detail=False, tracker=tracker)  # its slot is free again
+        await lobby.__anext__()
+        for stream in (lobby, *admins):
+            await stream.aclose()
+        assert tracker.stats()["subscribers"] == tracker.stats()["public_subscribers"] == 0
+
+    asyncio.run(exercise())
+
+
+def test_slow_subscriber_gets_a_fresh_snapshot_instead_of_a_backlog():
+    tracker = OccupancyTracker()
+
+    async def exercise():
+        stream = occupancy_event_stream(detail=False, tracker=tracker)
+        await stream.__anext__()
+        for user_id in range(1, 300):  # far more than the subscriber queue holds
+            tracker.enter(_occupant(user_id, user_id))
+        await asyncio.sleep(0)
+        kind, payload = _frame(await stream.__anext__())
+        await stream.aclose()
+        return kind, payload
+
+    kind, payload = asyncio.run(exercise())
+    assert kind == "count" and payload["count"] == 299 and payload["version"] == tracker.version
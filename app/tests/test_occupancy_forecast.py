@@ -0,0 +1,100 @@
+from datetime import date, datetime, time, timezone
+from zoneinfo import ZoneInfo
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import StaticPool
+
+from app.database import Base
+from app.models import PresenceSession, User
+from app.services.occupancy_forecast import (
+    SLOTS_PER_DAY,
+    ForecastUpdater,
+    OccupancyProfiles,
+    daily_occupancy,
+    slot_edges,
+)
+
+PRAGUE = ZoneInfo("Europe/Prague")
+
+
+def utc(*args) -> datetime:
+    return datetime(*args, tzinfo=timezone.utc)
+
+
+def test_sessions_are_binned_into_local_slots_across_midnight_and_dst():
+    # 2026-03-29: clocks jump 02:00 -> 03:00, the 02:xx slots are empty
+    edges = slot_edges(date(2026, 3, 29), PRAGUE)
+    assert len(edges) == SLOTS_PER_DAY + 1 and edges[8] == edges[12]
+    assert (edges[-1] - edges[0]).total_seconds() == 23 * 3600
+
+    visits = [
+        (utc(2026, 3, 2, 17, 0), utc(2026, 3, 2, 17, 30)),  # 18:00-18:30 Prague
+        (utc(2026, 3, 2, 17, 7, 30), utc(2026, 3, 2, 17, 15)),  # half of the 18:00 slot
+        (utc(2026, 3, 2, 22, 45), utc(2026, 3, 2, 23, 15)),  # 23:45-00:15, crosses midnight
+    ]
+    days = daily_occupancy(visits, date(2026, 3, 2), date(2026, 3, 3), PRAGUE)
+    monday, tuesday = days[date(2026, 3, 2)], days[date(2026, 3, 3)]
+    assert monday[72] == 1.5 and monday[73] == 1.0 and monday[95] == 1.0
+    assert tuesday[0] == 1.0 and sum(tuesday) == 1.0
+
+
+def test_profiles_average_first_weeks_then_weight_recent_ones():
+    profiles = OccupancyProfiles(alpha=0.25)
+    for week, count in enumerate([4.0, 8.0, 12.0, 12.0]):
+        profiles.fold_day(date(2026, 3, 2 + 7 * week), [count] * SLOTS_PER_DAY)
+    # mean of 4, 8, 12 = 8, then 8 + 0.25 * (12 - 8)
+    assert profiles.profile(0)[72] == 9.0 and profiles.observed(0) == 4
+    profiles.fold_day(date(2026, 3, 2), [100.0] * SLOTS_PER_DAY)  # already folded, ignored
+    assert profiles.profile(0)[72] == 9.0
+
+    forecast = profiles.forecast(date(2026, 3, 30), at=time(18, 10))
+    assert forecast["at"] == {"time": "18:00", "expected": 9.0}
+    assert forecast["days_observed"] == 4 and len(forecast["slots"]) == SLOTS_PER_DAY
+    assert profiles.forecast(date(2026, 3, 31))["peak"] is None  # nothing seen on Tuesdays
+
+
+def test_updater_builds_history_once_then_folds_new_days():
+    engine = create_engine("sqlite://", poolclass=StaticPool)
+    Base.metadata.create_all(engine)
+    with Session(engine) as db:
+        db.add(User(id=1, email="forecast@example.cz", name="F", password_hash="!"))
+        db.add_all([
+            PresenceSession(user_id=1, started_at=utc(2026, 3, 2, 17, 0), ended_at=utc(2026, 3, 2, 18, 0), status="closed"),
+            PresenceSession(user_id=1, started_at=utc(2026, 3, 9, 17, 0), ended_at=utc(2026, 3, 9, 18, 0), status="closed"),
+            PresenceSession(user_id=1, started_at=utc(2026, 3, 9, 5, 0), status="active"),  # still open
+        ])
+        db.commit()
+
+    profiles = OccupancyProfiles(alpha=0.5)
+    updater = ForecastUpdater(profiles, history_weeks=2)
+    assert updater.catch_up(engine, now=utc(2026, 3, 10, 12), tz=PRAGUE) == 14
+    assert profiles.last_day == date(2026, 3, 9)
+    assert profiles.observed(0) == 2 and profiles.profile(0)[72] == 1.0 and profiles.profile(0)[24] == 0.0
+
+    assert updater.catch_up(engine, now=utc(2026, 3, 10, 12), tz=PRAGUE) == 0
+    assert updater.catch_up(engine, now=utc(2026, 3, 17, 12), tz=PRAGUE) == 7
+    assert profiles.profile(0)[72] == 0.5  # the third Monday was empty
+
+
+def test_updater_waits_until_sessions_open_at_midnight_are_closed():
+    engine = create_engine("sqlite://", poolclass=StaticPool)
+    Base.metadata.create_all(engine)
+    with Session(engine) as db:
+        db.add(User(id=1, email="forecast@example.cz", name="F", password_hash="!"))
+        # 23:30-00:30 Prague, still open when Monday ends
+        db.add(PresenceSession(user_id=1, started_at=utc(2026, 3, 9, 22, 30), status="active"))
+        db.commit()
+
+    profiles = OccupancyProfiles(alpha=0.5)
+    updater = ForecastUpdater(profiles, history_weeks=1, settle_hours=8)
+    assert updater.catch_up(engine, now=utc(2026, 3, 10, 6, 59), tz=PRAGUE) == 7
+    assert profiles.last_day == date(2026, 3, 8)  # Monday is not settled before 08:00 Prague
+
+    with Session(engine) as db:
+        session = db.query(PresenceSession).one()
+        session.ended_at, session.status = utc(2026, 3, 9, 23, 30), "closed"
+        db.commit()
+    assert updater.catch_up(engine, now=utc(2026, 3, 10, 7, 0), tz=PRAGUE) == 1
+    assert profiles.last_day == date(2026, 3, 9)
+    assert profiles.profile(0)[94] == profiles.profile(0)[95] == 0.5  # mean with the empty 2 March
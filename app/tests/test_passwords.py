@@ -0,0 +1,55 @@
+import asyncio
+import threading
+
+import pytest
+
+from app.services.passwords import PasswordHasher, PasswordHasherBusy, build_crypt_context
+
+# cheap parameters keep the suite fast; the cost itself is not under test
+FAST = dict(time_cost=1, memory_cost=1024, parallelism=1)
+
+
+def test_hash_verify_and_rehash_on_parameter_change():
+    old_context = build_crypt_context(**FAST)
+    stored = old_context.hash("heslo123")
+    hasher = PasswordHasher(build_crypt_context(time_cost=2, memory_cost=1024, parallelism=1), workers=2)
+
+    async def exercise():
+        assert not await hasher.verify("spatne", stored)
+        valid, new_hash = await hasher.verify_and_update("heslo123", stored)
+        assert valid and new_hash and "t=2" in new_hash
+        assert await hasher.verify_and_update("heslo123", new_hash) == (True, None)
+        assert await hasher.verify("heslo123", await hasher.hash("heslo123"))
+
+    try:
+        asyncio.run(exercise())
+    finally:
+        hasher.shutdown()
+    stats = hasher.stats()
+    assert stats["completed"] == 5 and stats["rehashed"] == 1 and stats["queued"] == 0
+
+
+def test_pool_is_bounded_and_keeps_the_event_loop_free():
+    hasher = PasswordHasher(build_crypt_context(**FAST), workers=1, max_pending=2)
+    release = threading.Event()
+
+    async def exercise():
+        blocked = [asyncio.ensure_future(hasher._submit(release.wait)) for _ in range(2)]
+        ticks = 0
+        while hasher.stats()["running"] == 0:
+            await asyncio.sleep(0.001)
+        for _ in range(5):  # the loop keeps serving other work while the pool is busy
+            await asyncio.sleep(0)
+            ticks += 1
+        assert hasher.stats()["queued"] == 1
+        with pytest.raises(PasswordHasherBusy):
+            await hasher.verify("x", "y")
+        release.set()
+        await asyncio.gather(*blocked)
+        return ticks
+
+    try:
+        assert asyncio.run(exercise()) == 5
+    finally:
+        hasher.shutdown()
+    assert hasher.stats()["rejected"] == 1
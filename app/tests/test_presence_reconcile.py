@@ -0,0 +1,104 @@
+"""
+Bulk presence reconciliation against PostgreSQL:
+
+    TEST_DATABASE_URL=postgresql+psycopg2://user@localhost/gym_test pytest app/tests/test_presence_reconcile.py
+"""
+import os
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import create_engine, delete, event, select, text
+from sqlalchemy.orm import Session
+
+from app.migrations import run_migrations
+from app.models import AccessLog, AccessToken, PresenceSession, User
+from app.services.presence_reconcile import reconcile_presence
+
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+
+pytestmark = pytest.mark.skipif(not TEST_DATABASE_URL, reason="TEST_DATABASE_URL not set")
+
+USER_IDS = [920_001, 920_002, 920_003, 920_004]
+
+
+def _cleanup(db: Session) -> None:
+    db.execute(delete(AccessLog).where(AccessLog.token_string.like("reconcile-%")))
+    db.execute(delete(PresenceSession).where(PresenceSession.user_id.in_(USER_IDS)))
+    db.execute(delete(AccessToken).where(AccessToken.user_id.in_(USER_IDS)))
+    db.execute(delete(User).where(User.id.in_(USER_IDS)))
+    db.commit()
+
+
+def test_reconcile_dry_run_then_apply():
+    # like the app pool (DB_STATEMENT_TIMEOUT_MS); one connection, so the job's is reused below
+    engine = create_engine(TEST_DATABASE_URL, pool_size=1, connect_args={"options": "-c statement_timeout=30000"})
+    run_migrations(engine)
+    t0 = datetime.now(timezone.utc) - timedelta(days=1)
+    with Session(engine) as db:
+        _cleanup(db)
+        db.add_all(
+            User(id=uid, email=f"reconcile{uid}@example.cz", name=f"R {uid}", password_hash="!", is_in_gym=uid == 920_002)
+            for uid in USER_IDS
+        )
+        db.flush()
+        token = AccessToken(token="reconcile-token-1", user_id=920_001, is_active=True, scan_count=0)
+        db.add(token)
+        db.flush()
+        db.add_all([
+            # 920_001: kiosk scan in (logged by token only) -> in, gets a session
+            AccessLog(token_id=token.id, token_string="reconcile-1", status="allow", direction="in", entry=True, scanned_at=t0),
+            AccessLog(token_id=token.id, token_string="reconcile-2", status="deny", direction="out", exit=True, scanned_at=t0 + timedelta(hours=1)),
+            # 920_002: flagged in, but left through the exit scanner -> out, session closed at the exit
+            AccessLog(user_id=920_002, token_string="reconcile-3", status="allow", direction="out", exit=True, scanned_at=t0 + timedelta(hours=2)),
+            PresenceSession(user_id=920_002, started_at=t0, status="active", last_direction="in"),
+            # 920_003: two open sessions -> stays in, the older one is closed
+            PresenceSession(user_id=920_003, started_at=t0, status="active", last_direction="in"),
+            PresenceSession(user_id=920_003, started_at=t0 + timedelta(hours=3), status="active", last_direction="in"),
+            # 920_004: plain /api/verify credit scan (no entry/exit flag) -> not a presence event, stays out
+            AccessLog(user_id=920_004, token_string="reconcile-4", status="allow", direction="in", scanned_at=t0),
+        ])
+        db.commit()
+
+    try:
+        preview = reconcile_presence(engine, dry_run=True, batch_size=2)
+        diff = {entry["user_id"]: entry for entry in preview.diff if entry["user_id"] in USER_IDS}
+        assert diff[920_001]["is_in_gym"] == [False, True] and diff[920_001]["open_session"]
+        assert diff[920_002]["is_in_gym"] == [True, False] and diff[920_002]["close_sessions"] == 1
+        assert diff[920_003]["close_sessions"] == 1
+        assert 920_004 not in diff
+        assert preview.status == "done" and preview.processed_users == preview.total_users
+        with Session(engine) as db:
+            assert not db.get(User, 920_001).is_in_gym  # dry run wrote nothing
+
+        batches = []
+        result = reconcile_presence(engine, batch_size=2, on_batch=lambda p: batches.append(p.processed_users))
+        assert result.sessions_opened >= 1 and result.sessions_closed >= 2
+        assert batches == sorted(batches) and batches[-1] == result.total_users
+        with Session(engine) as db:
+            users = {u.id: u for u in db.scalars(select(User).where(User.id.in_(USER_IDS)))}
+            sessions = list(db.scalars(select(PresenceSession).where(PresenceSession.user_id.in_(USER_IDS)).order_by(PresenceSession.id)))
+        assert users[920_001].is_in_gym and users[920_001].last_entry_at == t0
+        assert not users[920_002].is_in_gym and users[920_002].last_exit_at == t0 + timedelta(hours=2)
+        assert users[920_003].is_in_gym
+        assert not users[920_004].is_in_gym and users[920_004].last_entry_at is None
+        by_user = {}
+        for session in sessions:
+            by_user.setdefault(session.user_id, []).append(session)
+        assert by_user[920_001][0].started_at == t0 and by_user[920_001][0].ended_at is None
+        assert by_user[920_002][0].status == "anomaly" and by_user[920_002][0].ended_at == t0 + timedelta(hours=2)
+        assert [s.status for s in by_user[920_003]] == ["anomaly", "active"]
+        assert 920_004 not in by_user
+
+        statements = []
+        event.listen(engine, "before_cursor_execute", lambda *args: statements.append(args[2].strip()))
+        again = reconcile_presence(engine, dry_run=True)
+        assert not [entry for entry in again.diff if entry["user_id"] in USER_IDS]
+        # the truth table is built without the pool's statement timeout, which is restored afterwards
+        creates = next(i for i, sql in enumerate(statements) if sql.startswith("CREATE TEMP"))
+        assert "SET statement_timeout = 0" in statements[:creates]
+        with engine.connect() as conn:
+            assert conn.execute(text("SHOW statement_timeout")).scalar() == "30s"
+    finally:
+        with Session(engine) as db:
+            _cleanup(db)
+        engine.dispose()
@@ -0,0 +1,79 @@
+import os
+from datetime import datetime, time, timedelta, timezone
+from zoneinfo import ZoneInfo
+
+import pytest
+from sqlalchemy import create_engine, delete, select
+from sqlalchemy.orm import Session
+
+from app.migrations import run_migrations
+from app.models import PresenceSession, User
+from app.services.occupancy import Occupant, occupancy
+from app.services.presence_sweeper import sweep_cutoffs, sweep_stale_sessions
+
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+PRAGUE = ZoneInfo("Europe/Prague")
+
+
+def test_closing_cutoff_is_the_last_local_closing_that_passed():
+    evening = datetime(2026, 3, 2, 21, 30, tzinfo=timezone.utc)  # 22:30 in Prague (CET)
+    morning = datetime(2026, 7, 2, 5, 0, tzinfo=timezone.utc)  # 07:00 in Prague (CEST)
+    cutoffs = sweep_cutoffs(evening, max_visit_hours=6, closing_time=time(22, 0), tz=PRAGUE)
+    assert cutoffs == {
+        "age_cutoff": datetime(2026, 3, 2, 15, 30, tzinfo=timezone.utc),
+        "closing_cutoff": datetime(2026, 3, 2, 21, 0, tzinfo=timezone.utc),
+    }
+    cutoffs = sweep_cutoffs(morning, max_visit_hours=0, closing_time=time(22, 0), tz=PRAGUE)
+    assert cutoffs == {"age_cutoff": None, "closing_cutoff": datetime(2026, 7, 1, 20, 0, tzinfo=timezone.utc)}
+
+
+@pytest.mark.skipif(not TEST_DATABASE_URL, reason="TEST_DATABASE_URL not set")
+def test_sweep_closes_stale_sessions_and_fixes_presence(monkeypatch):
+    monkeypatch.setenv("GYM_TIMEZONE", "Europe/Prague")
+    engine = create_engine(TEST_DATABASE_URL)
+    run_migrations(engine)
+    now = datetime(2026, 3, 3, 9, 0, tzinfo=timezone.utc)  # 10:00 in Prague
+    evening = datetime(2026, 3, 2, 19, 0, tzinfo=timezone.utc)  # 20:00 the day before
+    user_ids = [910_001, 910_002, 910_003]
+    with Session(engine) as db:
+        db.execute(delete(PresenceSession).where(PresenceSession.user_id.in_(user_ids)))
+        db.execute(delete(User).where(User.id.in_(user_ids)))
+        db.add_all(
+            User(id=uid, email=f"sweep{uid}@example.cz", name=f"Sweep {uid}", password_hash="!", is_in_gym=True)
+            for uid in user_ids
+        )
+        db.flush()
+        db.add_all([
+            PresenceSession(id=910_001, user_id=910_001, started_at=evening, status="active", last_direction="in"),
+            PresenceSession(id=910_002, user_id=910_002, started_at=now - timedelta(hours=9), status="active", last_direction="in"),
+            PresenceSession(id=910_003, user_id=910_003, started_at=now - timedelta(hours=1), status="active", last_direction="in"),
+        ])
+        db.commit()
+    for session_id in (910_001, 910_003):
+        occupancy.enter(Occupant(session_id, session_id, None, None, None, None, now))
+
+    try:
+        result = sweep_stale_sessions(engine, now=now, max_visit_hours=8, closing_time=time(22, 0), batch_size=1)
+        assert result["closed"] == 2 and result["users_fixed"] == 2
+        with Session(engine) as db:
+            sessions = {s.id: s for s in db.scalars(select(PresenceSession).where(PresenceSession.user_id.in_(user_ids)))}
+            users = {u.id: u for u in db.scalars(select(User).where(User.id.in_(user_ids)))}
+        # closed at 22:00 local, not at sweep time
+        assert sessions[910_001].status == "timeout"
+        assert sessions[910_001].ended_at == datetime(2026, 3, 2, 21, 0, tzinfo=timezone.utc)
+        assert sessions[910_001].duration_seconds == 7200
+        # longer than the max visit: capped at start + 8 h
+        assert sessions[910_002].ended_at == now - timedelta(hours=1)
+        assert sessions[910_003].ended_at is None and users[910_003].is_in_gym
+        assert not users[910_001].is_in_gym and not users[910_002].is_in_gym
+        assert users[910_002].last_exit_at == now - timedelta(hours=1)
+        live = {o["user_id"] for o in occupancy.snapshot(detail=True)["occupants"]}
+        assert 910_003 in live and 910_001 not in live
+        assert sweep_stale_sessions(engine, now=now, max_visit_hours=8, closing_time=time(22, 0))["closed"] == 0
+    finally:
+        occupancy.leave(910_003)
+        with Session(engine) as db:
+            db.execute(delete(PresenceSession).where(PresenceSession.user_id.in_(user_ids)))
+            db.execute(delete(User).where(User.id.in_(user_ids)))
+            db.commit()
+        engine.dispose()
@@ -0,0 +1,74 @@
+import asyncio
+import logging
+
+import pytest
+from fastapi import HTTPException
+from fastapi.security import HTTPAuthorizationCredentials
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app import auth
+from app.database import Base
+from app.models import User
+from app.services import principals
+from app.services.principals import PrincipalCache, invalidate_principal
+
+
+@pytest.fixture
+def db(monkeypatch):
+    monkeypatch.setattr(principals, "principal_cache", PrincipalCache(ttl_seconds=60, max_entries=100))
+    engine = create_engine("sqlite://", poolclass=StaticPool)
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+    session.add(User(id=1, email="a@example.com", name="Alice", password_hash="!", is_admin=False))
+    session.commit()
+    session.statements = []
+    event.listen(engine, "before_cursor_execute", lambda *args: session.statements.append(args[2]))
+    return session
+
+
+def _credentials(user_id, role="user"):
+    token = auth.create_access_token({"sub": user_id, "role": role})
+    return HTTPAuthorizationCredentials(scheme="Bearer", credentials=token)
+
+
+def test_claims_need_no_database():
+    claims = asyncio.run(auth.get_token_claims(_credentials(5, role="admin")))
+    assert claims.user_id == 5 and claims.is_admin and claims.issued_at > 0
+
+    with pytest.raises(HTTPException) as invalid:
+        asyncio.run(auth.get_token_claims(HTTPAuthorizationCredentials(scheme="Bearer", credentials="nope")))
+    assert invalid.value.status_code == 401
+
+
+def test_principal_is_cached_per_token_and_invalidated_on_change(db):
+    credentials = _credentials(1)
+    first = asyncio.run(auth.get_current_principal(credentials, db))
+    second = asyncio.run(auth.get_current_principal(credentials, db))
+    assert first is second and first.role == "user" and first.name == "Alice"
+    assert len(db.statements) == 1
+
+    user = db.get(User, 1)
+    user.is_admin = True
+    db.commit()
+    invalidate_principal(1)
+    db.statements.clear()
+    assert asyncio.run(auth.get_current_principal(credentials, db)).is_admin
+    assert len(db.statements) == 1
+
+    with pytest.raises(HTTPException) as missing:
+        asyncio.run(auth.get_current_principal(_credentials(404), db))
+    assert missing.value.status_code == 404
+
+
+def test_full_user_load_warms_the_cache_without_logging_the_payload(db, caplog):
+    credentials = _credentials(1)
+    with caplog.at_level(logging.INFO, logger="app.auth"):
+        user = asyncio.run(auth.get_current_user(credentials, db))
+    assert user.email == "a@example.com"
+    assert "payload" not in caplog.text.lower()
+
+    db.statements.clear()
+    assert asyncio.run(auth.get_current_principal(credentials, db)).id == 1
+    assert db.statements == []
@@ -0,0 +1,82 @@
+import io
+import re
+
+from fastapi import FastAPI
+from PIL import Image
+from starlette.requests import Request
+
+from app.routes import qr
+from app.services.qr_render import QRRenderCache, QRSpec, _qr_matrix, negotiate_format, render_qr
+from app.services.utils import etag_matches
+
+
+def test_cache_serves_memory_then_disk(tmp_path):
+    cache = QRRenderCache(max_entries=1, cache_dir=str(tmp_path))
+    first = cache.render(QRSpec("123456"))
+    assert first.content.startswith(b"\x89PNG")
+    assert cache.render(QRSpec("123456")) is first
+    cache.render(QRSpec("654321"))  # evicts 123456 from memory
+
+    again = QRRenderCache(max_entries=1, cache_dir=str(tmp_path)).render(QRSpec("123456"))
+    assert again.content == first.content
+    assert cache.stats() == {"size": 1, "hits": 1, "disk_hits": 0, "renders": 2, "evictions": 1}
+
+    assert QRSpec("123456").etag != QRSpec("123456", scale=6).etag
+    assert QRSpec("123456").etag != QRSpec("123456", format="svg").etag
+    assert etag_matches(f'W/{first.etag}, "other"', first.etag)
+    assert not etag_matches('"other"', first.etag)
+
+
+def test_compact_formats_encode_the_same_modules():
+    matrix = _qr_matrix(QRSpec("123456")).get_matrix()
+    size = len(matrix)
+
+    png = Image.open(io.BytesIO(render_qr("123456", format="png").content)).convert("1")
+    png1bit = Image.open(io.BytesIO(render_qr("123456", format="png1bit").content)).convert("1")
+    assert png.size == png1bit.size == (size * 10, size * 10)
+    assert png.tobytes() == png1bit.tobytes()
+
+    svg = render_qr("123456", format="svg", scale=4).content.decode()
+    assert f'width="{size * 4}"' in svg
+    dark = [[False] * size for _ in range(size)]
+    x, y = 0, 0
+    for dx, dy, width in re.findall(r"m(-?\d+) (-?\d+)h(\d+)", svg):
+        x, y = x + int(dx), y + int(dy)
+        for column in range(x, x + int(width)):
+            dark[y][column] = True
+        x += int(width)
+    assert dark == matrix
+
+
+def test_default_format_follows_accept_and_scale():
+    browser = "image/avif,image/webp,image/apng,image/svg+xml,image/*,*/*;q=0.8"
+    assert negotiate_format(browser, 10) == "png1bit"
+    assert negotiate_format(browser, 40) == "svg"
+    assert negotiate_format("image/*", 40) == "png1bit"
+
+
+def _request(headers=()):
+    return Request({"type": "http", "method": "GET", "path": "/", "headers": [(k.encode(), v.encode()) for k, v in headers]})
+
+
+def test_qr_image_revalidates_with_304():
+    response = qr.get_qr_image("123456", _request(), format=None, scale=10, border=5)
+    assert response.status_code == 200
+    assert response.media_type == "image/png"
+    assert response.headers["vary"] == "Accept"
+    assert "max-age" in response.headers["cache-control"]
+
+    etag = response.headers["etag"]
+    cached = qr.get_qr_image("123456", _request([("if-none-match", etag)]), format=None, scale=10, border=5)
+    assert cached.status_code == 304
+    assert cached.body == b""
+    assert qr.get_qr_image("123456", _request([("if-none-match", etag)]), format="svg", scale=10, border=5).status_code == 200
+
+
+def test_qr_image_url_is_relative_to_the_api_base():
+    app = FastAPI()
+    app.include_router(qr.router, prefix="/api")
+    # what uvicorn sees behind the TLS-terminating proxy
+    request = Request({"type": "http", "scheme": "http", "server": ("api", 8000), "path": "/", "headers": [], "app": app})
+    assert qr.qr_image_url(request, "12 34", format="svg") == "/api/qr_image/12%2034?format=svg"
+    assert qr.qr_image_url_prefix(request) == "/api/qr_image/"
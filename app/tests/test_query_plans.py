@@ -0,0 +1,117 @@
+"""
+EXPLAIN regression test for the hot queries. Needs a disposable PostgreSQL database:
+
+    TEST_DATABASE_URL=postgresql+psycopg2://user@localhost/gym_test pytest app/tests/test_query_plans.py
+
+Each hot query must use the index added for it. Sequential scans are disabled for the
+session, so the planner would rather walk any btree (e.g. a primary key) than seq scan;
+checking only for Seq Scan nodes would not notice a dropped index. Indexes of
+access_logs partitions are reported under their parent index name.
+"""
+import json
+import os
+from datetime import datetime, timezone
+
+import pytest
+from sqlalchemy import create_engine, or_, select, text
+
+from app.migrations import run_migrations
+from app.models import AccessLog, CalcomWebhookEvent
+from app.services.access_log_query import AccessLogFilters, Cursor, access_log_statement
+from app.services.presence_sessions import active_session_for_user_statement
+from app.services.verification import VERIFICATION_STATEMENT
+
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+
+pytestmark = pytest.mark.skipif(not TEST_DATABASE_URL, reason="TEST_DATABASE_URL not set")
+
+NOW = datetime(2026, 1, 15, 12, 0, tzinfo=timezone.utc)
+
+# name -> (statement, params, indexes its plan must use)
+HOT_QUERIES = {
+    "verification": (
+        VERIFICATION_STATEMENT,
+        {"token": "123456", "at_ts": NOW},
+        {"ix_access_tokens_token", "ix_memberships_user_status_validity", "ix_access_tokens_user_last_scan_active"},
+    ),
+    "active_presence_session": (active_session_for_user_statement(1), {}, {"ix_presence_sessions_open_user"}),
+    "latest_user_log": (
+        select(AccessLog)
+        .where(AccessLog.user_id == 1)
+        .order_by(AccessLog.scanned_at.desc().nullslast(), AccessLog.created_at.desc())
+        .limit(1),
+        {},
+        {"ix_access_logs_user_scanned_at"},
+    ),
+    "recent_scan_logs": (
+        select(AccessLog).order_by(AccessLog.created_at.desc()).limit(50),
+        {},
+        {"ix_access_logs_created_at"},
+    ),
+    "scan_logs_keyset_page": (
+        access_log_statement(AccessLogFilters(status="deny"), after=Cursor(created_at=NOW, id=1000), limit=51),
+        {},
+        {"ix_access_logs_created_at"},
+    ),
+    "calcom_bookings": (
+        select(CalcomWebhookEvent)
+        .where(
+            CalcomWebhookEvent.event_type.in_(["BOOKING_CREATED", "BOOKING_CANCELLED"]),
+            CalcomWebhookEvent.status != "duplicate",
+            or_(CalcomWebhookEvent.admin_id == 1, CalcomWebhookEvent.admin_id.is_(None)),
+        )
+        .order_by(CalcomWebhookEvent.received_at.desc(), CalcomWebhookEvent.id.desc())
+        .limit(50),
+        {},
+        {"ix_calcom_webhook_events_type_status_received"},
+    ),
+}
+
+# partition index -> the partitioned index it belongs to, up to the top
+_PARENT_INDEX = text(
+    """
+    WITH RECURSIVE up(oid, depth) AS (
+        SELECT CAST(:name AS regclass)::oid, 0
+        UNION ALL
+        SELECT i.inhparent, up.depth + 1 FROM pg_inherits i JOIN up ON i.inhrelid = up.oid
+    )
+    SELECT c.relname FROM up JOIN pg_class c ON c.oid = up.oid ORDER BY up.depth DESC LIMIT 1
+    """
+)
+
+
+@pytest.fixture(scope="module")
+def engine():
+    engine = create_engine(TEST_DATABASE_URL)
+    run_migrations(engine)
+    yield engine
+    engine.dispose()
+
+
+def _scans(plan: dict) -> tuple[list[str], set[str]]:
+    """(relations read by Seq Scan, index names used) anywhere in the plan."""
+    seq_scans, indexes = [], set()
+    if plan.get("Node Type") == "Seq Scan":
+        seq_scans.append(plan.get("Relation Name"))
+    if plan.get("Index Name"):
+        indexes.add(plan["Index Name"])
+    for child in plan.get("Plans", []):
+        child_seq_scans, child_indexes = _scans(child)
+        seq_scans.extend(child_seq_scans)
+        indexes |= child_indexes
+    return seq_scans, indexes
+
+
+@pytest.mark.parametrize("name", sorted(HOT_QUERIES))
+def test_hot_query_uses_indexes(engine, name):
+    statement, params, expected = HOT_QUERIES[name]
+    compiled = statement.params(**params).compile(dialect=engine.dialect, compile_kwargs={"render_postcompile": True})
+    with engine.connect() as conn:
+        conn.exec_driver_sql("SET LOCAL enable_seqscan = off")
+        raw = conn.exec_driver_sql(f"EXPLAIN (FORMAT JSON) {compiled}", compiled.params).scalar()
+        plan = (raw if isinstance(raw, list) else json.loads(raw))[0]["Plan"]
+        seq_scans, used = _scans(plan)
+        used = {conn.execute(_PARENT_INDEX, {"name": index}).scalar() for index in used}
+        conn.rollback()
+    assert seq_scans == [], f"{name} plans a sequential scan:\n{json.dumps(plan, indent=2)}"
+    assert expected <= used, f"{name} does not use {sorted(expected - used)}:\n{json.dumps(plan, indent=2)}"
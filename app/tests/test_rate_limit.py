@@ -0,0 +1,202 @@
+import asyncio
+import math
+import os
+
+import pytest
+
+from app.services.rate_limit import (
+    MemoryBackend,
+    PostgresBackend,
+    RateLimiter,
+    RateLimitRule,
+    RedisBackend,
+    identity_key,
+    rate_limit_headers,
+)
+
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class FakeRedis:
+    """
+    Stand-in for redis.asyncio.Redis: register_script() runs RedisBackend's Lua
+    scripts with their Redis semantics (string values, PX expiry on the shared
+    clock, Lua's 14-digit tostring), so the backend is tested without a server.
+    """
+
+    def __init__(self, clock: FakeClock):
+        self.clock = clock
+        self.values: dict[str, str] = {}
+        self.expires_at: dict[str, float] = {}
+        self.closed = False
+
+    def register_script(self, script: str):
+        handlers = {RedisBackend._SCRIPT: self._gcra, RedisBackend._REFUND_SCRIPT: self._refund}
+
+        async def run(*, keys, args):
+            return handlers[script](keys[0], [float(arg) for arg in args])
+
+        return run
+
+    def get(self, key: str):
+        if key in self.expires_at and self.expires_at[key] <= self.clock.now:
+            del self.values[key], self.expires_at[key]
+        return self.values.get(key)
+
+    def pttl(self, key: str) -> int:
+        return -2 if self.get(key) is None else round((self.expires_at[key] - self.clock.now) * 1000)
+
+    def _set_px(self, key: str, value: float, px: int) -> None:
+        self.values[key] = format(value, ".14g")  # Lua tostring()
+        self.expires_at[key] = self.clock.now + px / 1000
+
+    def _gcra(self, key: str, args: list[float]):
+        now, interval, period = args
+        stored = self.get(key)
+        tat = float(stored) if stored is not None else now
+        tat = max(tat, now)
+        new_tat = tat + interval
+        if new_tat - now <= period:
+            self._set_px(key, new_tat, math.ceil((new_tat - now) * 1000))
+            return [1, format(new_tat, ".14g").encode()]
+        return [0, format(tat, ".14g").encode()]
+
+    def _refund(self, key: str, args: list[float]) -> int:
+        now, interval = args
+        stored = self.get(key)
+        if stored is None:
+            return 0
+        new_tat = float(stored) - interval
+        if new_tat <= now:
+            del self.values[key], self.expires_at[key]
+        else:
+            self._set_px(key, new_tat, math.ceil((new_tat - now) * 1000))
+        return 1
+
+    async def aclose(self) -> None:
+        self.closed = True
+
+
+def _limiter(backend, clock=None, **limits):
+    clock = clock or FakeClock()
+    rules = [RateLimitRule(scope, limit) for scope, limit in limits.items()]
+    return RateLimiter(backend, rules, clock=clock), clock
+
+
+async def _exercise_budget(backend, clock=None):
+    limiter, clock = _limiter(backend, clock, api_key=3)
+    decisions = [await limiter.check({"api_key": "k"}) for _ in range(4)]
+    assert [d.allowed for d in decisions] == [True, True, True, False]
+    assert [d.remaining for d in decisions[:3]] == [2, 1, 0]
+    assert decisions[3].retry_after == pytest.approx(20)
+
+    clock.now += 20  # one emission interval refills one request
+    assert (await limiter.check({"api_key": "k"})).allowed
+    assert not (await limiter.check({"api_key": "k"})).allowed
+    assert (await limiter.check({"api_key": "other"})).allowed
+
+
+async def _exercise_refund(backend, clock=None):
+    # the shared IP scope is listed first on purpose: denials by a later scope must not drain it
+    limiter, _ = _limiter(backend, clock, ip=5, api_key=2)
+
+    async def allowed(key: str) -> list[bool]:
+        return [(await limiter.check({"ip": "10.0.0.1", "api_key": key})).allowed for _ in range(3)]
+
+    assert await allowed("noisy") == [True, True, False]
+    for _ in range(4):
+        assert await allowed("noisy") == [False, False, False]
+    assert await allowed("quiet") == [True, True, False]  # another key behind the same NAT address
+    assert await allowed("third") == [True, False, False]  # the IP budget: 2 + 2 + 1
+    denied = await limiter.check({"ip": "10.0.0.1", "api_key": "fourth"})
+    assert not denied.allowed and denied.rule.scope == "ip"
+
+
+def test_gcra_allows_burst_then_refills_steadily():
+    asyncio.run(_exercise_budget(MemoryBackend()))
+
+
+def test_scopes_are_independent_and_tightest_wins():
+    limiter, _ = _limiter(MemoryBackend(), ip=100, scanner=2)
+    first = asyncio.run(limiter.check({"ip": "10.0.0.1", "scanner": "gate-1", "api_key": "ignored"}))
+    assert first.rule.scope == "scanner" and first.remaining == 1
+    asyncio.run(limiter.check({"ip": "10.0.0.1", "scanner": "gate-1"}))
+    denied = asyncio.run(limiter.check({"ip": "10.0.0.1", "scanner": "gate-1"}))
+    assert not denied.allowed and denied.rule.scope == "scanner"
+    assert asyncio.run(limiter.check({"ip": "10.0.0.1", "scanner": "gate-2"})).allowed
+
+    headers = rate_limit_headers(denied)
+    assert headers["RateLimit-Limit"] == "2"
+    assert headers["RateLimit-Remaining"] == "0"
+    assert headers["RateLimit-Policy"] == "2;w=60"
+    assert headers["Retry-After"] == "30"
+
+
+def test_throttled_key_does_not_drain_the_shared_ip_bucket():
+    asyncio.run(_exercise_refund(MemoryBackend()))
+
+
+def test_redis_backend_script_budget_and_expiry():
+    clock = FakeClock()
+    client = FakeRedis(clock)
+    backend = RedisBackend(client)
+    asyncio.run(_exercise_budget(backend, clock))
+    asyncio.run(_exercise_refund(backend, clock))
+
+    limiter, _ = _limiter(backend, clock, scanner=2)
+    key = "ratelimit:" + identity_key("scanner", "gate-1")
+    assert asyncio.run(limiter.check({"scanner": "gate-1"})).remaining == 1
+    assert client.pttl(key) == 30_000  # expires when the bucket is full again
+    asyncio.run(limiter.check({"scanner": "gate-1"}))
+    denied = asyncio.run(limiter.check({"scanner": "gate-1"}))
+    assert not denied.allowed and denied.retry_after == pytest.approx(30)
+    assert client.pttl(key) == 60_000  # a denial leaves the bucket as it was
+
+    clock.now += 60
+    assert client.pttl(key) == -2  # expired: no state left for an idle scanner
+    assert asyncio.run(limiter.check({"scanner": "gate-1"})).remaining == 1
+
+    asyncio.run(backend.close())
+    assert client.closed
+
+
+def test_memory_backend_sweeps_expired_buckets():
+    backend = MemoryBackend(sweep_every=2)
+    limiter, clock = _limiter(backend, ip=10)
+    asyncio.run(limiter.check({"ip": "a"}))
+    clock.now += 3600
+    asyncio.run(limiter.check({"ip": "b"}))
+    assert len(backend) == 1
+
+
+@pytest.mark.skipif(not TEST_DATABASE_URL, reason="TEST_DATABASE_URL not set")
+def test_postgres_backend_matches_memory_backend():
+    from sqlalchemy import create_engine, text
+    from sqlalchemy.ext.asyncio import create_async_engine
+
+    from app.database import _build_async_database_url
+    from app.migrations import run_migrations
+
+    sync_engine = create_engine(TEST_DATABASE_URL)
+    run_migrations(sync_engine)
+    with sync_engine.begin() as conn:
+        conn.execute(text("TRUNCATE rate_limit_buckets"))
+    sync_engine.dispose()
+
+    async def exercise():
+        engine = create_async_engine(_build_async_database_url(TEST_DATABASE_URL))
+        try:
+            await _exercise_budget(PostgresBackend(engine))
+            await _exercise_refund(PostgresBackend(engine))
+        finally:
+            await engine.dispose()
+
+    asyncio.run(exercise())
@@ -0,0 +1,99 @@
+import asyncio
+import io
+import json
+
+from fastapi import FastAPI, HTTPException
+
+from app.request_log import REDACTED, UNMATCHED_ROUTE, RequestLogEmitter, RequestLogMiddleware
+
+
+def _app():
+    app = FastAPI()
+
+    @app.get("/api/items/{item_id}")
+    async def item(item_id: int):
+        return {"id": item_id}
+
+    @app.get("/health")
+    async def health():
+        return {"status": "healthy"}
+
+    @app.get("/api/broken")
+    async def broken():
+        raise HTTPException(status_code=503, detail="down")
+
+    return app
+
+
+def _call(app, path: str, headers: dict[str, str] | None = None) -> int:
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "root_path": "",
+        "query_string": b"token=secret",
+        "headers": [(k.lower().encode(), v.encode()) for k, v in (headers or {}).items()],
+        "client": ("10.0.0.7", 5000),
+        "server": ("testserver", 80),
+    }
+    statuses = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            statuses.append(message["status"])
+
+    asyncio.run(app(scope, receive, send))
+    return statuses[0]
+
+
+def _records(emitter: RequestLogEmitter, stream: io.StringIO) -> list[dict]:
+    emitter.stop()
+    return [json.loads(line) for line in stream.getvalue().splitlines()]
+
+
+def test_records_route_template_and_redacts_headers():
+    stream = io.StringIO()
+    emitter = RequestLogEmitter(stream, flush_interval_ms=10)
+    emitter.start()
+    app = RequestLogMiddleware(_app(), emitter=lambda: emitter, headers=("user-agent", "x-api-key"))
+
+    headers = {"User-Agent": "scanner/1.0", "X-API-KEY": "top-secret", "Cookie": "session=abc"}
+    assert _call(app, "/api/items/987654", headers) == 200
+    assert _call(app, "/health") == 200  # quiet path, sampled at 0 by default
+    assert _call(app, "/nope") == 404
+
+    first, second = _records(emitter, stream)
+    assert first["route"] == "/api/items/{item_id}" and first["method"] == "GET" and first["status"] == 200
+    assert first["headers"] == {"user-agent": "scanner/1.0", "x-api-key": REDACTED}
+    assert first["client"] == "10.0.0.7" and first["duration_ms"] >= 0 and first["ts"].endswith("+00:00")
+    assert "987654" not in json.dumps(first) and "secret" not in json.dumps(first)
+    assert second["route"] == UNMATCHED_ROUTE and second["status"] == 404 and "headers" not in second
+
+
+def test_sampling_keeps_errors_and_drops_when_queue_is_full():
+    stream = io.StringIO()
+    emitter = RequestLogEmitter(stream, flush_interval_ms=10)
+    emitter.start()
+    app = RequestLogMiddleware(_app(), emitter=lambda: emitter, sample_rate=0.5, rng=iter([0.9, 0.1]).__next__)
+
+    _call(app, "/api/items/1")  # 0.9 >= 0.5: sampled out
+    _call(app, "/api/items/2")  # kept
+    _call(app, "/api/broken")  # 5xx: always kept, no random draw
+
+    records = _records(emitter, stream)
+    assert [(r["route"], r["status"], r.get("sample_rate")) for r in records] == [
+        ("/api/items/{item_id}", 200, 0.5),
+        ("/api/broken", 503, None),
+    ]
+
+    full = RequestLogEmitter(io.StringIO(), queue_size=1)  # not started: nothing drains
+    full.emit({"ts": 0})
+    full.emit({"ts": 0})
+    assert full.stats()["queue_depth"] == 1 and full.stats()["dropped"] == 1
@@ -0,0 +1,112 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException, Response
+from starlette.requests import Request
+
+from app.routes import verify
+from app.services import api_keys, rate_limit
+from app.services.api_keys import APIKeyCache, APIKeyRecord, LastUsedTracker, _hash_key, scanner_key_metadata
+from app.services.rate_limit import MemoryBackend, RateLimiter, RateLimitRule
+from app.services.scanner_metrics import ScannerIdentity, ScannerMetrics
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1_000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def _request(headers):
+    return Request(
+        {
+            "type": "http",
+            "method": "POST",
+            "path": "/api/verify",
+            "client": ("10.0.0.5", 5000),
+            "headers": [(k.lower().encode(), v.encode()) for k, v in headers.items()],
+        }
+    )
+
+
+@pytest.fixture
+def scanner_key(monkeypatch):
+    monkeypatch.setattr(api_keys, "api_key_cache", APIKeyCache(ttl_seconds=60, max_entries=10))
+    monkeypatch.setattr(api_keys, "last_used_tracker", LastUsedTracker())
+    monkeypatch.setattr(verify, "scanner_metrics", ScannerMetrics())
+    monkeypatch.setattr(
+        rate_limit,
+        "_verify_limiter",
+        RateLimiter(MemoryBackend(), [RateLimitRule("api_key", 100), RateLimitRule("scanner", 100)]),
+    )
+    monkeypatch.setenv("API_VERIFY_KEY", "shared-secret")
+    raw = "ak_scanner_gate_1"
+    record = APIKeyRecord(
+        id=7,
+        name="Turniket vstup",
+        prefix=raw[:12],
+        created_by_user_id=None,
+        expires_at=None,
+        metadata=scanner_key_metadata("gate-1", 2),
+    )
+    api_keys.api_key_cache.put(_hash_key(raw), record)
+    return raw
+
+
+def test_scanner_key_has_identity_and_own_budget(scanner_key):
+    async def call(headers):
+        response = Response()
+        return await verify._require_api_key(_request(headers), response, db=None), response
+
+    scanner, response = asyncio.run(call({"X-TURNSTILE-API-KEY": scanner_key, "X-Scanner-Id": "spoofed"}))
+    assert scanner == ScannerIdentity(api_key_id=7, api_key_name="Turniket vstup", scanner_id="gate-1")
+    assert response.headers["RateLimit-Limit"] == "2"
+
+    asyncio.run(call({"X-API-KEY": scanner_key}))
+    with pytest.raises(HTTPException) as denied:
+        asyncio.run(call({"X-API-KEY": scanner_key}))
+    assert denied.value.status_code == 429
+
+    # the shared env key has its own bucket and takes the scanner id from the header
+    shared, _ = asyncio.run(call({"X-API-KEY": "shared-secret", "X-Scanner-Id": "kiosk"}))
+    assert shared.api_key_id is None and shared.scanner_id == "kiosk"
+
+    with pytest.raises(HTTPException) as missing:
+        asyncio.run(call({}))
+    assert missing.value.status_code == 401
+
+    devices = verify.scanner_metrics.snapshot()
+    assert devices[0]["device"] == "key:7/gate-1"
+    assert devices[0]["rate_limited"] == 1
+    assert devices[0]["denied_reasons"] == {"rate_limit_api_key": 1}
+
+
+def test_metrics_track_outcomes_errors_and_window():
+    clock = FakeClock()
+    metrics = ScannerMetrics(window_seconds=60, clock=clock)
+    gate = ScannerIdentity(api_key_id=1, api_key_name="gate", scanner_id="in-1")
+    metrics.record(gate, "allowed", reason="ok", latency_ms=4)
+    metrics.record(gate, "denied", reason="cooldown", latency_ms=2)
+    clock.now += 1
+    metrics.record(gate, "error", reason="http_500", latency_ms=30)
+
+    row = metrics.snapshot()[0]
+    assert (row["requests"], row["allowed"], row["denied"], row["error"]) == (3, 1, 1, 1)
+    assert row["denied_reasons"] == {"cooldown": 1, "http_500": 1}
+    assert row["per_minute"] == 3
+    assert row["latency_ms_max"] == 30
+    clock.now += 120
+    assert metrics.snapshot()[0]["per_minute"] == 0
+
+    tiny = ScannerMetrics(max_devices=1)
+    tiny.record(gate, "allowed")
+    tiny.record(ScannerIdentity(2, "other", None), "allowed")
+    assert len(tiny.snapshot()) == 1 and tiny.dropped == 1
+
+
+def test_scanner_keys_are_not_admin_keys():
+    record = APIKeyRecord(1, "gate", "ak_x", None, None, scanner_key_metadata("gate-1", None))
+    assert record.is_scanner and record.rate_limit_per_minute is None
+    assert not APIKeyRecord(2, "crm", "ak_y", None, None).is_scanner
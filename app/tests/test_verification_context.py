@@ -0,0 +1,167 @@
+import asyncio
+import os
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import create_engine, delete
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.orm import Session
+
+from app.services.membership import MembershipService, serialize_membership_for_response
+from app.services.verification import (
+    MembershipSnapshot,
+    PackageSnapshot,
+    VerificationContext,
+    build_membership_usage_statement,
+    persist_membership_usage,
+    record_granted_scan,
+    VERIFICATION_STATEMENT,
+)
+
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+
+
+def _membership(**overrides) -> MembershipSnapshot:
+    now = datetime.now(timezone.utc)
+    values = dict(
+        id=7,
+        package_id=3,
+        package_name_cache="30denní permanentka",
+        membership_type="membership",
+        status="active",
+        valid_from=now - timedelta(days=1),
+        valid_to=now + timedelta(days=29),
+        daily_limit_enabled=True,
+        daily_limit=1,
+        daily_usage_count=0,
+        last_usage_at=None,
+        sessions_total=None,
+        sessions_used=None,
+        auto_renew=False,
+        notes=None,
+        metadata_json=None,
+        package_snapshot_json={"slug": "monthly_standard"},
+        package=PackageSnapshot(id=3, name="30denní permanentka", slug="monthly_standard", package_type="membership"),
+    )
+    values.update(overrides)
+    return MembershipSnapshot(**values)
+
+
+def _context(**overrides) -> VerificationContext:
+    values = dict(
+        token_id=1,
+        token_is_active=True,
+        user_id=10,
+        user_name="Jan Novák",
+        user_email="jan@example.com",
+        user_credits=0,
+        last_scan_at=None,
+        membership=None,
+    )
+    values.update(overrides)
+    return VerificationContext(**values)
+
+
+def test_verification_statement_is_single_select():
+    sql = str(VERIFICATION_STATEMENT.compile(dialect=postgresql.dialect()))
+    assert sql.count("SELECT") == 4  # outer select + cooldown, membership and next-membership subqueries
+    assert "LEFT OUTER JOIN users" in sql
+    assert "LEFT OUTER JOIN memberships" in sql
+    assert "LEFT OUTER JOIN membership_packages" in sql
+
+
+def test_cooldown_seconds_left():
+    now = datetime.now(timezone.utc)
+    assert _context().cooldown_seconds_left(now, 60) is None
+    assert _context(last_scan_at=now - timedelta(seconds=15)).cooldown_seconds_left(now, 60) == 45
+    assert _context(last_scan_at=now - timedelta(seconds=61)).cooldown_seconds_left(now, 60) is None
+    naive = (now - timedelta(seconds=30)).replace(tzinfo=None)
+    assert _context(last_scan_at=naive).cooldown_seconds_left(now, 60) == 30
+
+
+def test_snapshot_works_with_membership_service():
+    service = MembershipService(db=None)
+    membership = _membership()
+    now = datetime.now(timezone.utc)
+    assert service.can_consume_entry(membership, at_ts=now).allowed
+
+    service.record_entry_usage(membership, at_ts=now)
+    assert membership.daily_usage_count == 1
+    verdict = service.can_consume_entry(membership, at_ts=now)
+    assert not verdict.allowed
+    assert verdict.reason == "daily_limit"
+
+    payload = serialize_membership_for_response(membership, reason=verdict.reason, daily_limit_hit=True)
+    assert payload["package_slug"] == "monthly_standard"
+    assert payload["message"] == "Denní limit vstupů byl vyčerpán."
+
+
+def test_membership_usage_statement_only_touches_tracked_counters():
+    now = datetime.now(timezone.utc)
+    assert build_membership_usage_statement(_membership(daily_limit_enabled=False, daily_limit=None), now) is None
+    statement = build_membership_usage_statement(_membership(sessions_total=10, sessions_used=2), now)
+    sql = str(statement.compile(dialect=postgresql.dialect()))
+    # relative to the row, never the snapshot's value; guarded by the limits
+    assert "sessions_used=(coalesce(memberships.sessions_used" in sql
+    assert "THEN coalesce(memberships.daily_usage_count" in sql
+    assert "< memberships.sessions_total" in sql and "< memberships.daily_limit" in sql
+    assert "RETURNING" in sql
+
+
+@pytest.mark.skipif(not TEST_DATABASE_URL, reason="TEST_DATABASE_URL not set")
+def test_stale_cached_counters_cannot_overwrite_or_overrun_limits():
+    from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+
+    from app.database import _build_async_database_url
+    from app.migrations import run_migrations
+    from app.models import AccessToken, Membership, User
+
+    engine = create_engine(TEST_DATABASE_URL)
+    run_migrations(engine)
+    user_id, now = 940_001, datetime.now(timezone.utc)
+    with Session(engine) as db:
+        db.execute(delete(AccessToken).where(AccessToken.user_id == user_id))
+        db.execute(delete(Membership).where(Membership.user_id == user_id))
+        db.execute(delete(User).where(User.id == user_id))
+        db.add(User(id=user_id, email="stale@example.cz", name="S", password_hash="!"))
+        db.flush()
+        db.add_all([
+            AccessToken(id=user_id, token="stale-cache-token", user_id=user_id, is_active=True),
+            Membership(
+                id=user_id, user_id=user_id, membership_type="membership", status="active",
+                valid_from=now - timedelta(days=1), valid_to=now + timedelta(days=1),
+                daily_limit_enabled=True, daily_limit=1, daily_usage_count=0, sessions_total=5, sessions_used=3,
+            ),
+        ])
+        db.commit()
+
+    async def scan(at, *, commit):
+        # every call starts from the same (cached, now stale) snapshot
+        membership = _membership(id=user_id, daily_limit=1, daily_usage_count=0, sessions_total=5, sessions_used=3)
+        ctx = _context(token_id=user_id, user_id=user_id, membership=membership)
+        async_engine = create_async_engine(_build_async_database_url(TEST_DATABASE_URL))
+        try:
+            async with AsyncSession(async_engine) as db:
+                granted = await record_granted_scan(db, ctx, at, cooldown_seconds=60)
+                counted = await persist_membership_usage(db, membership, at)
+                await (db.commit() if commit and granted and counted else db.rollback())
+                return granted, counted, membership.sessions_used
+        finally:
+            await async_engine.dispose()
+
+    try:
+        assert asyncio.run(scan(now, commit=True)) == (True, True, 4)
+        # second worker: cooldown and daily limit both caught by the UPDATEs
+        assert asyncio.run(scan(now, commit=True)) == (False, False, 3)
+        # cooldown over, the daily limit still stops it
+        assert asyncio.run(scan(now + timedelta(minutes=5), commit=False))[:2] == (True, False)
+        with Session(engine) as db:
+            row = db.get(Membership, user_id)
+            assert (row.daily_usage_count, row.sessions_used) == (1, 4)
+    finally:
+        with Session(engine) as db:
+            db.execute(delete(AccessToken).where(AccessToken.user_id == user_id))
+            db.execute(delete(Membership).where(Membership.user_id == user_id))
+            db.execute(delete(User).where(User.id == user_id))
+            db.commit()
+        engine.dispose()
@@ -0,0 +1,125 @@
+import os
+from datetime import date, datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
+
+import pytest
+from sqlalchemy import create_engine, delete, select, text
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import StaticPool
+
+from app.database import Base
+from app.migrations import run_migrations
+from app.models import PresenceSession, User, VisitStatsDaily, VisitStatsHourly, VisitStatsUserDaily
+from app.services.visit_rollups import daily_stats, peak_hours, rebuild_rollups, roll_up_closed_sessions, user_stats
+
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+PRAGUE = ZoneInfo("Europe/Prague")
+
+
+def test_readers_fill_gaps_and_find_the_peak_hour():
+    engine = create_engine("sqlite://", poolclass=StaticPool)
+    Base.metadata.create_all(engine)
+    with Session(engine) as db:
+        db.add_all([
+            VisitStatsDaily(day=date(2026, 3, 2), visits=3, members=2, total_seconds=9000),
+            VisitStatsUserDaily(user_id=1, day=date(2026, 3, 2), visits=2, total_seconds=5400),
+            # 17:00 and 18:00 Prague time (CET)
+            VisitStatsHourly(hour_start=datetime(2026, 3, 2, 16, 0, tzinfo=timezone.utc), arrivals=2, visit_seconds=3600),
+            VisitStatsHourly(hour_start=datetime(2026, 3, 2, 17, 0, tzinfo=timezone.utc), arrivals=1, visit_seconds=7200),
+            VisitStatsHourly(hour_start=datetime(2026, 2, 1, 17, 0, tzinfo=timezone.utc), arrivals=9, visit_seconds=99999),
+        ])
+        db.commit()
+
+        stats = daily_stats(db, date(2026, 3, 1), date(2026, 3, 3))
+        assert [day["visits"] for day in stats["days"]] == [0, 3, 0]
+        assert stats["visits"] == 3 and stats["avg_seconds"] == 3000
+
+        peaks = peak_hours(db, days=2, today=date(2026, 3, 3), tz=PRAGUE)
+        assert peaks["peak_hour"] == 18
+        assert peaks["hours"][17] == {"hour": 17, "avg_arrivals": 1.0, "avg_occupancy": 0.5}
+
+        member = user_stats(db, 1, date(2026, 3, 1), date(2026, 3, 31))
+        assert member["visits"] == 2 and member["days_visited"] == 1 and member["avg_seconds"] == 2700
+
+
+@pytest.mark.skipif(not TEST_DATABASE_URL, reason="TEST_DATABASE_URL not set")
+def test_closed_sessions_are_counted_once_across_batches(monkeypatch):
+    monkeypatch.setenv("GYM_TIMEZONE", "Europe/Prague")
+    engine = create_engine(TEST_DATABASE_URL)
+    run_migrations(engine)
+    start = datetime(2026, 3, 2, 16, 30, tzinfo=timezone.utc)  # 17:30 Prague
+    user_ids = [930_001, 930_002]
+    with Session(engine) as db:
+        db.execute(delete(PresenceSession).where(PresenceSession.user_id.in_(user_ids)))
+        db.execute(delete(User).where(User.id.in_(user_ids)))
+        db.add_all(User(id=uid, email=f"rollup{uid}@example.cz", name="R", password_hash="!") for uid in user_ids)
+        db.flush()
+        db.add_all([
+            # 90 minutes: 30 in the 16:00 UTC hour, 60 in the 17:00 UTC hour
+            PresenceSession(user_id=930_001, started_at=start, ended_at=start + timedelta(minutes=90), status="closed"),
+            PresenceSession(user_id=930_001, started_at=start + timedelta(hours=2), ended_at=start + timedelta(hours=3), status="timeout"),
+            PresenceSession(user_id=930_002, started_at=start, ended_at=start + timedelta(minutes=30), status="closed"),
+            PresenceSession(user_id=930_002, started_at=start, ended_at=start, status="anomaly"),  # zero length
+            PresenceSession(user_id=930_002, started_at=start + timedelta(hours=4), status="active"),
+        ])
+        db.commit()
+        # only this test's sessions are pending, so the counts below are exact
+        db.execute(
+            text("UPDATE presence_sessions SET rolled_up_at = now() WHERE rolled_up_at IS NULL AND NOT (user_id = ANY(:ids))"),
+            {"ids": user_ids},
+        )
+        db.execute(delete(VisitStatsDaily).where(VisitStatsDaily.day == date(2026, 3, 2)))
+        db.execute(
+            delete(VisitStatsHourly).where(
+                VisitStatsHourly.hour_start >= datetime(2026, 3, 2, tzinfo=timezone.utc),
+                VisitStatsHourly.hour_start < datetime(2026, 3, 3, tzinfo=timezone.utc),
+            )
+        )
+        db.commit()
+
+    def snapshot():
+        with Session(engine) as db:
+            daily = db.get(VisitStatsDaily, date(2026, 3, 2))
+            hourly = {
+                row.hour_start.astimezone(timezone.utc).hour: (row.arrivals, row.visit_seconds)
+                for row in db.scalars(
+                    select(VisitStatsHourly).where(
+                        VisitStatsHourly.hour_start >= datetime(2026, 3, 2, tzinfo=timezone.utc),
+                        VisitStatsHourly.hour_start < datetime(2026, 3, 3, tzinfo=timezone.utc),
+                    )
+                )
+            }
+            users = {
+                row.user_id: (row.visits, row.total_seconds)
+                for row in db.scalars(select(VisitStatsUserDaily).where(VisitStatsUserDaily.user_id.in_(user_ids)))
+            }
+            return (daily.visits, daily.members, daily.total_seconds), hourly, users
+
+    try:
+        totals = roll_up_closed_sessions(engine, batch_size=1)
+        assert totals == {"sessions": 4, "visits": 3, "batches": 4}
+        daily, hourly, users = snapshot()
+        assert daily == (3, 2, 5400 + 3600 + 1800)
+        assert hourly == {16: (2, 1800 + 1800), 17: (0, 3600), 18: (1, 1800), 19: (0, 1800)}
+        assert users == {930_001: (2, 9000), 930_002: (1, 1800)}
+        assert roll_up_closed_sessions(engine)["sessions"] == 0
+
+        with Session(engine) as db:  # the open session closes later
+            db.execute(
+                text("UPDATE presence_sessions SET ended_at = started_at + interval '1 hour' WHERE user_id = 930002 AND ended_at IS NULL")
+            )
+            db.commit()
+        assert roll_up_closed_sessions(engine)["visits"] == 1
+        daily, _, users = snapshot()
+        assert daily == (4, 2, 14400) and users[930_002] == (2, 5400)
+
+        before = snapshot()
+        rebuild_rollups(engine, batch_size=2)
+        assert snapshot() == before
+    finally:
+        with Session(engine) as db:
+            db.execute(delete(VisitStatsUserDaily).where(VisitStatsUserDaily.user_id.in_(user_ids)))
+            db.execute(delete(PresenceSession).where(PresenceSession.user_id.in_(user_ids)))
+            db.execute(delete(User).where(User.id.in_(user_ids)))
+            db.commit()
+        engine.dispose()
@@ -0,0 +1,152 @@
+"""
+Benchmark: /api/admin/tokens and /api/admin/scan-logs – per-row lazy loads vs. projected queries.
+
+For 100 and 1,000 rows, reports SQL round trips, JSON response size and p50/p99 latency
+of building the response body (query + serialization, no HTTP). "legacy" mirrors the
+handlers before the rewrite: ORM rows, a lazy `.user` load per row and, for tokens,
+a PNG data URL rendered per row.
+
+    DATABASE_URL=postgresql+psycopg2://... JWT_SECRET_KEY=x \\
+        python -m benchmarks.admin_listings --seed 1000 --iterations 20
+"""
+from __future__ import annotations
+
+import argparse
+import base64
+import json
+import statistics
+import time
+
+from sqlalchemy import event
+
+from app.database import SessionLocal, engine
+from app.models import AccessLog, AccessToken, User
+from app.routes.admin import _serialize_scan_log, _serialize_token, token_listing_statement
+from app.services.access_log_query import AccessLogFilters, fetch_page
+from app.services.qr_render import RENDERERS, QRSpec
+from benchmarks.verify_roundtrips import StatementCounter, percentile
+
+QR_PREFIX = "http://localhost:8000/api/qr_image/"
+
+
+def legacy_qr_data_url(token_str: str) -> str:
+    """Uncached render, as every request did before the QR cache."""
+    render, media_type, _ = RENDERERS["png"]
+    return f"data:{media_type};base64,{base64.b64encode(render(QRSpec(token_str, scale=6, border=2))).decode()}"
+
+
+def legacy_tokens(db, rows: int) -> list[dict]:
+    tokens = db.query(AccessToken).join(User).order_by(AccessToken.created_at.desc()).limit(rows).all()
+    response = []
+    for token in tokens:
+        user = token.user
+        response.append({
+            "id": token.id,
+            "token": token.token,
+            "user_id": user.id if user else None,
+            "user_name": user.name if user else None,
+            "user_email": user.email if user else None,
+            "expires_at": token.expires_at.isoformat() if token.expires_at else None,
+            "created_at": token.created_at.isoformat() if token.created_at else None,
+            "used_at": token.used_at.isoformat() if token.used_at else None,
+            "is_active": token.is_active,
+            "scan_count": token.scan_count or 0,
+            "qr_code_url": legacy_qr_data_url(token.token),
+        })
+    return response
+
+
+def projected_tokens(db, rows: int) -> list[dict]:
+    return [_serialize_token(row, QR_PREFIX) for row in db.execute(token_listing_statement(rows))]
+
+
+def legacy_scan_logs(db, rows: int) -> list[dict]:
+    logs = db.query(AccessLog).order_by(AccessLog.created_at.desc()).limit(rows).all()
+    return [
+        {
+            "id": log.id,
+            "user_id": log.user_id,
+            "user_name": log.user.name if log.user else None,
+            "reason": log.reason,
+            "status": log.status,
+            "allowed": log.allowed,
+            "created_at": log.created_at.isoformat() if log.created_at else None,
+            "metadata": log.metadata_json,
+        }
+        for log in logs
+    ]
+
+
+def keyset_scan_logs(db, rows: int) -> list[dict]:
+    page, _ = fetch_page(db, AccessLogFilters(), limit=rows)
+    return [_serialize_scan_log(row) for row in page]
+
+
+def seed(count: int) -> None:
+    from benchmarks.verify_concurrency import seed_tokens
+
+    seed_tokens(count)
+    db = SessionLocal()
+    try:
+        have = db.query(AccessLog).filter(AccessLog.token_string.like("bench-%")).count()
+        users = [
+            user_id
+            for (user_id,) in db.query(User.id).filter(User.email.like("bench-%")).order_by(User.id).limit(count)
+        ]
+        for i in range(have, count):
+            user_id = users[i % len(users)]
+            db.add(AccessLog(user_id=user_id, token_string=f"bench-{i:06d}", status="allow", reason="ok", allowed=True, direction="in"))
+        db.commit()
+    finally:
+        db.close()
+
+
+def measure(build, rows: int, iterations: int) -> tuple[list[float], float, int]:
+    counter = StatementCounter()
+    timings: list[float] = []
+    size = 0
+    event.listen(engine, "before_cursor_execute", counter)
+    try:
+        for _ in range(iterations):
+            db = SessionLocal()
+            try:
+                start = time.perf_counter()
+                body = json.dumps(build(db, rows), default=str)
+                timings.append((time.perf_counter() - start) * 1000)
+                size = len(body.encode())
+            finally:
+                db.close()
+    finally:
+        event.remove(engine, "before_cursor_execute", counter)
+    return timings, counter.count / iterations, size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, action="append", help="listing sizes (default: 100 and 1000)")
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0, help="create this many benchmark users, tokens and scan logs first")
+    args = parser.parse_args()
+
+    if args.seed:
+        seed(args.seed)
+
+    cases = (
+        ("tokens", "legacy", legacy_tokens),
+        ("tokens", "projected", projected_tokens),
+        ("scan-logs", "legacy", legacy_scan_logs),
+        ("scan-logs", "keyset", keyset_scan_logs),
+    )
+    print(f"{'listing':<10} {'strategy':<10} {'rows':>5} {'round trips':>12} {'bytes':>10} {'p50 ms':>8} {'p99 ms':>8} {'mean ms':>8}")
+    for rows in args.rows or [100, 1000]:
+        for listing, name, build in cases:
+            measure(build, rows, 2)  # warm up pool, mappers and plan caches
+            timings, round_trips, size = measure(build, rows, args.iterations)
+            print(
+                f"{listing:<10} {name:<10} {rows:>5} {round_trips:>12.1f} {size:>10} "
+                f"{percentile(timings, 50):>8.2f} {percentile(timings, 99):>8.2f} {statistics.mean(timings):>8.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+"""
+Offline evaluation of the occupancy forecast (app/services/occupancy_forecast.py)
+on synthetic presence sessions. No database or server needed; the same --seed
+always produces the same sessions and the same scores.
+
+The generator draws arrivals per 5 minutes from a Poisson process whose rate
+follows a weekday shape (morning, lunch and evening peaks on workdays, a late
+morning peak at weekends) scaled by a slow weekly trend, a random day factor
+and occasional closed days; visit lengths are log-normal and end at closing
+time. Days run in local time (--tz), so DST changes are included.
+
+Evaluation is online, the way the server uses the profiles: after --warmup-weeks
+every day is first predicted from the current profile of its weekday, scored
+against what actually happened, then folded in. Compared against two baselines:
+the same weekday one week earlier, and the plain mean of all earlier same
+weekdays (alpha=0). Scores cover opening hours only:
+
+* MAE / RMSE   expected vs. actual head count per 15-minute slot,
+* bias         mean (forecast - actual),
+* peak err     minutes between the forecast and the actual busiest slot.
+
+    python -m benchmarks.forecast_eval
+    python -m benchmarks.forecast_eval --weeks 26 --alpha 0.1 0.25 0.5 --seed 7
+"""
+from __future__ import annotations
+
+import argparse
+import math
+import random
+import statistics
+from datetime import date, datetime, time, timedelta, timezone
+from zoneinfo import ZoneInfo
+
+from app.services.occupancy_forecast import (
+    SLOT_MINUTES,
+    OccupancyProfiles,
+    Visit,
+    daily_occupancy,
+)
+
+OPEN_HOUR, CLOSE_HOUR = 6, 22
+WEEKDAY_SCALE = (1.15, 1.05, 1.1, 1.0, 0.85, 0.7, 0.55)
+BUCKET_MINUTES = 5
+
+
+def _bump(hour: float, center: float, width: float, height: float) -> float:
+    return height * math.exp(-((hour - center) ** 2) / (2 * width**2))
+
+
+def arrival_rate(weekday: int, hour: float) -> float:
+    """Expected arrivals per hour at local `hour` (float) on `weekday`."""
+    if not OPEN_HOUR <= hour < CLOSE_HOUR - 0.5:
+        return 0.0
+    if weekday < 5:
+        rate = 2 + _bump(hour, 7, 0.8, 10) + _bump(hour, 12.3, 0.7, 5) + _bump(hour, 18, 1.3, 18)
+    else:
+        rate = 2 + _bump(hour, 10.5, 1.6, 14) + _bump(hour, 16, 1.5, 6)
+    return rate * WEEKDAY_SCALE[weekday]
+
+
+def _poisson(rng: random.Random, lam: float) -> int:
+    limit, k, p = math.exp(-lam), 0, rng.random()
+    while p > limit:
+        k += 1
+        p *= rng.random()
+    return k
+
+
+def synthetic_visits(
+    first_day: date, days: int, tz: ZoneInfo, *, seed: int, trend_per_week: float = 0.01, closed_day_rate: float = 0.02
+) -> list[Visit]:
+    rng = random.Random(seed)
+    visits: list[Visit] = []
+    for offset in range(days):
+        day = first_day + timedelta(days=offset)
+        if rng.random() < closed_day_rate:
+            continue  # holiday / maintenance: nobody comes
+        factor = (1 + trend_per_week) ** (offset / 7) * rng.lognormvariate(0, 0.15)
+        closing = datetime.combine(day, time(CLOSE_HOUR), tzinfo=tz).astimezone(timezone.utc)
+        for bucket in range(24 * 60 // BUCKET_MINUTES):
+            hour = bucket * BUCKET_MINUTES / 60
+            lam = arrival_rate(day.weekday(), hour) * factor * BUCKET_MINUTES / 60
+            for _ in range(_poisson(rng, lam)):
+                minute = bucket * BUCKET_MINUTES + rng.random() * BUCKET_MINUTES
+                local = datetime.combine(day, time(int(minute // 60), int(minute % 60)), tzinfo=tz)
+                start = local.astimezone(timezone.utc)
+                end = min(start + timedelta(minutes=rng.lognormvariate(math.log(70), 0.35)), closing)
+                if end > start:
+                    visits.append((start, end))
+    return visits
+
+
+def _open_slots() -> range:
+    return range(OPEN_HOUR * 60 // SLOT_MINUTES, CLOSE_HOUR * 60 // SLOT_MINUTES)
+
+
+class Score:
+    def __init__(self):
+        self.errors: list[float] = []
+        self.peak_errors: list[int] = []
+
+    def add(self, forecast, actual) -> None:
+        slots = _open_slots()
+        self.errors.extend(forecast[slot] - actual[slot] for slot in slots)
+        if max(actual[slot] for slot in slots) > 0:
+            predicted_peak = max(slots, key=lambda slot: forecast[slot])
+            actual_peak = max(slots, key=lambda slot: actual[slot])
+            self.peak_errors.append(abs(predicted_peak - actual_peak) * SLOT_MINUTES)
+
+    def row(self) -> dict[str, float]:
+        return {
+            "MAE": statistics.fmean(abs(e) for e in self.errors),
+            "RMSE": math.sqrt(statistics.fmean(e * e for e in self.errors)),
+            "bias": statistics.fmean(self.errors),
+            "peak err min": statistics.median(self.peak_errors) if self.peak_errors else float("nan"),
+        }
+
+
+def evaluate(*, weeks: int, warmup_weeks: int, alphas: list[float], seed: int, tz: ZoneInfo, first_day: date) -> dict[str, dict]:
+    days = weeks * 7
+    visits = synthetic_visits(first_day, days, tz, seed=seed)
+    actual = daily_occupancy(visits, first_day, first_day + timedelta(days=days - 1), tz)
+
+    models = {f"profile alpha={alpha:g}": OccupancyProfiles(alpha=alpha) for alpha in alphas}
+    models["mean of weeks (alpha=0)"] = OccupancyProfiles(alpha=0.0)
+    scores = {name: Score() for name in [*models, "same day last week"]}
+    for day in sorted(actual):
+        scored = day >= first_day + timedelta(weeks=warmup_weeks)
+        for name, model in models.items():
+            if scored:
+                scores[name].add(model.profile(day.weekday()), actual[day])
+            model.fold_day(day, actual[day])
+        if scored:
+            scores["same day last week"].add(actual[day - timedelta(days=7)], actual[day])
+    return {
+        "visits": len(visits),
+        "scored_days": days - warmup_weeks * 7,
+        "peak_occupancy": max(max(vector) for vector in actual.values()),
+        "scores": {name: score.row() for name, score in scores.items()},
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--weeks", type=int, default=16)
+    parser.add_argument("--warmup-weeks", type=int, default=4)
+    parser.add_argument("--alpha", type=float, nargs="+", default=[0.1, 0.25, 0.5])
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--tz", default="Europe/Prague")
+    parser.add_argument("--first-day", type=date.fromisoformat, default=date(2026, 1, 5))
+    args = parser.parse_args()
+    if args.weeks <= args.warmup_weeks:
+        parser.error("--weeks must be larger than --warmup-weeks")
+
+    result = evaluate(
+        weeks=args.weeks,
+        warmup_weeks=args.warmup_weeks,
+        alphas=args.alpha,
+        seed=args.seed,
+        tz=ZoneInfo(args.tz),
+        first_day=args.first_day,
+    )
+    print(
+        f"{result['visits']} synthetic visits over {args.weeks} weeks, "
+        f"{result['scored_days']} days scored, peak {result['peak_occupancy']:.1f} people"
+    )
+    print(f"{'model':<26}{'MAE':>8}{'RMSE':>8}{'bias':>8}{'peak err min':>14}")
+    for name, row in result["scores"].items():
+        print(f"{name:<26}{row['MAE']:>8.2f}{row['RMSE']:>8.2f}{row['bias']:>8.2f}{row['peak err min']:>14.0f}")
+
+
+if __name__ == "__main__":
+    main()
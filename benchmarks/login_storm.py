@@ -0,0 +1,153 @@
+"""
+Benchmark: /api/verify latency while a burst of logins hits the same worker.
+
+Runs a steady scanner load (--scan-concurrency requests in flight) twice: alone,
+then together with --logins concurrent /api/login calls (--login-concurrency in
+flight), and compares verify latency percentiles. Before password hashing moved
+to its own pool every Argon2 verification stalled the event loop, so scans
+queued behind logins; now only the login requests themselves wait. Also prints
+the server's password_hashing stats from /health (queue depth, rejections).
+
+    DATABASE_URL=postgresql+psycopg2://... JWT_SECRET_KEY=x API_VERIFY_KEY=bench \\
+    VERIFY_RATE_LIMIT_PER_MINUTE=0 VERIFY_RATE_LIMIT_PER_IP_PER_MINUTE=0 \\
+        uvicorn app.main:app --port 8000 --timeout-keep-alive 60
+
+    DATABASE_URL=postgresql+psycopg2://... JWT_SECRET_KEY=x \\
+        python -m benchmarks.login_storm --api-key bench --seed 1000 --seed-logins 50
+
+--seed-logins creates (idempotently) users loginstorm-N@benchmark.local whose
+password is --password, hashed with the server's current Argon2 parameters.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import statistics
+import time
+from collections import Counter
+
+import httpx
+
+from benchmarks.verify_concurrency import SEED_EMAIL_DOMAIN, seed_tokens
+from benchmarks.verify_roundtrips import percentile
+
+
+def seed_login_users(count: int, password: str) -> list[str]:
+    from app.auth import get_password_hash
+    from app.database import SessionLocal
+    from app.models import User
+
+    emails = [f"loginstorm-{i}@{SEED_EMAIL_DOMAIN}" for i in range(count)]
+    db = SessionLocal()
+    try:
+        existing = {email for (email,) in db.query(User.email).filter(User.email.in_(emails))}
+        password_hash = get_password_hash(password)  # same hash for all: seeding speed, not realism
+        for i, email in enumerate(emails):
+            if email not in existing:
+                db.add(User(email=email, name=f"Login storm {i}", password_hash=password_hash))
+        db.commit()
+    finally:
+        db.close()
+    return emails
+
+
+async def scan_load(client: httpx.AsyncClient, tokens: list[str], concurrency: int, stop: asyncio.Event) -> list[float]:
+    latencies: list[float] = []
+    counter = iter(range(10**9))
+
+    async def worker():
+        for i in counter:
+            if stop.is_set():
+                return
+            start = time.perf_counter()
+            try:
+                await client.post("/api/verify", json={"token": tokens[i % len(tokens)]})
+            except httpx.TransportError:
+                continue  # idle keep-alive connection closed by the server
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies
+
+
+async def login_storm(
+    client: httpx.AsyncClient, emails: list[str], password: str, total: int, concurrency: int
+) -> tuple[list[float], Counter]:
+    latencies: list[float] = []
+    statuses: Counter = Counter()
+    counter = iter(range(total))
+
+    async def worker():
+        for i in counter:
+            start = time.perf_counter()
+            try:
+                response = await client.post(
+                    "/api/login", data={"username": emails[i % len(emails)], "password": password}
+                )
+            except httpx.TransportError as exc:
+                statuses[type(exc).__name__] += 1
+                continue
+            latencies.append((time.perf_counter() - start) * 1000)
+            statuses[response.status_code] += 1
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, statuses
+
+
+async def run(args, tokens: list[str], emails: list[str]):
+    limits = httpx.Limits(max_connections=args.scan_concurrency + args.login_concurrency + 4)
+    async with httpx.AsyncClient(
+        base_url=args.url, headers={"X-API-KEY": args.api_key}, limits=limits, timeout=120
+    ) as client:
+        stop = asyncio.Event()
+        scans = asyncio.create_task(scan_load(client, tokens, args.scan_concurrency, stop))
+        await asyncio.sleep(args.baseline_seconds)
+        stop.set()
+        baseline = await scans
+
+        stop = asyncio.Event()
+        scans = asyncio.create_task(scan_load(client, tokens, args.scan_concurrency, stop))
+        started = time.perf_counter()
+        login_latencies, statuses = await login_storm(client, emails, args.password, args.logins, args.login_concurrency)
+        storm_seconds = time.perf_counter() - started
+        stop.set()
+        during = await scans
+
+        health = (await client.get("/health")).json()
+    return baseline, during, login_latencies, statuses, storm_seconds, health.get("password_hashing")
+
+
+def _row(label: str, samples: list[float]) -> str:
+    return (
+        f"{label:<22} n={len(samples):>6} p50={percentile(samples, 50):>8.1f} p95={percentile(samples, 95):>8.1f} "
+        f"p99={percentile(samples, 99):>8.1f} max={max(samples):>8.1f} mean={statistics.mean(samples):>8.1f}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--api-key", required=True)
+    parser.add_argument("--seed", type=int, default=200, help="benchmark tokens to scan (created if missing)")
+    parser.add_argument("--seed-logins", type=int, default=50, help="login users to create if missing")
+    parser.add_argument("--password", default="storm-password-1")
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--login-concurrency", type=int, default=50)
+    parser.add_argument("--scan-concurrency", type=int, default=10)
+    parser.add_argument("--baseline-seconds", type=float, default=5.0)
+    args = parser.parse_args()
+
+    tokens = seed_tokens(args.seed)
+    emails = seed_login_users(args.seed_logins, args.password)
+    baseline, during, login_latencies, statuses, storm_seconds, pool = asyncio.run(run(args, tokens, emails))
+
+    print("latency ms")
+    print(_row("verify (no logins)", baseline))
+    print(_row("verify (login storm)", during))
+    print(_row("login", login_latencies))
+    print(f"logins: {args.logins} in {storm_seconds:.2f}s, status codes {dict(statuses)}")
+    print("server password_hashing:", pool)
+
+
+if __name__ == "__main__":
+    main()
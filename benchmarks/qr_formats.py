@@ -0,0 +1,52 @@
+"""
+Micro-benchmark: QR output formats – bytes on the wire and render time.
+
+For each format and scale reports the image size, its size as a base64 data URL
+(what JSON-embedding endpoints send), the size after gzip, and the uncached render
+time. No database needed.
+
+    python -m benchmarks.qr_formats --token 123456 --iterations 200
+"""
+from __future__ import annotations
+
+import argparse
+import base64
+import gzip
+import statistics
+import time
+
+from app.services.qr_render import RENDERERS, QRSpec
+
+
+def percentile(samples: list[float], pct: float) -> float:
+    # same as verify_roundtrips.percentile, which would pull in app.database
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--token", default="123456")
+    parser.add_argument("--scale", type=int, action="append", help="pixels per module (default: 4, 10, 20, 40)")
+    parser.add_argument("--iterations", type=int, default=200)
+    args = parser.parse_args()
+
+    print(f"{'format':<8} {'scale':>5} {'bytes':>7} {'base64':>7} {'gzip':>6} {'p50 ms':>8} {'p99 ms':>8} {'mean ms':>8}")
+    for scale in args.scale or [4, 10, 20, 40]:
+        for fmt, (render, _, _) in RENDERERS.items():
+            spec = QRSpec(token=args.token, scale=scale, format=fmt)
+            content = render(spec)
+            timings = []
+            for _ in range(args.iterations):
+                start = time.perf_counter()
+                render(spec)
+                timings.append((time.perf_counter() - start) * 1000)
+            print(
+                f"{fmt:<8} {scale:>5} {len(content):>7} {len(base64.b64encode(content)):>7} "
+                f"{len(gzip.compress(content)):>6} {percentile(timings, 50):>8.3f} "
+                f"{percentile(timings, 99):>8.3f} {statistics.mean(timings):>8.3f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
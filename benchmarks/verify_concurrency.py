@@ -0,0 +1,128 @@
+"""
+Benchmark: /api/verify throughput with many turnstiles scanning at once.
+
+Fires --requests scans at a running API with --concurrency requests in flight and
+reports throughput, latency percentiles and the reason mix. Start the server first
+(with the per-key rate limit off, all scans share one API key):
+
+    DATABASE_URL=postgresql+psycopg2://... JWT_SECRET_KEY=x API_VERIFY_KEY=bench \\
+    VERIFY_RATE_LIMIT_PER_MINUTE=0 uvicorn app.main:app --port 8000
+
+    DATABASE_URL=postgresql+psycopg2://... JWT_SECRET_KEY=x \\
+        python -m benchmarks.verify_concurrency --api-key bench --seed 1000 --concurrency 200
+
+--seed creates (idempotently) users with active tokens and memberships so the mix
+contains granted scans, cooldown denials and unknown tokens.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import statistics
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+
+import httpx
+
+from benchmarks.verify_roundtrips import percentile
+
+SEED_EMAIL_DOMAIN = "benchmark.local"
+
+
+def seed_tokens(count: int) -> list[str]:
+    from app.database import SessionLocal
+    from app.models import AccessToken, Membership, User
+
+    db = SessionLocal()
+    try:
+        existing = {
+            token
+            for (token,) in db.query(AccessToken.token)
+            .join(User, User.id == AccessToken.user_id)
+            .filter(User.email.like(f"%@{SEED_EMAIL_DOMAIN}"), AccessToken.is_active.is_(True))
+        }
+        now = datetime.now(timezone.utc)
+        for i in range(count):
+            token_str = f"bench-{i:06d}"
+            if token_str in existing:
+                continue
+            user = User(email=f"bench-{i}@{SEED_EMAIL_DOMAIN}", name=f"Bench {i}", password_hash="!", credits=5)
+            db.add(user)
+            db.flush()
+            db.add(AccessToken(token=token_str, user_id=user.id, is_active=True, scan_count=0))
+            if i % 2 == 0:
+                db.add(
+                    Membership(
+                        user_id=user.id,
+                        package_name_cache="Benchmark",
+                        membership_type="manual",
+                        valid_from=now - timedelta(days=1),
+                        valid_to=now + timedelta(days=365),
+                        status="active",
+                    )
+                )
+        db.commit()
+    finally:
+        db.close()
+    return [f"bench-{i:06d}" for i in range(count)]
+
+
+async def run(url: str, api_key: str, tokens: list[str], total: int, concurrency: int):
+    latencies: list[float] = []
+    reasons: Counter[str] = Counter()
+    counter = iter(range(total))
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=url, headers={"X-API-KEY": api_key}, limits=limits, timeout=60) as client:
+
+        async def worker():
+            for i in counter:
+                token_str = tokens[i % len(tokens)]
+                start = time.perf_counter()
+                try:
+                    response = await client.post("/api/verify", json={"token": token_str})
+                except httpx.TransportError as exc:
+                    reasons[type(exc).__name__] += 1
+                    continue
+                latencies.append((time.perf_counter() - start) * 1000)
+                reason = response.json().get("reason") if response.status_code == 200 else f"http_{response.status_code}"
+                reasons[reason] += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+    return elapsed, latencies, reasons
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--api-key", required=True)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--requests", type=int, default=4000)
+    parser.add_argument("--seed", type=int, default=0, help="create N benchmark users/tokens (needs DATABASE_URL)")
+    parser.add_argument("--token", action="append", help="token(s) to scan instead of seeded ones")
+    args = parser.parse_args()
+
+    tokens = args.token or (seed_tokens(args.seed) if args.seed else None)
+    if not tokens:
+        raise SystemExit("Pass --seed N or --token.")
+    # a few unknown tokens exercise the deny + log path
+    tokens = tokens + [f"unknown-{i}" for i in range(max(1, len(tokens) // 20))]
+
+    # warm-up: open connections and fill the server's pool
+    asyncio.run(run(args.url, args.api_key, tokens, args.concurrency, args.concurrency))
+    elapsed, latencies, reasons = asyncio.run(run(args.url, args.api_key, tokens, args.requests, args.concurrency))
+
+    print(f"scans={len(latencies)} concurrency={args.concurrency} elapsed={elapsed:.2f}s")
+    print(f"throughput={len(latencies) / elapsed:.1f} scans/s")
+    print(
+        f"latency ms: p50={percentile(latencies, 50):.1f} p95={percentile(latencies, 95):.1f} "
+        f"p99={percentile(latencies, 99):.1f} mean={statistics.mean(latencies):.1f}"
+    )
+    print("reasons:", dict(reasons.most_common()))
+
+
+if __name__ == "__main__":
+    main()
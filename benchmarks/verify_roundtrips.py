@@ -0,0 +1,117 @@
+"""
+Benchmark: read side of /api/verify – legacy query chain vs. single-query read model.
+
+Counts SQL round trips per scan and reports p50/p99 latency for both strategies.
+Runs read-only against DATABASE_URL (no scans are recorded).
+
+    DATABASE_URL=postgresql+psycopg2://... JWT_SECRET_KEY=x \
+        python -m benchmarks.verify_roundtrips --iterations 2000
+"""
+from __future__ import annotations
+
+import argparse
+import statistics
+import time
+from datetime import datetime, timezone
+
+from sqlalchemy import and_, event
+
+from app.database import SessionLocal, engine
+from app.models import AccessToken, User
+from app.services.membership import MembershipService
+from app.services.verification import load_verification_context
+
+
+class StatementCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, *args, **kwargs):
+        self.count += 1
+
+
+def legacy_lookup(db, token_str: str, now_ts: datetime):
+    """Read queries issued by process_verification before the single-query read model."""
+    token = db.query(AccessToken).filter(AccessToken.token == token_str).first()
+    if not token or not token.is_active:
+        return
+    user = db.query(User).filter(User.id == token.user_id).first()
+    if not user:
+        return
+    (
+        db.query(AccessToken)
+        .filter(
+            and_(
+                AccessToken.user_id == user.id,
+                AccessToken.is_active == True,  # noqa: E712 - mirrors original query
+                AccessToken.last_scan_at.isnot(None),
+            )
+        )
+        .order_by(AccessToken.last_scan_at.desc())
+        .first()
+    )
+    membership = MembershipService(db).get_active_membership(user.id, now_ts)
+    if membership:
+        _ = membership.package
+
+
+def read_model_lookup(db, token_str: str, now_ts: datetime):
+    load_verification_context(db, token_str, now_ts)
+
+
+def percentile(samples: list[float], pct: float) -> float:
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def run(strategy, tokens: list[str], iterations: int) -> tuple[list[float], float]:
+    counter = StatementCounter()
+    event.listen(engine, "before_cursor_execute", counter)
+    timings: list[float] = []
+    try:
+        for i in range(iterations):
+            token_str = tokens[i % len(tokens)]
+            db = SessionLocal()
+            try:
+                start = time.perf_counter()
+                strategy(db, token_str, datetime.now(timezone.utc))
+                timings.append((time.perf_counter() - start) * 1000)
+            finally:
+                db.close()
+    finally:
+        event.remove(engine, "before_cursor_execute", counter)
+    return timings, counter.count / iterations
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=1000)
+    parser.add_argument("--token", action="append", help="token(s) to scan; defaults to 50 active tokens from the DB")
+    args = parser.parse_args()
+
+    tokens = args.token
+    if not tokens:
+        db = SessionLocal()
+        try:
+            tokens = [t for (t,) in db.query(AccessToken.token).filter(AccessToken.is_active.is_(True)).limit(50)]
+        finally:
+            db.close()
+    if not tokens:
+        raise SystemExit("No active tokens found – pass --token or seed the database first.")
+
+    # warm up connection pool and plan caches
+    run(read_model_lookup, tokens, min(50, args.iterations))
+    run(legacy_lookup, tokens, min(50, args.iterations))
+
+    print(f"{'strategy':<12} {'round trips':>12} {'p50 ms':>8} {'p99 ms':>8} {'mean ms':>8}")
+    for name, strategy in (("legacy", legacy_lookup), ("read-model", read_model_lookup)):
+        timings, round_trips = run(strategy, tokens, args.iterations)
+        print(
+            f"{name:<12} {round_trips:>12.2f} {percentile(timings, 50):>8.3f} "
+            f"{percentile(timings, 99):>8.3f} {statistics.mean(timings):>8.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -2,7 +2,7 @@
 
 import { useMemo } from 'react';
 import { useQuery } from '@tanstack/react-query';
-import { apiClient } from '@/lib/apiClient';
+import { fetchDashboardSections } from '@/lib/dashboard';
 import { Toast, useToast } from '@/components/toast';
 import { DATE_LOCALE, DATE_TIMEZONE } from '@/lib/datetime';
 
@@ -43,7 +43,7 @@ export default function AktivitaPage() {
   const { toast } = useToast();
   const { data, isPending } = useQuery<MyQrResponse>({
     queryKey: ['my-qr', 'presence'],
-    queryFn: () => apiClient<MyQrResponse>('/api/my_qr'),
+    queryFn: () => fetchDashboardSections<MyQrResponse>(['presence_sessions']),
   });
 
   const sessions = useMemo(() => data?.presence_sessions ?? [], [data?.presence_sessions]);
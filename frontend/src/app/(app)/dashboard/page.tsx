@@ -3,7 +3,7 @@
 import { useState } from 'react';
 import Link from 'next/link';
 import { useQuery } from '@tanstack/react-query';
-import { apiClient } from '@/lib/apiClient';
+import { apiClient, apiUrl } from '@/lib/apiClient';
 import { Toast, useToast } from '@/components/toast';
 import Image from 'next/image';
 
@@ -18,7 +18,7 @@ export default function DashboardPage() {
 
   const { data, isPending, refetch } = useQuery<QrResponse>({
     queryKey: ['my-qr'],
-    queryFn: () => apiClient<QrResponse>('/api/my_qr'),
+    queryFn: () => apiClient<QrResponse>('/api/my_qr/token'),
   });
 
   async function regenerate() {
@@ -39,12 +39,23 @@ export default function DashboardPage() {
       showToast('QR kód není k dispozici', 'error');
       return;
     }
+    // The image lives on the API origin, where the download attribute is ignored.
+    let objectUrl: string;
+    try {
+      const res = await fetch(apiUrl(data.qr_code_url));
+      if (!res.ok) throw new Error(`HTTP ${res.status}`);
+      objectUrl = URL.createObjectURL(await res.blob());
+    } catch {
+      showToast('QR kód se nepodařilo stáhnout', 'error');
+      return;
+    }
     const link = document.createElement('a');
-    link.href = data.qr_code_url;
+    link.href = objectUrl;
     link.download = 'gym-access-qr.png';
     document.body.appendChild(link);
     link.click();
     document.body.removeChild(link);
+    URL.revokeObjectURL(objectUrl);
     showToast('QR kód stažen');
   }
 
@@ -67,7 +78,7 @@ export default function DashboardPage() {
               <div className="inline-flex flex-col items-center gap-4 glass-subcard rounded-2xl p-6">
                 {data?.qr_code_url ? (
                   <Image
-                    src={data.qr_code_url}
+                    src={apiUrl(data.qr_code_url)}
                     alt="QR Code"
                     width={320}
                     height={320}
@@ -8,7 +8,7 @@ import { useRouter, usePathname } from 'next/navigation';
 import { useLogout } from '@/hooks/useLogout';
 import { useBranding } from '@/components/branding-context';
 import { useBrandingLogo } from '@/hooks/useBrandingLogo';
-import { apiClient } from '@/lib/apiClient';
+import { apiClient, apiUrl } from '@/lib/apiClient';
 
 export default function AppLayout({ children }: PropsWithChildren) {
   const token = useAtomValue(tokenAtom);
@@ -47,9 +47,9 @@ export default function AppLayout({ children }: PropsWithChildren) {
     async function loadMiniQr() {
       if (!effectiveToken) return;
       try {
-        const res = await apiClient<{ qr_code_url?: string; token?: string }>('/api/my_qr');
+        const res = await apiClient<{ qr_code_url?: string; token?: string }>('/api/my_qr/token');
         if (cancelled) return;
-        setMiniQr(res.qr_code_url ?? null);
+        setMiniQr(res.qr_code_url ? apiUrl(res.qr_code_url) : null);
         setMiniToken(res.token ?? null);
       } catch {
         if (!cancelled) {
@@ -3,6 +3,7 @@
 import { useEffect, useState } from 'react';
 import { useQuery } from '@tanstack/react-query';
 import { apiClient } from '@/lib/apiClient';
+import { fetchDashboardSections } from '@/lib/dashboard';
 import { Toast, useToast } from '@/components/toast';
 import { DATE_LOCALE, DATE_TIMEZONE } from '@/lib/datetime';
 
@@ -114,7 +115,7 @@ export default function PermanentkyPage() {
 
   const { data, isPending } = useQuery<QrResponse>({
     queryKey: ['my-qr', 'permanentky'],
-    queryFn: () => apiClient<QrResponse>('/api/my_qr'),
+    queryFn: () => fetchDashboardSections<QrResponse>(['memberships', 'packages']),
   });
 
   const membershipCards =
@@ -3,6 +3,7 @@
 import { useEffect, useState } from 'react';
 import { useQuery } from '@tanstack/react-query';
 import { apiClient } from '@/lib/apiClient';
+import { fetchDashboardSections } from '@/lib/dashboard';
 import { Toast, useToast } from '@/components/toast';
 import { DATE_LOCALE, DATE_TIMEZONE } from '@/lib/datetime';
 
@@ -84,7 +85,7 @@ export default function TreninkyPage() {
 
   const { data, isPending } = useQuery<QrResponse>({
     queryKey: ['my-qr', 'treninky'],
-    queryFn: () => apiClient<QrResponse>('/api/my_qr'),
+    queryFn: () => fetchDashboardSections<QrResponse>(['memberships', 'packages']),
   });
 
   const trainingCards =
@@ -11,6 +11,9 @@ export default function AdminApiKeysPage() {
   const queryClient = useQueryClient();
   const { toast, showToast } = useToast();
   const [name, setName] = useState('');
+  const [kind, setKind] = useState<'admin' | 'scanner'>('admin');
+  const [scannerId, setScannerId] = useState('');
+  const [rateLimit, setRateLimit] = useState('');
   const [revealedToken, setRevealedToken] = useState<string | null>(null);
 
   const keysQuery = useQuery<AdminApiKey[]>({
@@ -22,11 +25,18 @@ export default function AdminApiKeysPage() {
     mutationFn: async () =>
       apiClient<AdminApiKey>('/api/admin/api-keys', {
         method: 'POST',
-        body: JSON.stringify({ name: name.trim() }),
+        body: JSON.stringify({
+          name: name.trim(),
+          kind,
+          scanner_id: kind === 'scanner' ? scannerId.trim() || null : null,
+          rate_limit_per_minute: kind === 'scanner' && rateLimit ? Number(rateLimit) : null,
+        }),
       }),
     onSuccess: (data) => {
       setRevealedToken(data.token ?? null);
       setName('');
+      setScannerId('');
+      setRateLimit('');
       showToast('API klíč vytvořen');
       queryClient.invalidateQueries({ queryKey: ['admin-api-keys'] });
     },
@@ -99,6 +109,41 @@ export default function AdminApiKeysPage() {
                   className="w-full rounded-xl bg-white/5 border border-white/10 px-3 py-2 text-white placeholder:text-slate-500 focus:outline-none focus:ring-2 focus:ring-white/20"
                 />
               </label>
+              <label className="space-y-1">
+                <span className="text-sm text-slate-300">Typ</span>
+                <select
+                  value={kind}
+                  onChange={(e) => setKind(e.target.value as 'admin' | 'scanner')}
+                  className="w-full rounded-xl bg-white/5 border border-white/10 px-3 py-2 text-white focus:outline-none focus:ring-2 focus:ring-white/20"
+                >
+                  <option value="admin">Integrace (admin API)</option>
+                  <option value="scanner">Čtečka / turniket (jen /api/verify)</option>
+                </select>
+              </label>
+              {kind === 'scanner' && (
+                <div className="grid gap-3 md:grid-cols-2">
+                  <label className="space-y-1">
+                    <span className="text-sm text-slate-300">ID čtečky</span>
+                    <input
+                      type="text"
+                      value={scannerId}
+                      onChange={(e) => setScannerId(e.target.value)}
+                      placeholder="Např. in-1"
+                      className="w-full rounded-xl bg-white/5 border border-white/10 px-3 py-2 text-white placeholder:text-slate-500 focus:outline-none focus:ring-2 focus:ring-white/20"
+                    />
+                  </label>
+                  <label className="space-y-1">
+                    <span className="text-sm text-slate-300">Limit požadavků za minutu (prázdné = výchozí)</span>
+                    <input
+                      type="number"
+                      min={0}
+                      value={rateLimit}
+                      onChange={(e) => setRateLimit(e.target.value)}
+                      className="w-full rounded-xl bg-white/5 border border-white/10 px-3 py-2 text-white placeholder:text-slate-500 focus:outline-none focus:ring-2 focus:ring-white/20"
+                    />
+                  </label>
+                </div>
+              )}
             </div>
             <div className="flex items-center gap-3">
               <button
@@ -140,6 +185,11 @@ export default function AdminApiKeysPage() {
                     <div>
                       <p className="text-lg font-semibold">{key.name}</p>
                       <p className="text-xs text-slate-400">Prefix: {key.prefix}</p>
+                      {key.kind === 'scanner' && (
+                        <p className="text-xs text-slate-400">
+                          Čtečka: {key.scanner_id || '---'} · limit: {key.rate_limit_per_minute ?? 'výchozí'}/min
+                        </p>
+                      )}
                     </div>
                     <span
                       className={`px-3 py-1 rounded-full text-xs ${
@@ -5,7 +5,7 @@ import { PropsWithChildren, useEffect, useState } from 'react';
 import { useAtomValue } from 'jotai';
 import { tokenAtom } from '@/lib/authStore';
 import { usePathname, useRouter } from 'next/navigation';
-import { apiClient } from '@/lib/apiClient';
+import { apiClient, apiUrl } from '@/lib/apiClient';
 import { useLogout } from '@/hooks/useLogout';
 import { useBranding } from '@/components/branding-context';
 import { useBrandingLogo } from '@/hooks/useBrandingLogo';
@@ -82,9 +82,9 @@ export default function AdminLayout({ children }: PropsWithChildren) {
     let cancelled = false;
     async function loadMiniQr() {
       try {
-        const res = await apiClient<{ qr_code_url?: string; token?: string }>('/api/my_qr');
+        const res = await apiClient<{ qr_code_url?: string; token?: string }>('/api/my_qr/token');
         if (cancelled) return;
-        setMiniQr(res.qr_code_url ?? null);
+        setMiniQr(res.qr_code_url ? apiUrl(res.qr_code_url) : null);
         setMiniToken(res.token ?? null);
       } catch {
         if (!cancelled) {
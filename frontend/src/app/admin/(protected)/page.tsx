@@ -1,9 +1,15 @@
 'use client';
 
-import { useMemo } from 'react';
+import { useEffect, useMemo } from 'react';
 import { useMutation, useQuery, useQueryClient } from '@tanstack/react-query';
-import { apiClient } from '@/lib/apiClient';
-import type { AdminMembershipPackage, AdminUser, AdminPresenceSession } from '@/types/admin';
+import { apiClient, apiEventStream } from '@/lib/apiClient';
+import type {
+  AdminLivePresence,
+  AdminMembershipPackage,
+  AdminPresenceEvent,
+  AdminPresenceSession,
+  AdminUser,
+} from '@/types/admin';
 import { DATE_LOCALE, DATE_TIMEZONE } from '@/lib/datetime';
 
 function formatTimeHM(value?: string | null) {
@@ -29,9 +35,47 @@ export default function AdminOverviewPage() {
   });
   const presenceQuery = useQuery<AdminPresenceSession[]>({
     queryKey: ['admin-presence-active'],
-    queryFn: () => apiClient('/api/admin/presence/active'),
+    queryFn: async () => (await apiClient<AdminLivePresence>('/api/admin/presence/live')).occupants,
   });
 
+  // Live updates pushed by the server (in-memory occupancy), instead of polling.
+  useEffect(() => {
+    const controller = new AbortController();
+    const key = ['admin-presence-active'];
+    const connect = async () => {
+      while (!controller.signal.aborted) {
+        try {
+          await apiEventStream(
+            '/api/admin/presence/live/stream',
+            ({ event, data }) => {
+              if (event === 'snapshot') {
+                queryClient.setQueryData<AdminPresenceSession[]>(key, (JSON.parse(data) as AdminLivePresence).occupants);
+              } else if (event === 'enter') {
+                const { occupant } = JSON.parse(data) as AdminPresenceEvent;
+                queryClient.setQueryData<AdminPresenceSession[]>(key, (current) => [
+                  occupant,
+                  ...(current ?? []).filter((session) => session.user_id !== occupant.user_id),
+                ]);
+              } else if (event === 'exit') {
+                const { occupant } = JSON.parse(data) as AdminPresenceEvent;
+                queryClient.setQueryData<AdminPresenceSession[]>(key, (current) =>
+                  (current ?? []).filter((session) => session.id !== occupant.id),
+                );
+              }
+            },
+            controller.signal,
+          );
+        } catch (error) {
+          if (controller.signal.aborted) return;
+          console.warn('Presence stream disconnected, retrying', error);
+        }
+        await new Promise((resolve) => setTimeout(resolve, 5000));
+      }
+    };
+    connect();
+    return () => controller.abort();
+  }, [queryClient]);
+
   const endPresenceMutation = useMutation({
     mutationFn: async (sessionId: number) =>
       apiClient(`/api/admin/presence/${sessionId}/end`, {
@@ -129,8 +173,9 @@ export default function AdminOverviewPage() {
                 </div>
                 {(() => {
                   const meta = session.metadata as { membership_id?: number } | undefined;
-                  return meta?.membership_id ? (
-                    <p className="text-xs text-slate-500">Permanentka ID: {meta.membership_id}</p>
+                  const membershipId = session.membership_id ?? meta?.membership_id;
+                  return membershipId ? (
+                    <p className="text-xs text-slate-500">Permanentka ID: {membershipId}</p>
                   ) : null;
                 })()}
               </div>
@@ -2,7 +2,7 @@
 
 import { useMemo, useState } from 'react';
 import { useMutation, useQuery, useQueryClient } from '@tanstack/react-query';
-import { apiClient } from '@/lib/apiClient';
+import { apiClient, apiUrl } from '@/lib/apiClient';
 import type { AdminMembershipPackage, AdminUser, AdminUserMembership, AdminUserQr } from '@/types/admin';
 import { useDebounce } from '@/hooks/useDebounce';
 import { Toast, useToast } from '@/components/toast';
@@ -294,7 +294,7 @@ export default function AdminUsersPage() {
                   <div className="glass-subcard rounded-2xl p-4 flex items-center justify-center bg-white/5">
                     {userTokenQuery.data?.qr_code_url ? (
                       <img
-                        src={userTokenQuery.data.qr_code_url}
+                        src={apiUrl(userTokenQuery.data.qr_code_url)}
                         alt="QR kód uživatele"
                         className="w-full max-w-[200px] rounded-xl border border-white/10 bg-white"
                       />
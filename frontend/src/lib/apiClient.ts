@@ -20,6 +20,14 @@ if (typeof window !== 'undefined') {
   }
 }
 
+/**
+ * Absolute URL for a path the API returned (e.g. qr_code_url = /api/qr_image/...);
+ * data: and absolute URLs are returned unchanged.
+ */
+export function apiUrl(url: string): string {
+  return url.startsWith('/') ? `${API_URL}${url}` : url;
+}
+
 type HttpMethod = 'GET' | 'POST' | 'PUT' | 'PATCH' | 'DELETE';
 
 type ApiClientOptions = RequestInit & { method?: HttpMethod };
@@ -110,3 +118,49 @@ async function safeParseError(response: Response): Promise<string | null> {
     return null;
   }
 }
+
+export type ServerSentEvent = { event: string; data: string };
+
+/**
+ * Reads a text/event-stream endpoint with the admin JWT (EventSource cannot send
+ * Authorization headers). Resolves when the server closes the stream; abort via signal.
+ */
+export async function apiEventStream(
+  path: string,
+  onEvent: (event: ServerSentEvent) => void,
+  signal: AbortSignal,
+): Promise<void> {
+  const headers = new Headers({ Accept: 'text/event-stream' });
+  const token = typeof window !== 'undefined' ? sessionStorage.getItem('access_token') : null;
+  if (token) {
+    headers.set('Authorization', `Bearer ${token}`);
+  }
+  const response = await fetch(`${API_URL}${path}`, { headers, signal });
+  if (!response.ok || !response.body) {
+    if (response.status === 401) {
+      handleUnauthorized('access_token');
+    }
+    throw new Error(`HTTP ${response.status}`);
+  }
+
+  const reader = response.body.pipeThrough(new TextDecoderStream()).getReader();
+  let buffer = '';
+  for (;;) {
+    const { value, done } = await reader.read();
+    if (done) return;
+    buffer += value;
+    let boundary = buffer.indexOf('\n\n');
+    while (boundary !== -1) {
+      const block = buffer.slice(0, boundary);
+      buffer = buffer.slice(boundary + 2);
+      boundary = buffer.indexOf('\n\n');
+      let event = 'message';
+      const data: string[] = [];
+      for (const line of block.split('\n')) {
+        if (line.startsWith('event: ')) event = line.slice(7);
+        else if (line.startsWith('data: ')) data.push(line.slice(6));
+      }
+      if (data.length) onEvent({ event, data: data.join('\n') });
+    }
+  }
+}
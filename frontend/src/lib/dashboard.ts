@@ -0,0 +1,22 @@
+import { apiClient } from '@/lib/apiClient';
+
+interface DashboardSection {
+  etag: string;
+  not_modified: boolean;
+  data: unknown;
+}
+
+interface DashboardResponse {
+  etag: string;
+  sections: Record<string, DashboardSection>;
+}
+
+// Loads only the listed sections of /api/dashboard and returns their data keyed by section name.
+export async function fetchDashboardSections<T extends object>(sections: (keyof T & string)[]): Promise<T> {
+  const res = await apiClient<DashboardResponse>(`/api/dashboard?sections=${sections.join(',')}`);
+  const data: Record<string, unknown> = {};
+  for (const name of sections) {
+    data[name] = res.sections[name]?.data ?? null;
+  }
+  return data as T;
+}
@@ -58,6 +58,20 @@ export interface AdminPresenceSession {
   metadata?: Record<string, unknown> | null;
 }
 
+export interface AdminLivePresence {
+  count: number;
+  version: number;
+  updated_at: string;
+  occupants: AdminPresenceSession[];
+}
+
+export interface AdminPresenceEvent {
+  count: number;
+  version: number;
+  updated_at: string;
+  occupant: AdminPresenceSession;
+}
+
 export interface AdminMembershipPackage {
   id: number;
   name: string;
@@ -104,6 +118,9 @@ export interface AdminApiKey {
   created_at?: string | null;
   last_used_at?: string | null;
   created_by_user_id?: number | null;
+  kind?: 'admin' | 'scanner';
+  scanner_id?: string | null;
+  rate_limit_per_minute?: number | null;
   token?: string | null;
 }
 